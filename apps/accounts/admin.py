@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, PhotographerProfile, ClientProfile
+from apps.payments import ledger
+from .models import User, PhotographerProfile, ClientProfile, ClientSelfie
 
 
 @admin.register(User)
@@ -22,6 +23,26 @@ class PhotographerProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'studio_name', 'is_verified', 'balance', 'total_earned']
     list_filter = ['is_verified']
     search_fields = ['user__username', 'studio_name']
+    list_select_related = ['user']
+    
+    # Остатки по книге проводок - подзапросами в списке, а не запросом на строку
+    def get_queryset(self, request):
+        return ledger.annotate_summary(super().get_queryset(request), 'photographer:')
+    
+    @admin.display(description='Баланс', ordering='ledger_balance')
+    def balance(self, obj):
+        return obj.ledger_balance
+    
+    @admin.display(description='Заработано', ordering='ledger_sales_total')
+    def total_earned(self, obj):
+        return obj.ledger_sales_total
+
+
+class ClientSelfieInline(admin.TabularInline):
+    model = ClientSelfie
+    extra = 0
+    fields = ['image', 'created_at']
+    readonly_fields = ['created_at']
 
 
 @admin.register(ClientProfile)
@@ -29,3 +50,12 @@ class ClientProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'face_processed', 'total_purchases', 'total_spent']
     list_filter = ['face_processed']
     search_fields = ['user__username']
+    list_select_related = ['user']
+    inlines = [ClientSelfieInline]
+    
+    def get_queryset(self, request):
+        return ledger.annotate_summary(super().get_queryset(request), 'client:')
+    
+    @admin.display(description='Потрачено', ordering='ledger_sales_total')
+    def total_spent(self, obj):
+        return -obj.ledger_sales_total
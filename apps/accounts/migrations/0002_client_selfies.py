@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_existing_selfies(apps, schema_editor):
+    """Переносит текущие селфи клиентов в список эталонов"""
+    ClientProfile = apps.get_model('accounts', 'ClientProfile')
+    ClientSelfie = apps.get_model('accounts', 'ClientSelfie')
+    
+    profiles = ClientProfile.objects.exclude(selfie='').exclude(selfie__isnull=True)
+    for profile in profiles.iterator():
+        ClientSelfie.objects.create(
+            profile=profile,
+            image=profile.selfie.name,
+            face_encoding=profile.face_encoding
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientprofile',
+            name='face_template',
+            field=models.JSONField(blank=True, null=True, verbose_name='Шаблон лица'),
+        ),
+        migrations.CreateModel(
+            name='ClientSelfie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='selfies/', verbose_name='Селфи')),
+                ('face_encoding', models.JSONField(blank=True, null=True, verbose_name='Кодировка лица')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='selfies', to='accounts.clientprofile', verbose_name='Профиль клиента')),
+            ],
+            options={
+                'verbose_name': 'Селфи клиента',
+                'verbose_name_plural': 'Селфи клиентов',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.RunPython(copy_existing_selfies, migrations.RunPython.noop),
+    ]
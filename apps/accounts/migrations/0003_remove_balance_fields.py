@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:38
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_client_selfies'),
+        # Остатки переносятся в книгу проводок до удаления полей
+        ('payments', '0006_ledger'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='clientprofile',
+            name='total_spent',
+        ),
+        migrations.RemoveField(
+            model_name='photographerprofile',
+            name='balance',
+        ),
+        migrations.RemoveField(
+            model_name='photographerprofile',
+            name='total_earned',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-19 00:06
+
+import apps.accounts.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_remove_balance_fields'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, upload_to=apps.accounts.models.avatar_upload_to, verbose_name='Аватар'),
+        ),
+    ]
@@ -1,12 +1,25 @@
 """
 Модели пользователей - Фотографы и Клиенты
 """
+import os
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
-from django.core.validators import MinValueValidator
+from django.utils.functional import cached_property
 from decimal import Decimal
 
 
+def avatar_upload_to(instance, filename):
+    """
+    Имя аватара - хеш содержимого: avatars/ отдаётся с Cache-Control
+    immutable, поэтому новый аватар получает новое имя и URL
+    """
+    from apps.photos.uploadhandlers import content_hash
+
+    ext = os.path.splitext(filename)[1].lower() or '.jpg'
+    return f'avatars/{content_hash(instance.avatar)[:32]}{ext}'
+
+
 class User(AbstractUser):
     """
     Расширенная модель пользователя
@@ -25,7 +38,7 @@ class User(AbstractUser):
     )
     phone = models.CharField(max_length=20, blank=True, verbose_name='Телефон')
     avatar = models.ImageField(
-        upload_to='avatars/',
+        upload_to=avatar_upload_to,
         blank=True,
         null=True,
         verbose_name='Аватар'
@@ -102,21 +115,6 @@ class PhotographerProfile(models.Model):
         verbose_name='Документ верификации'
     )
     
-    # Финансы
-    balance = models.DecimalField(
-        max_digits=12,
-        decimal_places=2,
-        default=Decimal('0.00'),
-        validators=[MinValueValidator(Decimal('0.00'))],
-        verbose_name='Баланс'
-    )
-    total_earned = models.DecimalField(
-        max_digits=12,
-        decimal_places=2,
-        default=Decimal('0.00'),
-        verbose_name='Всего заработано'
-    )
-    
     # Реквизиты для вывода
     bank_card = models.CharField(
         max_length=20,
@@ -145,6 +143,22 @@ class PhotographerProfile(models.Model):
     
     def __str__(self):
         return f"Профиль фотографа: {self.user.username}"
+    
+    # Финансы - по книге проводок (apps.payments.ledger)
+    @cached_property
+    def ledger(self):
+        from apps.payments import ledger
+        return ledger.summary(ledger.photographer_account(self.pk))
+    
+    @property
+    def balance(self):
+        """Баланс к выводу"""
+        return self.ledger.balance
+    
+    @property
+    def total_earned(self):
+        """Всего заработано на продажах"""
+        return self.ledger.sales_total
 
 
 class ClientProfile(models.Model):
@@ -167,12 +181,20 @@ class ClientProfile(models.Model):
     )
     
     # Кодировка лица (face encoding) - хранится как JSON
+    # При нескольких селфи - среднее по всем эталонам
     face_encoding = models.JSONField(
         null=True,
         blank=True,
         verbose_name='Кодировка лица'
     )
     
+    # Шаблон лица: среднее + несколько медоидов по всем селфи клиента
+    face_template = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name='Шаблон лица'
+    )
+    
     # Статус обработки селфи
     face_processed = models.BooleanField(
         default=False,
@@ -188,12 +210,6 @@ class ClientProfile(models.Model):
         default=0,
         verbose_name='Всего покупок'
     )
-    total_spent = models.DecimalField(
-        max_digits=12,
-        decimal_places=2,
-        default=Decimal('0.00'),
-        verbose_name='Всего потрачено'
-    )
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -204,3 +220,49 @@ class ClientProfile(models.Model):
     
     def __str__(self):
         return f"Профиль клиента: {self.user.username}"
+    
+    @cached_property
+    def total_spent(self):
+        """Всего потрачено (по книге проводок)"""
+        from apps.payments import ledger
+        return -ledger.summary(ledger.client_account(self.pk)).sales_total
+    
+    def get_face_template(self):
+        """Эталонные кодировки для сопоставления (шаблон или одиночная кодировка)"""
+        if self.face_template:
+            return self.face_template
+        if self.face_encoding:
+            return [self.face_encoding]
+        return []
+
+
+class ClientSelfie(models.Model):
+    """
+    Эталонное селфи клиента
+    Клиент может загрузить несколько селфи с разных ракурсов
+    """
+    profile = models.ForeignKey(
+        ClientProfile,
+        on_delete=models.CASCADE,
+        related_name='selfies',
+        verbose_name='Профиль клиента'
+    )
+    image = models.ImageField(
+        upload_to='selfies/',
+        verbose_name='Селфи'
+    )
+    face_encoding = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name='Кодировка лица'
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Селфи клиента'
+        verbose_name_plural = 'Селфи клиентов'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Селфи {self.id} клиента {self.profile.user.username}"
@@ -9,6 +9,12 @@ from apps.photos.models import DeletionRequest
 class SelfieUploadForm(forms.ModelForm):
     """Форма загрузки селфи для поиска"""
     
+    replace = forms.BooleanField(
+        required=False,
+        label='Заменить предыдущие селфи',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+    
     class Meta:
         model = ClientProfile
         fields = ['selfie']
@@ -24,7 +30,11 @@ class SelfieUploadForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['selfie'].label = ''
-        self.fields['selfie'].help_text = 'Сделайте селфи или загрузите фото. Лицо должно быть хорошо видно.'
+        self.fields['selfie'].required = True
+        self.fields['selfie'].help_text = (
+            'Сделайте селфи или загрузите фото. Лицо должно быть хорошо видно. '
+            'Несколько селфи с разных ракурсов улучшают поиск.'
+        )
 
 
 class DeletionRequestForm(forms.ModelForm):
@@ -48,6 +58,13 @@ class DeletionRequestForm(forms.ModelForm):
 class SearchFilterForm(forms.Form):
     """Фильтр поиска фотографий"""
     
+    q = forms.CharField(
+        required=False,
+        widget=forms.TextInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Событие, место, описание'
+        })
+    )
     EVENT_TYPE_CHOICES = [('', 'Все события')] + [
         ('wedding', 'Свадьба'),
         ('sport', 'Спортивное мероприятие'),
@@ -0,0 +1,73 @@
+"""
+Статус фотографий для конкретного пользователя
+- Куплено ли фото
+- Найдено ли на нём лицо пользователя
+- Активный и последний отклонённый запрос на удаление
+
+Всё считается аннотациями Exists/Subquery в том же запросе, что выбирает
+фото, поэтому одинаково дёшево и для одной фотографии, и для сетки.
+"""
+from django.db.models import BooleanField, Exists, OuterRef, Subquery, Value
+
+from apps.payments.models import Purchase
+from apps.photos.models import DeletionRequest, PhotoFace
+
+
+def annotate_user_status(queryset, user):
+    """
+    Добавляет к queryset фотографий аннотации для user:
+    - is_purchased - есть оплаченная покупка
+    - is_my_photo - лицо пользователя найдено на фото
+    - pending_deletion_id - id запроса на удаление в статусе pending
+    - rejected_deletion_id, rejected_deletion_response - последний отклонённый запрос
+    Для анонимного пользователя флаги False, id - None
+    """
+    if not user.is_authenticated:
+        return queryset.annotate(
+            is_purchased=Value(False, output_field=BooleanField()),
+            is_my_photo=Value(False, output_field=BooleanField()),
+        )
+
+    deletion_requests = DeletionRequest.objects.filter(
+        photo=OuterRef('pk'),
+        requester=user,
+    )
+    rejected = deletion_requests.filter(status='rejected').order_by('-processed_at')
+
+    return queryset.annotate(
+        is_purchased=Exists(Purchase.objects.filter(
+            photo=OuterRef('pk'),
+            buyer__user=user,
+            status='paid',
+        )),
+        is_my_photo=Exists(PhotoFace.objects.filter(
+            photo=OuterRef('pk'),
+            matched_user=user,
+        )),
+        pending_deletion_id=Subquery(
+            deletion_requests.filter(status='pending').values('id')[:1]
+        ),
+        rejected_deletion_id=Subquery(rejected.values('id')[:1]),
+        rejected_deletion_response=Subquery(rejected.values('response')[:1]),
+    )
+
+
+def get_photo_status(photo) -> dict:
+    """
+    Флаги для шаблона детальной страницы из фото, выбранного
+    через annotate_user_status
+    """
+    status = {
+        'is_purchased': photo.is_purchased,
+        'is_my_photo': photo.is_my_photo,
+        'deletion_request': None,
+        'rejected_request': None,
+    }
+    if getattr(photo, 'pending_deletion_id', None):
+        status['deletion_request'] = {'id': photo.pending_deletion_id}
+    elif getattr(photo, 'rejected_deletion_id', None):
+        status['rejected_request'] = {
+            'id': photo.rejected_deletion_id,
+            'response': photo.rejected_deletion_response,
+        }
+    return status
@@ -0,0 +1,89 @@
+import datetime
+from decimal import Decimal
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.accounts.models import ClientProfile, PhotographerProfile, User
+from apps.clients.services import annotate_user_status, get_photo_status
+from apps.payments.models import Purchase
+from apps.photos import counters
+from apps.photos.models import DeletionRequest, Photo, PhotoFace
+
+
+class PhotoStatusTests(TestCase):
+    """Статус фото для пользователя - аннотациями того же запроса"""
+
+    def setUp(self):
+        user = User.objects.create(username='photographer', user_type='photographer')
+        photographer = PhotographerProfile.objects.create(user=user)
+        self.photos = [
+            Photo.objects.create(photographer=photographer, status='active', price=Decimal('100'), original='x.jpg')
+            for _ in range(4)
+        ]
+        self.user = User.objects.create(username='client', user_type='client')
+        self.other = User.objects.create(username='other', user_type='client')
+        profile = ClientProfile.objects.create(user=self.user)
+        other_profile = ClientProfile.objects.create(user=self.other)
+
+        first, second, third, fourth = self.photos
+        # Первое куплено и на нём лицо клиента
+        self.purchase(profile, first, Purchase.Status.PAID)
+        PhotoFace.objects.create(photo=first, face_location={}, face_encoding=[], matched_user=self.user)
+        # Второе куплено другим клиентом, у клиента - неоплаченная покупка и запрос на удаление
+        self.purchase(other_profile, second, Purchase.Status.PAID)
+        self.purchase(profile, second, Purchase.Status.PENDING)
+        self.pending = DeletionRequest.objects.create(photo=second, requester=self.user, reason='Не я')
+        # Третье: два отклонённых запроса - берётся последний
+        now = timezone.now()
+        for days, response in ((2, 'Старый ответ'), (1, 'Новый ответ')):
+            self.rejected = DeletionRequest.objects.create(
+                photo=third, requester=self.user, reason='Удалите', status='rejected',
+                response=response, processed_at=now - datetime.timedelta(days=days),
+            )
+        # Четвёртое: лицо и запрос другого клиента
+        PhotoFace.objects.create(photo=fourth, face_location={}, face_encoding=[], matched_user=self.other)
+        DeletionRequest.objects.create(photo=fourth, requester=self.other, reason='Не хочу')
+
+        self.addCleanup(counters.view_counter.flush)
+
+    def purchase(self, buyer, photo, status):
+        return Purchase.objects.create(
+            buyer=buyer, photo=photo, photographer=photo.photographer, amount=photo.price, status=status,
+        )
+
+    def statuses(self, user):
+        with self.assertNumQueries(1):
+            photos = {photo.pk: photo for photo in annotate_user_status(Photo.objects.all(), user)}
+        return [get_photo_status(photos[photo.pk]) for photo in self.photos]
+
+    def test_user_status(self):
+        first, second, third, fourth = self.statuses(self.user)
+        self.assertEqual(first, {
+            'is_purchased': True, 'is_my_photo': True, 'deletion_request': None, 'rejected_request': None,
+        })
+        self.assertEqual(second, {
+            'is_purchased': False, 'is_my_photo': False,
+            'deletion_request': {'id': self.pending.pk}, 'rejected_request': None,
+        })
+        self.assertEqual(third['rejected_request'], {'id': self.rejected.pk, 'response': 'Новый ответ'})
+        self.assertIsNone(third['deletion_request'])
+        self.assertEqual(fourth, {
+            'is_purchased': False, 'is_my_photo': False, 'deletion_request': None, 'rejected_request': None,
+        })
+
+    def test_anonymous(self):
+        with self.assertNumQueries(1):
+            photos = list(annotate_user_status(Photo.objects.all(), AnonymousUser()))
+        self.assertFalse(any(photo.is_purchased or photo.is_my_photo for photo in photos))
+
+    def test_detail_view(self):
+        self.client.force_login(self.user)
+        response = self.client.get(f'/client/photo/{self.photos[0].pk}/')
+        self.assertTrue(response.context['is_purchased'])
+        self.assertTrue(response.context['is_my_photo'])
+
+        response = self.client.get(f'/client/photo/{self.photos[1].pk}/')
+        self.assertFalse(response.context['is_purchased'])
+        self.assertEqual(response.context['deletion_request'], {'id': self.pending.pk})
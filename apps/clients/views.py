@@ -10,9 +10,13 @@ from django.http import JsonResponse, HttpResponse
 from django.db.models import Q
 
 from apps.accounts.models import ClientProfile
-from apps.photos.models import Photo, PhotoFace, DeletionRequest
+from apps.photos import search
+from apps.photos.counters import view_counter
+from apps.photos.models import Event, Photo, PhotoFace, DeletionRequest
+from apps.payments import pricing
 from apps.payments.models import Purchase
 from .forms import SelfieUploadForm, DeletionRequestForm, SearchFilterForm
+from .services import annotate_user_status, get_photo_status
 
 
 class ClientRequiredMixin(UserPassesTestMixin):
@@ -74,48 +78,34 @@ def upload_selfie(request):
     if request.method == 'POST':
         form = SelfieUploadForm(request.POST, request.FILES, instance=profile)
         if form.is_valid():
-            profile = form.save(commit=False)
-            profile.face_processed = False
-            profile.face_encoding = None
-            profile.save()
-            
             # Обрабатываем селфи и ищем совпадения
             from apps.recognition.services import face_service
             
             if face_service.available:
+                from apps.recognition.matching import add_client_selfie, match_client_photos
+                
                 try:
-                    # Получаем кодировку лица с селфи
-                    faces = face_service.get_face_data(profile.selfie.path)
+                    # Добавляем селфи к эталонам клиента и пересобираем шаблон лица
+                    error = add_client_selfie(
+                        profile,
+                        form.cleaned_data['selfie'],
+                        replace=form.cleaned_data.get('replace', False)
+                    )
                     
-                    if faces:
-                        # Сохраняем кодировку первого (основного) лица
-                        profile.face_encoding = faces[0]['encoding']
-                        profile.face_processed = True
-                        profile.save()
-                        
-                        # Ищем совпадения на всех фото
-                        from apps.photos.models import PhotoFace
-                        
-                        matched_count = 0
-                        for photo_face in PhotoFace.objects.filter(matched_user__isnull=True):
-                            if photo_face.face_encoding:
-                                is_match, confidence = face_service.compare_faces(
-                                    profile.face_encoding,
-                                    photo_face.face_encoding
-                                )
-                                if is_match:
-                                    photo_face.matched_user = request.user
-                                    photo_face.save()
-                                    matched_count += 1
-                        
-                        messages.success(request, f'Селфи обработано! Найдено {matched_count} фото с вами.')
+                    if error:
+                        messages.warning(request, f'{error}. Попробуйте другое фото.')
                     else:
-                        messages.warning(request, 'Лицо не найдено на селфи. Попробуйте другое фото.')
+                        # Ищем совпадения на всех фото
+                        matched_count, _ = match_client_photos(profile)
+                        selfies_count = profile.selfies.count()
+                        messages.success(
+                            request,
+                            f'Селфи обработано (эталонов: {selfies_count})! Найдено {matched_count} фото с вами.'
+                        )
                 except Exception as e:
                     messages.error(request, f'Ошибка обработки: {e}')
-                    profile.face_processed = True  # Помечаем как обработанное, чтобы не зависло
-                    profile.save()
             else:
+                profile = form.save(commit=False)
                 profile.face_processed = True
                 profile.save()
                 messages.info(request, 'Селфи загружено. Распознавание лиц временно недоступно.')
@@ -159,6 +149,8 @@ class MyPhotosView(LoginRequiredMixin, ClientRequiredMixin, ListView):
         # Применяем фильтры
         form = SearchFilterForm(self.request.GET)
         if form.is_valid():
+            if form.cleaned_data.get('q'):
+                queryset = search.filter_photos(queryset, form.cleaned_data['q'])
             if form.cleaned_data.get('event_type'):
                 queryset = queryset.filter(event__event_type=form.cleaned_data['event_type'])
             if form.cleaned_data.get('city'):
@@ -172,12 +164,24 @@ class MyPhotosView(LoginRequiredMixin, ClientRequiredMixin, ListView):
             if form.cleaned_data.get('price_max'):
                 queryset = queryset.filter(price__lte=form.cleaned_data['price_max'])
         
-        return queryset.order_by('-created_at')
+        # Бейдж "Куплено" без отдельного запроса на каждое фото
+        return annotate_user_status(queryset, self.request.user).order_by('-created_at')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['filter_form'] = SearchFilterForm(self.request.GET)
         context['profile'] = self.request.user.client_profile
+        
+        # Предложения «все мои фото» по событиям - из кэша цен
+        quotes = pricing.user_quotes(self.request.user)
+        offers = [quote for quote in quotes.values() if quote.photos > 1 or quote.discount]
+        if offers:
+            events = Event.objects.in_bulk([quote.event_id for quote in offers])
+            context['bundle_offers'] = [
+                {'event': events[quote.event_id], 'quote': quote}
+                for quote in sorted(offers, key=lambda quote: -quote.discount)
+                if quote.event_id in events
+            ]
         return context
 
 
@@ -187,46 +191,26 @@ class PhotoDetailView(LoginRequiredMixin, DetailView):
     context_object_name = 'photo'
     
     def get_queryset(self):
-        return Photo.objects.filter(status='active').select_related('photographer__user', 'event')
+        # Статус фото для пользователя выбирается тем же запросом
+        return annotate_user_status(
+            Photo.objects.filter(status='active').select_related('photographer__user', 'event'),
+            self.request.user
+        )
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        view_counter.record(self.object, self.request)
         
         # Проверяем, куплено ли уже это фото (только для клиентов)
         context['is_purchased'] = False
         context['is_client'] = self.request.user.is_client
         
         if self.request.user.is_client:
-            profile, _ = ClientProfile.objects.get_or_create(user=self.request.user)
-            context['is_purchased'] = Purchase.objects.filter(
-                buyer=profile,
-                photo=self.object,
-                status='paid'
-            ).exists()
-            
-            # Проверяем, найдено ли лицо пользователя на этом фото
-            context['is_my_photo'] = PhotoFace.objects.filter(
-                photo=self.object,
-                matched_user=self.request.user
-            ).exists()
+            # Куплено ли, есть ли лицо пользователя, запросы на удаление
+            context.update(get_photo_status(self.object))
             
             # Форма запроса на удаление
             context['deletion_form'] = DeletionRequestForm()
-            
-            # Есть ли активный (pending) запрос на удаление
-            context['deletion_request'] = DeletionRequest.objects.filter(
-                photo=self.object,
-                requester=self.request.user,
-                status='pending'
-            ).first()
-            
-            # Последний отклонённый запрос (для показа причины отказа)
-            if not context['deletion_request']:
-                context['rejected_request'] = DeletionRequest.objects.filter(
-                    photo=self.object,
-                    requester=self.request.user,
-                    status='rejected'
-                ).order_by('-processed_at').first()
         
         return context
 
@@ -273,7 +257,7 @@ class PurchasesView(LoginRequiredMixin, ClientRequiredMixin, ListView):
     def get_queryset(self):
         return Purchase.objects.filter(
             buyer=self.request.user.client_profile
-        ).select_related('photo', 'photographer__user').order_by('-created_at')
+        ).select_related('photo__event', 'photographer__user').order_by('-created_at')
 
 
 class DeletionRequestsView(LoginRequiredMixin, ClientRequiredMixin, ListView):
@@ -311,45 +295,31 @@ def search_photos(request):
         messages.error(request, 'Сервис распознавания лиц временно недоступен.')
         return redirect('clients:dashboard')
     
-    # Если нет кодировки лица - пробуем получить
-    if not profile.face_encoding:
+    # Если нет шаблона лица - пробуем получить его из загруженных селфи
+    if not profile.get_face_template():
+        from apps.accounts.models import ClientSelfie
+        from apps.recognition.matching import extract_selfie_encoding, rebuild_client_template
+        
         try:
-            faces = face_service.get_face_data(profile.selfie.path)
-            if faces:
-                profile.face_encoding = faces[0]['encoding']
-                profile.face_processed = True
-                profile.save()
-            else:
-                messages.warning(request, 'Лицо не найдено на селфи. Попробуйте другое фото.')
+            if not profile.selfies.exists():
+                ClientSelfie.objects.create(profile=profile, image=profile.selfie.name)
+            
+            errors = [
+                extract_selfie_encoding(selfie)
+                for selfie in profile.selfies.filter(face_encoding__isnull=True)
+            ]
+            if not rebuild_client_template(profile):
+                error = next((e for e in errors if e), 'Лицо не найдено на селфи')
+                messages.warning(request, f'{error}. Попробуйте другое фото.')
                 return redirect('clients:dashboard')
         except Exception as e:
             messages.error(request, f'Ошибка обработки селфи: {e}')
             return redirect('clients:dashboard')
     
-    # Ищем совпадения во всех фото, где ещё нет совпадений с этим пользователем
-    from apps.photos.models import PhotoFace
-    
-    matched_count = 0
-    new_matches = 0
-    
-    # Получаем все лица на фото
-    all_faces = PhotoFace.objects.select_related('photo').all()
+    # Ищем совпадения во всех фото через хранилище кодировок
+    from apps.recognition.matching import match_client_photos
     
-    for photo_face in all_faces:
-        if photo_face.face_encoding:
-            try:
-                is_match, confidence = face_service.compare_faces(
-                    profile.face_encoding,
-                    photo_face.face_encoding
-                )
-                if is_match:
-                    matched_count += 1
-                    if photo_face.matched_user != request.user:
-                        photo_face.matched_user = request.user
-                        photo_face.save()
-                        new_matches += 1
-            except Exception:
-                continue
+    matched_count, new_matches = match_client_photos(profile, include_matched=True)
     
     if new_matches > 0:
         messages.success(request, f'Поиск завершён! Найдено {new_matches} новых фото с вами. Всего совпадений: {matched_count}.')
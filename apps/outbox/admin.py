@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import OutboxMessage
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['id', 'topic', 'key', 'status', 'attempts', 'available_at', 'created_at']
+    list_filter = ['status', 'topic']
+    search_fields = ['key', 'topic']
+    readonly_fields = ['payload', 'created_at', 'processed_at']
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+
+
+class OutboxConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.outbox'
+    verbose_name = 'Исходящие задачи'
+
+    def ready(self):
+        from django.core.signals import request_finished, request_started
+
+        from .relay import begin_request, finish_request
+
+        request_started.connect(begin_request, dispatch_uid='outbox_begin_request')
+        request_finished.connect(finish_request, dispatch_uid='outbox_finish_request')
@@ -0,0 +1,25 @@
+"""
+Команда для отправки сообщений outbox
+Запускается по расписанию: повторяет отложенные после ошибки сообщения
+и подбирает то, что не успел отправить relay после коммита
+"""
+from django.core.management.base import BaseCommand
+
+from apps.outbox import relay
+from apps.outbox.models import OutboxMessage
+
+
+class Command(BaseCommand):
+    help = 'Отправляет готовые OutboxMessage пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--purge', action='store_true', help='Удалить старые выполненные сообщения')
+
+    def handle(self, *args, **options):
+        sent = relay.relay_pending()
+        pending = OutboxMessage.objects.filter(status=OutboxMessage.Status.PENDING).count()
+        failed = OutboxMessage.objects.filter(status=OutboxMessage.Status.FAILED).count()
+        message = f'Отправлено: {sent}, ждут повтора: {pending}, с ошибкой: {failed}'
+        if options['purge']:
+            message += f', удалено выполненных: {relay.purge()}'
+        self.stdout.write(self.style.SUCCESS(message))
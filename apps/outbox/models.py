@@ -0,0 +1,54 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class OutboxMessage(models.Model):
+    """
+    Отложенное действие после изменения данных (apps.outbox.relay)
+    Пишется в той же транзакции, что и изменение, поэтому не теряется
+    при падении процесса после коммита и не видно до коммита
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Ожидает'
+        DONE = 'done', 'Выполнено'
+        FAILED = 'failed', 'Ошибка'
+    
+    id = models.BigAutoField(primary_key=True)
+    # Путь к обработчику пачки: функция или задача Celery
+    topic = models.CharField(max_length=200, verbose_name='Обработчик')
+    payload = models.JSONField(default=dict, verbose_name='Данные')
+    # Одинаковые ключи среди ожидающих сообщений схлопываются в одно
+    key = models.CharField(max_length=200, blank=True, verbose_name='Ключ')
+    
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток')
+    available_at = models.DateTimeField(default=timezone.now, verbose_name='Не раньше')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Исходящая задача'
+        verbose_name_plural = 'Исходящие задачи'
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'],
+                condition=Q(status='pending') & ~Q(key=''),
+                name='outbox_pending_key_unique',
+            ),
+        ]
+        indexes = [
+            # Выборка готовых к отправке
+            models.Index(fields=['status', 'available_at', 'id'], name='outbox_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.topic} #{self.id} ({self.status})"
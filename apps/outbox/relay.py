@@ -0,0 +1,210 @@
+"""
+Транзакционный outbox: действия после изменения данных
+
+1. publish пишет OutboxMessage в текущей транзакции: сообщение видно
+   только после коммита и не теряется, если процесс упал сразу после него.
+   Сообщения с одинаковым key, ещё ждущие отправки, схлопываются в одно
+2. После коммита запускается relay: с OUTBOX_ASYNC - задачей Celery
+   (одна на несколько коммитов), иначе в этом процессе - сразу или, если
+   коммит в HTTP-запросе, после отправки ответа (request_finished): запросы
+   обработчиков не входят во время ответа и бюджет запросов view
+3. relay_batch берёт готовые сообщения пачкой (skip_locked), группирует
+   по topic и вызывает обработчик один раз на группу со списком payload:
+   - обычная функция выполняется в той же транзакции, что и отметка
+     о выполнении, - ровно один раз для изменений в БД
+   - задача Celery получает список payload через delay (хотя бы один раз)
+   Ошибка откладывает группу с экспоненциальной задержкой, после
+   OUTBOX_MAX_ATTEMPTS сообщения помечаются failed
+
+Повтор отложенных сообщений - команда relay_outbox или задача relay_outbox
+по расписанию.
+"""
+import logging
+import random
+import threading
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutboxMessage
+
+
+logger = logging.getLogger(__name__)
+
+# Relay уже поставлен в очередь Celery
+SCHEDULED_KEY = 'outbox:relay-scheduled'
+
+_state = threading.local()
+
+
+def batch_size() -> int:
+    return getattr(settings, 'OUTBOX_BATCH_SIZE', 200)
+
+
+def max_attempts() -> int:
+    return getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+
+
+def backoff(attempts: int) -> timedelta:
+    """Задержка перед повтором: удваивается с каждой попыткой, +-10%"""
+    base = getattr(settings, 'OUTBOX_BACKOFF_SECONDS', 30)
+    limit = getattr(settings, 'OUTBOX_MAX_BACKOFF_SECONDS', 3600)
+    seconds = min(limit, base * 2 ** max(attempts - 1, 0))
+    return timedelta(seconds=seconds * random.uniform(0.9, 1.1))
+
+
+@lru_cache(maxsize=None)
+def handler(topic):
+    return import_string(topic)
+
+
+def publish(topic: str, payload=None, key: str = ''):
+    """Одно сообщение, см. publish_many"""
+    publish_many(topic, [payload or {}], keys=[key])
+
+
+def publish_many(topic: str, payloads, keys=None):
+    """
+    Пишет сообщения для обработчика topic (путь к функции или задаче,
+    принимающей список payload) в текущей транзакции
+    keys - ключи схлопывания по одному на payload ('' - без ключа)
+    """
+    payloads = list(payloads)
+    if not payloads:
+        return
+    keys = list(keys) if keys is not None else [''] * len(payloads)
+    messages = [
+        OutboxMessage(topic=topic, payload=payload, key=key or '')
+        for payload, key in zip(payloads, keys)
+    ]
+    # Повтор ключа, ещё ждущего отправки, отбрасывается уникальным индексом
+    OutboxMessage.objects.bulk_create(messages, ignore_conflicts=any(keys))
+    transaction.on_commit(kick)
+
+
+def kick():
+    """Запускает relay после коммита"""
+    if getattr(_state, 'relaying', False):
+        # Сообщения от обработчиков заберёт уже идущий relay_pending
+        _state.published = True
+        return
+    if getattr(settings, 'OUTBOX_ASYNC', False):
+        from .tasks import relay_outbox
+        if cache.add(SCHEDULED_KEY, 1, timeout=60):
+            relay_outbox.delay()
+        return
+    if getattr(_state, 'in_request', False):
+        _state.deferred = True
+        return
+    relay_pending()
+
+
+def begin_request(**kwargs):
+    """Сигнал request_started: relay запроса откладывается до ответа"""
+    _state.in_request = True
+    _state.deferred = False
+
+
+def finish_request(**kwargs):
+    """Сигнал request_finished: ответ отправлен, запускаем отложенный relay"""
+    _state.in_request = False
+    if not getattr(_state, 'deferred', False):
+        return
+    _state.deferred = False
+    try:
+        relay_pending()
+    except Exception:
+        # Сообщения остались pending - их отправит relay_outbox по расписанию
+        logger.exception('Outbox: relay после ответа')
+
+
+def _dispatch(topic, payloads):
+    func = handler(topic)
+    if hasattr(func, 'delay'):
+        func.delay(payloads)
+    else:
+        func(payloads)
+
+
+def relay_batch(after=0, limit=None) -> list:
+    """
+    Отправляет пачку готовых сообщений с id больше after,
+    возвращает сообщения пачки
+    Параллельные relay берут разные пачки (skip_locked)
+    """
+    limit = limit or batch_size()
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxMessage.Status.PENDING, available_at__lte=now, id__gt=after)
+            .order_by('id')[:limit]
+        )
+
+        groups = {}
+        for message in messages:
+            groups.setdefault(message.topic, []).append(message)
+
+        for topic, group in groups.items():
+            for message in group:
+                message.attempts += 1
+            try:
+                with transaction.atomic():
+                    _dispatch(topic, [message.payload for message in group])
+            except Exception as e:
+                logger.warning('Outbox %s: %s', topic, e, exc_info=True)
+                for message in group:
+                    message.error = str(e)
+                    if message.attempts >= max_attempts():
+                        message.status = OutboxMessage.Status.FAILED
+                    else:
+                        message.available_at = now + backoff(message.attempts)
+                continue
+            for message in group:
+                message.status = OutboxMessage.Status.DONE
+                message.error = ''
+                message.processed_at = now
+
+        OutboxMessage.objects.bulk_update(
+            messages, ['status', 'attempts', 'available_at', 'error', 'processed_at']
+        )
+    return messages
+
+
+def relay_pending() -> int:
+    """
+    Отправляет все готовые сообщения пачками, возвращает их число
+    Отложенное после ошибки сообщение ждёт следующего запуска
+    """
+    total = 0
+    last_id = 0
+    limit = batch_size()
+    _state.relaying = True
+    try:
+        while True:
+            _state.published = False
+            messages = relay_batch(after=last_id, limit=limit)
+            total += len(messages)
+            # Неполная пачка - готовых больше нет, если обработчики не добавили
+            if len(messages) < limit and not _state.published:
+                return total
+            if messages:
+                last_id = messages[-1].id
+    finally:
+        _state.relaying = False
+
+
+def purge(days=None) -> int:
+    """Удаляет выполненные сообщения старше OUTBOX_RETENTION_DAYS"""
+    if days is None:
+        days = getattr(settings, 'OUTBOX_RETENTION_DAYS', 7)
+    deleted, _ = OutboxMessage.objects.filter(
+        status=OutboxMessage.Status.DONE,
+        processed_at__lt=timezone.now() - timedelta(days=days),
+    ).delete()
+    return deleted
@@ -0,0 +1,15 @@
+"""
+Celery задачи outbox
+"""
+from celery import shared_task
+from django.core.cache import cache
+
+from . import relay
+
+
+@shared_task
+def relay_outbox():
+    """Отправляет готовые сообщения outbox (после коммитов и по расписанию)"""
+    # Коммиты во время прогона снова поставят задачу
+    cache.delete(relay.SCHEDULED_KEY)
+    return f"Сообщений отправлено: {relay.relay_pending()}"
@@ -0,0 +1,146 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from apps.accounts.models import User
+from apps.outbox import relay
+from apps.outbox.models import OutboxMessage
+
+
+handled = []
+calls = []
+failures = []
+
+
+def record(payloads):
+    handled.extend(payloads)
+
+
+def create_users(payloads):
+    # Изменения в БД, затем ошибка, пока в failures что-то есть
+    calls.append(payloads)
+    User.objects.bulk_create([User(username=payload['username']) for payload in payloads])
+    if failures:
+        raise RuntimeError(failures.pop())
+
+
+def chain(payloads):
+    # Обработчик, публикующий следующее сообщение во время relay
+    calls.append(payloads)
+    if payloads[0]['n'] < 3:
+        relay.publish('apps.outbox.tests.chain', {'n': payloads[0]['n'] + 1})
+
+
+class DeferredRelayTests(TestCase):
+    """Relay коммита в HTTP-запросе выполняется после ответа"""
+
+    topic = 'apps.outbox.tests.record'
+
+    def setUp(self):
+        handled.clear()
+        self.addCleanup(relay.finish_request)
+
+    def test_relay_waits_for_response(self):
+        relay.begin_request()
+        with self.captureOnCommitCallbacks(execute=True):
+            relay.publish(self.topic, {'n': 1})
+        self.assertEqual(handled, [])
+        self.assertEqual(OutboxMessage.objects.get().status, OutboxMessage.Status.PENDING)
+
+        relay.finish_request()
+        self.assertEqual(handled, [{'n': 1}])
+        self.assertEqual(OutboxMessage.objects.get().status, OutboxMessage.Status.DONE)
+
+    def test_relay_outside_request_is_immediate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            relay.publish(self.topic, {'n': 2})
+        self.assertEqual(handled, [{'n': 2}])
+
+
+@override_settings(OUTBOX_ASYNC=False, OUTBOX_MAX_ATTEMPTS=3)
+class RelayTests(TestCase):
+    """Пачка на topic, ровно один раз для обработчиков-функций, повторы до failed"""
+
+    topic = 'apps.outbox.tests.create_users'
+
+    def setUp(self):
+        calls.clear()
+        failures.clear()
+
+    def publish(self, *names, key=''):
+        relay.publish_many(self.topic, [{'username': name} for name in names], keys=[key] * len(names))
+
+    def ready(self):
+        # Задержка повтора прошла
+        OutboxMessage.objects.update(available_at=timezone.now() - timedelta(seconds=1))
+
+    def test_group_dispatched_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.publish('a', 'b')
+            self.publish('c')
+        self.assertEqual(calls, [[{'username': 'a'}, {'username': 'b'}, {'username': 'c'}]])
+        self.assertEqual(set(OutboxMessage.objects.values_list('status', flat=True)), {OutboxMessage.Status.DONE})
+
+        self.assertEqual(relay.relay_pending(), 0)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(User.objects.count(), 3)
+
+    def test_pending_key_collapses(self):
+        self.publish('a', key='same')
+        self.publish('a', key='same')
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        relay.relay_pending()
+        # Выполненное сообщение ключ не держит
+        self.publish('a2', key='same')
+        self.assertEqual(OutboxMessage.objects.filter(status=OutboxMessage.Status.PENDING).count(), 1)
+
+    def test_failure_rolls_back_and_retries(self):
+        failures.extend(['нет связи'])
+        self.publish('a')
+        with self.assertLogs('apps.outbox.relay', 'WARNING'):
+            relay.relay_pending()
+        message = OutboxMessage.objects.get()
+        # Изменения обработчика откатились вместе с ошибкой
+        self.assertFalse(User.objects.exists())
+        self.assertEqual((message.status, message.attempts, message.error),
+                         (OutboxMessage.Status.PENDING, 1, 'нет связи'))
+        self.assertGreater(message.available_at, timezone.now())
+
+        # До конца задержки не повторяется
+        self.assertEqual(relay.relay_pending(), 0)
+        self.ready()
+        self.assertEqual(relay.relay_pending(), 1)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.Status.DONE, 2))
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['a'])
+
+    def test_failed_after_max_attempts(self):
+        failures.extend(['1', '2', '3', '4'])
+        self.publish('a')
+        for _ in range(3):
+            self.ready()
+            with self.assertLogs('apps.outbox.relay', 'WARNING'):
+                relay.relay_pending()
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.Status.FAILED, 3))
+        self.ready()
+        self.assertEqual(relay.relay_pending(), 0)
+        self.assertEqual(len(calls), 3)
+
+
+@override_settings(OUTBOX_ASYNC=False)
+class RelayChainTests(TransactionTestCase):
+    """Сообщения, опубликованные обработчиками, забирает тот же relay (нужны настоящие коммиты)"""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_messages_published_by_handlers_are_relayed(self):
+        # Коммит вне запроса - relay сразу, в том же вызове и цепочка
+        with transaction.atomic():
+            relay.publish('apps.outbox.tests.chain', {'n': 1})
+        self.assertEqual(calls, [[{'n': 1}], [{'n': 2}], [{'n': 3}]])
+        self.assertEqual(set(OutboxMessage.objects.values_list('status', flat=True)), {OutboxMessage.Status.DONE})
+        self.assertEqual(relay.relay_pending(), 0)
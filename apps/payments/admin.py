@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Purchase, Withdrawal, Transaction
+from . import ledger
+from .models import (
+    Purchase, Withdrawal, Transaction, SalesDailyRollup, WebhookEvent, Order, CartItem, PriceTier,
+    LedgerEntry, BalanceSnapshot,
+)
 
 
 @admin.register(Purchase)
@@ -15,6 +19,18 @@ class WithdrawalAdmin(admin.ModelAdmin):
     list_display = ['id', 'photographer', 'amount', 'bank_card', 'status', 'created_at']
     list_filter = ['status', 'created_at']
     search_fields = ['photographer__user__username', 'bank_card']
+    readonly_fields = ['amount', 'status', 'processed_by', 'processed_at']
+    actions = ['complete', 'reject']
+    
+    @admin.action(description='Выплачено')
+    def complete(self, request, queryset):
+        closed = sum(ledger.close_withdrawal(w, completed=True, user=request.user) for w in queryset)
+        self.message_user(request, f'Выплачено заявок: {closed}')
+    
+    @admin.action(description='Отклонить (вернуть на баланс)')
+    def reject(self, request, queryset):
+        closed = sum(ledger.close_withdrawal(w, completed=False, user=request.user) for w in queryset)
+        self.message_user(request, f'Отклонено заявок: {closed}')
 
 
 @admin.register(Transaction)
@@ -22,3 +38,70 @@ class TransactionAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'transaction_type', 'amount', 'created_at']
     list_filter = ['transaction_type', 'created_at']
     search_fields = ['user__username', 'description']
+
+
+@admin.register(SalesDailyRollup)
+class SalesDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['day', 'photographer', 'event', 'sales_count', 'refunds_count', 'gross', 'net']
+    list_filter = ['day']
+    search_fields = ['photographer__user__username', 'event__name']
+    raw_id_fields = ['photographer', 'event']
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'provider', 'event_type', 'payment_id', 'status', 'attempts', 'received_at']
+    list_filter = ['provider', 'status', 'event_type']
+    search_fields = ['event_id', 'payment_id']
+    readonly_fields = ['payload', 'received_at', 'processed_at']
+
+
+class OrderPurchaseInline(admin.TabularInline):
+    model = Purchase
+    fields = ['photo', 'photographer', 'amount', 'status']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ['id', 'buyer', 'amount', 'status', 'payment_backend', 'created_at', 'paid_at']
+    list_filter = ['status', 'payment_backend', 'created_at']
+    search_fields = ['id', 'payment_id', 'buyer__user__username']
+    inlines = [OrderPurchaseInline]
+
+
+@admin.register(CartItem)
+class CartItemAdmin(admin.ModelAdmin):
+    list_display = ['buyer', 'photo', 'added_at']
+    raw_id_fields = ['buyer', 'photo']
+
+
+@admin.register(PriceTier)
+class PriceTierAdmin(admin.ModelAdmin):
+    list_display = ['event', 'kind', 'min_photos', 'value']
+    list_filter = ['kind']
+    search_fields = ['event__name']
+    raw_id_fields = ['event']
+
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'account', 'kind', 'amount', 'group', 'created_at']
+    list_filter = ['kind']
+    search_fields = ['account', 'group']
+    raw_id_fields = ['purchase', 'withdrawal']
+    
+    # Книга только дополняется
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BalanceSnapshot)
+class BalanceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['account', 'entry_id', 'balance', 'sales_total', 'created_at']
+    search_fields = ['account']
@@ -0,0 +1,74 @@
+"""
+Платёжные провайдеры
+
+Провайдер выбирается настройкой PAYMENT_BACKEND (путь к классу):
+- apps.payments.backends.YooKassaBackend - ЮКасса, оплата по ссылке,
+  подтверждение приходит webhook'ом (apps.payments.webhooks)
+- apps.payments.backends.FakeBackend - локальная замена для разработки
+  и тестов: платёж сразу считается оплаченным (FAKE_PAYMENT_AUTO_CAPTURE)
+  или ждёт уведомления от apps.payments.fake_provider
+
+Один платёж создаётся на весь заказ.
+"""
+import uuid
+from dataclasses import dataclass
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+@dataclass
+class PaymentResult:
+    """Созданный платёж: ID у провайдера, ссылка на оплату, оплачен ли сразу"""
+    payment_id: str
+    confirmation_url: str = ''
+    paid: bool = False
+
+
+class PaymentBackend:
+    """Базовый провайдер"""
+    name = ''
+
+    def create_payment(self, order, return_url: str) -> PaymentResult:
+        raise NotImplementedError
+
+
+class FakeBackend(PaymentBackend):
+    """Локальный провайдер без внешних вызовов"""
+    name = 'fake'
+
+    def create_payment(self, order, return_url: str) -> PaymentResult:
+        return PaymentResult(
+            payment_id=f'fake-{uuid.uuid4()}',
+            paid=getattr(settings, 'FAKE_PAYMENT_AUTO_CAPTURE', True),
+        )
+
+
+class YooKassaBackend(PaymentBackend):
+    """ЮКасса: платёж с подтверждением по ссылке"""
+    name = 'yookassa'
+
+    def create_payment(self, order, return_url: str) -> PaymentResult:
+        from yookassa import Configuration, Payment
+
+        Configuration.account_id = settings.YOOKASSA_SHOP_ID
+        Configuration.secret_key = settings.YOOKASSA_SECRET_KEY
+        payment = Payment.create({
+            'amount': {'value': str(order.amount), 'currency': 'RUB'},
+            'confirmation': {'type': 'redirect', 'return_url': return_url},
+            'capture': True,
+            'description': f'Заказ {order.id}',
+            'metadata': {'order_id': str(order.id)},
+        }, str(order.id))
+        return PaymentResult(payment_id=payment.id, confirmation_url=payment.confirmation.confirmation_url)
+
+
+@lru_cache(maxsize=None)
+def _load(path):
+    return import_string(path)()
+
+
+def get_backend() -> PaymentBackend:
+    """Провайдер из PAYMENT_BACKEND"""
+    return _load(getattr(settings, 'PAYMENT_BACKEND', 'apps.payments.backends.FakeBackend'))
@@ -0,0 +1,170 @@
+"""
+Локальная замена платёжного провайдера для нагрузочных тестов webhook
+
+Создаёт неоплаченные заказы или покупки с платежами fake-<uuid> и доставляет
+уведомления в формате ЮКассы так, как это делает провайдер при ретраях:
+каждое событие несколько раз, вперемешку, из нескольких потоков.
+Доставка - в view напрямую (RequestFactory) или по HTTP на запущенный сервер.
+
+После прогона check() сверяет, что начисления не задвоились.
+"""
+import json
+import random
+import time
+import uuid
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.db import close_old_connections
+from django.db.models import Sum
+from django.test import RequestFactory
+
+from apps.accounts.models import ClientProfile, User
+from apps.photos.models import Photo
+
+from . import services, webhooks
+from .models import Order, Purchase, Transaction
+
+
+PAYMENT_PREFIX = 'fake-'
+BUYER_USERNAME = 'fake-provider-buyer'
+
+
+def buyer() -> ClientProfile:
+    """Служебный покупатель нагрузочных тестов"""
+    user, _ = User.objects.get_or_create(
+        username=BUYER_USERNAME, defaults={'user_type': User.UserType.CLIENT}
+    )
+    profile, _ = ClientProfile.objects.get_or_create(user=user)
+    return profile
+
+
+def _photos() -> list:
+    photos = list(Photo.objects.filter(status='active').select_related('photographer')[:1000])
+    if not photos:
+        raise ValueError('Нет активных фото для покупок')
+    return photos
+
+
+def create_payments(count: int) -> list:
+    """Неоплаченные покупки случайных активных фото, по платежу на каждую"""
+    photos = _photos()
+    profile = buyer()
+    purchases = []
+    for _ in range(count):
+        photo = random.choice(photos)
+        purchase = Purchase.objects.create(
+            buyer=profile,
+            photo=photo,
+            photographer=photo.photographer,
+            amount=photo.price,
+            payment_id=f'{PAYMENT_PREFIX}{uuid.uuid4()}',
+            download_token=str(uuid.uuid4()),
+        )
+        purchases.append(purchase)
+    return purchases
+
+
+def create_orders(count: int, size: int) -> list:
+    """Неоплаченные заказы по size случайных фото, по платежу на заказ"""
+    photos = _photos()
+    profile = buyer()
+    orders = []
+    for _ in range(count):
+        order = services.create_order(profile, random.sample(photos, min(size, len(photos))))
+        order.payment_id = f'{PAYMENT_PREFIX}{uuid.uuid4()}'
+        Order.objects.filter(pk=order.pk).update(payment_id=order.payment_id)
+        Purchase.objects.filter(order=order).update(payment_id=order.payment_id)
+        orders.append(order)
+    return orders
+
+
+def notification(payment, event_type=webhooks.SUCCEEDED) -> dict:
+    """Уведомление ЮКассы о платеже заказа или покупки"""
+    status = 'succeeded' if event_type == webhooks.SUCCEEDED else 'canceled'
+    return {
+        'type': 'notification',
+        'event': event_type,
+        'object': {
+            'id': payment.payment_id,
+            'status': status,
+            'amount': {'value': str(payment.amount), 'currency': 'RUB'},
+            'metadata': {'payment_for': str(payment.id)},
+        },
+    }
+
+
+def deliveries(payments, duplicates: int = 3, cancel_ratio: float = 0.0, seed: int = 0) -> list:
+    """Тела уведомлений: каждое событие duplicates раз, в случайном порядке"""
+    rng = random.Random(seed)
+    bodies = []
+    for payment in payments:
+        event_type = webhooks.CANCELED if rng.random() < cancel_ratio else webhooks.SUCCEEDED
+        bodies.extend([json.dumps(notification(payment, event_type)).encode()] * duplicates)
+    rng.shuffle(bodies)
+    return bodies
+
+
+def _deliver_local(body):
+    from .views import yookassa_webhook
+
+    request = RequestFactory().post('/payments/webhook/yookassa/', body, content_type='application/json')
+    try:
+        return yookassa_webhook(request).status_code
+    finally:
+        close_old_connections()
+
+
+def _deliver_http(url, body):
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def deliver(bodies, url=None, concurrency: int = 1):
+    """
+    Доставляет уведомления, возвращает (длительности, коды ответов)
+    url - адрес webhook запущенного сервера, иначе view вызывается напрямую
+    """
+    def send(body):
+        started = time.perf_counter()
+        status = _deliver_http(url, body) if url else _deliver_local(body)
+        return time.perf_counter() - started, status
+
+    if concurrency <= 1:
+        results = [send(body) for body in bodies]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(send, bodies))
+    return [timing for timing, _ in results], [status for _, status in results]
+
+
+def check(payments) -> dict:
+    """
+    Сверка после прогона (заказы или покупки): каждая оплаченная покупка
+    начислена ровно один раз (две транзакции), сумма начислений равна
+    сумме долей
+    """
+    orders = [payment.pk for payment in payments if isinstance(payment, Order)]
+    ids = [payment.pk for payment in payments if isinstance(payment, Purchase)]
+    ids += list(Purchase.objects.filter(order_id__in=orders).values_list('pk', flat=True))
+    paid = Purchase.objects.filter(pk__in=ids, status=Purchase.Status.PAID)
+    transactions = Transaction.objects.filter(purchase_id__in=ids)
+    expected = paid.aggregate(total=Sum('photographer_amount'))['total'] or Decimal('0')
+    credited = transactions.filter(
+        transaction_type=Transaction.TransactionType.SALE
+    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+    result = {
+        'purchases': len(ids),
+        'paid': paid.count(),
+        'failed': Purchase.objects.filter(pk__in=ids, status=Purchase.Status.FAILED).count(),
+        'pending': Purchase.objects.filter(pk__in=ids, status=Purchase.Status.PENDING).count(),
+        'transactions': transactions.count(),
+        'credited': str(credited),
+    }
+    result['ok'] = result['transactions'] == 2 * result['paid'] and credited == expected
+    return result
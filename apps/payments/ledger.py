@@ -0,0 +1,345 @@
+"""
+Книга проводок (двойная запись) вместо изменяемых полей баланса
+
+Каждая денежная операция - группа проводок LedgerEntry с общим group,
+сумма которых равна нулю. Проводки только добавляются, поэтому
+начисления не блокируют строки: параллельные продажи одного фотографа
+просто вставляют свои проводки.
+
+Счета:
+- photographer:<id> - деньги фотографа (баланс к выводу)
+- client:<id> - траты клиента (отрицательный остаток)
+- platform:commission - комиссия сервиса
+- platform:payouts - выводы, ожидающие выплаты
+- platform:paid_out - выплачено фотографам
+- platform:opening - начальные остатки при переходе на книгу
+
+Остаток счёта = последний BalanceSnapshot + сумма проводок после него
+(узкий диапазон индекса account, id). Снимки делает take_snapshots
+(команда snapshot_balances), сверку - reconcile (reconcile_ledger).
+"""
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import CharField, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Concat
+from django.utils import timezone
+
+from .models import BalanceSnapshot, LedgerEntry, Withdrawal
+
+
+ZERO = Decimal('0.00')
+
+COMMISSION = 'platform:commission'
+PAYOUTS = 'platform:payouts'
+PAID_OUT = 'platform:paid_out'
+OPENING = 'platform:opening'
+
+Kind = LedgerEntry.Kind
+
+
+class LedgerError(Exception):
+    """Проводки операции не сбалансированы или не хватает средств"""
+
+
+@dataclass
+class Summary:
+    """Остаток счёта и сумма его проводок продаж"""
+    balance: Decimal = ZERO
+    sales_total: Decimal = ZERO
+
+
+def photographer_account(photographer_id) -> str:
+    return f'photographer:{photographer_id}'
+
+
+def client_account(client_id) -> str:
+    return f'client:{client_id}'
+
+
+# --- Проводки ---
+
+def _entries(postings, kind, **links) -> list:
+    """Проводки одной операции, postings - [(счёт, сумма)]"""
+    if sum((amount for _, amount in postings), ZERO) != 0:
+        raise LedgerError(f'Операция {kind} не сбалансирована: {postings}')
+    group = uuid.uuid4()
+    return [
+        LedgerEntry(group=group, account=account, kind=kind, amount=amount, **links)
+        for account, amount in postings
+        if amount
+    ]
+
+
+def post(postings, kind, **links):
+    """Записывает одну операцию"""
+    return LedgerEntry.objects.bulk_create(_entries(postings, kind, **links))
+
+
+def post_sales(buyer, purchases):
+    """
+    Продажи: с клиента - сумма покупки, фотографу - его доля,
+    сервису - комиссия. Все покупки заказа - одной вставкой
+    """
+    entries = []
+    for purchase in purchases:
+        entries.extend(_entries([
+            (client_account(buyer.pk), -purchase.amount),
+            (photographer_account(purchase.photographer_id), purchase.photographer_amount),
+            (COMMISSION, purchase.commission),
+        ], Kind.SALE, purchase=purchase))
+    return LedgerEntry.objects.bulk_create(entries)
+
+
+def post_withdrawal(withdrawal):
+    """Вывод: сумма уходит с баланса фотографа в ожидающие выплаты"""
+    return post([
+        (photographer_account(withdrawal.photographer_id), -withdrawal.amount),
+        (PAYOUTS, withdrawal.amount),
+    ], Kind.WITHDRAWAL, withdrawal=withdrawal)
+
+
+def post_withdrawal_reversal(withdrawal):
+    """Вывод отклонён: сумма возвращается на баланс фотографа"""
+    return post([
+        (PAYOUTS, -withdrawal.amount),
+        (photographer_account(withdrawal.photographer_id), withdrawal.amount),
+    ], Kind.WITHDRAWAL_REVERSAL, withdrawal=withdrawal)
+
+
+def post_payout(withdrawal):
+    """Вывод выплачен"""
+    return post([
+        (PAYOUTS, -withdrawal.amount),
+        (PAID_OUT, withdrawal.amount),
+    ], Kind.PAYOUT, withdrawal=withdrawal)
+
+
+def withdraw(photographer, amount, bank_card=''):
+    """
+    Создаёт заявку на вывод, если хватает средств
+    Строка фотографа блокируется только здесь: списания идут по одному,
+    а начисления от продаж - параллельно и без блокировок
+    """
+    from apps.accounts.models import PhotographerProfile
+
+    with transaction.atomic():
+        PhotographerProfile.objects.select_for_update().filter(pk=photographer.pk).exists()
+        if amount > summary(photographer_account(photographer.pk)).balance:
+            raise LedgerError('Недостаточно средств на балансе')
+        withdrawal = Withdrawal.objects.create(photographer=photographer, amount=amount, bank_card=bank_card)
+        post_withdrawal(withdrawal)
+    return withdrawal
+
+
+def close_withdrawal(withdrawal, completed: bool, user=None, reason='') -> bool:
+    """
+    Выплата проведена (completed) или заявка отклонена: деньги уходят
+    в выплаченные или возвращаются на баланс фотографа
+    Возвращает False, если заявка уже закрыта
+    """
+    with transaction.atomic():
+        withdrawal = Withdrawal.objects.select_for_update().get(pk=withdrawal.pk)
+        if withdrawal.status in (Withdrawal.Status.COMPLETED, Withdrawal.Status.REJECTED):
+            return False
+        if completed:
+            withdrawal.status = Withdrawal.Status.COMPLETED
+            post_payout(withdrawal)
+        else:
+            withdrawal.status = Withdrawal.Status.REJECTED
+            withdrawal.rejection_reason = reason
+            post_withdrawal_reversal(withdrawal)
+        withdrawal.processed_by = user
+        withdrawal.processed_at = timezone.now()
+        withdrawal.save(update_fields=['status', 'rejection_reason', 'processed_by', 'processed_at'])
+    return True
+
+
+# --- Остатки ---
+
+def summary(account) -> Summary:
+    """Остаток счёта: последний снимок и проводки после него"""
+    snapshot = latest_snapshot(account).first()
+    entries = LedgerEntry.objects.filter(account=account)
+    result = Summary()
+    if snapshot is not None:
+        entries = entries.filter(id__gt=snapshot.entry_id)
+        result = Summary(snapshot.balance, snapshot.sales_total)
+    delta = entries.aggregate(
+        balance=Sum('amount'),
+        sales_total=Sum('amount', filter=Q(kind=Kind.SALE)),
+    )
+    return Summary(
+        result.balance + (delta['balance'] or ZERO),
+        result.sales_total + (delta['sales_total'] or ZERO),
+    )
+
+
+def latest_snapshot(account):
+    """Подзапрос: последний снимок счёта account (выражение или OuterRef)"""
+    return BalanceSnapshot.objects.filter(account=account).order_by('-entry_id')
+
+
+def annotate_summary(queryset, prefix):
+    """
+    Добавляет к профилям ledger_balance и ledger_sales_total счёта
+    <prefix><pk> (последний снимок + проводки после него) - коррелированными
+    подзапросами, для списков без запроса на строку
+    """
+    account = Concat(Value(prefix), Cast(OuterRef('pk'), output_field=CharField()))
+    snapshot = latest_snapshot(account)
+    entries = (
+        LedgerEntry.objects.filter(account=account)
+        .filter(id__gt=Coalesce(Subquery(latest_snapshot(OuterRef('account')).values('entry_id')[:1]), 0))
+        .values('account')
+        .order_by()
+    )
+    return queryset.annotate(
+        ledger_balance=(
+            Coalesce(Subquery(snapshot.values('balance')[:1]), Value(ZERO))
+            + Coalesce(Subquery(entries.annotate(total=Sum('amount')).values('total')), Value(ZERO))
+        ),
+        ledger_sales_total=(
+            Coalesce(Subquery(snapshot.values('sales_total')[:1]), Value(ZERO))
+            + Coalesce(Subquery(
+                entries.annotate(total=Sum('amount', filter=Q(kind=Kind.SALE))).values('total')
+            ), Value(ZERO))
+        ),
+    )
+
+
+def snapshot_lag() -> int:
+    return getattr(settings, 'LEDGER_SNAPSHOT_LAG_SECONDS', 600)
+
+
+def take_snapshots() -> int:
+    """
+    Снимки остатков счетов, по которым были проводки после прошлого
+    прогона: одним GROUP BY по новым проводкам. Каждый прогон снимает
+    все затронутые счета, поэтому прошлый снимок счёта покрывает всё
+    до своей проводки. Возвращает число снимков
+
+    id выдаются при вставке, а видны проводки после коммита: транзакция,
+    начатая раньше (например, пачка webhooks.process_batch), может
+    закоммитить проводки с id ниже уже видимых. Поэтому снимок доходит
+    только до проводок старше LEDGER_SNAPSHOT_LAG_SECONDS - к этому
+    времени транзакции, выдавшие меньшие id, закоммичены. Задержка
+    должна быть больше самой долгой транзакции с проводками
+    """
+    cutoff = timezone.now() - timedelta(seconds=snapshot_lag())
+    with transaction.atomic():
+        # С конца по первичному ключу до первой достаточно старой проводки
+        last_entry = (
+            LedgerEntry.objects.filter(created_at__lt=cutoff)
+            .order_by('-id').values_list('id', flat=True).first()
+        )
+        if last_entry is None:
+            return 0
+        watermark = BalanceSnapshot.objects.aggregate(last=Max('entry_id'))['last'] or 0
+        if watermark >= last_entry:
+            return 0
+
+        deltas = list(
+            LedgerEntry.objects.filter(id__gt=watermark, id__lte=last_entry)
+            .values('account')
+            .annotate(balance=Sum('amount'), sales_total=Sum('amount', filter=Q(kind=Kind.SALE)))
+            .order_by()
+        )
+        accounts = [row['account'] for row in deltas]
+        # Только последний снимок каждого счёта, а не вся история
+        previous = {
+            snapshot.account: snapshot
+            for snapshot in BalanceSnapshot.objects.filter(
+                account__in=accounts,
+                pk=Subquery(latest_snapshot(OuterRef('account')).values('pk')[:1]),
+            )
+        }
+
+        snapshots = []
+        for row in deltas:
+            base = previous.get(row['account'])
+            balance, sales_total = (base.balance, base.sales_total) if base else (ZERO, ZERO)
+            snapshots.append(BalanceSnapshot(
+                account=row['account'],
+                entry_id=last_entry,
+                balance=balance + row['balance'],
+                sales_total=sales_total + (row['sales_total'] or ZERO),
+            ))
+        BalanceSnapshot.objects.bulk_create(snapshots, batch_size=500)
+    return len(snapshots)
+
+
+
+# --- Сверка ---
+
+def reconcile(chunk_size=2000) -> list:
+    """
+    Проверяет всю книгу одним потоковым проходом по проводкам (по id):
+    - каждая операция в сумме равна нулю
+    - каждый снимок совпадает с суммой проводок счёта до его entry_id
+    - комиссия и доля фотографов в проводках продаж совпадают с покупками
+    Память - остатки счетов и незакрытые операции, не вся книга.
+    Возвращает список найденных расхождений (пустой - книга сходится)
+    """
+    from .models import Purchase
+
+    problems = []
+    balances = {}
+    sales = {}
+    open_groups = {}
+    commission = earned = ZERO
+
+    snapshots = BalanceSnapshot.objects.order_by('entry_id', 'account').values_list(
+        'account', 'entry_id', 'balance', 'sales_total'
+    ).iterator(chunk_size=chunk_size)
+    snapshot = next(snapshots, None)
+
+    def check_snapshots(until_id):
+        # Снимки по проводку until_id включительно
+        nonlocal snapshot
+        while snapshot is not None and snapshot[1] <= until_id:
+            account, entry_id, balance, sales_total = snapshot
+            expected = (balances.get(account, ZERO), sales.get(account, ZERO))
+            if expected != (balance, sales_total):
+                problems.append(
+                    f'Снимок {account} #{entry_id}: {balance}/{sales_total}, по проводкам {expected[0]}/{expected[1]}'
+                )
+            snapshot = next(snapshots, None)
+
+    entries = LedgerEntry.objects.order_by('id').values_list(
+        'id', 'group', 'account', 'kind', 'amount'
+    ).iterator(chunk_size=chunk_size)
+    for entry_id, group, account, kind, amount in entries:
+        check_snapshots(entry_id - 1)
+        balances[account] = balances.get(account, ZERO) + amount
+        if kind == Kind.SALE:
+            sales[account] = sales.get(account, ZERO) + amount
+            if account == COMMISSION:
+                commission += amount
+            elif account.startswith('photographer:'):
+                earned += amount
+        total = open_groups.pop(group, ZERO) + amount
+        if total:
+            open_groups[group] = total
+    check_snapshots(float('inf'))
+
+    for group, total in open_groups.items():
+        problems.append(f'Операция {group} не сбалансирована: {total:+}')
+
+    for account, balance in balances.items():
+        if account.startswith('photographer:') and balance < 0:
+            problems.append(f'Отрицательный баланс {account}: {balance}')
+
+    # Покупки, когда-либо оплаченные (в т.ч. возвращённые позже)
+    paid = Purchase.objects.filter(paid_at__isnull=False).aggregate(
+        commission=Sum('commission'), earned=Sum('photographer_amount'),
+    )
+    if commission != (paid['commission'] or ZERO):
+        problems.append(f'Комиссия в книге {commission}, по покупкам {paid["commission"] or ZERO}')
+    if earned != (paid['earned'] or ZERO):
+        problems.append(f'Доход фотографов в книге {earned}, по покупкам {paid["earned"] or ZERO}')
+    return problems
@@ -0,0 +1,21 @@
+"""
+Команда для применения накопленных уведомлений о платежах
+Запускается по расписанию: повторяет события с ошибкой и подбирает
+то, что не успела обработать задача Celery
+"""
+from django.core.management.base import BaseCommand
+
+from apps.payments import webhooks
+from apps.payments.models import WebhookEvent
+
+
+class Command(BaseCommand):
+    help = 'Применяет необработанные WebhookEvent пачками'
+
+    def handle(self, *args, **options):
+        processed = webhooks.process_pending()
+        pending = WebhookEvent.objects.filter(status=WebhookEvent.Status.RECEIVED).count()
+        failed = WebhookEvent.objects.filter(status=WebhookEvent.Status.FAILED).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано: {processed}, ждут повтора: {pending}, с ошибкой: {failed}'
+        ))
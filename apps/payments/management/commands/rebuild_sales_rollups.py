@@ -0,0 +1,35 @@
+"""
+Команда для пересчёта дневных агрегатов продаж из покупок
+Нужна после первого развёртывания и для сверки с исходными данными
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.accounts.models import PhotographerProfile
+from apps.payments import rollups
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает SalesDailyRollup по оплаченным и возвращённым покупкам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--photographer', type=int, help='ID профиля фотографа (по умолчанию - все)')
+        parser.add_argument('--since', help='Пересчитать начиная с даты YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        photographer = None
+        if options['photographer']:
+            photographer = PhotographerProfile.objects.filter(pk=options['photographer']).first()
+            if photographer is None:
+                raise CommandError(f"Фотограф {options['photographer']} не найден")
+
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('Дата должна быть в формате YYYY-MM-DD')
+
+        count = rollups.rebuild(photographer=photographer, since=since)
+        self.stdout.write(self.style.SUCCESS(f'Готово: строк агрегатов {count}'))
@@ -0,0 +1,23 @@
+"""
+Команда сверки книги проводок
+Один потоковый проход: баланс операций, снимки остатков, суммы продаж
+против покупок. Код выхода 1, если найдены расхождения
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.payments import ledger
+
+
+class Command(BaseCommand):
+    help = 'Проверяет книгу проводок и снимки остатков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Проводок за одну выборку')
+
+    def handle(self, *args, **options):
+        problems = ledger.reconcile(chunk_size=options['chunk_size'])
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError(f'Найдено расхождений: {len(problems)}')
+        self.stdout.write(self.style.SUCCESS('Книга проводок сходится'))
@@ -0,0 +1,52 @@
+"""
+Команда для нагрузочного теста webhook на локальной замене провайдера
+(apps.payments.fake_provider): повторные доставки, параллельные потоки,
+сверка начислений после прогона
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.payments import fake_provider, webhooks
+from benchmarks import report
+
+
+class Command(BaseCommand):
+    help = 'Шлёт уведомления об оплате с повторами и проверяет, что начисления не задвоились'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=100, help='Сколько платежей провести')
+        parser.add_argument('--order-size', type=int, default=0,
+                            help='Фото в заказе (0 - платёж на отдельную покупку)')
+        parser.add_argument('--duplicates', type=int, default=3, help='Доставок каждого события')
+        parser.add_argument('--concurrency', type=int, default=1, help='Потоков доставки')
+        parser.add_argument('--cancel-ratio', type=float, default=0.0, help='Доля отменённых платежей')
+        parser.add_argument('--url', help='Webhook запущенного сервера (по умолчанию - view в процессе)')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно порядка доставки')
+        parser.add_argument('--output', help='Файл для JSON-отчёта (по умолчанию stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            if options['order_size']:
+                payments = fake_provider.create_orders(options['payments'], options['order_size'])
+            else:
+                payments = fake_provider.create_payments(options['payments'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        bodies = fake_provider.deliveries(
+            payments, options['duplicates'], options['cancel_ratio'], options['seed']
+        )
+        timings, statuses = fake_provider.deliver(bodies, options['url'], options['concurrency'])
+        # Остаток очереди (WEBHOOK_ASYNC без воркера, события с ошибкой)
+        webhooks.process_pending()
+
+        result = {
+            'environment': report.environment(),
+            'deliveries': len(bodies),
+            'errors': sum(1 for status in statuses if status != 200),
+            'ack': report.summarize(timings),
+            'check': fake_provider.check(payments),
+        }
+        report.write_report(result, options['output'], stream=self.stdout)
+
+        if not result['check']['ok'] or result['errors']:
+            raise CommandError('Начисления не сходятся или webhook отвечал ошибкой')
@@ -0,0 +1,16 @@
+"""
+Команда для снимков остатков книги проводок
+Запускать периодически (cron или Celery beat): чем свежее снимок,
+тем меньше проводок суммируется при чтении баланса
+"""
+from django.core.management.base import BaseCommand
+
+from apps.payments import ledger
+
+
+class Command(BaseCommand):
+    help = 'Сохраняет BalanceSnapshot по счетам с новыми проводками'
+
+    def handle(self, *args, **options):
+        count = ledger.take_snapshots()
+        self.stdout.write(self.style.SUCCESS(f'Готово: снимков {count}'))
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:22
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0007_upload_session'),
+        ('accounts', '0002_client_selfies'),
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('sales_count', models.IntegerField(default=0, verbose_name='Продаж')),
+                ('refunds_count', models.IntegerField(default=0, verbose_name='Возвратов')),
+                ('gross', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Выручка')),
+                ('commission', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Комиссия сервиса')),
+                ('net', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Доход фотографа')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('event', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales_rollups', to='photos.event', verbose_name='Событие')),
+                ('photographer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='accounts.photographerprofile', verbose_name='Фотограф')),
+            ],
+            options={
+                'verbose_name': 'Продажи за день',
+                'verbose_name_plural': 'Продажи по дням',
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['photographer', 'day'], name='payments_rollup_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='salesdailyrollup',
+            constraint=models.UniqueConstraint(fields=('photographer', 'event', 'day'), name='payments_rollup_unique'),
+        ),
+    ]
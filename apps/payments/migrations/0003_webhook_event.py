@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_sales_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='purchase',
+            name='payment_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100, verbose_name='ID платежа YooKassa'),
+        ),
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(default='yookassa', max_length=20, verbose_name='Провайдер')),
+                ('event_id', models.CharField(max_length=200, verbose_name='Ключ события')),
+                ('event_type', models.CharField(max_length=50, verbose_name='Тип события')),
+                ('payment_id', models.CharField(blank=True, max_length=100, verbose_name='ID платежа')),
+                ('payload', models.JSONField(verbose_name='Тело уведомления')),
+                ('status', models.CharField(choices=[('received', 'Получено'), ('processed', 'Применено'), ('ignored', 'Пропущено'), ('failed', 'Ошибка')], default='received', max_length=20, verbose_name='Статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток обработки')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='Получено')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Обработано')),
+            ],
+            options={
+                'verbose_name': 'Уведомление о платеже',
+                'verbose_name_plural': 'Уведомления о платежах',
+                'ordering': ['-received_at'],
+                'indexes': [models.Index(fields=['status', 'id'], name='payments_webhook_queue_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='webhookevent',
+            constraint=models.UniqueConstraint(fields=('provider', 'event_id'), name='payments_webhook_event_unique'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_client_selfies'),
+        ('photos', '0007_upload_session'),
+        ('payments', '0003_webhook_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Сумма заказа')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает оплаты'), ('paid', 'Оплачен'), ('failed', 'Ошибка оплаты')], default='pending', max_length=20, verbose_name='Статус')),
+                ('payment_backend', models.CharField(blank=True, max_length=50, verbose_name='Платёжный провайдер')),
+                ('payment_id', models.CharField(blank=True, db_index=True, max_length=100, verbose_name='ID платежа')),
+                ('payment_url', models.URLField(blank=True, max_length=500, verbose_name='Ссылка на оплату')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('paid_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата оплаты')),
+                ('buyer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='accounts.clientprofile', verbose_name='Покупатель')),
+            ],
+            options={
+                'verbose_name': 'Заказ',
+                'verbose_name_plural': 'Заказы',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+                ('buyer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to='accounts.clientprofile', verbose_name='Покупатель')),
+                ('photo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='photos.photo', verbose_name='Фотография')),
+            ],
+            options={
+                'verbose_name': 'Фото в корзине',
+                'verbose_name_plural': 'Корзины',
+                'ordering': ['added_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purchases', to='payments.order', verbose_name='Заказ'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('buyer', 'photo'), name='payments_cart_item_unique'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:33
+
+from decimal import Decimal
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0007_upload_session'),
+        ('payments', '0004_cart_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('percent', 'Скидка, %'), ('photo_price', 'Цена за фото'), ('bundle', 'Все мои фото')], default='percent', max_length=20, verbose_name='Тип')),
+                ('min_photos', models.PositiveIntegerField(default=1, verbose_name='От фото')),
+                ('value', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))], verbose_name='Значение')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_tiers', to='photos.event', verbose_name='Событие')),
+            ],
+            options={
+                'verbose_name': 'Ступень цены',
+                'verbose_name_plural': 'Ступени цен',
+                'ordering': ['event', 'kind', 'min_photos'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='pricetier',
+            constraint=models.UniqueConstraint(fields=('event', 'kind', 'min_photos'), name='payments_price_tier_unique'),
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+from decimal import Decimal
+
+
+def open_ledger(apps, schema_editor):
+    """
+    Переносит деньги в книгу проводок: продажи - по оплаченным покупкам,
+    выводы - по заявкам; расхождение с прежним полем balance фотографа
+    записывается начальным остатком (platform:opening)
+    """
+    LedgerEntry = apps.get_model('payments', 'LedgerEntry')
+    Purchase = apps.get_model('payments', 'Purchase')
+    Withdrawal = apps.get_model('payments', 'Withdrawal')
+    PhotographerProfile = apps.get_model('accounts', 'PhotographerProfile')
+
+    balances = {}
+    batch = []
+
+    def add(kind, postings, **links):
+        group = uuid.uuid4()
+        for account, amount in postings:
+            if amount:
+                batch.append(LedgerEntry(group=group, account=account, kind=kind, amount=amount, **links))
+                balances[account] = balances.get(account, Decimal('0')) + amount
+        if len(batch) >= 1000:
+            LedgerEntry.objects.bulk_create(batch)
+            batch.clear()
+
+    purchases = Purchase.objects.filter(paid_at__isnull=False).order_by('paid_at', 'id')
+    for purchase in purchases.iterator():
+        add('sale', [
+            (f'client:{purchase.buyer_id}', -purchase.amount),
+            (f'photographer:{purchase.photographer_id}', purchase.photographer_amount),
+            ('platform:commission', purchase.commission),
+        ], purchase_id=purchase.pk)
+
+    for withdrawal in Withdrawal.objects.order_by('created_at').iterator():
+        account = f'photographer:{withdrawal.photographer_id}'
+        add('withdrawal', [(account, -withdrawal.amount), ('platform:payouts', withdrawal.amount)],
+            withdrawal_id=withdrawal.pk)
+        if withdrawal.status == 'completed':
+            add('payout', [('platform:payouts', -withdrawal.amount), ('platform:paid_out', withdrawal.amount)],
+                withdrawal_id=withdrawal.pk)
+        elif withdrawal.status == 'rejected':
+            add('withdrawal_reversal', [('platform:payouts', -withdrawal.amount), (account, withdrawal.amount)],
+                withdrawal_id=withdrawal.pk)
+
+    for pk, balance in PhotographerProfile.objects.values_list('pk', 'balance').iterator():
+        difference = balance - balances.get(f'photographer:{pk}', Decimal('0'))
+        add('opening', [(f'photographer:{pk}', difference), ('platform:opening', -difference)])
+
+    LedgerEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_client_selfies'),
+        ('payments', '0005_price_tier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account', models.CharField(max_length=64, verbose_name='Счёт')),
+                ('entry_id', models.BigIntegerField(verbose_name='Последняя проводка')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Остаток')),
+                ('sales_total', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Продажи')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Снимок остатка',
+                'verbose_name_plural': 'Снимки остатков',
+                'ordering': ['-entry_id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('group', models.UUIDField(db_index=True, verbose_name='Операция')),
+                ('account', models.CharField(max_length=64, verbose_name='Счёт')),
+                ('kind', models.CharField(choices=[('sale', 'Продажа фото'), ('withdrawal', 'Вывод средств'), ('withdrawal_reversal', 'Отмена вывода'), ('payout', 'Выплата'), ('opening', 'Начальный остаток')], max_length=20, verbose_name='Тип')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Сумма')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('purchase', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='payments.purchase', verbose_name='Покупка')),
+                ('withdrawal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='payments.withdrawal', verbose_name='Вывод')),
+            ],
+            options={
+                'verbose_name': 'Проводка',
+                'verbose_name_plural': 'Проводки',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='balancesnapshot',
+            constraint=models.UniqueConstraint(fields=('account', 'entry_id'), name='payments_snapshot_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['account', 'id'], name='payments_ledger_account_idx'),
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,8 @@
 Модели платежей и транзакций
 """
 import uuid
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
 from django.db import models
 from django.conf import settings
 from decimal import Decimal
@@ -9,6 +11,91 @@ from apps.accounts.models import User, PhotographerProfile, ClientProfile
 from apps.photos.models import Photo
 
 
+class CartItem(models.Model):
+    """
+    Фото в корзине клиента
+    """
+    buyer = models.ForeignKey(
+        ClientProfile,
+        on_delete=models.CASCADE,
+        related_name='cart_items',
+        verbose_name='Покупатель'
+    )
+    photo = models.ForeignKey(
+        Photo,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Фотография'
+    )
+    added_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Фото в корзине'
+        verbose_name_plural = 'Корзины'
+        ordering = ['added_at']
+        constraints = [
+            models.UniqueConstraint(fields=['buyer', 'photo'], name='payments_cart_item_unique'),
+        ]
+    
+    def __str__(self):
+        return f"Корзина {self.buyer.user.username}: {self.photo_id}"
+
+
+class Order(models.Model):
+    """
+    Заказ: покупки из корзины с одной оплатой у провайдера
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Ожидает оплаты'
+        PAID = 'paid', 'Оплачен'
+        FAILED = 'failed', 'Ошибка оплаты'
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    
+    buyer = models.ForeignKey(
+        ClientProfile,
+        on_delete=models.CASCADE,
+        related_name='orders',
+        verbose_name='Покупатель'
+    )
+    amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        verbose_name='Сумма заказа'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name='Статус'
+    )
+    
+    # Платёж у провайдера (apps.payments.backends)
+    payment_backend = models.CharField(max_length=50, blank=True, verbose_name='Платёжный провайдер')
+    payment_id = models.CharField(
+        max_length=100,
+        blank=True,
+        db_index=True,
+        verbose_name='ID платежа'
+    )
+    payment_url = models.URLField(
+        max_length=500,
+        blank=True,
+        verbose_name='Ссылка на оплату'
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    paid_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата оплаты')
+    
+    class Meta:
+        verbose_name = 'Заказ'
+        verbose_name_plural = 'Заказы'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Заказ {self.id} - {self.buyer.user.username}"
+
+
 class Purchase(models.Model):
     """
     Покупка фотографии
@@ -39,6 +126,15 @@ class Purchase(models.Model):
         related_name='sales',
         verbose_name='Фотограф'
     )
+    # Заказ из корзины (одна оплата на все фото заказа)
+    order = models.ForeignKey(
+        'Order',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='purchases',
+        verbose_name='Заказ'
+    )
     
     # Суммы
     amount = models.DecimalField(
@@ -68,6 +164,7 @@ class Purchase(models.Model):
     payment_id = models.CharField(
         max_length=100,
         blank=True,
+        db_index=True,
         verbose_name='ID платежа YooKassa'
     )
     payment_url = models.URLField(
@@ -101,12 +198,15 @@ class Purchase(models.Model):
     def __str__(self):
         return f"Покупка {self.id} - {self.buyer.user.username}"
     
-    def save(self, *args, **kwargs):
-        # Расчёт комиссии
+    def calculate_commission(self):
+        """Комиссия сервиса и доля фотографа (bulk_create не вызывает save)"""
         if not self.commission:
             commission_percent = Decimal(str(settings.SERVICE_COMMISSION_PERCENT)) / 100
             self.commission = self.amount * commission_percent
             self.photographer_amount = self.amount - self.commission
+    
+    def save(self, *args, **kwargs):
+        self.calculate_commission()
         super().save(*args, **kwargs)
 
 
@@ -232,3 +332,224 @@ class Transaction(models.Model):
     
     def __str__(self):
         return f"{self.get_transaction_type_display()} - {self.amount}₽"
+
+
+class SalesDailyRollup(models.Model):
+    """
+    Продажи фотографа за день по событию (apps.payments.rollups)
+    Обновляется при оплате и возврате покупки, пересчитывается командой
+    rebuild_sales_rollups. Суммы - за вычетом возвратов
+    """
+    photographer = models.ForeignKey(
+        PhotographerProfile,
+        on_delete=models.CASCADE,
+        related_name='sales_rollups',
+        verbose_name='Фотограф'
+    )
+    # Пусто - фото без события (или событие удалено)
+    event = models.ForeignKey(
+        'photos.Event',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='sales_rollups',
+        verbose_name='Событие'
+    )
+    # День оплаты в TIME_ZONE
+    day = models.DateField(verbose_name='День')
+    
+    sales_count = models.IntegerField(default=0, verbose_name='Продаж')
+    refunds_count = models.IntegerField(default=0, verbose_name='Возвратов')
+    gross = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), verbose_name='Выручка')
+    commission = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), verbose_name='Комиссия сервиса')
+    net = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), verbose_name='Доход фотографа')
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Продажи за день'
+        verbose_name_plural = 'Продажи по дням'
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['photographer', 'event', 'day'], name='payments_rollup_unique'),
+        ]
+        indexes = [
+            # Графики и итоги фотографа за период
+            models.Index(fields=['photographer', 'day'], name='payments_rollup_day_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Продажи {self.photographer.user.username} за {self.day}"
+
+
+class WebhookEvent(models.Model):
+    """
+    Входящее уведомление платёжного провайдера (apps.payments.webhooks)
+    Сохраняется как есть до обработки; повторная доставка того же
+    события упирается в уникальный ключ и не применяется дважды
+    """
+    class Status(models.TextChoices):
+        RECEIVED = 'received', 'Получено'
+        PROCESSED = 'processed', 'Применено'
+        IGNORED = 'ignored', 'Пропущено'
+        FAILED = 'failed', 'Ошибка'
+    
+    provider = models.CharField(max_length=20, default='yookassa', verbose_name='Провайдер')
+    # Ключ события у провайдера: тип события и ID платежа
+    event_id = models.CharField(max_length=200, verbose_name='Ключ события')
+    event_type = models.CharField(max_length=50, verbose_name='Тип события')
+    payment_id = models.CharField(max_length=100, blank=True, verbose_name='ID платежа')
+    payload = models.JSONField(verbose_name='Тело уведомления')
+    
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.RECEIVED,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток обработки')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    
+    received_at = models.DateTimeField(auto_now_add=True, verbose_name='Получено')
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name='Обработано')
+    
+    class Meta:
+        verbose_name = 'Уведомление о платеже'
+        verbose_name_plural = 'Уведомления о платежах'
+        ordering = ['-received_at']
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'event_id'], name='payments_webhook_event_unique'),
+        ]
+        indexes = [
+            # Очередь необработанных уведомлений
+            models.Index(fields=['status', 'id'], name='payments_webhook_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.provider} {self.event_type} {self.payment_id}"
+
+
+class PriceTier(models.Model):
+    """
+    Скидка события (apps.payments.pricing)
+    - percent: скидка value % при покупке от min_photos фото события
+    - photo_price: цена value за фото при покупке от min_photos фото
+    - bundle: value за все фото клиента с события (не меньше min_photos)
+    Из подходящих ступеней применяется самая выгодная для клиента
+    """
+    class Kind(models.TextChoices):
+        PERCENT = 'percent', 'Скидка, %'
+        PHOTO_PRICE = 'photo_price', 'Цена за фото'
+        BUNDLE = 'bundle', 'Все мои фото'
+    
+    event = models.ForeignKey(
+        'photos.Event',
+        on_delete=models.CASCADE,
+        related_name='price_tiers',
+        verbose_name='Событие'
+    )
+    kind = models.CharField(
+        max_length=20,
+        choices=Kind.choices,
+        default=Kind.PERCENT,
+        verbose_name='Тип'
+    )
+    min_photos = models.PositiveIntegerField(default=1, verbose_name='От фото')
+    value = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        validators=[MinValueValidator(Decimal('0.00'))],
+        verbose_name='Значение'
+    )
+    
+    class Meta:
+        verbose_name = 'Ступень цены'
+        verbose_name_plural = 'Ступени цен'
+        ordering = ['event', 'kind', 'min_photos']
+        constraints = [
+            models.UniqueConstraint(fields=['event', 'kind', 'min_photos'], name='payments_price_tier_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} от {self.min_photos} фото: {self.value}"
+    
+    def clean(self):
+        if self.kind == self.Kind.PERCENT and self.value is not None and self.value > 100:
+            raise ValidationError({'value': 'Скидка не может быть больше 100%'})
+
+
+class LedgerEntry(models.Model):
+    """
+    Проводка двойной записи (apps.payments.ledger)
+    Только добавляется; проводки одной операции (group) в сумме дают ноль.
+    Счёт - строка: photographer:<id>, client:<id>, platform:commission, ...
+    """
+    class Kind(models.TextChoices):
+        SALE = 'sale', 'Продажа фото'
+        WITHDRAWAL = 'withdrawal', 'Вывод средств'
+        WITHDRAWAL_REVERSAL = 'withdrawal_reversal', 'Отмена вывода'
+        PAYOUT = 'payout', 'Выплата'
+        OPENING = 'opening', 'Начальный остаток'
+    
+    id = models.BigAutoField(primary_key=True)
+    group = models.UUIDField(db_index=True, verbose_name='Операция')
+    account = models.CharField(max_length=64, verbose_name='Счёт')
+    kind = models.CharField(max_length=20, choices=Kind.choices, verbose_name='Тип')
+    # Плюс - поступление на счёт, минус - списание
+    amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name='Сумма')
+    
+    purchase = models.ForeignKey(
+        Purchase,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ledger_entries',
+        verbose_name='Покупка'
+    )
+    withdrawal = models.ForeignKey(
+        Withdrawal,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ledger_entries',
+        verbose_name='Вывод'
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Проводка'
+        verbose_name_plural = 'Проводки'
+        ordering = ['id']
+        indexes = [
+            # Остаток счёта: проводки после последнего снимка
+            models.Index(fields=['account', 'id'], name='payments_ledger_account_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.account} {self.amount:+}"
+
+
+class BalanceSnapshot(models.Model):
+    """
+    Остаток счёта по проводку entry_id включительно
+    Текущий остаток = последний снимок + проводки после entry_id
+    """
+    account = models.CharField(max_length=64, verbose_name='Счёт')
+    entry_id = models.BigIntegerField(verbose_name='Последняя проводка')
+    balance = models.DecimalField(max_digits=14, decimal_places=2, verbose_name='Остаток')
+    # Сумма проводок продаж: доход фотографа, траты клиента (со знаком минус)
+    sales_total = models.DecimalField(max_digits=14, decimal_places=2, verbose_name='Продажи')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Снимок остатка'
+        verbose_name_plural = 'Снимки остатков'
+        ordering = ['-entry_id']
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'entry_id'], name='payments_snapshot_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.account} = {self.balance} (#{self.entry_id})"
@@ -0,0 +1,240 @@
+"""
+Цены с учётом скидок событий (PriceTier)
+
+Предложение (Quote) для клиента по событию: сколько его фото с события
+ещё не куплено, сумма по ценам фото и цена с лучшей скидкой. Для всех
+событий клиента оно считается одним агрегатным запросом (GROUP BY
+события по фото, где найдено его лицо) и кэшируется по версии
+совпадений клиента. Версии в кэше:
+- pricing:matches:<user> - меняется, когда у клиента появились
+  совпадения или покупки (matches_changed)
+- pricing:event:<event> - меняется при изменении фото или скидок
+  события (prices_changed); закэшированные итоги по событию с другой
+  версией пересчитываются
+
+Ступени скидок события кэшируются по той же версии события.
+"""
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef, Sum
+
+from apps.photos.models import DeletionRequest, Photo, PhotoFace
+
+from .models import PriceTier, Purchase
+
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+
+@dataclass
+class Quote:
+    """Цена покупки фото события"""
+    event_id: int
+    photos: int
+    subtotal: Decimal
+    total: Decimal
+    tier: str = ''
+
+    @property
+    def discount(self) -> Decimal:
+        return self.subtotal - self.total
+
+
+def cache_timeout() -> int:
+    return getattr(settings, 'PRICING_CACHE_SECONDS', 300)
+
+
+# --- Версии кэша ---
+
+def _version_key(kind, pk) -> str:
+    return f'pricing:{kind}:{pk}'
+
+
+def _versions(kind, ids) -> dict:
+    keys = {pk: _version_key(kind, pk) for pk in ids}
+    values = cache.get_many(list(keys.values()))
+    return {pk: values.get(key, 0) for pk, key in keys.items()}
+
+
+def _bump(kind, ids):
+    for pk in set(ids):
+        key = _version_key(kind, pk)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, timeout=None)
+
+
+def matches_changed(user_ids):
+    """У клиентов изменились совпадения лиц или покупки"""
+    _bump('matches', [pk for pk in user_ids if pk])
+
+
+def prices_changed(event_ids):
+    """Изменились фото, цены или скидки событий"""
+    _bump('event', [pk for pk in event_ids if pk])
+
+
+# --- Скидки ---
+
+def event_tiers(event_ids) -> dict:
+    """Ступени скидок событий: {id события: [(вид, от фото, значение)]}"""
+    event_ids = [pk for pk in set(event_ids) if pk]
+    versions = _versions('event', event_ids)
+    keys = {pk: f'pricing:tiers:{pk}:{versions[pk]}' for pk in event_ids}
+    cached = cache.get_many(list(keys.values()))
+    result = {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+    missing = [pk for pk in event_ids if pk not in result]
+    if missing:
+        loaded = {pk: [] for pk in missing}
+        for tier in PriceTier.objects.filter(event_id__in=missing).order_by('min_photos'):
+            loaded[tier.event_id].append((tier.kind, tier.min_photos, tier.value))
+        cache.set_many({keys[pk]: tiers for pk, tiers in loaded.items()}, cache_timeout())
+        result.update(loaded)
+    return result
+
+
+def best_price(count: int, subtotal: Decimal, tiers, complete: bool = False):
+    """
+    Самая низкая цена count фото на сумму subtotal по ступеням события
+    complete - покупаются все фото клиента с события (доступна ступень bundle)
+    Возвращает (цена, описание скидки)
+    """
+    best, label = subtotal, ''
+    for kind, min_photos, value in tiers:
+        if count < min_photos:
+            continue
+        if kind == PriceTier.Kind.PERCENT:
+            price = subtotal * (100 - min(value, Decimal('100'))) / 100
+            text = f'Скидка {value.normalize():f}% от {min_photos} фото'
+        elif kind == PriceTier.Kind.PHOTO_PRICE:
+            price = value * count
+            text = f'{value} ₽ за фото от {min_photos} фото'
+        elif complete:
+            price = value
+            text = f'Все ваши фото за {value} ₽'
+        else:
+            continue
+        price = price.quantize(CENT, rounding=ROUND_HALF_UP)
+        if price < best:
+            best, label = price, text
+    return best, label
+
+
+def allocate(photos, total: Decimal) -> dict:
+    """
+    Делит цену заказа между фото пропорционально их ценам
+    Возвращает {id фото: сумма}, суммы в копейках дают ровно total
+    """
+    subtotal = sum((photo.price for photo in photos), ZERO)
+    prices = {}
+    remaining = total
+    for n, photo in enumerate(photos):
+        if n == len(photos) - 1:
+            amount = remaining
+        elif subtotal:
+            amount = (total * photo.price / subtotal).quantize(CENT, rounding=ROUND_HALF_UP)
+        else:
+            amount = ZERO
+        amount = max(min(amount, remaining), ZERO)
+        prices[photo.id] = amount
+        remaining -= amount
+    return prices
+
+
+def price_photos(photos) -> dict:
+    """
+    Цены набора фото (корзина): скидки считаются по числу фото
+    каждого события в наборе. Возвращает {id фото: сумма}
+    """
+    by_event = {}
+    for photo in photos:
+        by_event.setdefault(photo.event_id, []).append(photo)
+    tiers = event_tiers(by_event)
+
+    prices = {}
+    for event_id, group in by_event.items():
+        subtotal = sum((photo.price for photo in group), ZERO)
+        total, _ = best_price(len(group), subtotal, tiers.get(event_id, []))
+        prices.update(allocate(group, total))
+    return prices
+
+
+# --- Предложения клиенту ---
+
+def matched_photos(user):
+    """Активные, не купленные клиентом фото событий, где найдено его лицо"""
+    return Photo.objects.filter(status='active', event__isnull=False).filter(
+        Exists(PhotoFace.objects.filter(photo=OuterRef('pk'), matched_user=user))
+    ).exclude(
+        Exists(Purchase.objects.filter(photo=OuterRef('pk'), buyer__user=user, status='paid'))
+    ).exclude(
+        Exists(DeletionRequest.objects.filter(photo=OuterRef('pk'), status='pending'))
+    )
+
+
+def _totals(user) -> dict:
+    """
+    Итоги по событиям {id события: (фото, сумма, версия события)}
+    Из кэша, если версии событий не менялись, иначе одним запросом
+    """
+    key = f'pricing:totals:{user.pk}:{_versions("matches", [user.pk])[user.pk]}'
+    totals = cache.get(key)
+    if totals is not None:
+        current = _versions('event', totals)
+        if all(current[pk] == version for pk, (_, _, version) in totals.items()):
+            return totals
+
+    rows = list(
+        matched_photos(user).values('event_id').annotate(
+            photos=Count('id'), subtotal=Sum('price')
+        ).order_by()
+    )
+    versions = _versions('event', [row['event_id'] for row in rows])
+    totals = {
+        row['event_id']: (row['photos'], (row['subtotal'] or ZERO).quantize(CENT), versions[row['event_id']])
+        for row in rows
+    }
+    cache.set(key, totals, cache_timeout())
+    return totals
+
+
+def user_quotes(user) -> dict:
+    """Предложения «все мои фото» по всем событиям клиента: {id события: Quote}"""
+    if not user.is_authenticated:
+        return {}
+    totals = _totals(user)
+    tiers = event_tiers(totals)
+    quotes = {}
+    for event_id, (count, subtotal, _) in totals.items():
+        total, label = best_price(count, subtotal, tiers.get(event_id, []), complete=True)
+        quotes[event_id] = Quote(event_id, count, subtotal, total, label)
+    return quotes
+
+
+def event_quote(user, event_id):
+    """Предложение «все мои фото» по событию или None"""
+    return user_quotes(user).get(event_id)
+
+
+def bundle(user, event_id):
+    """
+    Фото и цены покупки всех фото клиента с события по предложению
+    Возвращает (фото, {id фото: сумма}); фото нет - покупать нечего
+    """
+    quote = event_quote(user, event_id)
+    if quote is None:
+        return [], {}
+    photos = list(matched_photos(user).filter(event_id=event_id).order_by('taken_at', 'id'))
+    total = quote.total
+    if len(photos) != quote.photos:
+        # Совпадения изменились после расчёта предложения
+        matches_changed([user.pk])
+        subtotal = sum((photo.price for photo in photos), ZERO)
+        total, _ = best_price(len(photos), subtotal, event_tiers([event_id])[event_id], complete=True)
+    return photos, allocate(photos, total)
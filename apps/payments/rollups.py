@@ -0,0 +1,243 @@
+"""
+Дневные агрегаты продаж (SalesDailyRollup)
+
+Покупка попадает в агрегат дня оплаты (paid_at в TIME_ZONE), когда
+становится оплаченной, и вычитается из того же дня при возврате
+или отмене. Изменения пишутся одним UPDATE с F(), поэтому
+параллельные оплаты не теряют приращения.
+
+Смена статуса покупки публикуется в outbox (apps.outbox) в той же
+транзакции, агрегаты обновляет apply_changes пачкой по многим покупкам.
+
+Дашборды и API графика читают агрегаты: O(дней), а не O(покупок).
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from apps.outbox.relay import publish_many
+
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+# Максимальный период графика, дней
+MAX_CHART_DAYS = 366
+
+# Обработчик изменений в outbox
+OUTBOX_TOPIC = 'apps.payments.rollups.apply_changes'
+
+SALE = 'sale'
+REFUND = 'refund'
+REVERSAL = 'reversal'
+
+
+def _money(value) -> Decimal:
+    # SQLite возвращает суммы без масштаба
+    return (value or ZERO).quantize(CENT)
+
+
+def sale_day(purchase):
+    """День продажи в текущем часовом поясе"""
+    return timezone.localdate(purchase.paid_at or timezone.now())
+
+
+def _key(purchase) -> tuple:
+    return purchase.photographer_id, purchase.photo.event_id, sale_day(purchase)
+
+
+def _apply(key, sales=0, gross=ZERO, commission=ZERO, net=ZERO, refunds=0):
+    from .models import SalesDailyRollup
+
+    photographer_id, event_id, day = key
+    lookup = {'photographer_id': photographer_id, 'event_id': event_id, 'day': day}
+    changes = {
+        'sales_count': F('sales_count') + sales,
+        'gross': F('gross') + gross,
+        'commission': F('commission') + commission,
+        'net': F('net') + net,
+    }
+    if refunds:
+        changes['refunds_count'] = F('refunds_count') + refunds
+
+    with transaction.atomic():
+        rollup = SalesDailyRollup.objects.filter(**lookup).order_by('pk').first()
+        if rollup is None:
+            try:
+                with transaction.atomic():
+                    rollup = SalesDailyRollup.objects.create(**lookup)
+            except IntegrityError:
+                # Параллельная оплата создала строку раньше
+                rollup = SalesDailyRollup.objects.filter(**lookup).order_by('pk').first()
+        SalesDailyRollup.objects.filter(pk=rollup.pk).update(**changes, updated_at=timezone.now())
+
+
+def record_sale(purchase):
+    """Покупка оплачена"""
+    record_sales([purchase])
+
+
+def record_sales(purchases):
+    """Оплачены покупки (заказ): одно обновление на фотографа, событие и день"""
+    groups = {}
+    for purchase in purchases:
+        group = groups.setdefault(_key(purchase), [0, ZERO, ZERO, ZERO])
+        group[0] += 1
+        group[1] += purchase.amount
+        group[2] += purchase.commission
+        group[3] += purchase.photographer_amount
+    for key, (sales, gross, commission, net) in groups.items():
+        _apply(key, sales, gross, commission, net)
+
+
+def record_reversal(purchase, refund: bool = True):
+    """Оплаченная покупка возвращена (refund) или отменена"""
+    _apply(
+        _key(purchase),
+        -1,
+        -purchase.amount,
+        -purchase.commission,
+        -purchase.photographer_amount,
+        refunds=1 if refund else 0,
+    )
+
+
+def publish_sales(purchases):
+    """Покупки оплачены - агрегаты обновятся после коммита"""
+    publish_many(OUTBOX_TOPIC, [{'purchase': str(purchase.pk), 'change': SALE} for purchase in purchases])
+
+
+def publish_reversal(purchase, refund: bool = True):
+    """Оплаченная покупка возвращена или отменена"""
+    publish_many(OUTBOX_TOPIC, [{'purchase': str(purchase.pk), 'change': REFUND if refund else REVERSAL}])
+
+
+def apply_changes(payloads):
+    """
+    Обработчик outbox: изменения статусов пачки покупок,
+    продажи - одним обновлением на фотографа, событие и день
+    """
+    from .models import Purchase
+
+    purchases = {
+        str(purchase.pk): purchase
+        for purchase in Purchase.objects.filter(
+            pk__in={payload['purchase'] for payload in payloads}
+        ).select_related('photo')
+    }
+    sales = []
+    for payload in payloads:
+        purchase = purchases.get(payload['purchase'])
+        if purchase is None:
+            continue
+        if payload['change'] == SALE:
+            sales.append(purchase)
+        else:
+            record_reversal(purchase, refund=payload['change'] == REFUND)
+    record_sales(sales)
+
+
+def rebuild(photographer=None, since=None) -> int:
+    """
+    Пересчитывает агрегаты из покупок одним GROUP BY
+    photographer, since (дата) - ограничить пересчёт
+    Возвращает число строк агрегатов
+    """
+    from .models import Purchase, SalesDailyRollup
+
+    purchases = Purchase.objects.filter(status__in=['paid', 'refunded'], paid_at__isnull=False)
+    rollups = SalesDailyRollup.objects.all()
+    if photographer is not None:
+        purchases = purchases.filter(photographer=photographer)
+        rollups = rollups.filter(photographer=photographer)
+    if since is not None:
+        purchases = purchases.filter(paid_at__date__gte=since)
+        rollups = rollups.filter(day__gte=since)
+
+    paid = Q(status='paid')
+    rows = purchases.annotate(
+        day=TruncDate('paid_at', tzinfo=timezone.get_current_timezone())
+    ).values('photographer_id', 'photo__event_id', 'day').annotate(
+        sales_count=Count('id', filter=paid),
+        refunds_count=Count('id', filter=Q(status='refunded')),
+        gross=Sum('amount', filter=paid),
+        commission=Sum('commission', filter=paid),
+        net=Sum('photographer_amount', filter=paid),
+    ).order_by()
+
+    with transaction.atomic():
+        rollups.delete()
+        created = SalesDailyRollup.objects.bulk_create([
+            SalesDailyRollup(
+                photographer_id=row['photographer_id'],
+                event_id=row['photo__event_id'],
+                day=row['day'],
+                sales_count=row['sales_count'],
+                refunds_count=row['refunds_count'],
+                gross=_money(row['gross']),
+                commission=_money(row['commission']),
+                net=_money(row['net']),
+            )
+            for row in rows
+        ], batch_size=500)
+    return len(created)
+
+
+def totals(photographer, since=None, until=None) -> dict:
+    """Итоги фотографа за период (даты включительно)"""
+    from .models import SalesDailyRollup
+
+    rollups = SalesDailyRollup.objects.filter(photographer=photographer)
+    if since is not None:
+        rollups = rollups.filter(day__gte=since)
+    if until is not None:
+        rollups = rollups.filter(day__lte=until)
+    result = rollups.aggregate(
+        sales_count=Sum('sales_count'),
+        refunds_count=Sum('refunds_count'),
+        gross=Sum('gross'),
+        commission=Sum('commission'),
+        net=Sum('net'),
+    )
+    return {
+        key: (value or 0) if key.endswith('_count') else _money(value)
+        for key, value in result.items()
+    }
+
+
+def daily_series(photographer, days: int = 30, event=None) -> list:
+    """
+    Продажи по дням за последние days дней, включая дни без продаж
+    [{'day', 'sales_count', 'gross', 'net'}] по возрастанию даты
+    """
+    from .models import SalesDailyRollup
+
+    days = max(1, min(days, MAX_CHART_DAYS))
+    until = timezone.localdate()
+    since = until - timedelta(days=days - 1)
+
+    rollups = SalesDailyRollup.objects.filter(photographer=photographer, day__range=(since, until))
+    if event is not None:
+        rollups = rollups.filter(event=event)
+    by_day = {
+        row['day']: row
+        for row in rollups.values('day').annotate(
+            sales_count=Sum('sales_count'), gross=Sum('gross'), net=Sum('net')
+        ).order_by()
+    }
+
+    series = []
+    for offset in range(days):
+        day = since + timedelta(days=offset)
+        row = by_day.get(day, {})
+        series.append({
+            'day': day.isoformat(),
+            'sales_count': row.get('sales_count') or 0,
+            'gross': str(_money(row.get('gross'))),
+            'net': str(_money(row.get('net'))),
+        })
+    return series
@@ -0,0 +1,222 @@
+"""
+Корзина, заказы и смена статуса покупок с начислениями
+
+Деньги фотографов и клиентов - проводки в книге (apps.payments.ledger):
+оплата только добавляет строки и не блокирует профили, поэтому
+параллельные оплаты одного фотографа не ждут друг друга. Функции
+complete_* и fail_* вызывать внутри транзакции, заказ или покупка
+должны быть заблокированы (select_for_update).
+
+Заказ из корзины оплачивается одним платежом: покупки и транзакции
+и проводки создаются пачками.
+"""
+import uuid
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.accounts.models import ClientProfile, PhotographerProfile
+
+from . import ledger, pricing, rollups
+from .backends import get_backend
+from .models import CartItem, Order, Purchase, Transaction
+
+
+class CheckoutError(Exception):
+    """Заказ нельзя оформить или оплатить"""
+
+
+# ===== Корзина =====
+
+def add_to_cart(buyer, photo) -> bool:
+    """Добавляет фото в корзину, False - уже в корзине или куплено"""
+    if Purchase.objects.filter(buyer=buyer, photo=photo, status=Purchase.Status.PAID).exists():
+        return False
+    _, created = CartItem.objects.get_or_create(buyer=buyer, photo=photo)
+    return created
+
+
+def remove_from_cart(buyer, photo_id):
+    CartItem.objects.filter(buyer=buyer, photo_id=photo_id).delete()
+
+
+def cart_photos(buyer) -> list:
+    """Фото корзины, доступные для покупки (активные и ещё не купленные)"""
+    items = list(
+        buyer.cart_items.filter(photo__status='active')
+        .select_related('photo__event')
+        .order_by('added_at')
+    )
+    owned = set(
+        Purchase.objects.filter(
+            buyer=buyer, status=Purchase.Status.PAID, photo_id__in=[item.photo_id for item in items]
+        ).values_list('photo_id', flat=True)
+    )
+    return [item.photo for item in items if item.photo_id not in owned]
+
+
+# ===== Заказ =====
+
+def create_order(buyer, photos, prices=None) -> Order:
+    """
+    Заказ с неоплаченными покупками всех фото в одной транзакции
+    prices - {id фото: сумма}, по умолчанию цены со скидками событий
+    """
+    if not photos:
+        raise CheckoutError('Корзина пуста')
+    if prices is None:
+        prices = pricing.price_photos(photos)
+
+    with transaction.atomic():
+        order = Order.objects.create(
+            buyer=buyer,
+            amount=sum((prices[photo.id] for photo in photos), Decimal('0')),
+            payment_backend=get_backend().name,
+        )
+        purchases = []
+        for photo in photos:
+            purchase = Purchase(
+                buyer=buyer,
+                photo=photo,
+                photographer_id=photo.photographer_id,
+                order=order,
+                amount=prices[photo.id],
+                download_token=str(uuid.uuid4()),
+            )
+            purchase.calculate_commission()
+            purchases.append(purchase)
+        Purchase.objects.bulk_create(purchases)
+    return order
+
+
+def pay_order(order, return_url: str) -> Order:
+    """
+    Создаёт у провайдера один платёж на заказ
+    Вызывать вне транзакции: запрос к провайдеру не держит блокировки
+    Если провайдер подтвердил оплату сразу, заказ оплачивается
+    """
+    try:
+        result = get_backend().create_payment(order, return_url)
+    except Exception as e:
+        with transaction.atomic():
+            fail_order(Order.objects.select_for_update().get(pk=order.pk))
+        raise CheckoutError(f'Платёжный сервис недоступен: {e}') from e
+
+    order.payment_id = result.payment_id
+    order.payment_url = result.confirmation_url
+    Order.objects.filter(pk=order.pk).update(payment_id=order.payment_id, payment_url=order.payment_url)
+    Purchase.objects.filter(order=order).update(payment_id=order.payment_id)
+
+    if result.paid:
+        with transaction.atomic():
+            order = Order.objects.select_for_update().select_related('buyer').get(pk=order.pk)
+            complete_order(order)
+    return order
+
+
+def _credit(buyer, purchases):
+    """
+    Начисления за оплаченные покупки: проводки и транзакции - одним
+    INSERT каждые, счётчик покупок клиента - одним UPDATE
+    """
+    ledger.post_sales(buyer, purchases)
+    ClientProfile.objects.filter(pk=buyer.pk).update(
+        total_purchases=F('total_purchases') + len(purchases),
+    )
+
+    photographer_users = dict(
+        PhotographerProfile.objects.filter(
+            pk__in={purchase.photographer_id for purchase in purchases}
+        ).values_list('pk', 'user_id')
+    )
+    entries = []
+    for purchase in purchases:
+        entries.append(Transaction(
+            user_id=buyer.user_id,
+            transaction_type=Transaction.TransactionType.PURCHASE,
+            amount=purchase.amount,
+            purchase=purchase,
+            description=f"Покупка фото {purchase.photo_id}"
+        ))
+        entries.append(Transaction(
+            user_id=photographer_users[purchase.photographer_id],
+            transaction_type=Transaction.TransactionType.SALE,
+            amount=purchase.photographer_amount,
+            purchase=purchase,
+            description=f"Продажа фото {purchase.photo_id}"
+        ))
+    Transaction.objects.bulk_create(entries)
+    # Купленные фото выпадают из предложений клиента
+    transaction.on_commit(lambda: pricing.matches_changed([buyer.user_id]))
+
+
+def complete_order(order) -> bool:
+    """
+    Отмечает заказ и его покупки оплаченными, начисляет фотографам
+    и очищает корзину от купленных фото
+    Возвращает False, если заказ уже не ждёт оплаты
+    """
+    if order.status != Order.Status.PENDING:
+        return False
+
+    now = timezone.now()
+    purchases = list(
+        Purchase.objects.select_for_update(of=('self',))
+        .filter(order=order, status=Purchase.Status.PENDING)
+        .select_related('photo')
+    )
+    Purchase.objects.filter(pk__in=[purchase.pk for purchase in purchases]).update(
+        status=Purchase.Status.PAID, paid_at=now
+    )
+    for purchase in purchases:
+        purchase.status = Purchase.Status.PAID
+        purchase.paid_at = now
+    _credit(order.buyer, purchases)
+
+    order.status = Order.Status.PAID
+    order.paid_at = now
+    order.save(update_fields=['status', 'paid_at'])
+    CartItem.objects.filter(buyer=order.buyer, photo_id__in=[purchase.photo_id for purchase in purchases]).delete()
+
+    # UPDATE не вызывает сигналы - агрегаты продаж через outbox
+    rollups.publish_sales(purchases)
+    return True
+
+
+def fail_order(order) -> bool:
+    """Отмечает неоплаченный заказ и его покупки ошибкой оплаты"""
+    if order.status != Order.Status.PENDING:
+        return False
+    Purchase.objects.filter(order=order, status=Purchase.Status.PENDING).update(status=Purchase.Status.FAILED)
+    order.status = Order.Status.FAILED
+    order.save(update_fields=['status'])
+    return True
+
+
+# ===== Отдельная покупка =====
+
+def complete_purchase(purchase) -> bool:
+    """
+    Отмечает покупку оплаченной, начисляет фотографу его долю,
+    обновляет статистику клиента и пишет транзакции
+    Возвращает False, если покупка уже не ждёт оплаты
+    """
+    if purchase.status != Purchase.Status.PENDING:
+        return False
+
+    purchase.status = Purchase.Status.PAID
+    purchase.paid_at = timezone.now()
+    purchase.save()
+    _credit(purchase.buyer, [purchase])
+    return True
+
+
+def fail_purchase(purchase) -> bool:
+    """Отмечает неоплаченную покупку ошибкой оплаты"""
+    if purchase.status != Purchase.Status.PENDING:
+        return False
+    purchase.status = Purchase.Status.FAILED
+    purchase.save(update_fields=['status'])
+    return True
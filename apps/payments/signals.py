@@ -0,0 +1,52 @@
+"""
+Сигналы платежей
+- дневные агрегаты продаж при смене статуса покупки
+- версии кэша цен (apps.payments.pricing) при изменении фото, лиц и скидок
+"""
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from apps.photos.models import Photo, PhotoFace
+
+from . import pricing, rollups
+from .models import PriceTier, Purchase
+
+
+@receiver(post_init, sender=Purchase)
+def remember_status(sender, instance, **kwargs):
+    """Статус на момент загрузки - чтобы после save увидеть переход"""
+    # Отложенное поле не читаем: лишний запрос на каждую загруженную покупку
+    if 'status' not in instance.get_deferred_fields():
+        instance._rollup_status = instance.status
+
+
+@receiver(post_save, sender=Purchase)
+def update_sales_rollup(sender, instance, created, **kwargs):
+    current = instance.status
+    # Без исходного статуса переход не определить - сверит rebuild_sales_rollups
+    previous = None if created else getattr(instance, '_rollup_status', current)
+    instance._rollup_status = current
+    if previous == current:
+        return
+
+    if current == Purchase.Status.PAID:
+        rollups.publish_sales([instance])
+    elif previous == Purchase.Status.PAID:
+        rollups.publish_reversal(instance, refund=current == Purchase.Status.REFUNDED)
+
+
+@receiver(post_save, sender=Photo)
+@receiver(post_delete, sender=Photo)
+@receiver(post_save, sender=PriceTier)
+@receiver(post_delete, sender=PriceTier)
+def invalidate_event_prices(sender, instance, **kwargs):
+    """Фото или скидки события изменились - предложения по событию устарели"""
+    pricing.prices_changed([instance.event_id])
+
+
+@receiver(post_save, sender=PhotoFace)
+@receiver(post_delete, sender=PhotoFace)
+def invalidate_client_quotes(sender, instance, **kwargs):
+    """Лицо сопоставлено с клиентом - его предложения устарели"""
+    if instance.matched_user_id:
+        pricing.matches_changed([instance.matched_user_id])
@@ -0,0 +1,19 @@
+"""
+Celery задачи платежей
+"""
+from celery import shared_task
+
+from . import ledger, webhooks
+
+
+@shared_task
+def process_webhook_events():
+    """Применяет накопленные уведомления провайдера"""
+    processed = webhooks.process_pending()
+    return f"Уведомлений обработано: {processed}"
+
+
+@shared_task
+def snapshot_ledger_balances():
+    """Снимки остатков по счетам с новыми проводками"""
+    return f"Снимков остатков: {ledger.take_snapshots()}"
@@ -0,0 +1,343 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Q, Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.accounts.models import ClientProfile, PhotographerProfile, User
+from apps.payments import ledger, pricing, rollups, services, webhooks
+from apps.payments.models import BalanceSnapshot, LedgerEntry, Order, PriceTier, Purchase, WebhookEvent
+from apps.photos.models import Event, Photo, PhotoFace
+
+
+class SnapshotLagTests(TestCase):
+    """Снимки остатков и проводки, закоммиченные позже с меньшим id"""
+
+    account = ledger.photographer_account(1)
+
+    def entries(self, ids, amount):
+        # Начисление фотографу: id задаём явно, чтобы смоделировать порядок выдачи
+        entries = ledger._entries([
+            (self.account, amount),
+            (ledger.OPENING, -amount),
+        ], ledger.Kind.OPENING)
+        for entry, entry_id in zip(entries, ids):
+            entry.id = entry_id
+        return LedgerEntry.objects.bulk_create(entries)
+
+    def age(self, ids):
+        LedgerEntry.objects.filter(id__in=ids).update(
+            created_at=timezone.now() - timedelta(seconds=ledger.snapshot_lag() + 60)
+        )
+
+    def test_late_commit_with_lower_id_is_counted(self):
+        self.entries([1, 2], Decimal('100.00'))
+        self.age([1, 2])
+        # Транзакция B (id 5, 6) закоммичена, A (id 3, 4) ещё открыта
+        self.entries([5, 6], Decimal('10.00'))
+
+        self.assertEqual(ledger.take_snapshots(), 2)
+        self.assertEqual(
+            set(BalanceSnapshot.objects.values_list('entry_id', flat=True)), {2}
+        )
+
+        # A коммитит проводки с id ниже уже видимых
+        self.entries([3, 4], Decimal('1.00'))
+        self.assertEqual(ledger.summary(self.account).balance, Decimal('111.00'))
+
+        self.age([3, 4, 5, 6])
+        ledger.take_snapshots()
+        self.assertEqual(ledger.summary(self.account).balance, Decimal('111.00'))
+        self.assertEqual(ledger.summary(ledger.OPENING).balance, Decimal('-111.00'))
+        self.assertEqual(ledger.reconcile(), [])
+
+    def test_recent_entries_are_not_snapshotted(self):
+        self.entries([1, 2], Decimal('50.00'))
+        self.assertEqual(ledger.take_snapshots(), 0)
+        self.assertEqual(ledger.summary(self.account).balance, Decimal('50.00'))
+
+    def test_snapshot_builds_on_latest_only(self):
+        for ids in ([1, 2], [3, 4], [5, 6]):
+            self.entries(ids, Decimal('10.00'))
+            self.age(ids)
+            ledger.take_snapshots()
+        self.assertEqual(BalanceSnapshot.objects.filter(account=self.account).count(), 3)
+        self.assertEqual(ledger.summary(self.account).balance, Decimal('30.00'))
+        self.assertEqual(
+            BalanceSnapshot.objects.get(account=self.account, entry_id=6).balance, Decimal('30.00')
+        )
+        self.assertEqual(ledger.reconcile(), [])
+
+
+class LedgerAnnotationTests(TestCase):
+    """Остатки профилей в списках админки - подзапросами, как ledger.summary"""
+
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', is_staff=True, is_superuser=True)
+        self.photographers = []
+        self.clients = []
+        for n in range(3):
+            user = User.objects.create(username=f'photographer{n}', user_type='photographer')
+            self.photographers.append(PhotographerProfile.objects.create(user=user))
+            user = User.objects.create(username=f'client{n}', user_type='client')
+            self.clients.append(ClientProfile.objects.create(user=user))
+
+    def sale(self, client, photographer, amount):
+        ledger.post([
+            (ledger.client_account(client.pk), -amount),
+            (ledger.photographer_account(photographer.pk), amount - 1),
+            (ledger.COMMISSION, Decimal('1.00')),
+        ], ledger.Kind.SALE)
+
+    def test_annotation_matches_summary(self):
+        self.sale(self.clients[0], self.photographers[0], Decimal('100.00'))
+        self.sale(self.clients[1], self.photographers[0], Decimal('50.00'))
+        LedgerEntry.objects.update(created_at=timezone.now() - timedelta(seconds=ledger.snapshot_lag() + 60))
+        ledger.take_snapshots()
+        # Проводки после снимка
+        self.sale(self.clients[0], self.photographers[1], Decimal('20.00'))
+        ledger.post_withdrawal(self.photographers[0].withdrawals.create(amount=Decimal('40.00')))
+
+        for profile in ledger.annotate_summary(PhotographerProfile.objects.all(), 'photographer:'):
+            expected = ledger.summary(ledger.photographer_account(profile.pk))
+            self.assertEqual((profile.ledger_balance, profile.ledger_sales_total),
+                             (expected.balance, expected.sales_total))
+        for profile in ledger.annotate_summary(ClientProfile.objects.all(), 'client:'):
+            expected = ledger.summary(ledger.client_account(profile.pk))
+            self.assertEqual(profile.ledger_sales_total, expected.sales_total)
+        self.assertEqual(
+            ledger.annotate_summary(PhotographerProfile.objects.filter(pk=self.photographers[0].pk),
+                                    'photographer:').get().ledger_balance,
+            Decimal('108.00'),
+        )
+
+    def test_changelists_do_not_query_per_row(self):
+        self.client.force_login(self.admin)
+        for url in ('/admin/accounts/photographerprofile/', '/admin/accounts/clientprofile/'):
+            with CaptureQueriesContext(connection) as few:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            for n in range(3, 8):
+                self.sale(ClientProfile.objects.create(
+                    user=User.objects.create(username=f'{url}client{n}')
+                ), PhotographerProfile.objects.create(
+                    user=User.objects.create(username=f'{url}photographer{n}')
+                ), Decimal('10.00'))
+            with CaptureQueriesContext(connection) as many:
+                response = self.client.get(url)
+            self.assertEqual(
+                {row.ledger_sales_total for row in response.context['cl'].result_list},
+                {Decimal('0.00'), Decimal('-10.00') if 'client' in url else Decimal('9.00')},
+            )
+            self.assertEqual(len(many), len(few), url)
+
+
+@override_settings(FAKE_PAYMENT_AUTO_CAPTURE=False, WEBHOOK_ASYNC=False, WEBHOOK_MAX_ATTEMPTS=3)
+class WebhookTests(TestCase):
+    """Уведомления провайдера: повторная доставка и повторы до failed"""
+
+    def setUp(self):
+        user = User.objects.create(username='photographer', user_type='photographer')
+        photographer = PhotographerProfile.objects.create(user=user)
+        buyer = ClientProfile.objects.create(user=User.objects.create(username='client', user_type='client'))
+        photo = Photo.objects.create(
+            photographer=photographer, status='active', price=Decimal('100.00'), original='x.jpg'
+        )
+        self.order = services.pay_order(services.create_order(buyer, [photo]), 'http://testserver/')
+
+    def notify(self, event='payment.succeeded', payment_id=None):
+        body = {'event': event, 'object': {'id': payment_id or self.order.payment_id, 'status': 'succeeded'}}
+        return self.client.post('/payments/webhook/yookassa/', body, content_type='application/json')
+
+    def test_redelivery_is_applied_once(self):
+        self.assertEqual(self.order.status, Order.Status.PENDING)
+        self.assertEqual(self.notify().json(), {'status': 'ok', 'duplicate': False})
+        self.assertEqual(self.notify().json(), {'status': 'ok', 'duplicate': True})
+
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), (WebhookEvent.Status.PROCESSED, 1))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.Status.PAID)
+        self.assertEqual(LedgerEntry.objects.filter(kind=ledger.Kind.SALE).count(), 3)
+
+        # Отмена после оплаты заказ не меняет
+        self.notify(event='payment.canceled')
+        self.assertEqual(WebhookEvent.objects.get(event_type='payment.canceled').status, WebhookEvent.Status.IGNORED)
+
+    def test_unknown_payment_retries_then_fails(self):
+        with self.assertLogs('apps.payments.webhooks', 'WARNING'):
+            self.notify(payment_id='unknown')
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), (WebhookEvent.Status.RECEIVED, 1))
+        self.assertIn('unknown', event.error)
+
+        with self.assertLogs('apps.payments.webhooks', 'WARNING'):
+            webhooks.process_pending()
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (WebhookEvent.Status.RECEIVED, 2))
+
+        with self.assertLogs('apps.payments.webhooks', 'WARNING'):
+            webhooks.process_pending()
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (WebhookEvent.Status.FAILED, 3))
+        self.assertEqual(webhooks.process_pending(), 0)
+
+    def test_malformed_body(self):
+        for body in ('[]', '{"event": "payment.succeeded"}', '{'):
+            response = self.client.post('/payments/webhook/yookassa/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+
+class PriceTierTests(TestCase):
+    """Выбор самой выгодной ступени скидки и раскладка цены по фото"""
+
+    Kind = PriceTier.Kind
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        user = User.objects.create(username='photographer', user_type='photographer')
+        self.photographer = PhotographerProfile.objects.create(user=user)
+        self.event = Event.objects.create(photographer=self.photographer, name='Забег', date='2026-05-01')
+        self.client_user = User.objects.create(username='client', user_type='client')
+
+    def photo(self, price, event=None):
+        photo = Photo.objects.create(
+            photographer=self.photographer, event=event or self.event, status='active',
+            price=Decimal(price), original='x.jpg',
+        )
+        PhotoFace.objects.create(photo=photo, face_location={}, face_encoding=[], matched_user=self.client_user)
+        return photo
+
+    def test_best_price(self):
+        tiers = [
+            (self.Kind.PERCENT, 3, Decimal('10')),
+            (self.Kind.PHOTO_PRICE, 5, Decimal('70.00')),
+            (self.Kind.BUNDLE, 2, Decimal('250.00')),
+        ]
+        subtotal = Decimal('100.00')
+        # Ни одна ступень не подходит
+        self.assertEqual(pricing.best_price(1, subtotal, tiers), (subtotal, ''))
+        # bundle - только при покупке всех фото
+        self.assertEqual(pricing.best_price(2, Decimal('200.00'), tiers), (Decimal('200.00'), ''))
+        self.assertEqual(pricing.best_price(2, Decimal('300.00'), tiers, complete=True),
+                         (Decimal('250.00'), 'Все ваши фото за 250.00 ₽'))
+        self.assertEqual(pricing.best_price(3, Decimal('300.00'), tiers),
+                         (Decimal('270.00'), 'Скидка 10% от 3 фото'))
+        # От 5 фото цена за фото выгоднее процента
+        self.assertEqual(pricing.best_price(5, Decimal('500.00'), tiers),
+                         (Decimal('350.00'), '70.00 ₽ за фото от 5 фото'))
+        # Ступень дороже исходной суммы не применяется
+        self.assertEqual(pricing.best_price(5, Decimal('300.00'), tiers), (Decimal('270.00'), 'Скидка 10% от 3 фото'))
+
+    def test_allocate_sums_to_total(self):
+        photos = [self.photo('100.00'), self.photo('50.00'), self.photo('50.00')]
+        prices = pricing.allocate(photos, Decimal('133.33'))
+        self.assertEqual(sum(prices.values()), Decimal('133.33'))
+        self.assertEqual(prices[photos[0].id], Decimal('66.67'))
+
+    def test_cart_discount_per_event(self):
+        other = Event.objects.create(photographer=self.photographer, name='Старт', date='2026-05-02')
+        PriceTier.objects.create(event=self.event, kind=self.Kind.PERCENT, min_photos=2, value=Decimal('50'))
+        photos = [self.photo('100.00'), self.photo('100.00'), self.photo('100.00', event=other)]
+        prices = pricing.price_photos(photos)
+        self.assertEqual([prices[photo.id] for photo in photos],
+                         [Decimal('50.00'), Decimal('50.00'), Decimal('100.00')])
+
+    def test_quote_follows_tier_changes(self):
+        for _ in range(4):
+            self.photo('100.00')
+        quote = pricing.event_quote(self.client_user, self.event.pk)
+        self.assertEqual((quote.photos, quote.subtotal, quote.total), (4, Decimal('400.00'), Decimal('400.00')))
+
+        tier = PriceTier.objects.create(event=self.event, kind=self.Kind.BUNDLE, min_photos=3, value=Decimal('300.00'))
+        quote = pricing.event_quote(self.client_user, self.event.pk)
+        self.assertEqual((quote.total, quote.discount), (Decimal('300.00'), Decimal('100.00')))
+
+        tier.delete()
+        self.assertEqual(pricing.event_quote(self.client_user, self.event.pk).total, Decimal('400.00'))
+
+        photos, prices = pricing.bundle(self.client_user, self.event.pk)
+        self.assertEqual(len(photos), 4)
+        self.assertEqual(sum(prices.values()), Decimal('400.00'))
+
+
+@override_settings(FAKE_PAYMENT_AUTO_CAPTURE=True, OUTBOX_ASYNC=False)
+class RollupTotalsTests(TestCase):
+    """Итоги по дневным агрегатам совпадают с подсчётом по самим покупкам"""
+
+    def setUp(self):
+        user = User.objects.create(username='photographer', user_type='photographer')
+        self.photographer = PhotographerProfile.objects.create(user=user)
+        events = [
+            Event.objects.create(photographer=self.photographer, name=name, date='2026-05-01')
+            for name in ('Забег', 'Старт')
+        ]
+        self.photos = [
+            Photo.objects.create(
+                photographer=self.photographer, event=events[n % 2], status='active',
+                price=Decimal(price), original='x.jpg',
+            )
+            for n, price in enumerate(('100.00', '250.00', '99.90', '500.00', '120.00'))
+        ]
+        self.buyers = [
+            ClientProfile.objects.create(user=User.objects.create(username=f'client{n}', user_type='client'))
+            for n in range(2)
+        ]
+
+    def pay(self, buyer, photos):
+        # Агрегаты обновляет outbox после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            return services.pay_order(services.create_order(buyer, photos), 'http://testserver/')
+
+    def expected(self, **filters):
+        purchases = Purchase.objects.filter(photographer=self.photographer, paid_at__isnull=False, **filters)
+        paid = Q(status=Purchase.Status.PAID)
+        result = purchases.aggregate(
+            sales_count=Count('id', filter=paid),
+            refunds_count=Count('id', filter=Q(status=Purchase.Status.REFUNDED)),
+            gross=Sum('amount', filter=paid),
+            commission=Sum('commission', filter=paid),
+            net=Sum('photographer_amount', filter=paid),
+        )
+        return {key: value if key.endswith('_count') else (value or ledger.ZERO).quantize(Decimal('0.01'))
+                for key, value in result.items()}
+
+    def test_totals_match_purchases(self):
+        self.pay(self.buyers[0], self.photos[:3])
+        self.pay(self.buyers[1], self.photos[2:])
+
+        refund = Purchase.objects.filter(photo=self.photos[1]).get()
+        with self.captureOnCommitCallbacks(execute=True):
+            refund.status = Purchase.Status.REFUNDED
+            refund.save()
+        cancel = Purchase.objects.filter(photo=self.photos[4]).get()
+        with self.captureOnCommitCallbacks(execute=True):
+            cancel.status = Purchase.Status.FAILED
+            cancel.save()
+
+        totals = rollups.totals(self.photographer)
+        self.assertEqual(totals, self.expected())
+        self.assertEqual((totals['sales_count'], totals['refunds_count']), (4, 1))
+        self.assertEqual(totals['gross'], Decimal('799.80'))
+        self.assertEqual(totals['commission'] + totals['net'], totals['gross'])
+
+        # Пересчёт одним GROUP BY даёт те же итоги
+        rollups.rebuild()
+        self.assertEqual(rollups.totals(self.photographer), totals)
+
+    def test_period(self):
+        self.pay(self.buyers[0], self.photos[:2])
+        today = timezone.localdate()
+        Purchase.objects.filter(photo=self.photos[0]).update(paid_at=timezone.now() - timedelta(days=3))
+        rollups.rebuild()
+
+        self.assertEqual(rollups.totals(self.photographer, since=today),
+                         self.expected(paid_at__date__gte=today))
+        self.assertEqual(rollups.totals(self.photographer, until=today - timedelta(days=1))['gross'],
+                         Decimal('100.00'))
+        self.assertEqual(rollups.totals(self.photographer), self.expected())
@@ -5,6 +5,15 @@ app_name = 'payments'
 
 urlpatterns = [
     path('buy/<uuid:photo_id>/', views.create_payment, name='create_payment'),
+    
+    # Корзина и заказы
+    path('cart/', views.cart, name='cart'),
+    path('cart/add/<uuid:photo_id>/', views.cart_add, name='cart_add'),
+    path('cart/remove/<uuid:photo_id>/', views.cart_remove, name='cart_remove'),
+    path('checkout/', views.checkout, name='checkout'),
+    path('bundle/<int:event_id>/', views.buy_bundle, name='buy_bundle'),
+    path('orders/<uuid:order_id>/', views.order_detail, name='order'),
+    
     path('success/<uuid:purchase_id>/', views.payment_success, name='success'),
     path('download/<uuid:purchase_id>/<str:token>/', views.download_photo, name='download'),
     path('webhook/yookassa/', views.yookassa_webhook, name='yookassa_webhook'),
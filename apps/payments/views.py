@@ -1,18 +1,20 @@
 """
 Views для платежей
 """
-import uuid
+import os
 from decimal import Decimal
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from django.conf import settings
-from django.utils import timezone
+from django.urls import reverse
+from django.utils.http import url_has_allowed_host_and_scheme
 
 from apps.photos.models import Photo
-from apps.payments.models import Purchase, Transaction
+from apps.payments import pricing, services, webhooks
+from apps.payments.models import Order, Purchase
 
 
 @login_required
@@ -34,67 +36,115 @@ def create_payment(request, photo_id):
     if existing:
         return redirect('clients:photo_detail', pk=photo_id)
     
-    # Создаём покупку
-    purchase = Purchase.objects.create(
-        buyer=profile,
-        photo=photo,
-        photographer=photo.photographer,
-        amount=photo.price,
-        download_token=str(uuid.uuid4())
-    )
+    # Заказ из одного фото, платёж - через PAYMENT_BACKEND
+    try:
+        order = services.create_order(profile, [photo])
+        order = services.pay_order(order, request.build_absolute_uri(reverse('payments:order', args=[order.id])))
+    except services.CheckoutError as e:
+        messages.error(request, str(e))
+        return redirect('clients:photo_detail', pk=photo_id)
     
-    # Здесь интеграция с ЮКассой
-    # В реальном проекте:
-    # from yookassa import Configuration, Payment
-    # Configuration.account_id = settings.YOOKASSA_SHOP_ID
-    # Configuration.secret_key = settings.YOOKASSA_SECRET_KEY
-    # 
-    # payment = Payment.create({
-    #     "amount": {"value": str(photo.price), "currency": "RUB"},
-    #     "confirmation": {"type": "redirect", "return_url": f"{request.build_absolute_uri('/payments/callback/')}?purchase_id={purchase.id}"},
-    #     "capture": True,
-    #     "description": f"Покупка фото #{photo.id}"
-    # })
-    # 
-    # purchase.payment_id = payment.id
-    # purchase.payment_url = payment.confirmation.confirmation_url
-    # purchase.save()
-    # return redirect(purchase.payment_url)
-    
-    # Для демо - сразу помечаем как оплаченное
-    purchase.status = 'paid'
-    purchase.paid_at = timezone.now()
-    purchase.save()
+    if order.status != Order.Status.PAID:
+        return redirect(order.payment_url or reverse('payments:order', args=[order.id]))
     
-    # Обновляем баланс фотографа
-    photographer = photo.photographer
-    photographer.balance += purchase.photographer_amount
-    photographer.total_earned += purchase.photographer_amount
-    photographer.save()
-    
-    # Обновляем статистику клиента
-    profile.total_purchases += 1
-    profile.total_spent += purchase.amount
-    profile.save()
-    
-    # Создаём транзакции
-    Transaction.objects.create(
-        user=request.user,
-        transaction_type='purchase',
-        amount=purchase.amount,
-        purchase=purchase,
-        description=f"Покупка фото {photo.id}"
-    )
+    purchase = order.purchases.get()
+    return redirect('payments:success', purchase_id=purchase.id)
+
+
+@login_required
+def cart(request):
+    """Корзина клиента"""
+    if not request.user.is_client:
+        return redirect('accounts:dashboard')
     
-    Transaction.objects.create(
-        user=photographer.user,
-        transaction_type='sale',
-        amount=purchase.photographer_amount,
-        purchase=purchase,
-        description=f"Продажа фото {photo.id}"
-    )
+    photos = services.cart_photos(request.user.client_profile)
+    prices = pricing.price_photos(photos)
+    subtotal = sum((photo.price for photo in photos), Decimal('0'))
+    total = sum(prices.values(), Decimal('0'))
+    return render(request, 'payments/cart.html', {
+        'photos': photos,
+        'subtotal': subtotal,
+        'discount': subtotal - total,
+        'total': total,
+    })
+
+
+@login_required
+@require_POST
+def cart_add(request, photo_id):
+    """Добавление фото в корзину"""
+    if not request.user.is_client:
+        return redirect('accounts:dashboard')
     
-    return redirect('payments:success', purchase_id=purchase.id)
+    photo = get_object_or_404(Photo, id=photo_id, status='active')
+    if services.add_to_cart(request.user.client_profile, photo):
+        messages.success(request, 'Фото добавлено в корзину')
+    else:
+        messages.info(request, 'Фото уже в корзине или куплено')
+    next_url = request.POST.get('next', '')
+    if url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return redirect(next_url)
+    return redirect('payments:cart')
+
+
+@login_required
+@require_POST
+def cart_remove(request, photo_id):
+    """Удаление фото из корзины"""
+    if request.user.is_client:
+        services.remove_from_cart(request.user.client_profile, photo_id)
+    return redirect('payments:cart')
+
+
+@login_required
+@require_POST
+def checkout(request):
+    """
+    Оформление заказа: все фото корзины - покупки одного заказа
+    с одним платежом у провайдера
+    """
+    if not request.user.is_client:
+        return redirect('accounts:dashboard')
+    
+    profile = request.user.client_profile
+    try:
+        order = services.create_order(profile, services.cart_photos(profile))
+        order = services.pay_order(order, request.build_absolute_uri(reverse('payments:order', args=[order.id])))
+    except services.CheckoutError as e:
+        messages.error(request, str(e))
+        return redirect('payments:cart')
+    
+    if order.status != Order.Status.PAID and order.payment_url:
+        return redirect(order.payment_url)
+    return redirect('payments:order', order_id=order.id)
+
+
+@login_required
+@require_POST
+def buy_bundle(request, event_id):
+    """Покупка всех фото клиента с события по цене предложения"""
+    if not request.user.is_client:
+        return redirect('accounts:dashboard')
+    
+    photos, prices = pricing.bundle(request.user, event_id)
+    try:
+        order = services.create_order(request.user.client_profile, photos, prices)
+        order = services.pay_order(order, request.build_absolute_uri(reverse('payments:order', args=[order.id])))
+    except services.CheckoutError as e:
+        messages.error(request, str(e))
+        return redirect('clients:my_photos')
+    
+    if order.status != Order.Status.PAID and order.payment_url:
+        return redirect(order.payment_url)
+    return redirect('payments:order', order_id=order.id)
+
+
+@login_required
+def order_detail(request, order_id):
+    """Заказ: статус оплаты и ссылки на скачивание"""
+    order = get_object_or_404(Order, id=order_id, buyer__user=request.user)
+    purchases = order.purchases.select_related('photo').order_by('photo__taken_at', 'photo_id')
+    return render(request, 'payments/order.html', {'order': order, 'purchases': purchases})
 
 
 def payment_success(request, purchase_id):
@@ -131,46 +181,33 @@ def download_photo(request, purchase_id, token):
     purchase.download_count += 1
     purchase.save()
     
-    # Отдаём файл
+    # Отдаёт фронтовой прокси (X-Accel-Redirect) или хранилище, не воркер
+    from apps.photos.media import serve_protected
     photo = purchase.photo
-    response = HttpResponse(photo.original.read(), content_type='image/jpeg')
-    response['Content-Disposition'] = f'attachment; filename="photo_{photo.id}.jpg"'
-    return response
+    extension = os.path.splitext(photo.original.name)[1] or '.jpg'
+    return serve_protected(
+        photo.original.name,
+        download_name=f'photo_{photo.id}{extension}',
+        storage=photo.original.storage,
+    )
 
 
 @csrf_exempt
 @require_POST
 def yookassa_webhook(request):
-    """Webhook для уведомлений от ЮКассы"""
+    """
+    Webhook для уведомлений от ЮКассы
+    Уведомление сохраняется и подтверждается сразу, применяется пачкой
+    (apps.payments.webhooks); повторная доставка не начисляет дважды
+    """
     import json
     
     try:
         data = json.loads(request.body)
-        event_type = data.get('event')
-        
-        if event_type == 'payment.succeeded':
-            payment_id = data['object']['id']
-            
-            purchase = Purchase.objects.filter(payment_id=payment_id).first()
-            if purchase and purchase.status == 'pending':
-                purchase.status = 'paid'
-                purchase.paid_at = timezone.now()
-                purchase.save()
-                
-                # Обновляем баланс фотографа
-                photographer = purchase.photographer
-                photographer.balance += purchase.photographer_amount
-                photographer.total_earned += purchase.photographer_amount
-                photographer.save()
-        
-        elif event_type == 'payment.canceled':
-            payment_id = data['object']['id']
-            purchase = Purchase.objects.filter(payment_id=payment_id).first()
-            if purchase:
-                purchase.status = 'failed'
-                purchase.save()
-        
-        return JsonResponse({'status': 'ok'})
-    
-    except Exception as e:
+        event, created = webhooks.ingest(data)
+    except (ValueError, webhooks.WebhookError) as e:
         return JsonResponse({'error': str(e)}, status=400)
+    
+    if created:
+        webhooks.enqueue_processing()
+    return JsonResponse({'status': 'ok', 'duplicate': not created})
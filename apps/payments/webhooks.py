@@ -0,0 +1,166 @@
+"""
+Приём и обработка уведомлений платёжного провайдера
+
+1. ingest: view сохраняет уведомление в WebhookEvent и сразу отвечает 200.
+   Ключ (провайдер, тип события, ID платежа) уникален, поэтому повторная
+   доставка при ретраях провайдера не создаёт второго события
+2. process_pending: события применяются пачками по WEBHOOK_BATCH_SIZE в
+   одной транзакции. Заказы и покупки пачки блокируются select_for_update,
+   начисления - через F() (apps.payments.services)
+
+Ошибка одного события откатывает только его (savepoint); событие
+повторяется до WEBHOOK_MAX_ATTEMPTS раз, затем помечается failed.
+"""
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import services
+from .models import Order, Purchase, WebhookEvent
+
+
+logger = logging.getLogger(__name__)
+
+SUCCEEDED = 'payment.succeeded'
+CANCELED = 'payment.canceled'
+HANDLED_EVENTS = (SUCCEEDED, CANCELED)
+
+
+class WebhookError(Exception):
+    """Уведомление нельзя разобрать - провайдеру отвечаем 400"""
+
+
+def batch_size() -> int:
+    return getattr(settings, 'WEBHOOK_BATCH_SIZE', 100)
+
+
+def max_attempts() -> int:
+    return getattr(settings, 'WEBHOOK_MAX_ATTEMPTS', 5)
+
+
+def parse(data) -> dict:
+    """Поля WebhookEvent из тела уведомления (формат ЮКассы)"""
+    if not isinstance(data, dict) or not isinstance(data.get('object'), dict):
+        raise WebhookError('Некорректное уведомление')
+    event_type = str(data.get('event') or '')
+    payment_id = str(data['object'].get('id') or '')
+    if not event_type or not payment_id:
+        raise WebhookError('Нет типа события или ID платежа')
+    return {
+        'event_id': f'{event_type}:{payment_id}',
+        'event_type': event_type,
+        'payment_id': payment_id,
+        'payload': data,
+    }
+
+
+def ingest(data, provider='yookassa'):
+    """
+    Сохраняет уведомление, возвращает (событие, создано ли)
+    Повторная доставка возвращает уже сохранённое событие
+    """
+    fields = parse(data)
+    try:
+        with transaction.atomic():
+            return WebhookEvent.objects.create(provider=provider, **fields), True
+    except IntegrityError:
+        event = WebhookEvent.objects.get(provider=provider, event_id=fields['event_id'])
+        return event, False
+
+
+def _apply(event, target) -> bool:
+    """Применяет событие к заказу или покупке, True - что-то изменилось"""
+    if target is None:
+        raise LookupError(f'Заказ или покупка с платежом {event.payment_id} не найдены')
+    if isinstance(target, Order):
+        if event.event_type == SUCCEEDED:
+            return services.complete_order(target)
+        return services.fail_order(target)
+    if event.event_type == SUCCEEDED:
+        return services.complete_purchase(target)
+    return services.fail_purchase(target)
+
+
+def process_batch(after=0, limit=None) -> list:
+    """
+    Применяет пачку необработанных событий с id больше after,
+    возвращает события пачки
+    Параллельные обработчики берут разные пачки (skip_locked)
+    """
+    limit = limit or batch_size()
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            WebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(status=WebhookEvent.Status.RECEIVED, id__gt=after)
+            .order_by('id')[:limit]
+        )
+        if not events:
+            return events
+
+        payment_ids = {event.payment_id for event in events if event.event_type in HANDLED_EVENTS}
+        # Платёж заказа из корзины; отдельные покупки - старые платежи по одному фото
+        targets = {
+            order.payment_id: order
+            for order in Order.objects.select_for_update(of=('self',))
+            .filter(payment_id__in=payment_ids)
+            .select_related('buyer')
+        }
+        targets.update({
+            purchase.payment_id: purchase
+            for purchase in Purchase.objects.select_for_update(of=('self',))
+            .filter(payment_id__in=payment_ids - set(targets), order__isnull=True)
+            .select_related('buyer')
+        })
+
+        for event in events:
+            event.attempts += 1
+            if event.event_type not in HANDLED_EVENTS:
+                event.status = WebhookEvent.Status.IGNORED
+                event.processed_at = now
+                continue
+            try:
+                with transaction.atomic():
+                    changed = _apply(event, targets.get(event.payment_id))
+            except Exception as e:
+                logger.warning('Webhook %s: %s', event.event_id, e)
+                event.error = str(e)
+                if event.attempts >= max_attempts():
+                    event.status = WebhookEvent.Status.FAILED
+                continue
+            event.status = WebhookEvent.Status.PROCESSED if changed else WebhookEvent.Status.IGNORED
+            event.error = ''
+            event.processed_at = now
+
+        WebhookEvent.objects.bulk_update(events, ['status', 'attempts', 'error', 'processed_at'])
+    return events
+
+
+def process_pending() -> int:
+    """
+    Применяет необработанные события пачками, возвращает их число
+    Каждое событие пробуется один раз за вызов: событие с ошибкой
+    остаётся в очереди до следующего запуска
+    """
+    total = 0
+    last_id = 0
+    while True:
+        events = process_batch(after=last_id)
+        if not events:
+            return total
+        total += len(events)
+        last_id = events[-1].id
+
+
+def enqueue_processing():
+    """
+    С WEBHOOK_ASYNC - задача Celery после коммита транзакции,
+    иначе события применяются сразу
+    """
+    if getattr(settings, 'WEBHOOK_ASYNC', False):
+        from .tasks import process_webhook_events
+        transaction.on_commit(lambda: process_webhook_events.delay())
+        return 0
+    return process_pending()
@@ -2,6 +2,7 @@
 Формы для кабинета фотографа
 """
 from django import forms
+from apps.payments.models import PriceTier
 from apps.photos.models import Event, Photo
 
 
@@ -23,6 +24,51 @@ class EventForm(forms.ModelForm):
         }
 
 
+class LoadedObjectField(forms.ModelChoiceField):
+    """Скрытый id строки formset: объект из уже загруженных, без запроса"""
+    
+    def __init__(self, objects, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.objects = objects
+    
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        obj = self.objects.get(str(value))
+        if obj is None:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return obj
+
+
+class BasePriceTierFormSet(forms.BaseInlineFormSet):
+    """Строки скидок события проверяются по одному запросу на formset"""
+    
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        if not hasattr(self, '_loaded_objects'):
+            self._loaded_objects = {str(obj.pk): obj for obj in self.get_queryset()}
+        field = form.fields[self._pk_field.name]
+        form.fields[self._pk_field.name] = LoadedObjectField(
+            self._loaded_objects, field.queryset, initial=field.initial, required=False, widget=field.widget
+        )
+
+
+# Скидки события (apps.payments.pricing)
+PriceTierFormSet = forms.inlineformset_factory(
+    Event,
+    PriceTier,
+    formset=BasePriceTierFormSet,
+    fields=['kind', 'min_photos', 'value'],
+    extra=2,
+    can_delete=True,
+    widgets={
+        'kind': forms.Select(attrs={'class': 'form-select form-select-sm'}),
+        'min_photos': forms.NumberInput(attrs={'class': 'form-control form-control-sm', 'min': 1}),
+        'value': forms.NumberInput(attrs={'class': 'form-control form-control-sm', 'min': 0, 'step': '1'}),
+    },
+)
+
+
 class PhotoUploadForm(forms.ModelForm):
     """Форма загрузки одного фото"""
     
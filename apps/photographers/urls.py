@@ -15,11 +15,17 @@ urlpatterns = [
     # Фотографии
     path('photos/', views.PhotoListView.as_view(), name='photos'),
     path('photos/upload/', views.photo_upload, name='photo_upload'),
+    
+    # Загрузка по частям (JSON API)
+    path('uploads/', views.upload_sessions, name='upload_sessions'),
+    path('uploads/<uuid:pk>/', views.upload_session, name='upload_session'),
+    path('uploads/<uuid:pk>/commit/', views.upload_session_commit, name='upload_session_commit'),
     path('photos/<uuid:pk>/edit/', views.photo_edit, name='photo_edit'),
     path('photos/<uuid:pk>/delete/', views.photo_delete, name='photo_delete'),
     
     # Продажи
     path('sales/', views.SalesListView.as_view(), name='sales'),
+    path('sales/chart/', views.earnings_chart, name='earnings_chart'),
     
     # Запросы на удаление
     path('deletion-requests/', views.DeletionRequestListView.as_view(), name='deletion_requests'),
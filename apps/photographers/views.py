@@ -1,19 +1,24 @@
 """
 Views для кабинета фотографа
 """
+import json
+from decimal import Decimal, InvalidOperation
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView
 from django.urls import reverse_lazy
 from django.contrib import messages
-from django.db.models import Sum, Count
 from django.utils import timezone
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods, require_POST
 
 from apps.accounts.models import PhotographerProfile
 from apps.photos.models import Event, Photo, DeletionRequest
-from apps.payments.models import Purchase, Withdrawal
-from .forms import EventForm, PhotoUploadForm, BulkPhotoUploadForm, WithdrawalForm, PhotoEditForm
+from apps.payments import ledger, rollups
+from apps.payments.models import Purchase
+from .forms import EventForm, PhotoUploadForm, BulkPhotoUploadForm, WithdrawalForm, PhotoEditForm, PriceTierFormSet
 
 
 class PhotographerRequiredMixin(UserPassesTestMixin):
@@ -45,14 +50,9 @@ class DashboardView(LoginRequiredMixin, PhotographerRequiredMixin, TemplateView)
             status='paid'
         ).select_related('buyer__user', 'photo')[:5]
         
-        # Доход за месяц
-        month_start = timezone.now().replace(day=1, hour=0, minute=0, second=0)
-        month_sales = Purchase.objects.filter(
-            photographer=profile,
-            status='paid',
-            paid_at__gte=month_start
-        ).aggregate(total=Sum('photographer_amount'))
-        context['month_earnings'] = month_sales['total'] or 0
+        # Доход за месяц - из дневных агрегатов
+        month_start = timezone.localdate().replace(day=1)
+        context['month_earnings'] = rollups.totals(profile, since=month_start)['net']
         
         return context
 
@@ -90,6 +90,20 @@ class EventUpdateView(LoginRequiredMixin, PhotographerRequiredMixin, UpdateView)
     def get_queryset(self):
         return Event.objects.filter(photographer=self.request.user.photographer_profile)
     
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.setdefault('tiers_formset', PriceTierFormSet(instance=self.object))
+        return context
+    
+    def post(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        form = self.get_form()
+        tiers_formset = PriceTierFormSet(request.POST, instance=self.object)
+        if form.is_valid() and tiers_formset.is_valid():
+            tiers_formset.save()
+            return self.form_valid(form)
+        return self.render_to_response(self.get_context_data(form=form, tiers_formset=tiers_formset))
+    
     def form_valid(self, form):
         messages.success(self.request, 'Событие обновлено!')
         return super().form_valid(form)
@@ -137,17 +151,29 @@ def photo_upload(request):
             price = form.cleaned_data['price']
             
             # Импортируем сервис обработки
+            from apps.photos import uploads
             from apps.photos.services import photo_service
             
-            processed = 0
+            processed = skipped = reused = 0
             for f in files:
-                photo = Photo.objects.create(
+                photo = Photo(
                     photographer=profile,
                     event=event,
-                    original=f,
                     price=price,
                     status='processing'
                 )
+                
+                # Точные дубликаты: в том же событии пропускаем,
+                # в другом - берём готовые версии и лица без обработки
+                result, photo = uploads.store_photo(photo, f)
+                if result == uploads.DUPLICATE:
+                    skipped += 1
+                    continue
+                if result == uploads.REUSED:
+                    reused += 1
+                    processed += 1
+                    continue
+                
                 # Обрабатываем фото (превью, водяной знак, лица)
                 if photo_service.process_photo(photo):
                     processed += 1
@@ -157,7 +183,12 @@ def photo_upload(request):
                 event.photos_count = Photo.objects.filter(event=event, status='active').count()
                 event.save()
             
-            messages.success(request, f'Загружено и обработано {processed} из {len(files)} фото!')
+            summary = f'Загружено и обработано {processed} из {len(files)} фото!'
+            if reused:
+                summary += f' Уже обработанных копий из других событий: {reused}.'
+            if skipped:
+                summary += f' Пропущено дубликатов в этом событии: {skipped}.'
+            messages.success(request, summary)
             return redirect('photographers:photos')
     else:
         form = BulkPhotoUploadForm(profile)
@@ -165,6 +196,111 @@ def photo_upload(request):
     return render(request, 'photographers/photos/upload.html', {'form': form})
 
 
+# ===== API загрузки по частям (apps.photos.uploads) =====
+
+def _upload_error(error):
+    return JsonResponse({'error': str(error), **error.extra}, status=error.status)
+
+
+def _photographer_session(request, pk):
+    from apps.photos.models import UploadSession
+    
+    return get_object_or_404(UploadSession, pk=pk, photographer=request.user.photographer_profile)
+
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def upload_sessions(request):
+    """
+    GET - незавершённые загрузки фотографа (для продолжения)
+    POST {filename, size, sha256, event, price} - начать загрузку файла
+    """
+    from apps.photos import uploads
+    
+    if not request.user.is_photographer:
+        return JsonResponse({'error': 'Только для фотографов'}, status=403)
+    profile = request.user.photographer_profile
+    
+    if request.method == 'GET':
+        sessions = profile.upload_sessions.filter(status='open').order_by('created_at')
+        return JsonResponse({'sessions': [uploads.session_data(session) for session in sessions]})
+    
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            return JsonResponse({'error': 'Некорректный запрос'}, status=400)
+        event = None
+        if data.get('event'):
+            event = Event.objects.filter(pk=data['event'], photographer=profile).first()
+            if event is None:
+                return JsonResponse({'error': 'Событие не найдено'}, status=404)
+        price = Decimal(str(data['price'])) if data.get('price') not in (None, '') else None
+        if price is not None and price < 0:
+            raise uploads.UploadError('Некорректная цена')
+        session = uploads.create_session(
+            profile, data.get('filename'), data.get('size'), data.get('sha256'),
+            event=event, price=price,
+        )
+    except (ValueError, TypeError, InvalidOperation):
+        return JsonResponse({'error': 'Некорректный запрос'}, status=400)
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    
+    return JsonResponse(uploads.session_data(session), status=201 if session.received == 0 else 200)
+
+
+@login_required
+@require_http_methods(['GET', 'PUT', 'DELETE'])
+def upload_session(request, pk):
+    """
+    GET - состояние загрузки (смещение для продолжения)
+    PUT - часть файла, смещение в заголовке Upload-Offset
+    DELETE - отменить загрузку
+    """
+    from apps.photos import uploads
+    
+    if not request.user.is_photographer:
+        return JsonResponse({'error': 'Только для фотографов'}, status=403)
+    session = _photographer_session(request, pk)
+    
+    if request.method == 'PUT':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            return JsonResponse({'error': 'Нужны заголовки Upload-Offset и Content-Length'}, status=400)
+        try:
+            # Тело читается потоком, без загрузки части в память целиком
+            uploads.append_chunk(session, offset, request, length)
+        except uploads.UploadError as e:
+            return _upload_error(e)
+        session.refresh_from_db()
+    elif request.method == 'DELETE':
+        uploads.abort(session)
+    
+    return JsonResponse(uploads.session_data(session))
+
+
+@login_required
+@require_POST
+def upload_session_commit(request, pk):
+    """Завершить загрузку: проверка размера и SHA-256, создание фото и обработка"""
+    from apps.photos import uploads
+    
+    if not request.user.is_photographer:
+        return JsonResponse({'error': 'Только для фотографов'}, status=403)
+    session = _photographer_session(request, pk)
+    
+    try:
+        session = uploads.commit(session)
+    except uploads.UploadError as e:
+        return _upload_error(e)
+    
+    data = uploads.session_data(session)
+    data['photo_status'] = session.photo.status if session.photo else None
+    return JsonResponse(data)
+
+
 @login_required
 def photo_edit(request, pk):
     """Редактирование фотографии"""
@@ -236,14 +372,44 @@ class SalesListView(LoginRequiredMixin, PhotographerRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         profile = self.request.user.photographer_profile
         
-        total = Purchase.objects.filter(
-            photographer=profile, status='paid'
-        ).aggregate(total=Sum('photographer_amount'))
-        context['total_earned'] = total['total'] or 0
+        context['total_earned'] = rollups.totals(profile)['net']
         
         return context
 
 
+@login_required
+def earnings_chart(request):
+    """
+    Продажи по дням для графика (JSON)
+    ?days=30 - период до сегодняшнего дня, ?event=<id> - одно событие
+    """
+    if not request.user.is_photographer:
+        return JsonResponse({'error': 'Только для фотографов'}, status=403)
+    profile = request.user.photographer_profile
+    
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        return JsonResponse({'error': 'Некорректный период'}, status=400)
+    
+    event = None
+    if request.GET.get('event'):
+        event = Event.objects.filter(pk=request.GET['event'], photographer=profile).first()
+        if event is None:
+            return JsonResponse({'error': 'Событие не найдено'}, status=404)
+    
+    series = rollups.daily_series(profile, days=days, event=event)
+    return JsonResponse({
+        'event': event.pk if event else None,
+        'days': series,
+        'total': {
+            'sales_count': sum(day['sales_count'] for day in series),
+            'gross': str(sum(Decimal(day['gross']) for day in series)),
+            'net': str(sum(Decimal(day['net']) for day in series)),
+        },
+    })
+
+
 class DeletionRequestListView(LoginRequiredMixin, PhotographerRequiredMixin, ListView):
     """Запросы на удаление"""
     template_name = 'photographers/deletion_requests.html'
@@ -306,16 +472,11 @@ def withdrawal_request(request):
         if form.is_valid():
             amount = form.cleaned_data['amount']
             
-            if amount > profile.balance:
+            try:
+                ledger.withdraw(profile, amount, form.cleaned_data['bank_card'])
+            except ledger.LedgerError:
                 messages.error(request, 'Недостаточно средств на балансе.')
             else:
-                Withdrawal.objects.create(
-                    photographer=profile,
-                    amount=amount,
-                    bank_card=form.cleaned_data['bank_card']
-                )
-                profile.balance -= amount
-                profile.save()
                 messages.success(request, f'Заявка на вывод {amount}₽ создана.')
                 return redirect('photographers:dashboard')
     else:
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Event, Photo, PhotoFace, DeletionRequest
+from .models import Event, Photo, PhotoFace, DeletionRequest, PhotoProcessingRecord, UploadSession
 
 
 @admin.register(Event)
@@ -15,7 +15,8 @@ class PhotoAdmin(admin.ModelAdmin):
     list_display = ['id', 'photographer', 'event', 'status', 'price', 'faces_count', 'views_count', 'created_at']
     list_filter = ['status', 'faces_processed', 'created_at']
     search_fields = ['id', 'photographer__user__username', 'title']
-    readonly_fields = ['faces_count', 'faces_processed', 'width', 'height', 'file_size']
+    readonly_fields = ['faces_count', 'faces_processed', 'width', 'height', 'file_size', 'perceptual_hash']
+    raw_id_fields = ['burst_leader']
 
 
 @admin.register(PhotoFace)
@@ -30,3 +31,19 @@ class DeletionRequestAdmin(admin.ModelAdmin):
     list_display = ['id', 'photo', 'requester', 'status', 'created_at', 'processed_at']
     list_filter = ['status', 'created_at']
     search_fields = ['photo__id', 'requester__username', 'reason']
+
+
+@admin.register(PhotoProcessingRecord)
+class PhotoProcessingRecordAdmin(admin.ModelAdmin):
+    list_display = ['photo', 'total_ms', 'width', 'height', 'faces_count', 'processed_at']
+    list_filter = ['processed_at']
+    search_fields = ['photo__id', 'error']
+    readonly_fields = ['photo', 'stages_ms', 'total_ms', 'width', 'height', 'faces_count', 'error', 'processed_at']
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'photographer', 'filename', 'received', 'size', 'status', 'updated_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['id', 'filename', 'sha256', 'photographer__user__username']
+    readonly_fields = ['photographer', 'event', 'filename', 'size', 'sha256', 'received', 'photo', 'error']
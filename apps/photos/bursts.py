@@ -0,0 +1,185 @@
+"""
+Серии кадров (burst) по перцептивному хешу
+- dHash 64 бита по превью: яркость соседних пикселей в уменьшенном сером кадре
+- Кадр попадает в серию, если снят в пределах BURST_WINDOW_SECONDS от
+  соседнего кадра события и его хеш отличается не более чем на
+  BURST_MAX_DISTANCE бит
+- Серия хранится ссылкой на первый кадр (Photo.burst_leader), у первого
+  кадра ссылка пустая
+
+Кадры без времени съёмки в серии не объединяются: порядок загрузки
+не говорит, что кадры сняты подряд.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Func, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .lazy import lazy_import
+
+Image = lazy_import('PIL.Image')
+np = lazy_import('numpy')
+
+
+# Сторона сетки хеша: 8x8 сравнений = 64 бита
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+HASH_MASK = (1 << HASH_BITS) - 1
+
+
+def max_distance() -> int:
+    """Порог расстояния Хэмминга для кадров одной серии"""
+    return getattr(settings, 'BURST_MAX_DISTANCE', 10)
+
+
+def propagate_distance() -> int:
+    """Порог, при котором лица соседнего кадра переносятся без распознавания"""
+    return getattr(settings, 'BURST_PROPAGATE_DISTANCE', 6)
+
+
+def window() -> timedelta:
+    """Наибольший промежуток между соседними кадрами серии"""
+    return timedelta(seconds=getattr(settings, 'BURST_WINDOW_SECONDS', 3))
+
+
+def dhash(img) -> int:
+    """
+    dHash изображения (обычно превью): знаковое 64-битное число,
+    чтобы помещаться в BigIntegerField
+    """
+    gray = img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR)
+    if np is not None:
+        pixels = np.asarray(gray, dtype=np.int16)
+        bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+        value = int.from_bytes(np.packbits(bits).tobytes(), 'big')
+    else:
+        pixels = list(gray.getdata())
+        value = 0
+        for row in range(HASH_SIZE):
+            line = pixels[row * (HASH_SIZE + 1):(row + 1) * (HASH_SIZE + 1)]
+            for left, right in zip(line, line[1:]):
+                value = (value << 1) | (right > left)
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def hamming(a: int, b: int) -> int:
+    """Число различающихся бит двух хешей"""
+    return bin((a ^ b) & HASH_MASK).count('1')
+
+
+def find_sibling(photo):
+    """
+    Ближайший по хешу обработанный кадр той же серии:
+    то же событие, снят не дальше window() и отличается не более чем на
+    max_distance() бит
+    Возвращает (фото, расстояние) или (None, None)
+    """
+    from .models import Photo
+
+    if photo.perceptual_hash is None or photo.taken_at is None or not photo.event_id:
+        return None, None
+
+    gap = window()
+    candidates = Photo.objects.filter(
+        event_id=photo.event_id,
+        status='active',
+        perceptual_hash__isnull=False,
+        taken_at__range=(photo.taken_at - gap, photo.taken_at + gap),
+    ).exclude(pk=photo.pk).only(
+        'id', 'perceptual_hash', 'burst_leader_id', 'width', 'height', 'faces_count', 'faces_processed'
+    )
+
+    best, best_distance = None, None
+    for candidate in candidates:
+        distance = hamming(photo.perceptual_hash, candidate.perceptual_hash)
+        if distance <= max_distance() and (best_distance is None or distance < best_distance):
+            best, best_distance = candidate, distance
+    return best, best_distance
+
+
+def can_propagate(photo, sibling, distance) -> bool:
+    """
+    Дешёвая проверка перед переносом лиц с соседнего кадра:
+    хеши почти совпадают и кадр того же размера и ориентации
+    """
+    return (
+        sibling is not None
+        and distance is not None
+        and distance <= propagate_distance()
+        and (sibling.width, sibling.height) == (photo.width, photo.height)
+    )
+
+
+def cluster(frames) -> dict:
+    """
+    Разбивает кадры события на серии
+    frames - [(id, taken_at, hash)], отсортированные по taken_at
+    Кадр продолжает серию, если он близок по времени и хешу к предыдущему
+    кадру. Возвращает {id: id первого кадра серии или None}
+    """
+    leaders = {}
+    gap, threshold = window(), max_distance()
+    previous = None
+    for photo_id, taken_at, value in frames:
+        leader = None
+        if (
+            previous is not None
+            and taken_at - previous[1] <= gap
+            and hamming(value, previous[2]) <= threshold
+        ):
+            leader = leaders[previous[0]] or previous[0]
+        leaders[photo_id] = leader
+        previous = (photo_id, taken_at, value)
+    return leaders
+
+
+def cluster_event(event) -> tuple:
+    """
+    Пересчитывает серии события, возвращает (серий, кадров в сериях)
+    Пишутся только изменившиеся ссылки
+    """
+    from .models import Photo
+
+    photos = list(
+        Photo.objects.filter(
+            event=event, status='active', perceptual_hash__isnull=False, taken_at__isnull=False
+        ).order_by('taken_at', 'id').only('id', 'taken_at', 'perceptual_hash', 'burst_leader_id')
+    )
+    leaders = cluster([(photo.id, photo.taken_at, photo.perceptual_hash) for photo in photos])
+
+    changed = []
+    for photo in photos:
+        if photo.burst_leader_id != leaders[photo.id]:
+            photo.burst_leader_id = leaders[photo.id]
+            changed.append(photo)
+    if changed:
+        Photo.objects.bulk_update(changed, ['burst_leader'], batch_size=500)
+
+    members = [leader for leader in leaders.values() if leader is not None]
+    return len(set(members)), len(members) + len(set(members))
+
+
+def collapse(queryset):
+    """
+    Оставляет по одному кадру на серию и добавляет burst_size - число
+    кадров серии в queryset (1 для одиночных) и burst_key - id первого
+    кадра серии (параметр burst для burst_photos)
+    Кадр серии - первый по времени съёмки среди кадров queryset: если
+    первый кадр скрыт, удалён или ждёт удаления, серию показывает следующий
+    """
+    key = OuterRef('burst_key')
+    visible = queryset.order_by().filter(Q(pk=key) | Q(burst_leader=key))
+    first = visible.order_by(F('taken_at').asc(nulls_last=True), 'pk').values('pk')[:1]
+    # COUNT без GROUP BY: одна строка на серию
+    size = visible.annotate(n=Func('pk', function='COUNT', output_field=IntegerField())).values('n')
+    return queryset.annotate(
+        burst_key=Coalesce('burst_leader', 'pk'),
+    ).filter(pk=Subquery(first)).annotate(
+        burst_size=Subquery(size),
+    )
+
+
+def burst_photos(queryset, leader_id):
+    """Все кадры серии по времени съёмки"""
+    return queryset.filter(Q(pk=leader_id) | Q(burst_leader_id=leader_id)).order_by('taken_at', 'id')
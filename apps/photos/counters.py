@@ -0,0 +1,186 @@
+"""
+Счётчики просмотров фото и событий (views_count)
+
+Просмотр не пишет в БД сразу:
+- повторный просмотр тем же посетителем в течение окна отбрасывается
+  (cache.add по ключу объект + сессия/пользователь)
+- приращения копятся в памяти процесса
+- раз в VIEW_COUNTER_FLUSH_SECONDS (или при переполнении буфера и при
+  выходе процесса) они сбрасываются одним UPDATE на пачку:
+  views_count = views_count + CASE id WHEN ... THEN delta END
+  По времени буфер сбрасывает фоновый поток процесса (запускается при
+  первом просмотре после fork), а не следующий просмотр: простаивающий
+  воркер не держит просмотры
+
+Окно потери: при аварийном завершении процесса (SIGKILL, OOM, kill по
+таймауту gunicorn) atexit не выполняется и теряются просмотры за
+последние VIEW_COUNTER_FLUSH_SECONDS, не больше VIEW_COUNTER_MAX_PENDING
+на процесс. Ошибка записи в БД ничего не теряет - приращения
+возвращаются в буфер.
+
+Пачки собираются по отсортированным ключам, чтобы параллельные сбросы
+из разных воркеров реже конфликтовали за одни и те же строки.
+Дедупликация идёт через кэш Django: с Redis окно общее для всех воркеров.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, models
+from django.db.models import Case, F, Value, When
+
+
+logger = logging.getLogger('apps.photos.counters')
+
+# Строк в одном UPDATE
+FLUSH_BATCH_SIZE = 500
+
+
+def visitor_key(request) -> str:
+    """Идентификатор посетителя: пользователь, сессия или IP + User-Agent"""
+    if request.user.is_authenticated:
+        return f'u{request.user.pk}'
+
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return f's{session.session_key}'
+
+    raw = f"{request.META.get('REMOTE_ADDR', '')}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return 'a' + hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+class ViewCounter:
+    """Буфер приращений views_count внутри процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(lambda: defaultdict(int))
+        self._size = 0
+        self._last_flush = time.monotonic()
+        self._flusher_pid = None
+
+    @property
+    def dedupe_seconds(self) -> int:
+        return getattr(settings, 'VIEW_COUNTER_DEDUPE_SECONDS', 30 * 60)
+
+    @property
+    def flush_seconds(self) -> float:
+        return getattr(settings, 'VIEW_COUNTER_FLUSH_SECONDS', 10)
+
+    @property
+    def max_pending(self) -> int:
+        return getattr(settings, 'VIEW_COUNTER_MAX_PENDING', 1000)
+
+    def record(self, obj, request) -> bool:
+        """
+        Учитывает просмотр объекта (Photo или Event)
+        Возвращает False, если это повтор в окне дедупликации
+        """
+        model = type(obj)
+        seen_key = f'views:seen:{model._meta.label_lower}:{obj.pk}:{visitor_key(request)}'
+        if not cache.add(seen_key, 1, timeout=self.dedupe_seconds):
+            return False
+
+        with self._lock:
+            self._pending[model][obj.pk] += 1
+            self._size += 1
+            due = (
+                self._size >= self.max_pending
+                or time.monotonic() - self._last_flush >= self.flush_seconds
+            )
+
+        if due:
+            self.flush()
+        self._ensure_flusher()
+        return True
+
+    def pending(self, obj) -> int:
+        """Накопленные, но ещё не записанные просмотры"""
+        with self._lock:
+            return self._pending.get(type(obj), {}).get(obj.pk, 0)
+
+    def flush_if_due(self) -> int:
+        """Сбрасывает буфер, если с прошлого сброса прошло flush_seconds"""
+        with self._lock:
+            due = self._size and time.monotonic() - self._last_flush >= self.flush_seconds
+        return self.flush() if due else 0
+
+    def _ensure_flusher(self):
+        """Запускает поток сброса по времени (один на процесс, заново после fork)"""
+        pid = os.getpid()
+        if self._flusher_pid == pid:
+            return
+        with self._lock:
+            if self._flusher_pid == pid:
+                return
+            self._flusher_pid = pid
+        threading.Thread(target=self._run_flusher, name='view-counter-flush', daemon=True).start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush_if_due()
+            except Exception:
+                logger.exception("Ошибка фонового сброса просмотров")
+            finally:
+                # Соединение потока не держим открытым между сбросами
+                connection.close()
+
+    def flush(self) -> int:
+        """Записывает накопленные приращения в БД, возвращает число строк"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+            self._size = 0
+            self._last_flush = time.monotonic()
+
+        updated = 0
+        for model, deltas in pending.items():
+            try:
+                updated += apply_deltas(model, deltas)
+            except Exception:
+                # Не теряем просмотры: вернём их в буфер до следующего сброса
+                logger.exception("Не удалось записать просмотры %s", model._meta.label)
+                with self._lock:
+                    for pk, delta in deltas.items():
+                        self._pending[model][pk] += delta
+                        self._size += delta
+        return updated
+
+
+def apply_deltas(model, deltas: dict) -> int:
+    """
+    Один UPDATE на пачку:
+    views_count = views_count + CASE WHEN id=... THEN delta ... END
+    """
+    updated = 0
+    pks = sorted(deltas)
+    for start in range(0, len(pks), FLUSH_BATCH_SIZE):
+        batch = pks[start:start + FLUSH_BATCH_SIZE]
+        increment = Case(
+            *[When(pk=pk, then=Value(deltas[pk])) for pk in batch],
+            default=Value(0),
+            output_field=models.PositiveIntegerField(),
+        )
+        updated += model.objects.filter(pk__in=batch).update(
+            views_count=F('views_count') + increment
+        )
+    return updated
+
+
+# Синглтон
+view_counter = ViewCounter()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        view_counter.flush()
+    except Exception:
+        pass
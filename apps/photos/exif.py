@@ -0,0 +1,147 @@
+"""
+Чтение метаданных и EXIF из изображений PIL
+Image.open() и Image.getexif() читают только заголовки,
+пиксели не декодируются
+"""
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+from .lazy import lazy_import
+
+Image = lazy_import('PIL.Image')
+
+
+# Теги EXIF
+EXIF_IFD = 0x8769
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_ORIENTATION = 0x0112
+TAG_DATETIME = 0x0132
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_OFFSET_TIME_ORIGINAL = 0x9011
+TAG_SUBSEC_TIME_ORIGINAL = 0x9291
+
+EXIF_DATETIME_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+# Ориентации EXIF, при которых ширина и высота меняются местами
+ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Длина Photo.camera_model
+CAMERA_MODEL_MAX_LENGTH = 100
+
+
+def _clean(value) -> str:
+    if isinstance(value, bytes):
+        value = value.decode('ascii', 'ignore')
+    return str(value or '').strip().strip('\x00').strip()
+
+
+def _parse_offset(value: str):
+    """'+03:00' -> tzinfo"""
+    value = _clean(value)
+    if len(value) != 6 or value[0] not in '+-' or value[3] != ':':
+        return None
+    try:
+        hours, minutes = int(value[1:3]), int(value[4:6])
+    except ValueError:
+        return None
+    sign = 1 if value[0] == '+' else -1
+    return dt_timezone(sign * timedelta(hours=hours, minutes=minutes))
+
+
+def read_taken_at(img):
+    """
+    Время съёмки из EXIF (DateTimeOriginal, иначе DateTime)
+    Без смещения OffsetTimeOriginal время считается локальным (TIME_ZONE)
+    Возвращает aware datetime или None
+    """
+    try:
+        exif = img.getexif()
+    except Exception:
+        return None
+    if not exif:
+        return None
+
+    details = exif.get_ifd(EXIF_IFD)
+    raw = _clean(details.get(TAG_DATETIME_ORIGINAL) or exif.get(TAG_DATETIME))
+    try:
+        taken_at = datetime.strptime(raw[:19], EXIF_DATETIME_FORMAT)
+    except ValueError:
+        return None
+
+    subsec = _clean(details.get(TAG_SUBSEC_TIME_ORIGINAL))
+    if subsec.isdigit():
+        taken_at = taken_at.replace(microsecond=int(subsec[:6].ljust(6, '0')))
+
+    offset = _parse_offset(details.get(TAG_OFFSET_TIME_ORIGINAL))
+    if offset is not None:
+        return taken_at.replace(tzinfo=offset)
+    try:
+        return timezone.make_aware(taken_at)
+    except Exception:
+        # Несуществующее локальное время (переход на летнее время)
+        return None
+
+
+def read_orientation(img) -> int:
+    """Ориентация из EXIF (1 - без поворота)"""
+    try:
+        orientation = int(img.getexif().get(TAG_ORIENTATION, 1))
+    except Exception:
+        return 1
+    return orientation if 1 <= orientation <= 8 else 1
+
+
+def read_camera_model(img) -> str:
+    """'Производитель Модель' без повтора производителя ('Canon Canon EOS R5')"""
+    try:
+        exif = img.getexif()
+    except Exception:
+        return ''
+    make = _clean(exif.get(TAG_MAKE))
+    model = _clean(exif.get(TAG_MODEL))
+    if make and model.lower().startswith(make.split()[0].lower()):
+        make = ''
+    return ' '.join(part for part in (make, model) if part)[:CAMERA_MODEL_MAX_LENGTH]
+
+
+def read_metadata(img) -> dict:
+    """
+    Метаданные открытого (не декодированного) изображения
+    width/height - с учётом ориентации, как фото будет показано
+    """
+    width, height = img.size
+    orientation = read_orientation(img)
+    if orientation in ROTATED_ORIENTATIONS:
+        width, height = height, width
+    return {
+        'width': width,
+        'height': height,
+        'orientation': orientation,
+        'taken_at': read_taken_at(img),
+        'camera_model': read_camera_model(img),
+    }
+
+
+def read_file_metadata(file) -> dict:
+    """
+    Метаданные из файла (путь или файловый объект) плюс file_size
+    Файловый объект возвращается на начало; при ошибке - пустой dict
+    """
+    position = file.tell() if hasattr(file, 'tell') else None
+    try:
+        with Image.open(file) as img:
+            metadata = read_metadata(img)
+    except Exception:
+        return {}
+    finally:
+        if position is not None:
+            file.seek(position)
+
+    if isinstance(file, (str, os.PathLike)):
+        metadata['file_size'] = os.path.getsize(file)
+    else:
+        metadata['file_size'] = getattr(file, 'size', 0) or 0
+    return metadata
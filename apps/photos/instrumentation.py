@@ -0,0 +1,209 @@
+"""
+Замер времени этапов обработки фотографий
+- Спаны по этапам (открытие, EXIF, превью, водяной знак, лица, запись)
+- Структурированные логи (одна JSON-строка на фото)
+- Гистограммы по этапам в формате Prometheus
+
+Фото обрабатывают воркеры Celery, а /photos/metrics/ отдаёт веб-воркер,
+поэтому гистограммы хранятся не в памяти процесса, а в БД
+(ProcessingMetric): каждое фото - два запроса приращений, экспозиция -
+один запрос
+"""
+import bisect
+import json
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
+
+
+logger = logging.getLogger('apps.photos.processing')
+
+# Этапы обработки
+OPEN_DECODE = 'open_decode'
+METADATA = 'metadata'
+THUMBNAIL = 'thumbnail'
+WATERMARK = 'watermark'
+FACE_DETECTION = 'face_detection'
+FACE_ENCODING = 'face_encoding'
+MATCHING = 'matching'
+STORAGE_WRITE = 'storage_write'
+DB_WRITE = 'db_write'
+
+# Границы корзин гистограммы, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class ProcessingTrace:
+    """
+    Время этапов обработки одного фото
+
+    Спаны могут быть вложенными: время вложенного этапа (например, записи
+    превью в хранилище) вычитается из родительского, поэтому сумма этапов
+    равна общему времени.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.width = 0
+        self.height = 0
+        self.faces_count = 0
+        self.error = ''
+        self._stack = []
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            yield
+        finally:
+            nested = self._stack.pop()
+            elapsed = time.perf_counter() - started
+            self.stages[stage] = self.stages.get(stage, 0.0) + elapsed - nested
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> dict:
+        return {
+            'width': self.width,
+            'height': self.height,
+            'faces_count': self.faces_count,
+            'total_ms': round(self.total * 1000, 1),
+            'stages_ms': {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+            'error': self.error or None,
+        }
+
+    def emit(self, photo_id):
+        """Пишет структурированный лог и обновляет гистограммы"""
+        data = {'event': 'photo_processed', 'photo_id': str(photo_id), **self.as_dict()}
+        if self.error:
+            logger.warning(json.dumps(data, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(data, ensure_ascii=False))
+
+        metrics.record(self.stages, 'error' if self.error else 'ok')
+
+
+class NullTrace:
+    """Заглушка, когда замеры не нужны"""
+
+    def span(self, stage: str):
+        return nullcontext()
+
+
+null_trace = NullTrace()
+
+
+class ProcessingMetrics:
+    """
+    Метрики обработки фото, общие для всех процессов (таблица ProcessingMetric)
+    Пишутся только при PHOTO_METRICS_ENABLED
+    """
+
+    STAGE_METRIC = 'photomarket_photo_processing_stage_seconds'
+    RESULT_METRIC = 'photomarket_photo_processing_total'
+    # Счётчики результатов - строки с именем result:<результат>
+    RESULT_PREFIX = 'result:'
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+
+    @property
+    def enabled(self) -> bool:
+        return getattr(settings, 'PHOTO_METRICS_ENABLED', False)
+
+    def bucket(self, seconds: float) -> int:
+        """Индекс первой границы >= seconds (len(buckets) - больше всех)"""
+        return bisect.bisect_left(self.buckets, seconds)
+
+    def record(self, stages: dict, result: str):
+        """Приращения одного обработанного фото: время этапов и результат"""
+        if not self.enabled:
+            return
+        deltas = {}
+        for stage, seconds in stages.items():
+            key = (stage, self.bucket(seconds))
+            count, total = deltas.get(key, (0, 0.0))
+            deltas[key] = (count + 1, total + seconds)
+        deltas[(self.RESULT_PREFIX + result, 0)] = (1, 0.0)
+        try:
+            apply_deltas(deltas)
+        except Exception:
+            # Метрики не роняют обработку фото
+            logger.exception('Не удалось записать метрики обработки')
+
+    def render(self) -> str:
+        """Текстовый формат экспозиции Prometheus"""
+        from .models import ProcessingMetric
+
+        stages = {}
+        results = {}
+        for name, bucket, count, total in ProcessingMetric.objects.order_by('name', 'bucket').values_list(
+            'name', 'bucket', 'count', 'total'
+        ):
+            if name.startswith(self.RESULT_PREFIX):
+                results[name[len(self.RESULT_PREFIX):]] = count
+                continue
+            counts, _ = stages.setdefault(name, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[min(bucket, len(self.buckets))] += count
+            stages[name][1][0] += total
+
+        lines = [
+            f'# HELP {self.STAGE_METRIC} Время этапа обработки фото',
+            f'# TYPE {self.STAGE_METRIC} histogram',
+        ]
+        for stage, (counts, total) in sorted(stages.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.STAGE_METRIC}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.STAGE_METRIC}_bucket{{stage="{stage}",le="+Inf"}} {sum(counts)}')
+            lines.append(f'{self.STAGE_METRIC}_sum{{stage="{stage}"}} {total[0]:.6f}')
+            lines.append(f'{self.STAGE_METRIC}_count{{stage="{stage}"}} {sum(counts)}')
+
+        lines.append(f'# HELP {self.RESULT_METRIC} Обработано фото')
+        lines.append(f'# TYPE {self.RESULT_METRIC} counter')
+        for result, count in sorted(results.items()):
+            lines.append(f'{self.RESULT_METRIC}{{result="{result}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def apply_deltas(deltas: dict):
+    """
+    Прибавляет {(имя, корзина): (наблюдений, сумма)} к строкам ProcessingMetric:
+    недостающие строки создаются, затем один UPDATE
+    count = count + CASE ... END, total = total + CASE ... END
+    Ключи отсортированы: параллельные воркеры блокируют строки в одном порядке
+    """
+    from .models import ProcessingMetric
+
+    keys = sorted(deltas)
+    conditions = [Q(name=name, bucket=bucket) for name, bucket in keys]
+    with transaction.atomic():
+        ProcessingMetric.objects.bulk_create(
+            [ProcessingMetric(name=name, bucket=bucket) for name, bucket in keys],
+            ignore_conflicts=True,
+        )
+        ProcessingMetric.objects.filter(Q(*conditions, _connector=Q.OR)).update(
+            count=F('count') + Case(
+                *[When(condition, then=Value(deltas[key][0])) for condition, key in zip(conditions, keys)],
+                default=Value(0), output_field=models.PositiveBigIntegerField(),
+            ),
+            total=F('total') + Case(
+                *[When(condition, then=Value(deltas[key][1])) for condition, key in zip(conditions, keys)],
+                default=Value(0.0), output_field=models.FloatField(),
+            ),
+        )
+
+
+# Синглтон
+metrics = ProcessingMetrics()
@@ -0,0 +1,45 @@
+"""
+Отложенный импорт тяжёлых библиотек (numpy, PIL)
+
+Модули сервисов нужны views, поэтому их импорт входит в запуск каждого
+воркера gunicorn и каждой команды manage.py. lazy_import регистрирует
+модуль сразу, а выполняет его код при первом обращении к атрибуту
+(importlib.util.LazyLoader) - процессы, которые не обрабатывают
+изображения, библиотеку не загружают.
+
+    np = lazy_import('numpy')         # None, если библиотека не установлена
+    Image = lazy_import('PIL.Image')
+
+is_loaded показывает, выполнен ли код модуля (бенчмарк запуска).
+"""
+import importlib.util
+import sys
+
+
+def lazy_import(name: str):
+    """Модуль name с загрузкой при первом обращении, None если его нет"""
+    if name in sys.modules:
+        return sys.modules[name]
+    try:
+        spec = importlib.util.find_spec(name)
+    except ImportError:
+        # Нет родительского пакета (PIL для PIL.Image)
+        return None
+    if spec is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    # Как при обычном импорте: PIL.Image доступен атрибутом пакета
+    parent, _, child = name.rpartition('.')
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+def is_loaded(name: str) -> bool:
+    """Код модуля выполнен, а не только зарегистрирован lazy_import"""
+    module = sys.modules.get(name)
+    return module is not None and type(module) is not getattr(importlib.util, '_LazyModule', None)
@@ -0,0 +1,73 @@
+"""
+Команда для заполнения метаданных существующих фото
+Читает только заголовки и EXIF (без декодирования), файлы обрабатываются параллельно
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from apps.photos.exif import read_file_metadata
+from apps.photos.models import Photo
+from apps.photos.services import METADATA_FIELDS, photo_service
+from apps.photos.storage import open_file
+
+
+def read_original_metadata(photo):
+    """Метаданные оригинала через хранилище, пустой dict для недоступного файла"""
+    try:
+        with open_file(photo.original) as source:
+            return read_file_metadata(source)
+    except OSError:
+        return {}
+
+
+class Command(BaseCommand):
+    help = 'Заполняет width/height/file_size/taken_at/camera_model из заголовков файлов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перечитать все фото и перезаписать метаданные',
+        )
+        parser.add_argument('--workers', type=int, default=8, help='Параллельных чтений файлов')
+        parser.add_argument('--batch-size', type=int, default=500, help='Фото в одном bulk_update')
+
+    def handle(self, *args, **options):
+        photos = Photo.objects.only('id', 'original', *METADATA_FIELDS).order_by('pk')
+        if not options['all']:
+            photos = photos.filter(Q(width=0) | Q(height=0) | Q(file_size=0) | Q(taken_at__isnull=True))
+
+        total = photos.count()
+        self.stdout.write(f'Фото для обработки: {total}')
+
+        updated = failed = 0
+        batch_size = options['batch_size']
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            # Keyset по pk: обновлённые фото выпадают из выборки, смещение сдвигать нельзя
+            last_pk = None
+            while True:
+                batch_query = photos if last_pk is None else photos.filter(pk__gt=last_pk)
+                batch = list(batch_query[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                results = pool.map(read_original_metadata, batch)
+                changed_photos, fields = [], set()
+                for photo, metadata in zip(batch, results):
+                    if not metadata:
+                        failed += 1
+                        continue
+                    changed = photo_service.apply_metadata(photo, metadata, overwrite=options['all'])
+                    if changed:
+                        changed_photos.append(photo)
+                        fields.update(changed)
+
+                if changed_photos:
+                    Photo.objects.bulk_update(changed_photos, sorted(fields))
+                    updated += len(changed_photos)
+                self.stdout.write(f'  ... {updated} обновлено, {failed} не прочитано')
+
+        self.stdout.write(self.style.SUCCESS(f'Готово: обновлено {updated}, не прочитано {failed}'))
@@ -0,0 +1,37 @@
+"""
+Команда для замера производительности обработки фотографий
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import photo_pipeline, report
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк обработки фото (превью, водяной знак, лица) на синтетических кадрах'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=list(photo_pipeline.DEFAULT_SIZES),
+            help='Размеры кадров в мегапикселях (по умолчанию: 12 24 45)',
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов на каждый этап')
+        parser.add_argument('--output', help='Файл для JSON-отчёта (по умолчанию stdout)')
+        parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения')
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.2,
+            help='Допустимое замедление p50 относительно базового прогона (0.2 = 20%%)',
+        )
+
+    def handle(self, *args, **options):
+        result = photo_pipeline.run(sizes=options['sizes'], repeat=options['repeat'])
+        report.write_report(result, options['output'], stream=self.stdout)
+
+        if photo_pipeline.check_baseline(
+            result, options['baseline'], options['threshold'], stream=self.stderr
+        ):
+            raise CommandError('Производительность хуже базового прогона')
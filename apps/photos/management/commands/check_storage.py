@@ -0,0 +1,62 @@
+"""
+Команда для проверки хранилища медиа (локальный диск или S3/MinIO)
+Записывает, читает потоком и удаляет пробные файлы через Storage API
+"""
+import hashlib
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Блок потокового чтения
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class Command(BaseCommand):
+    help = 'Проверяет запись, потоковое чтение и удаление файлов в хранилище медиа'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-kb', type=int, default=1024, help='Размер пробного файла')
+        parser.add_argument('--files', type=int, default=4, help='Сколько файлов')
+        parser.add_argument('--threads', type=int, default=4, help='Параллельных операций (пул соединений)')
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        self.stdout.write(f'Хранилище: {storage.__class__.__module__}.{storage.__class__.__name__}')
+
+        payload = os.urandom(options['size_kb'] * 1024)
+        digest = hashlib.sha256(payload).hexdigest()
+        names = [f'healthcheck/{uuid.uuid4()}.bin' for _ in range(options['files'])]
+
+        def roundtrip(name):
+            started = time.monotonic()
+            saved = storage.save(name, ContentFile(payload))
+            try:
+                if not storage.exists(saved) or storage.size(saved) != len(payload):
+                    raise CommandError(f'{saved}: файл не записан')
+                hasher = hashlib.sha256()
+                with storage.open(saved, 'rb') as f:
+                    for chunk in f.chunks(READ_CHUNK_SIZE):
+                        hasher.update(chunk)
+                if hasher.hexdigest() != digest:
+                    raise CommandError(f'{saved}: прочитано не то, что записано')
+                url = storage.url(saved)
+            finally:
+                storage.delete(saved)
+            return saved, url, (time.monotonic() - started) * 1000
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            results = list(pool.map(roundtrip, names))
+
+        for saved, url, elapsed in results:
+            self.stdout.write(f'  {saved}: {elapsed:.0f} мс, url {url[:80]}')
+        leftovers = [saved for saved, _, _ in results if storage.exists(saved)]
+        if leftovers:
+            raise CommandError(f'Файлы не удалены: {", ".join(leftovers)}')
+
+        self.stdout.write(self.style.SUCCESS(f'Хранилище работает: {len(results)} файлов записано, прочитано и удалено'))
@@ -0,0 +1,18 @@
+"""
+Команда для отмены заброшенных загрузок по частям
+Удаляет временные файлы сессий без активности дольше UPLOAD_SESSION_TTL_HOURS
+"""
+from django.core.management.base import BaseCommand
+
+from apps.photos import uploads
+
+
+class Command(BaseCommand):
+    help = 'Отменяет заброшенные загрузки по частям и удаляет их временные файлы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, help='Без активности дольше (по умолчанию UPLOAD_SESSION_TTL_HOURS)')
+
+    def handle(self, *args, **options):
+        expired = uploads.expire_sessions(hours=options['hours'])
+        self.stdout.write(self.style.SUCCESS(f'Отменено загрузок: {expired}'))
@@ -0,0 +1,70 @@
+"""
+Команда для разбиения фото событий на серии кадров (burst)
+Фото без перцептивного хеша получают его по превью (оригинал не декодируется)
+"""
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from apps.photos import bursts
+from apps.photos.models import Event, Photo
+from apps.photos.storage import open_file
+
+
+class Command(BaseCommand):
+    help = 'Считает dHash превью и группирует кадры событий в серии'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, help='ID события (по умолчанию - все события)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Фото в одном bulk_update')
+
+    def handle(self, *args, **options):
+        events = Event.objects.order_by('pk')
+        if options['event']:
+            events = events.filter(pk=options['event'])
+            if not events.exists():
+                raise CommandError(f"Событие {options['event']} не найдено")
+
+        hashed = self.fill_hashes(events, options['batch_size'])
+        self.stdout.write(f'Посчитано хешей: {hashed}')
+
+        total_bursts = total_frames = 0
+        for event in events:
+            count, frames = bursts.cluster_event(event)
+            if count:
+                self.stdout.write(f'  {event}: серий {count}, кадров в сериях {frames}')
+            total_bursts += count
+            total_frames += frames
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: серий {total_bursts}, кадров в сериях {total_frames}'
+        ))
+
+    def fill_hashes(self, events, batch_size):
+        photos = Photo.objects.filter(
+            event__in=events, perceptual_hash__isnull=True
+        ).exclude(thumbnail='').exclude(thumbnail__isnull=True).only('id', 'thumbnail').order_by('pk')
+
+        hashed = 0
+        last_pk = None
+        while True:
+            # Keyset по pk: посчитанные фото выпадают из выборки
+            batch_query = photos if last_pk is None else photos.filter(pk__gt=last_pk)
+            batch = list(batch_query[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            changed = []
+            for photo in batch:
+                try:
+                    with open_file(photo.thumbnail) as source, Image.open(source) as img:
+                        photo.perceptual_hash = bursts.dhash(img)
+                except Exception as e:
+                    self.stdout.write(self.style.WARNING(f'  {photo.id}: {e}'))
+                    continue
+                changed.append(photo)
+
+            if changed:
+                Photo.objects.bulk_update(changed, ['perceptual_hash'])
+                hashed += len(changed)
+        return hashed
@@ -5,6 +5,7 @@ from django.core.management.base import BaseCommand
 from apps.photos.models import PhotoFace
 from apps.accounts.models import ClientProfile
 from apps.recognition.services import face_service
+from apps.recognition.matching import ClientTemplateIndex
 
 
 class Command(BaseCommand):
@@ -35,21 +36,20 @@ class Command(BaseCommand):
         
         matched_count = 0
         
+        # Шаблоны всех клиентов в одной матрице
+        index = ClientTemplateIndex(clients)
+        
         for photo_face in unmatched_faces:
-            for client in clients:
-                if client.face_encoding and photo_face.face_encoding:
-                    is_match, confidence = face_service.compare_faces(
-                        client.face_encoding,
-                        photo_face.face_encoding
-                    )
-                    if is_match:
-                        photo_face.matched_user = client.user
-                        photo_face.save()
-                        matched_count += 1
-                        self.stdout.write(
-                            f'  Фото {photo_face.photo_id} -> {client.user.username} ({confidence:.1f}%)'
-                        )
-                        break
+            match = index.best_match(photo_face.face_encoding)
+            if match:
+                client, confidence = match
+                photo_face.matched_user = client.user
+                photo_face.match_confidence = confidence
+                photo_face.save()
+                matched_count += 1
+                self.stdout.write(
+                    f'  Фото {photo_face.photo_id} -> {client.user.username} ({confidence:.1f}%)'
+                )
         
         self.stdout.write('')
         self.stdout.write(self.style.SUCCESS(f'Сопоставлено лиц: {matched_count}'))
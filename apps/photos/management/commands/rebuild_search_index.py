@@ -0,0 +1,20 @@
+"""
+Команда для пересоздания поисковых индексов событий и фото
+"""
+from django.core.management.base import BaseCommand
+
+from apps.photos import search
+
+
+class Command(BaseCommand):
+    help = 'Создаёт поисковые индексы (PostgreSQL) или перестраивает FTS5 (SQLite)'
+
+    def handle(self, *args, **options):
+        kind = search.backend()
+        if kind == 'basic':
+            self.stdout.write(self.style.WARNING('СУБД без полнотекстового поиска, используется icontains'))
+            return
+
+        search.install()
+        search.invalidate()
+        self.stdout.write(self.style.SUCCESS(f'Поисковые индексы готовы ({kind})'))
@@ -0,0 +1,114 @@
+"""
+Раздача медиафайлов
+
+Публичные версии (превью, водяной знак, аватары) отдаёт фронтовой прокси
+прямо из MEDIA_ROOT: имена содержат хеш содержимого, поэтому кэшируются
+навсегда (Cache-Control: immutable).
+
+Оригиналы, селфи и остальные приватные файлы доступны только по короткой
+подписанной ссылке (HMAC от имени файла и срока действия). View проверяет
+подпись и передаёт отдачу байтов прокси:
+- MEDIA_ACCEL_MODE = 'nginx'    - заголовок X-Accel-Redirect (internal location)
+- MEDIA_ACCEL_MODE = 'sendfile' - заголовок X-Sendfile (Apache, lighttpd)
+- без режима - файл отдаёт Django (разработка)
+Файлы в S3 отдаются редиректом на подписанную ссылку хранилища.
+"""
+import mimetypes
+import time
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+
+SIGNATURE_SALT = 'apps.photos.media'
+
+# Год - для файлов с хешем содержимого в имени
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+PRIVATE_CACHE_CONTROL = 'private, no-store'
+
+
+def public_prefixes():
+    """Каталоги MEDIA_ROOT, которые можно отдавать без подписи"""
+    return tuple(getattr(settings, 'PUBLIC_MEDIA_PREFIXES', ('thumbnails/', 'watermarked/', 'avatars/')))
+
+
+def is_public(name: str) -> bool:
+    return bool(name) and '..' not in name and name.startswith(public_prefixes())
+
+
+def sign(name: str, expires: int) -> str:
+    return salted_hmac(SIGNATURE_SALT, f'{name}:{expires}', algorithm='sha256').hexdigest()[:32]
+
+
+def verify(name: str, expires, signature: str) -> bool:
+    """Подпись верна и срок действия не истёк"""
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < time.time():
+        return False
+    return constant_time_compare(sign(name, expires), signature or '')
+
+
+def signed_url(field, ttl=None, download=False) -> str:
+    """
+    Подписанная ссылка на приватный файл поля (оригинал, селфи)
+    Действует SIGNED_MEDIA_TTL_SECONDS секунд; download - отдать как вложение
+    """
+    if not field:
+        return ''
+    if ttl is None:
+        ttl = getattr(settings, 'SIGNED_MEDIA_TTL_SECONDS', 300)
+    # Срок округляется вверх до минуты: ссылка не меняется на каждом запросе
+    expires = (int(time.time()) + ttl + 59) // 60 * 60
+    params = {'e': expires, 's': sign(field.name, expires)}
+    if download:
+        params['dl'] = 1
+    return f"{reverse('photos:protected_media', kwargs={'name': field.name})}?{urlencode(params)}"
+
+
+def _local_path(storage, name):
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        return None
+
+
+def serve_protected(name: str, download_name: str = '', storage=None):
+    """
+    Ответ с приватным файлом без чтения его в Python (кроме режима разработки)
+    download_name - имя для Content-Disposition: attachment
+    """
+    storage = storage or default_storage
+    disposition = f"attachment; filename=\"{download_name}\"" if download_name else 'inline'
+
+    path = _local_path(storage, name)
+    if path is None:
+        # Объектное хранилище: клиент забирает файл по подписанной ссылке напрямую
+        try:
+            url = storage.url(name, parameters={'ResponseContentDisposition': disposition})
+        except TypeError:
+            url = storage.url(name)
+        response = HttpResponseRedirect(url)
+        response['Cache-Control'] = PRIVATE_CACHE_CONTROL
+        return response
+
+    mode = getattr(settings, 'MEDIA_ACCEL_MODE', '')
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if mode == 'nginx':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/') + quote(name)
+    elif mode == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    else:
+        response = FileResponse(storage.open(name, 'rb'), content_type=content_type)
+
+    response['Content-Disposition'] = disposition
+    response['Cache-Control'] = PRIVATE_CACHE_CONTROL
+    return response
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhotoProcessingRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stages_ms', models.JSONField(default=dict, verbose_name='Время этапов, мс')),
+                ('total_ms', models.FloatField(default=0.0, verbose_name='Общее время, мс')),
+                ('width', models.PositiveIntegerField(default=0, verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(default=0, verbose_name='Высота')),
+                ('faces_count', models.PositiveIntegerField(default=0, verbose_name='Количество лиц')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('processed_at', models.DateTimeField(auto_now=True, verbose_name='Дата обработки')),
+                ('photo', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='processing_record', to='photos.photo', verbose_name='Фотография')),
+            ],
+            options={
+                'verbose_name': 'Запись обработки фото',
+                'verbose_name_plural': 'Записи обработки фото',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+"""
+Поисковые индексы по событиям и фото
+
+PostgreSQL: GIN по to_tsvector и триграммы по городу/месту
+SQLite: FTS5-таблицы с триггерами
+Выражения индексов задаются в apps.photos.search и должны совпадать
+с выражениями запросов.
+"""
+from django.db import migrations
+
+
+def install_search_indexes(apps, schema_editor):
+    from apps.photos import search
+
+    search.install(schema_editor.connection)
+
+
+def uninstall_search_indexes(apps, schema_editor):
+    from apps.photos import search
+
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0002_photo_processing_record'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_indexes, uninstall_search_indexes),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0003_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['event', 'taken_at', 'id'], name='photos_event_taken_idx'),
+        ),
+    ]
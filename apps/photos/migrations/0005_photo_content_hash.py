@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0004_photo_taken_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='SHA-256 оригинала'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['photographer', 'content_hash'], name='photos_photographer_hash_idx'),
+        ),
+    ]
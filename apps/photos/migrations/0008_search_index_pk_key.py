@@ -0,0 +1,28 @@
+"""
+FTS5-индекс SQLite по первичному ключу вместо rowid
+
+У фото первичный ключ - UUID, rowid неявный и может измениться при
+VACUUM, после чего индекс указывает на чужие строки. Таблицы FTS5
+пересоздаются с колонкой pk (UNINDEXED), поиск соединяется по ней.
+"""
+from django.db import migrations
+
+
+def reinstall_search_indexes(apps, schema_editor):
+    from apps.photos import search
+
+    if search.backend(schema_editor.connection) != 'sqlite':
+        return
+    search.uninstall(schema_editor.connection)
+    search.install(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0007_upload_session'),
+    ]
+
+    operations = [
+        migrations.RunPython(reinstall_search_indexes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-19 00:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0008_search_index_pk_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, verbose_name='Этап или результат')),
+                ('bucket', models.PositiveSmallIntegerField(default=0, verbose_name='Корзина')),
+                ('count', models.PositiveBigIntegerField(default=0, verbose_name='Наблюдений')),
+                ('total', models.FloatField(default=0.0, verbose_name='Сумма, с')),
+            ],
+            options={
+                'verbose_name': 'Метрика обработки',
+                'verbose_name_plural': 'Метрики обработки',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='processingmetric',
+            constraint=models.UniqueConstraint(fields=('name', 'bucket'), name='photos_processing_metric_unique'),
+        ),
+    ]
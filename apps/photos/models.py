@@ -15,15 +15,16 @@ def photo_upload_path(instance, filename):
 
 
 def watermarked_upload_path(instance, filename):
-    """Путь для фото с водяным знаком"""
-    ext = filename.split('.')[-1]
-    return f"watermarked/{instance.photographer.user.id}/{uuid.uuid4()}.{ext}"
+    """
+    Путь для фото с водяным знаком
+    Имя - хеш содержимого (services), файл кэшируется навсегда
+    """
+    return f"watermarked/{instance.photographer.user.id}/{filename}"
 
 
 def thumbnail_upload_path(instance, filename):
-    """Путь для превью"""
-    ext = filename.split('.')[-1]
-    return f"thumbnails/{instance.photographer.user.id}/{uuid.uuid4()}.{ext}"
+    """Путь для превью, имя - хеш содержимого"""
+    return f"thumbnails/{instance.photographer.user.id}/{filename}"
 
 
 class Event(models.Model):
@@ -149,6 +150,20 @@ class Photo(models.Model):
     taken_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата съёмки')
     camera_model = models.CharField(max_length=100, blank=True, verbose_name='Камера')
     
+    # SHA-256 оригинала (дедупликация повторных загрузок)
+    content_hash = models.CharField(max_length=64, blank=True, verbose_name='SHA-256 оригинала')
+    
+    # Серии кадров (apps.photos.bursts): dHash превью и первый кадр серии
+    perceptual_hash = models.BigIntegerField(null=True, blank=True, verbose_name='dHash превью')
+    burst_leader = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='burst_members',
+        verbose_name='Первый кадр серии'
+    )
+    
     # Ценообразование
     price = models.DecimalField(
         max_digits=10,
@@ -186,6 +201,12 @@ class Photo(models.Model):
         verbose_name = 'Фотография'
         verbose_name_plural = 'Фотографии'
         ordering = ['-created_at']
+        indexes = [
+            # Лента события по времени съёмки (apps.photos.timeline)
+            models.Index(fields=['event', 'taken_at', 'id'], name='photos_event_taken_idx'),
+            # Поиск дубликатов в аккаунте фотографа
+            models.Index(fields=['photographer', 'content_hash'], name='photos_photographer_hash_idx'),
+        ]
     
     def __str__(self):
         return f"Фото {self.id} от {self.photographer.user.username}"
@@ -237,6 +258,60 @@ class PhotoFace(models.Model):
         return f"Лицо на фото {self.photo.id}"
 
 
+class PhotoProcessingRecord(models.Model):
+    """
+    Итоги последней обработки фото: время этапов, размеры, число лиц
+    """
+    photo = models.OneToOneField(
+        Photo,
+        on_delete=models.CASCADE,
+        related_name='processing_record',
+        verbose_name='Фотография'
+    )
+    
+    # Время этапов в миллисекундах: {"thumbnail": 120.5, ...}
+    stages_ms = models.JSONField(default=dict, verbose_name='Время этапов, мс')
+    total_ms = models.FloatField(default=0.0, verbose_name='Общее время, мс')
+    
+    width = models.PositiveIntegerField(default=0, verbose_name='Ширина')
+    height = models.PositiveIntegerField(default=0, verbose_name='Высота')
+    faces_count = models.PositiveIntegerField(default=0, verbose_name='Количество лиц')
+    
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    
+    processed_at = models.DateTimeField(auto_now=True, verbose_name='Дата обработки')
+    
+    class Meta:
+        verbose_name = 'Запись обработки фото'
+        verbose_name_plural = 'Записи обработки фото'
+    
+    def __str__(self):
+        return f"Обработка фото {self.photo_id}: {self.total_ms:.0f} мс"
+
+
+class ProcessingMetric(models.Model):
+    """
+    Корзина гистограммы времени этапа обработки (или счётчик результата)
+    Общая для всех процессов: воркеры Celery дописывают приращения,
+    /photos/metrics/ читает сумму (apps.photos.instrumentation)
+    """
+    name = models.CharField(max_length=64, verbose_name='Этап или результат')
+    # Индекс корзины в DEFAULT_BUCKETS, len(DEFAULT_BUCKETS) - больше последней границы
+    bucket = models.PositiveSmallIntegerField(default=0, verbose_name='Корзина')
+    count = models.PositiveBigIntegerField(default=0, verbose_name='Наблюдений')
+    total = models.FloatField(default=0.0, verbose_name='Сумма, с')
+    
+    class Meta:
+        verbose_name = 'Метрика обработки'
+        verbose_name_plural = 'Метрики обработки'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'bucket'], name='photos_processing_metric_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name}[{self.bucket}]: {self.count}"
+
+
 class DeletionRequest(models.Model):
     """
     Запрос на удаление фотографии (согласно 152-ФЗ)
@@ -289,3 +364,81 @@ class DeletionRequest(models.Model):
     
     def __str__(self):
         return f"Запрос на удаление фото {self.photo.id}"
+
+
+class UploadSession(models.Model):
+    """
+    Загрузка одного файла по частям (apps.photos.uploads)
+    Части дописываются во временный файл, после commit он переносится
+    в хранилище как оригинал нового Photo
+    """
+    
+    class Status(models.TextChoices):
+        OPEN = 'open', 'Загружается'
+        COMMITTED = 'committed', 'Завершена'
+        FAILED = 'failed', 'Ошибка'
+        ABORTED = 'aborted', 'Отменена'
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    
+    photographer = models.ForeignKey(
+        PhotographerProfile,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions',
+        verbose_name='Фотограф'
+    )
+    event = models.ForeignKey(
+        Event,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='upload_sessions',
+        verbose_name='Событие'
+    )
+    price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        validators=[MinValueValidator(Decimal('0.00'))],
+        verbose_name='Цена'
+    )
+    
+    # Заявленные клиентом имя, размер и SHA-256 файла
+    filename = models.CharField(max_length=255, verbose_name='Имя файла')
+    size = models.BigIntegerField(verbose_name='Размер')
+    sha256 = models.CharField(max_length=64, verbose_name='SHA-256')
+    
+    # Сколько байт уже принято (смещение следующей части)
+    received = models.BigIntegerField(default=0, verbose_name='Принято байт')
+    
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.OPEN,
+        verbose_name='Статус'
+    )
+    error = models.CharField(max_length=255, blank=True, verbose_name='Ошибка')
+    
+    # Результат: созданное фото или уже загруженный дубликат
+    photo = models.ForeignKey(
+        Photo,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Фотография'
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Загрузка по частям'
+        verbose_name_plural = 'Загрузки по частям'
+        ordering = ['-created_at']
+        indexes = [
+            # Незавершённые загрузки фотографа (продолжение после обрыва)
+            models.Index(fields=['photographer', 'status', 'sha256'], name='photos_upload_open_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Загрузка {self.filename} ({self.received}/{self.size})"
@@ -0,0 +1,350 @@
+"""
+Полнотекстовый и фасетный поиск по событиям и фотографиям
+
+Индексируются Event.name/description/location/city и Photo.title/description.
+Реализация зависит от СУБД:
+- PostgreSQL: GIN-индексы по to_tsvector (websearch_to_tsquery + ts_rank)
+  и триграммные индексы по UPPER(city)/UPPER(location) для icontains
+- SQLite: таблицы FTS5, синхронизируемые триггерами (bm25 для ранжирования);
+  строка индекса хранит первичный ключ исходной строки в колонке pk
+  (UNINDEXED), поиск соединяется по нему, а не по rowid: у таблиц с
+  UUID-ключом rowid неявный и меняется при VACUUM
+- остальные: icontains по всем полям
+
+Фасеты (тип события, город, месяц, диапазон цены) считаются одним
+GROUP BY запросом, результаты кэшируются с версией, которая меняется при
+любом изменении событий и фото.
+"""
+import hashlib
+import json
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import BooleanField, Case, Count, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import TruncMonth
+
+
+# Конфигурация словаря PostgreSQL (должна совпадать с индексами в миграции)
+SEARCH_CONFIG = 'russian'
+
+# Индексируемые поля: таблица -> колонки
+EVENT_TABLE = 'photos_event'
+EVENT_COLUMNS = ('name', 'description', 'location', 'city')
+PHOTO_TABLE = 'photos_photo'
+PHOTO_COLUMNS = ('title', 'description')
+
+# Колонки с триграммным индексом (PostgreSQL) для icontains
+TRIGRAM_COLUMNS = ((EVENT_TABLE, 'city'), (EVENT_TABLE, 'location'))
+
+# Диапазоны цены для фасета: (ключ, от, до)
+PRICE_RANGES = (
+    ('0-300', 0, 300),
+    ('300-700', 300, 700),
+    ('700-1500', 700, 1500),
+    ('1500+', 1500, None),
+)
+
+# Не больше стольких слов из запроса
+MAX_TERMS = 8
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def backend(conn=None) -> str:
+    """Какой механизм поиска используется: postgres, sqlite или basic"""
+    conn = conn or connection
+    if conn.vendor == 'postgresql':
+        return 'postgres'
+    if conn.vendor == 'sqlite':
+        return 'sqlite'
+    return 'basic'
+
+
+def terms(query: str) -> list:
+    """Слова запроса (без операторов и кавычек)"""
+    return _TERM_RE.findall((query or '').lower())[:MAX_TERMS]
+
+
+# --- Индексы ---
+
+def _document(columns, table=None) -> str:
+    prefix = f'"{table}".' if table else ''
+    return " || ' ' || ".join(f"coalesce({prefix}\"{column}\", '')" for column in columns)
+
+
+def _fts_table(table: str) -> str:
+    return f'{table}_fts'
+
+
+# Колонка FTS5 с первичным ключом исходной строки
+FTS_KEY = 'pk'
+
+
+def install(conn=None):
+    """Создаёт поисковые индексы для текущей СУБД (идемпотентно)"""
+    conn = conn or connection
+    kind = backend(conn)
+    if kind == 'postgres':
+        _install_postgres(conn)
+    elif kind == 'sqlite':
+        rebuild(conn)
+
+
+def uninstall(conn=None):
+    conn = conn or connection
+    kind = backend(conn)
+    with conn.cursor() as cursor:
+        if kind == 'postgres':
+            for table, _ in ((EVENT_TABLE, EVENT_COLUMNS), (PHOTO_TABLE, PHOTO_COLUMNS)):
+                cursor.execute(f'DROP INDEX IF EXISTS {table}_search_gin')
+            for table, column in TRIGRAM_COLUMNS:
+                cursor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+        elif kind == 'sqlite':
+            for table in (EVENT_TABLE, PHOTO_TABLE):
+                for suffix in ('ai', 'ad', 'au'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {_fts_table(table)}_{suffix}')
+                cursor.execute(f'DROP TABLE IF EXISTS {_fts_table(table)}')
+
+
+def _install_postgres(conn):
+    with conn.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, columns in ((EVENT_TABLE, EVENT_COLUMNS), (PHOTO_TABLE, PHOTO_COLUMNS)):
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_search_gin ON {table} '
+                f"USING gin (to_tsvector('{SEARCH_CONFIG}', {_document(columns)}))"
+            )
+        for table, column in TRIGRAM_COLUMNS:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm ON {table} '
+                f'USING gin (UPPER("{column}") gin_trgm_ops)'
+            )
+
+
+def _install_sqlite(conn):
+    """
+    FTS5-таблица на каждую таблицу, ключ исходной строки - колонка pk
+    UNINDEXED: удаление и изменение текста ищут строку индекса перебором,
+    зато ключ не зависит от rowid
+    Триггеры пересоздаются после миграций: SQLite пересобирает таблицы
+    при ALTER и теряет их (см. signals.ensure_search_index)
+    """
+    with conn.cursor() as cursor:
+        for table, columns in ((EVENT_TABLE, EVENT_COLUMNS), (PHOTO_TABLE, PHOTO_COLUMNS)):
+            fts = _fts_table(table)
+            column_list = ', '.join(columns)
+            new_values = ', '.join(f'new.{column}' for column in columns)
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5('
+                f"{FTS_KEY} UNINDEXED, {column_list}, tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN '
+                f'INSERT INTO {fts}({FTS_KEY}, {column_list}) VALUES (new.id, {new_values}); END'
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN '
+                f'DELETE FROM {fts} WHERE {FTS_KEY} = old.id; END'
+            )
+            # Только при изменении текстовых полей: статус и счётчики фото меняются часто
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column_list} ON {table} BEGIN '
+                f'DELETE FROM {fts} WHERE {FTS_KEY} = old.id; '
+                f'INSERT INTO {fts}({FTS_KEY}, {column_list}) VALUES (new.id, {new_values}); END'
+            )
+
+
+def rebuild(conn=None):
+    """Перестраивает FTS5-таблицы SQLite из исходных данных"""
+    conn = conn or connection
+    if backend(conn) != 'sqlite':
+        return
+    _install_sqlite(conn)
+    with conn.cursor() as cursor:
+        for table, columns in ((EVENT_TABLE, EVENT_COLUMNS), (PHOTO_TABLE, PHOTO_COLUMNS)):
+            fts = _fts_table(table)
+            column_list = ', '.join(columns)
+            cursor.execute(f'DELETE FROM {fts}')
+            cursor.execute(
+                f'INSERT INTO {fts}({FTS_KEY}, {column_list}) '
+                f'SELECT id, {column_list} FROM {table}'
+            )
+
+
+# --- Поиск ---
+
+def _matching_ids_sql(table, columns, words):
+    """Подзапрос (sql, params), выбирающий id подходящих строк"""
+    if backend() == 'postgres':
+        document = f"to_tsvector('{SEARCH_CONFIG}', {_document(columns)})"
+        return (
+            f"SELECT id FROM {table} WHERE {document} @@ websearch_to_tsquery('{SEARCH_CONFIG}', %s)",
+            [' '.join(words)],
+        )
+    fts = _fts_table(table)
+    return f'SELECT {FTS_KEY} FROM {fts} WHERE {fts} MATCH %s', [' '.join(f'"{word}"*' for word in words)]
+
+
+def _match(table, columns, words, prefix=''):
+    """
+    Условие совпадения и выражение релевантности для строк table
+    prefix - путь к модели таблицы из модели запроса (например, 'event__')
+    """
+    kind = backend()
+    if kind == 'basic':
+        condition = Q()
+        for word in words:
+            condition &= Q(*[Q(**{f'{prefix}{column}__icontains': word}) for column in columns],
+                           _connector=Q.OR)
+        return condition, Value(0.0, output_field=FloatField())
+
+    sql, params = _matching_ids_sql(table, columns, words)
+    if kind == 'postgres':
+        document = f"to_tsvector('{SEARCH_CONFIG}', {_document(columns, table)})"
+        rank = RawSQL(f"ts_rank({document}, websearch_to_tsquery('{SEARCH_CONFIG}', %s))",
+                      params, output_field=FloatField())
+    else:
+        fts = _fts_table(table)
+        rank = RawSQL(f'(SELECT -bm25({fts}) FROM {fts} WHERE {fts} MATCH %s AND {FTS_KEY} = "{table}".id)',
+                      params, output_field=FloatField())
+    condition = RawSQL(f'"{table}".id IN ({sql})', params, output_field=BooleanField())
+    return condition, rank
+
+
+def filter_events(queryset, query: str):
+    """
+    События, подходящие под запрос, с аннотацией search_rank
+    Пустой запрос возвращает queryset без изменений
+    """
+    words = terms(query)
+    if not words:
+        return queryset
+    condition, rank = _match(EVENT_TABLE, EVENT_COLUMNS, words)
+    return queryset.filter(condition).annotate(search_rank=rank)
+
+
+def filter_photos(queryset, query: str):
+    """
+    Фото, у которых запрос найден в названии/описании фото или в тексте события
+    """
+    words = terms(query)
+    if not words:
+        return queryset
+    condition, rank = _match(PHOTO_TABLE, PHOTO_COLUMNS, words)
+
+    if backend() == 'basic':
+        event_condition, _ = _match(EVENT_TABLE, EVENT_COLUMNS, words, prefix='event__')
+    else:
+        # Подзапрос отдаёт id событий (в SQLite - колонка pk индекса)
+        sql, params = _matching_ids_sql(EVENT_TABLE, EVENT_COLUMNS, words)
+        event_condition = RawSQL(f'"{PHOTO_TABLE}".event_id IN ({sql})', params,
+                                 output_field=BooleanField())
+
+    return queryset.filter(Q(condition) | Q(event_condition)).annotate(search_rank=rank)
+
+
+# --- Фасеты ---
+
+def _price_bucket():
+    whens = []
+    for key, low, high in PRICE_RANGES:
+        condition = Q(price__gte=low)
+        if high is not None:
+            condition &= Q(price__lt=high)
+        whens.append(When(condition, then=Value(key)))
+    return Case(*whens, default=Value(''))
+
+
+def _fold(rows, dimensions) -> dict:
+    """Маргинальные суммы по каждому измерению из строк GROUP BY"""
+    facets = {name: {} for name in dimensions.values()}
+    for row in rows:
+        for field, name in dimensions.items():
+            value = row[field]
+            if value in (None, ''):
+                continue
+            if hasattr(value, 'strftime'):
+                value = value.strftime('%Y-%m')
+            facets[name][value] = facets[name].get(value, 0) + row['n']
+    return {
+        name: sorted(({'value': value, 'count': count} for value, count in counts.items()),
+                     key=lambda item: (-item['count'], str(item['value'])))
+        for name, counts in facets.items()
+    }
+
+
+def _label_event_types(facets: dict) -> dict:
+    from .models import Event
+
+    labels = dict(Event.EventType.choices)
+    for item in facets['event_type']:
+        item['label'] = labels.get(item['value'], item['value'])
+    return facets
+
+
+def event_facets(queryset) -> dict:
+    """Фасеты событий (тип, город, месяц) одним GROUP BY запросом"""
+    rows = queryset.order_by().annotate(
+        facet_month=TruncMonth('date'),
+    ).values('event_type', 'city', 'facet_month').annotate(n=Count('id'))
+    facets = _fold(rows, {'event_type': 'event_type', 'city': 'city', 'facet_month': 'month'})
+    return _label_event_types(facets)
+
+
+def photo_facets(queryset) -> dict:
+    """Фасеты фото (тип события, город, месяц, цена) одним GROUP BY запросом"""
+    rows = queryset.order_by().annotate(
+        facet_month=TruncMonth('event__date'),
+        facet_price=_price_bucket(),
+    ).values('event__event_type', 'event__city', 'facet_month', 'facet_price').annotate(n=Count('id'))
+    facets = _fold(rows, {
+        'event__event_type': 'event_type',
+        'event__city': 'city',
+        'facet_month': 'month',
+        'facet_price': 'price',
+    })
+    # Диапазоны цены - в фиксированном порядке
+    order = {key: n for n, (key, _, _) in enumerate(PRICE_RANGES)}
+    facets['price'].sort(key=lambda item: order[item['value']])
+    return _label_event_types(facets)
+
+
+# --- Кэш ---
+
+VERSION_KEY = 'search:version'
+
+
+def cache_version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def invalidate():
+    """Сбрасывает кэш поиска (меняет версию ключей)"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 2, timeout=None)
+
+
+def cached(kind: str, params: dict, compute):
+    """
+    Результат compute() из кэша по (kind, params, версия)
+    Время жизни - SEARCH_CACHE_SECONDS
+    """
+    timeout = getattr(settings, 'SEARCH_CACHE_SECONDS', 300)
+    if not timeout:
+        return compute()
+    digest = hashlib.md5(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    key = f'search:{kind}:{cache_version()}:{digest}'
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result, timeout)
+    return result
@@ -1,15 +1,41 @@
 """
 Сервис обработки фотографий
-- Создание превью (thumbnail)
+- Метаданные из заголовков и EXIF (размеры, время съёмки, камера)
+- Создание превью (thumbnail) и перцептивного хеша
 - Добавление водяных знаков
-- Распознавание лиц
+- Распознавание лиц (с переносом на кадры одной серии)
 """
+import hashlib
+import logging
 import os
-import uuid
 from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont, ImageEnhance
 from django.core.files.base import ContentFile
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from . import bursts, instrumentation as stages
+from .exif import read_metadata, read_orientation
+from .instrumentation import ProcessingTrace, null_trace
+from .lazy import lazy_import
+from .storage import open_file
+from .uploadhandlers import content_hash
+
+logger = logging.getLogger(__name__)
+
+# PIL загружается при первой обработке, а не при импорте views
+Image = lazy_import('PIL.Image')
+ImageDraw = lazy_import('PIL.ImageDraw')
+ImageEnhance = lazy_import('PIL.ImageEnhance')
+ImageFont = lazy_import('PIL.ImageFont')
+ImageOps = lazy_import('PIL.ImageOps')
+
+# Поля Photo, заполняемые из метаданных файла
+METADATA_FIELDS = ('width', 'height', 'file_size', 'taken_at', 'camera_model')
+
+
+def rendition_name(data: bytes, ext: str) -> str:
+    """Имя файла версии по SHA-256 содержимого (первые 32 символа)"""
+    return f"{hashlib.sha256(data).hexdigest()[:32]}.{ext}"
 
 
 class PhotoProcessingService:
@@ -23,41 +49,211 @@ class PhotoProcessingService:
     def process_photo(self, photo):
         """
         Полная обработка фото:
-        1. Создание превью
+        1. Создание превью и перцептивного хеша
         2. Создание версии с водяным знаком
-        3. Распознавание лиц
-        4. Обновление статуса
+        3. Поиск серии кадров (burst)
+        4. Распознавание лиц или перенос лиц с соседнего кадра серии
+        5. Обновление статуса
+        Время каждого этапа пишется в лог, метрики и PhotoProcessingRecord
         """
+        trace = ProcessingTrace()
         try:
-            # Открываем оригинал
-            img = Image.open(photo.original.path)
+            # Точный дубликат уже обработанного фото - берём готовые версии и лица
+            with trace.span(stages.METADATA):
+                if not photo.content_hash:
+                    with open_file(photo.original) as source:
+                        photo.content_hash = content_hash(source)
+                duplicate = self.find_duplicate(photo)
+            if duplicate is not None:
+                with trace.span(stages.DB_WRITE):
+                    self.reuse_processed(photo, duplicate)
+                trace.width, trace.height = photo.width, photo.height
+                trace.faces_count = photo.faces_count
+                return True
+            
+            # Оригинал читается через хранилище (локальный диск или S3)
+            with open_file(photo.original) as source:
+                # Метаданные из заголовков, до декодирования пикселей
+                with trace.span(stages.METADATA):
+                    img = Image.open(source)
+                    metadata = read_metadata(img)
+                    metadata['file_size'] = photo.original.size
+                    self.apply_metadata(photo, metadata)
+                trace.width, trace.height = photo.width, photo.height
+                
+                # Декодируем оригинал и поворачиваем по EXIF
+                with trace.span(stages.OPEN_DECODE):
+                    img = self.orient(img, metadata['orientation'])
             
             # 1. Создаём превью
-            self.create_thumbnail(photo, img)
+            self.create_thumbnail(photo, img, trace=trace)
             
             # 2. Создаём версию с водяным знаком
-            self.create_watermarked(photo, img)
+            self.create_watermarked(photo, img, trace=trace)
+            
+            # 3. Серия кадров: почти такой же соседний кадр - лица берём у него
+            sibling, distance = bursts.find_sibling(photo)
+            if sibling is not None:
+                photo.burst_leader_id = sibling.burst_leader_id or sibling.id
             
-            # 3. Распознавание лиц
-            faces_count = self.detect_faces(photo)
+            # 4. Распознавание лиц
+            if bursts.can_propagate(photo, sibling, distance):
+                with trace.span(stages.DB_WRITE):
+                    faces_count = self.copy_faces(photo, sibling)
+                photo.faces_processed = sibling.faces_processed
+            else:
+                faces_count = self.detect_faces(photo, trace=trace)
             photo.faces_count = faces_count
+            trace.faces_count = faces_count
             
-            # 4. Обновляем статус
+            # 5. Обновляем статус
             photo.status = 'active'
-            photo.save()
+            with trace.span(stages.DB_WRITE):
+                photo.save()
             
             return True
         except Exception as e:
-            print(f"Ошибка обработки фото {photo.id}: {e}")
+            logger.exception("Ошибка обработки фото %s", photo.id)
+            trace.error = str(e)
             photo.status = 'error'
             photo.save()
             return False
+        finally:
+            trace.emit(photo.id)
+            self.save_processing_record(photo, trace)
+    
+    def find_duplicate(self, photo):
+        """
+        Уже обработанное фото с тем же SHA-256 в аккаунте фотографа
+        (самое раннее) или None
+        """
+        from apps.photos.models import Photo
+        
+        if not photo.content_hash:
+            return None
+        duplicates = Photo.objects.filter(
+            photographer_id=photo.photographer_id,
+            content_hash=photo.content_hash,
+            status='active',
+        ).exclude(thumbnail='').exclude(thumbnail__isnull=True)
+        if photo.pk:
+            duplicates = duplicates.exclude(pk=photo.pk)
+        return duplicates.order_by('created_at').first()
+    
+    def reuse_processed(self, photo, source):
+        """
+        Заполняет фото из обработанного дубликата без повторной обработки:
+        превью, водяной знак, метаданные и найденные лица
+        Файлы версий общие (удаление фото файлы не удаляет)
+        """
+        from django.db import transaction
+        
+        photo.thumbnail.name = source.thumbnail.name
+        photo.watermarked.name = source.watermarked.name
+        for field in METADATA_FIELDS + ('perceptual_hash', 'faces_count', 'faces_processed'):
+            setattr(photo, field, getattr(source, field))
+        photo.status = 'active'
+        
+        with transaction.atomic():
+            photo.save()
+            self.copy_faces(photo, source)
+        return photo
+    
+    def copy_faces(self, photo, source):
+        """
+        Копирует лица (с кодировками и совпадениями) с другого фото
+        вместо распознавания, возвращает их число
+        """
+        from django.db import transaction
+        from apps.photos.models import PhotoFace
+        from apps.recognition.store import face_store
+        
+        with transaction.atomic():
+            PhotoFace.objects.filter(photo=photo).delete()
+            faces = PhotoFace.objects.bulk_create([
+                PhotoFace(
+                    photo=photo,
+                    face_location=face.face_location,
+                    face_encoding=face.face_encoding,
+                    matched_user_id=face.matched_user_id,
+                    match_confidence=face.match_confidence,
+                )
+                for face in source.faces.all()
+            ])
+            # bulk_create не шлёт post_save - дописываем лица в хранилище сами
+            rows = [(face.id, face.face_encoding) for face in faces if face.id and face.face_encoding]
+            if rows:
+                transaction.on_commit(lambda: face_store.append(rows))
+            # и сбрасываем предложения цен клиентов, найденных на фото
+            matched = [face.matched_user_id for face in faces if face.matched_user_id]
+            if matched:
+                from apps.payments import pricing
+                transaction.on_commit(lambda: pricing.matches_changed(matched))
+        return len(faces)
+    
+    def apply_metadata(self, photo, metadata, overwrite=False):
+        """
+        Заполняет width/height/file_size/taken_at/camera_model из read_metadata
+        Уже заполненные поля не трогает (кроме overwrite=True)
+        Возвращает список изменённых полей
+        """
+        changed = []
+        for field in METADATA_FIELDS:
+            value = metadata.get(field)
+            if value in (None, '', 0):
+                continue
+            if overwrite or getattr(photo, field) in (None, '', 0):
+                if getattr(photo, field) != value:
+                    setattr(photo, field, value)
+                    changed.append(field)
+        return changed
+    
+    def orient(self, img, orientation=None):
+        """
+        Декодирует изображение и применяет EXIF-ориентацию,
+        чтобы превью и водяной знак не были повёрнуты
+        """
+        if orientation is None:
+            orientation = read_orientation(img)
+        img.load()
+        if orientation != 1:
+            img = ImageOps.exif_transpose(img)
+        return img
+    
+    def open_original(self, photo):
+        """Оригинал, декодированный и повёрнутый по EXIF"""
+        with open_file(photo.original) as source:
+            return self.orient(Image.open(source))
     
-    def create_thumbnail(self, photo, img=None):
+    def save_processing_record(self, photo, trace):
+        """Сохраняет итоги обработки фото"""
+        from apps.photos.models import PhotoProcessingRecord
+        
+        data = trace.as_dict()
+        try:
+            PhotoProcessingRecord.objects.update_or_create(
+                photo=photo,
+                defaults={
+                    'stages_ms': data['stages_ms'],
+                    'total_ms': data['total_ms'],
+                    'width': data['width'],
+                    'height': data['height'],
+                    'faces_count': data['faces_count'],
+                    'error': trace.error,
+                }
+            )
+        except Exception:
+            logger.exception("Не удалось сохранить запись обработки фото %s", photo.id)
+    
+    def create_thumbnail(self, photo, img=None, trace=null_trace):
         """Создание превью"""
         if img is None:
-            img = Image.open(photo.original.path)
+            img = self.open_original(photo)
         
+        with trace.span(stages.THUMBNAIL):
+            self._render_thumbnail(photo, img, trace)
+    
+    def _render_thumbnail(self, photo, img, trace):
         # Копируем и уменьшаем
         thumb = img.copy()
         thumb.thumbnail(self.thumbnail_size, Image.Resampling.LANCZOS)
@@ -73,21 +269,30 @@ class PhotoProcessingService:
             thumb = thumb.convert('RGB')
             format = 'JPEG'
         
+        # Перцептивный хеш для поиска серий - по уже уменьшенному кадру
+        photo.perceptual_hash = bursts.dhash(thumb)
+        
         thumb.save(buffer, format=format, quality=85)
         buffer.seek(0)
         
-        # Генерируем имя файла
+        # Имя - хеш содержимого: публичные версии кэшируются навсегда
         ext = 'jpg' if format == 'JPEG' else 'png'
-        filename = f"{uuid.uuid4()}.{ext}"
+        data = buffer.read()
+        filename = rendition_name(data, ext)
         
         # Сохраняем в поле модели
-        photo.thumbnail.save(filename, ContentFile(buffer.read()), save=False)
+        with trace.span(stages.STORAGE_WRITE):
+            photo.thumbnail.save(filename, ContentFile(data), save=False)
     
-    def create_watermarked(self, photo, img=None):
+    def create_watermarked(self, photo, img=None, trace=null_trace):
         """Создание версии с водяным знаком"""
         if img is None:
-            img = Image.open(photo.original.path)
+            img = self.open_original(photo)
         
+        with trace.span(stages.WATERMARK):
+            self._render_watermarked(photo, img, trace)
+    
+    def _render_watermarked(self, photo, img, trace):
         # Конвертируем в RGBA для прозрачности
         if img.mode != 'RGBA':
             img = img.convert('RGBA')
@@ -144,11 +349,12 @@ class PhotoProcessingService:
         watermarked.save(buffer, format='JPEG', quality=70)
         buffer.seek(0)
         
-        # Сохраняем
-        filename = f"{uuid.uuid4()}.jpg"
-        photo.watermarked.save(filename, ContentFile(buffer.read()), save=False)
+        # Сохраняем под хешем содержимого
+        data = buffer.read()
+        with trace.span(stages.STORAGE_WRITE):
+            photo.watermarked.save(rendition_name(data, 'jpg'), ContentFile(data), save=False)
     
-    def detect_faces(self, photo):
+    def detect_faces(self, photo, trace=null_trace):
         """Распознавание лиц на фото и сопоставление с клиентами"""
         try:
             from apps.recognition.services import face_service
@@ -158,42 +364,46 @@ class PhotoProcessingService:
                 return 0
             
             # Получаем данные о лицах
-            faces = face_service.get_face_data(photo.original.path)
+            with open_file(photo.original) as source:
+                faces = face_service.get_face_data(source, trace=trace)
+            if not faces:
+                return 0
             
             # Загружаем клиентов с обработанными селфи
             from apps.accounts.models import ClientProfile
             from apps.photos.models import PhotoFace
             
-            clients_with_faces = list(ClientProfile.objects.filter(
-                face_processed=True
-            ).exclude(face_encoding__isnull=True).select_related('user'))
+            from apps.recognition.matching import ClientTemplateIndex
             
-            # Сохраняем каждое лицо в базу и пробуем сопоставить
-            for face in faces:
-                photo_face = PhotoFace.objects.create(
-                    photo=photo,
-                    face_location=face['location'],
-                    face_encoding=face['encoding']
-                )
+            with trace.span(stages.MATCHING):
+                clients_with_faces = ClientProfile.objects.filter(
+                    face_processed=True
+                ).exclude(face_encoding__isnull=True).select_related('user')
+                index = ClientTemplateIndex(clients_with_faces)
                 
-                # Пробуем найти совпадение среди клиентов
-                for client in clients_with_faces:
-                    if client.face_encoding:
-                        is_match, confidence = face_service.compare_faces(
-                            client.face_encoding,
-                            face['encoding']
-                        )
-                        if is_match:
-                            photo_face.matched_user = client.user
-                            photo_face.save()
-                            print(f"[MATCH] Найдено совпадение: фото {photo.id} -> пользователь {client.user.username}")
-                            break  # Один пользователь на одно лицо
+                # Ищем ближайшего клиента среди шаблонов всех клиентов
+                matches = [index.best_match(face['encoding']) for face in faces]
+            
+            # Сохраняем каждое лицо в базу вместе с совпадением
+            with trace.span(stages.DB_WRITE):
+                for face, match in zip(faces, matches):
+                    client, confidence = match if match else (None, 0.0)
+                    
+                    PhotoFace.objects.create(
+                        photo=photo,
+                        face_location=face['location'],
+                        face_encoding=face['encoding'],
+                        matched_user=client.user if client else None,
+                        match_confidence=confidence
+                    )
+                    if client:
+                        logger.info("Найдено совпадение: фото %s -> пользователь %s", photo.id, client.user.username)
             
             return len(faces)
-        except Exception as e:
-            print(f"Ошибка распознавания лиц: {e}")
+        except Exception:
+            logger.exception("Ошибка распознавания лиц на фото %s", photo.id)
             return 0
 
 
-# Синглтон
-photo_service = PhotoProcessingService()
+# Синглтон (создаётся при первом обращении)
+photo_service = SimpleLazyObject(PhotoProcessingService)
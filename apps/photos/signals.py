@@ -0,0 +1,32 @@
+"""
+Сигналы фотографий и событий
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import search
+from .models import Event, Photo
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=Photo)
+@receiver(post_delete, sender=Photo)
+def invalidate_search_cache(sender, **kwargs):
+    """Любое изменение событий и фото делает кэш поиска устаревшим"""
+    search.invalidate()
+
+
+def ensure_search_index(sender, using, **kwargs):
+    """
+    После миграций пересоздаёт FTS5-индекс SQLite: при ALTER SQLite
+    пересобирает таблицы и теряет триггеры
+    """
+    from django.db import connections
+
+    connection = connections[using]
+    if search.backend(connection) != 'sqlite':
+        return
+    tables = connection.introspection.table_names()
+    if search.EVENT_TABLE in tables and search.PHOTO_TABLE in tables:
+        search.rebuild(connection)
@@ -0,0 +1,22 @@
+"""
+Чтение файлов через Storage API Django
+
+Обработка не обращается к .path: оригиналы, версии и селфи читаются
+через хранилище поля, поэтому могут лежать в S3-совместимом хранилище
+(STORAGE_BACKEND=s3), а воркеры обработки - работать на других хостах.
+"""
+from contextlib import contextmanager
+
+
+@contextmanager
+def open_file(field):
+    """
+    Файл поля FileField/ImageField, открытый на чтение через его хранилище
+    Закрывается при выходе из блока
+    """
+    file = field.open('rb')
+    try:
+        yield file
+    finally:
+        file.close()
+
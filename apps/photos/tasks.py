@@ -0,0 +1,56 @@
+"""
+Celery задачи обработки фотографий
+"""
+from celery import shared_task
+from django.conf import settings
+
+from apps.outbox.relay import publish
+
+from .models import Event, Photo
+from .services import photo_service
+
+
+def update_photos_count(event_id):
+    """Пересчитывает счётчик активных фото события"""
+    if event_id:
+        Event.objects.filter(pk=event_id).update(
+            photos_count=Photo.objects.filter(event_id=event_id, status='active').count()
+        )
+
+
+@shared_task(bind=True, max_retries=3)
+def process_uploaded_photo(self, photo_id: str):
+    """
+    Обрабатывает загруженное фото: превью, водяной знак, лица
+    """
+    photo = Photo.objects.filter(pk=photo_id, status='processing').first()
+    if photo is None:
+        return f"Фото {photo_id} не найдено или уже обработано"
+
+    processed = photo_service.process_photo(photo)
+    update_photos_count(photo.event_id)
+    return f"Фото {photo_id}: {'обработано' if processed else 'ошибка обработки'}"
+
+
+@shared_task
+def process_uploaded_photos(payloads):
+    """Обрабатывает пачку фото из outbox (enqueue_processing)"""
+    results = [process_uploaded_photo(payload['photo']) for payload in payloads]
+    return f"Фото в пачке: {len(results)}"
+
+
+def enqueue_processing(photo):
+    """
+    Ставит фото в обработку
+    С PHOTO_PROCESSING_ASYNC - через outbox: сообщение пишется в текущей
+    транзакции, после коммита пачка уходит задачей Celery. Иначе
+    обрабатывает сразу. Возвращает True, если фото уже обработано
+    """
+    if getattr(settings, 'PHOTO_PROCESSING_ASYNC', False):
+        photo_id = str(photo.id)
+        publish('apps.photos.tasks.process_uploaded_photos', {'photo': photo_id}, key=f'process_photo:{photo_id}')
+        return False
+
+    processed = photo_service.process_photo(photo)
+    update_photos_count(photo.event_id)
+    return processed
@@ -0,0 +1,18 @@
+"""
+Ссылки на приватные медиафайлы в шаблонах
+
+    {% load media_urls %}
+    <img src="{{ photo.original|signed_url }}">
+"""
+from django import template
+
+from apps.photos import media
+
+
+register = template.Library()
+
+
+@register.filter
+def signed_url(field):
+    """Короткая подписанная ссылка на оригинал, селфи и другие приватные файлы"""
+    return media.signed_url(field)
@@ -0,0 +1,461 @@
+import datetime
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils.functional import empty
+from django.db import connection
+from django.http import UnreadablePostError
+from django.test import RequestFactory, TestCase, override_settings
+from PIL import Image
+
+try:
+    import boto3
+    import moto
+    import requests
+    from storages.backends.s3 import S3Storage
+except ImportError:
+    moto = None
+
+from apps.accounts.models import PhotographerProfile, User
+from apps.photos import bursts, counters, exif, instrumentation, media, search, tasks, timeline, uploads
+from apps.photos.services import photo_service
+from apps.photos.storage import open_file
+from apps.photos.models import DeletionRequest, Event, Photo, PhotoFace, ProcessingMetric, UploadSession
+
+
+class BrokenStream:
+    """Тело запроса, которое обрывается после limit байт"""
+
+    def __init__(self, data, limit):
+        self.data = io.BytesIO(data)
+        self.limit = limit
+
+    def read(self, size):
+        if self.data.tell() >= self.limit:
+            raise UnreadablePostError('connection reset')
+        return self.data.read(min(size, self.limit - self.data.tell()))
+
+
+class AppendChunkTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        override = override_settings(UPLOAD_SESSION_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        user = User.objects.create(username='photographer', user_type='photographer')
+        self.photographer = PhotographerProfile.objects.create(user=user)
+        self.data = os.urandom(200 * 1024)
+        self.session = uploads.create_session(
+            self.photographer, 'photo.jpg', len(self.data), hashlib.sha256(self.data).hexdigest()
+        )
+
+    def test_broken_chunk_keeps_received_bytes(self):
+        received = 150 * 1024
+        with self.assertRaises(uploads.UploadError) as error:
+            uploads.append_chunk(self.session, 0, BrokenStream(self.data, received), len(self.data))
+        self.assertEqual(error.exception.extra['offset'], received)
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.received, received)
+        self.assertEqual(self.session.status, UploadSession.Status.OPEN)
+
+        offset = uploads.append_chunk(
+            self.session, received, io.BytesIO(self.data[received:]), len(self.data) - received
+        )
+        self.assertEqual(offset, len(self.data))
+        with open(uploads.part_path(self.session), 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_wrong_offset_is_rejected(self):
+        with self.assertRaises(uploads.UploadError) as error:
+            uploads.append_chunk(self.session, 10, io.BytesIO(self.data[:10]), 10)
+        self.assertEqual(error.exception.status, 409)
+        self.assertEqual(error.exception.extra['offset'], 0)
+
+
+class UploadSessionsViewTests(TestCase):
+    """Начало загрузки: тело - JSON-объект"""
+
+    def setUp(self):
+        user = User.objects.create(username='photographer', user_type='photographer')
+        PhotographerProfile.objects.create(user=user)
+        self.client.force_login(user)
+
+    def test_non_object_body(self):
+        for body in ('[]', '"x"', '1', 'null', '{'):
+            response = self.client.post('/photographer/uploads/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        self.assertFalse(UploadSession.objects.exists())
+
+
+class BurstCollapseTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username='photographer', user_type='photographer')
+        photographer = PhotographerProfile.objects.create(user=user)
+        event = Event.objects.create(photographer=photographer, name='Забег', date=datetime.date(2026, 5, 1))
+        taken = datetime.datetime(2026, 5, 1, 10, 0, tzinfo=datetime.timezone.utc)
+
+        def photo(seconds, leader=None):
+            return Photo.objects.create(
+                photographer=photographer, event=event, status='active', original='x.jpg',
+                taken_at=taken + datetime.timedelta(seconds=seconds), burst_leader=leader,
+            )
+
+        self.leader = photo(0)
+        self.second = photo(1, self.leader)
+        self.third = photo(2, self.leader)
+        self.single = photo(60)
+
+    def collapsed(self):
+        visible = Photo.objects.filter(status='active').exclude(
+            id__in=DeletionRequest.objects.filter(status='pending').values('photo_id')
+        )
+        return {photo.pk: (photo.burst_size, photo.burst_key) for photo in bursts.collapse(visible)}
+
+    def test_burst_is_shown_by_leader(self):
+        self.assertEqual(self.collapsed(), {
+            self.leader.pk: (3, self.leader.pk),
+            self.single.pk: (1, self.single.pk),
+        })
+
+    def test_hidden_leader_keeps_burst_visible(self):
+        Photo.objects.filter(pk=self.leader.pk).update(status=Photo.Status.HIDDEN)
+        self.assertEqual(self.collapsed(), {
+            self.second.pk: (2, self.leader.pk),
+            self.single.pk: (1, self.single.pk),
+        })
+        members = bursts.burst_photos(Photo.objects.filter(status='active'), self.leader.pk)
+        self.assertEqual(list(members), [self.second, self.third])
+
+
+class ViewCounterFlushTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username='photographer', user_type='photographer')
+        photographer = PhotographerProfile.objects.create(user=user)
+        self.event = Event.objects.create(photographer=photographer, name='Забег', date=datetime.date(2026, 5, 1))
+        self.counter = counters.ViewCounter()
+        # Поток сброса в тестах не запускаем: вызываем его шаг напрямую
+        self.counter._flusher_pid = os.getpid()
+
+    def view(self, visitor):
+        request = RequestFactory().get('/', REMOTE_ADDR=visitor)
+        request.user = mock.Mock(is_authenticated=False)
+        return self.counter.record(self.event, request)
+
+    def test_idle_buffer_is_flushed_by_time(self):
+        self.assertTrue(self.view('10.0.0.1'))
+        self.assertEqual(self.counter.flush_if_due(), 0)
+        self.assertEqual(self.counter.pending(self.event), 1)
+
+        # Следующего просмотра нет - сброс по времени из фонового потока
+        self.counter._last_flush -= self.counter.flush_seconds
+        self.assertEqual(self.counter.flush_if_due(), 1)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.views_count, 1)
+        self.assertEqual(self.counter.pending(self.event), 0)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'FTS5 - только SQLite')
+class SqliteSearchIndexTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username='photographer', user_type='photographer')
+        photographer = PhotographerProfile.objects.create(user=user)
+        self.event = Event.objects.create(photographer=photographer, name='Регата', date=datetime.date(2026, 5, 1))
+        self.sunset = Photo.objects.create(photographer=photographer, event=self.event, original='a.jpg', title='Закат')
+        self.finish = Photo.objects.create(photographer=photographer, event=self.event, original='b.jpg', title='Финиш')
+
+    def found(self, query):
+        return list(search.filter_photos(Photo.objects.all(), query))
+
+    def test_index_survives_rowid_change(self):
+        # VACUUM перенумеровывает неявный rowid таблиц с UUID-ключом
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {search.PHOTO_TABLE} SET rowid = CASE id '
+                f'WHEN %s THEN 1001 ELSE 1000 END', [self.sunset.pk.hex]
+            )
+        self.assertEqual(self.found('закат'), [self.sunset])
+        self.assertEqual(self.found('финиш'), [self.finish])
+
+        self.finish.title = 'Старт'
+        self.finish.save()
+        self.assertEqual(self.found('финиш'), [])
+        self.assertEqual(self.found('старт'), [self.finish])
+        self.sunset.delete()
+        self.assertEqual(self.found('закат'), [])
+
+
+class TimelineParamsTests(TestCase):
+    """Параметры ленты из запроса: некорректные значения - без прыжка и курсора"""
+
+    def setUp(self):
+        user = User.objects.create(username='photographer', user_type='photographer')
+        photographer = PhotographerProfile.objects.create(user=user)
+        self.event = Event.objects.create(
+            photographer=photographer, name='Забег', date=datetime.date(2026, 5, 1), is_public=True
+        )
+        self.photo = Photo.objects.create(
+            photographer=photographer, event=self.event, status='active', original='x.jpg',
+            taken_at=datetime.datetime(2026, 5, 1, 10, 0, tzinfo=datetime.timezone.utc),
+        )
+        # Просмотры из буфера - в БД теста, а не при выходе процесса
+        self.addCleanup(counters.view_counter.flush)
+
+    def test_malformed_moment(self):
+        for value in ('25:99', '2026-13-01T10:00', 'завтра'):
+            self.assertIsNone(timeline.parse_moment(value, self.event), value)
+        self.assertIsNotNone(timeline.parse_moment('10:00', self.event))
+
+    def test_malformed_cursor(self):
+        for value in ('2026-05-01T10:00:00Z|garbage', '2026-05-01T10:00:00Z|zz', '2026-05-01T25:00:00Z|'
+                      + str(self.photo.pk), 'garbage', '|'):
+            self.assertIsNone(timeline.decode_cursor(value), value)
+        self.assertIsNotNone(timeline.decode_cursor(timeline.encode_cursor(self.photo)))
+
+    def test_views_ignore_malformed_params(self):
+        detail = f'/photos/events/{self.event.pk}/'
+        photos = f'/photos/events/{self.event.pk}/timeline/photos/'
+        for url, params in (
+            (detail, {'at': '25:99'}),
+            (detail, {'after': '2026-05-01T10:00:00Z|garbage'}),
+            (photos, {'at': '25:99'}),
+            (photos, {'after': '2026-05-01T10:00:00Z|zz'}),
+        ):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, (url, params))
+
+        response = self.client.get(photos, {'after': '2026-05-01T10:00:00Z|zz'})
+        self.assertEqual([item['id'] for item in response.json()['photos']], [str(self.photo.pk)])
+
+
+@override_settings(PHOTO_METRICS_ENABLED=True, METRICS_TOKEN='metrics')
+class ProcessingMetricsTests(TestCase):
+    """Гистограммы обработки - в БД: задача воркера видна на /photos/metrics/ веб-процесса"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=directory)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        user = User.objects.create(username='photographer', user_type='photographer')
+        self.photographer = PhotographerProfile.objects.create(user=user)
+
+    def upload(self, name, color):
+        data = io.BytesIO()
+        Image.new('RGB', (64, 48), color).save(data, 'JPEG')
+        photo = Photo(photographer=self.photographer, status='processing')
+        photo.original.save(name, ContentFile(data.getvalue()), save=False)
+        photo.save()
+        return photo
+
+    def test_task_timings_reach_endpoint(self):
+        for name, color in (('a.jpg', 'white'), ('b.jpg', 'black')):
+            tasks.process_uploaded_photo(str(self.upload(name, color).pk))
+
+        # Веб-процесс: в памяти ничего нет, всё читается из БД
+        with mock.patch.object(instrumentation, 'metrics', instrumentation.ProcessingMetrics()):
+            response = self.client.get('/photos/metrics/', HTTP_AUTHORIZATION='Bearer metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        metric = instrumentation.ProcessingMetrics.STAGE_METRIC
+        self.assertIn(f'{metric}_count{{stage="thumbnail"}} 2', body)
+        self.assertIn(f'{metric}_bucket{{stage="thumbnail",le="+Inf"}} 2', body)
+        self.assertIn(f'{instrumentation.ProcessingMetrics.RESULT_METRIC}{{result="ok"}} 2', body)
+
+    @override_settings(PHOTO_METRICS_ENABLED=False)
+    def test_disabled(self):
+        instrumentation.metrics.record({'thumbnail': 0.1}, 'ok')
+        self.assertFalse(ProcessingMetric.objects.exists())
+
+
+@unittest.skipIf(moto is None, 'нужны moto, boto3 и django-storages')
+class S3StorageTests(TestCase):
+    """STORAGE_BACKEND=s3: загрузка, подписанная ссылка и удаление через default_storage"""
+
+    # Как STORAGES['default'] в settings при STORAGE_BACKEND=s3
+    OPTIONS = {
+        'bucket_name': 'photomarket', 'region_name': 'us-east-1',
+        'access_key': 'test', 'secret_key': 'test', 'addressing_style': 'path',
+        'default_acl': None, 'querystring_auth': True, 'file_overwrite': False,
+    }
+
+    def setUp(self):
+        mock = moto.mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='photomarket')
+        # override_settings(STORAGES=...) в Django 4.2 теряет OPTIONS - подменяем само хранилище
+        default_storage._wrapped = S3Storage(**self.OPTIONS)
+        self.addCleanup(setattr, default_storage, '_wrapped', empty)
+
+        user = User.objects.create(username='photographer', user_type='photographer')
+        self.photographer = PhotographerProfile.objects.create(user=user)
+
+    def test_upload_sign_delete(self):
+        photo = Photo(photographer=self.photographer, status='processing')
+        photo.original.save('finish.jpg', ContentFile(b'jpeg'), save=False)
+        photo.save()
+        name = photo.original.name
+        self.assertTrue(default_storage.exists(name))
+        with open_file(photo.original) as file:
+            self.assertEqual(file.read(), b'jpeg')
+
+        # Приватный файл: редирект на подписанную ссылку хранилища
+        response = media.serve_protected(name, download_name='finish.jpg')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('Signature=', response.url)
+        download = requests.get(response.url)
+        self.assertEqual(download.content, b'jpeg')
+        self.assertIn('attachment', download.headers['Content-Disposition'])
+
+        default_storage.delete(name)
+        self.assertFalse(default_storage.exists(name))
+
+
+def jpeg(size=(80, 40), color='white', orientation=None, taken_at=None, offset=None, make=None, model=None):
+    """JPEG с заданными тегами EXIF"""
+    tags = Image.Exif()
+    if orientation:
+        tags[exif.TAG_ORIENTATION] = orientation
+    if make:
+        tags[exif.TAG_MAKE] = make
+    if model:
+        tags[exif.TAG_MODEL] = model
+    details = tags.get_ifd(exif.EXIF_IFD)
+    if taken_at:
+        details[exif.TAG_DATETIME_ORIGINAL] = taken_at
+    if offset:
+        details[exif.TAG_OFFSET_TIME_ORIGINAL] = offset
+    data = io.BytesIO()
+    Image.new('RGB', size, color).save(data, 'JPEG', exif=tags.tobytes())
+    return data.getvalue()
+
+
+class PhotoMetadataTests(TestCase):
+    """Размеры, время съёмки и камера из заголовков, поворот по EXIF"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=directory)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        user = User.objects.create(username='photographer', user_type='photographer')
+        self.photographer = PhotographerProfile.objects.create(user=user)
+
+    def test_read_file_metadata(self):
+        data = jpeg(orientation=6, taken_at='2026:05:01 10:15:30', offset='+03:00', make='Canon', model='Canon EOS R5')
+        metadata = exif.read_file_metadata(ContentFile(data))
+        self.assertEqual((metadata['width'], metadata['height'], metadata['orientation']), (40, 80, 6))
+        self.assertEqual(metadata['taken_at'], datetime.datetime(
+            2026, 5, 1, 7, 15, 30, tzinfo=datetime.timezone.utc
+        ))
+        self.assertEqual(metadata['camera_model'], 'Canon EOS R5')
+        self.assertEqual(metadata['file_size'], len(data))
+
+    def test_missing_or_broken_tags(self):
+        metadata = exif.read_file_metadata(ContentFile(jpeg(orientation=12, taken_at='вчера')))
+        self.assertEqual((metadata['width'], metadata['height'], metadata['orientation']), (80, 40, 1))
+        self.assertIsNone(metadata['taken_at'])
+        self.assertEqual(metadata['camera_model'], '')
+        self.assertEqual(exif.read_file_metadata(ContentFile(b'not an image')), {})
+
+    def test_processing_fills_metadata_and_rotates(self):
+        photo = Photo(photographer=self.photographer, status='processing', camera_model='Задано вручную')
+        photo.original.save('rotated.jpg', ContentFile(jpeg(
+            orientation=6, taken_at='2026:05:01 10:15:30', make='Sony', model='ILCE-7M4',
+        )), save=False)
+        photo.save()
+
+        self.assertTrue(photo_service.process_photo(photo))
+        photo.refresh_from_db()
+        self.assertEqual((photo.width, photo.height), (40, 80))
+        self.assertEqual(photo.file_size, photo.original.size)
+        self.assertIsNotNone(photo.taken_at)
+        # Заполненное поле не перезаписывается
+        self.assertEqual(photo.camera_model, 'Задано вручную')
+        # Превью повёрнуто: портрет, как в EXIF
+        with Image.open(photo.thumbnail.path) as thumbnail:
+            self.assertGreater(thumbnail.height, thumbnail.width)
+
+
+class DuplicateUploadTests(TestCase):
+    """Точные дубликаты оригиналов по SHA-256 в аккаунте фотографа"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=directory)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        user = User.objects.create(username='photographer', user_type='photographer')
+        self.photographer = PhotographerProfile.objects.create(user=user)
+        self.events = [
+            Event.objects.create(photographer=self.photographer, name=name, date=datetime.date(2026, 5, 1))
+            for name in ('Забег', 'Старт')
+        ]
+        self.client.force_login(user)
+        self.data = jpeg()
+
+    def upload(self, event, *files):
+        return self.client.post('/photographer/photos/upload/', {
+            'photos': [SimpleUploadedFile(name, data, content_type='image/jpeg') for name, data in files],
+            'event': event.pk,
+            'price': '300',
+        })
+
+    def test_hash_computed_while_uploading(self):
+        with mock.patch.object(uploads, 'content_hash', wraps=uploads.content_hash) as hashed:
+            self.upload(self.events[0], ('a.jpg', self.data))
+        photo = Photo.objects.get()
+        self.assertEqual(photo.content_hash, hashlib.sha256(self.data).hexdigest())
+        # Хэш уже посчитан обработчиком загрузки - файл не перечитывается
+        self.assertTrue(getattr(hashed.call_args.args[0], 'content_hash', ''))
+
+    def test_same_event_skipped_other_event_reused(self):
+        self.upload(self.events[0], ('a.jpg', self.data), ('b.jpg', jpeg(color='black')))
+        original = Photo.objects.get(event=self.events[0], content_hash=hashlib.sha256(self.data).hexdigest())
+        PhotoFace.objects.create(photo=original, face_location={'top': 1}, face_encoding=[0.1] * 128)
+
+        with mock.patch.object(photo_service, 'process_photo') as process:
+            self.upload(self.events[0], ('again.jpg', self.data))
+            self.assertEqual(Photo.objects.filter(event=self.events[0]).count(), 2)
+
+            self.upload(self.events[1], ('copy.jpg', self.data))
+        process.assert_not_called()
+
+        copy = Photo.objects.get(event=self.events[1])
+        self.assertEqual(copy.status, 'active')
+        self.assertEqual(
+            (copy.original.name, copy.thumbnail.name, copy.watermarked.name),
+            (original.original.name, original.thumbnail.name, original.watermarked.name),
+        )
+        self.assertEqual((copy.width, copy.height), (original.width, original.height))
+        self.assertEqual(list(copy.faces.values_list('face_location', flat=True)), [{'top': 1}])
+        self.events[1].refresh_from_db()
+        self.assertEqual(self.events[1].photos_count, 1)
+
+    def test_other_photographer_not_deduplicated(self):
+        self.upload(self.events[0], ('a.jpg', self.data))
+        user = User.objects.create(username='other', user_type='photographer')
+        other = PhotographerProfile.objects.create(user=user)
+        photo = Photo(photographer=other, status='processing', content_hash=hashlib.sha256(self.data).hexdigest())
+        self.assertIsNone(photo_service.find_duplicate(photo))
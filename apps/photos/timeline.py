@@ -0,0 +1,139 @@
+"""
+Лента события по времени съёмки (taken_at)
+- Количество фото по интервалам (1-60 минут) одним GROUP BY запросом
+- Keyset-пагинация по (taken_at, id) с прыжком сразу к нужному времени
+
+Запросы опираются на индекс (event, taken_at, id).
+"""
+import uuid
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+# Допустимые размеры интервала, минуты
+BUCKET_MINUTES = (1, 5, 10, 15, 30, 60)
+DEFAULT_BUCKET_MINUTES = 5
+PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+def timeline_photos(event):
+    """Фото события, видимые в ленте (без активных запросов на удаление)"""
+    from .models import DeletionRequest, Photo
+
+    return Photo.objects.filter(
+        event=event, status='active'
+    ).exclude(
+        id__in=DeletionRequest.objects.filter(status='pending').values('photo_id')
+    )
+
+
+def _floor(moment, minutes: int):
+    """Начало интервала в текущем часовом поясе"""
+    moment = timezone.localtime(moment)
+    minute = moment.minute - moment.minute % minutes if minutes < 60 else 0
+    return moment.replace(minute=minute, second=0, microsecond=0)
+
+
+def bucket_counts(queryset, minutes: int = DEFAULT_BUCKET_MINUTES) -> dict:
+    """
+    Количество фото по интервалам времени съёмки
+    Возвращает {'minutes', 'buckets': [{'start', 'end', 'count'}], 'unknown'}
+    unknown - фото без времени съёмки
+    """
+    if minutes not in BUCKET_MINUTES:
+        minutes = DEFAULT_BUCKET_MINUTES
+
+    rows = queryset.order_by().values(
+        minute=TruncMinute('taken_at')
+    ).annotate(n=Count('id')).order_by('minute')
+
+    buckets = {}
+    unknown = 0
+    for row in rows:
+        if row['minute'] is None:
+            unknown += row['n']
+            continue
+        start = _floor(row['minute'], minutes)
+        buckets[start] = buckets.get(start, 0) + row['n']
+
+    step = timedelta(minutes=minutes)
+    return {
+        'minutes': minutes,
+        'buckets': [
+            {'start': start.isoformat(), 'end': (start + step).isoformat(), 'count': count}
+            for start, count in sorted(buckets.items())
+        ],
+        'unknown': unknown,
+    }
+
+
+def encode_cursor(photo) -> str:
+    # UTC с 'Z': без '+' в смещении курсор не ломается в URL
+    moment = photo.taken_at.astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    return f'{moment}|{photo.id}'
+
+
+def decode_cursor(cursor: str):
+    """(taken_at, id) или None для некорректного курсора"""
+    moment, _, photo_id = (cursor or '').partition('|')
+    try:
+        taken_at = parse_datetime(moment) if moment else None
+        photo_id = uuid.UUID(photo_id)
+    except ValueError:
+        # Дата вне диапазона (25:99) или не UUID - как без курсора
+        return None
+    if taken_at is None:
+        return None
+    return taken_at, photo_id
+
+
+def page(queryset, start=None, after=None, limit: int = PAGE_SIZE):
+    """
+    Страница ленты по возрастанию времени съёмки
+    start - прыжок к моменту (datetime), after - курсор предыдущей страницы
+    Возвращает (фото, курсор следующей страницы или None)
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    queryset = queryset.filter(taken_at__isnull=False)
+
+    position = decode_cursor(after) if after else None
+    if position:
+        taken_at, photo_id = position
+        queryset = queryset.filter(
+            Q(taken_at__gt=taken_at) | Q(taken_at=taken_at, id__gt=photo_id)
+        )
+    elif start is not None:
+        queryset = queryset.filter(taken_at__gte=start)
+
+    photos = list(queryset.order_by('taken_at', 'id')[:limit + 1])
+    next_cursor = encode_cursor(photos[limit - 1]) if len(photos) > limit else None
+    return photos[:limit], next_cursor
+
+
+def parse_moment(value: str, event=None):
+    """
+    Момент из параметра запроса: ISO дата-время или ЧЧ:ММ в день события
+    Время без пояса считается локальным (TIME_ZONE)
+    Некорректное значение - None (без прыжка)
+    """
+    value = (value or '').strip()
+    if not value:
+        return None
+
+    try:
+        moment = parse_datetime(value)
+        if moment is None and event is not None and len(value) in (4, 5) and ':' in value:
+            moment = parse_datetime(f'{event.date.isoformat()}T{value.zfill(5)}')
+    except ValueError:
+        # Похоже на дату, но значения вне диапазона (25:99, 2026-13-01)
+        return None
+    if moment is None:
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
@@ -0,0 +1,69 @@
+"""
+Обработчики загрузки с подсчётом SHA-256 на лету
+
+Хэш считается по мере записи файла в память/на диск, повторно читать
+оригинал не нужно. Результат - атрибут content_hash у UploadedFile.
+Подключаются через FILE_UPLOAD_HANDLERS.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+# Размер блока при подсчёте хэша уже сохранённого файла
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class HashingUploadMixin:
+    """Считает SHA-256 принятых блоков и кладёт его в file.content_hash"""
+
+    def new_file(self, *args, **kwargs):
+        # До super(): MemoryFileUploadHandler прерывает цепочку исключением
+        self.hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.hasher.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def content_hash(file) -> str:
+    """
+    SHA-256 файла: из обработчика загрузки, если он уже посчитан,
+    иначе потоково по блокам (позиция файла восстанавливается)
+    """
+    precomputed = getattr(file, 'content_hash', None)
+    if precomputed:
+        return precomputed
+
+    hasher = hashlib.sha256()
+    if hasattr(file, 'chunks'):
+        file.seek(0)
+        for chunk in file.chunks(HASH_CHUNK_SIZE):
+            hasher.update(chunk)
+        file.seek(0)
+    elif hasattr(file, 'read'):
+        # Обычный двоичный файл (например, открытый через хранилище)
+        file.seek(0)
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+        file.seek(0)
+    else:
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+    return hasher.hexdigest()
@@ -0,0 +1,349 @@
+"""
+Загрузка оригиналов по частям с продолжением после обрыва
+
+Каждый файл - отдельная UploadSession:
+1. create_session: имя, размер и SHA-256 файла. Открытая сессия того же
+   файла возвращается повторно, клиент продолжает с session.received
+2. append_chunk: часть с явным смещением дописывается во временный файл
+   в UPLOAD_SESSION_DIR вне транзакции, принятые байты учитываются даже
+   при обрыве
+3. commit: размер и SHA-256 сверяются с заявленными, временный файл
+   переносится в хранилище (без копирования на том же диске), фото
+   ставится в обработку
+
+Уже загруженный в это событие файл (тот же SHA-256) повторно не передаётся.
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.http import UnreadablePostError
+from django.utils import timezone
+
+from .uploadhandlers import content_hash
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# Блок записи части на диск
+WRITE_BLOCK_SIZE = 64 * 1024
+
+# Допустимые расширения оригиналов
+ALLOWED_EXTENSIONS = ('jpg', 'jpeg', 'png', 'webp')
+
+# Результаты store_photo
+STORED = 'stored'
+REUSED = 'reused'
+DUPLICATE = 'duplicate'
+
+
+class UploadError(Exception):
+    """Ошибка загрузки, status - HTTP-код ответа API"""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+class PartFile(File):
+    """
+    Временный файл сессии: FileSystemStorage переносит его через
+    temporary_file_path, а не копирует
+    """
+
+    def __init__(self, path, name):
+        super().__init__(open(path, 'rb'), name=name)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def session_dir():
+    return str(getattr(settings, 'UPLOAD_SESSION_DIR', os.path.join(settings.MEDIA_ROOT, 'uploads', 'partial')))
+
+
+def part_path(session) -> str:
+    return os.path.join(session_dir(), f'{session.id}.part')
+
+
+def max_file_size() -> int:
+    return getattr(settings, 'MAX_PHOTO_SIZE_MB', 50) * 1024 * 1024
+
+
+def max_chunk_size() -> int:
+    return getattr(settings, 'UPLOAD_CHUNK_MAX_BYTES', 8 * 1024 * 1024)
+
+
+def _remove_part(session):
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def create_session(photographer, filename, size, sha256, event=None, price=None):
+    """
+    Новая сессия или открытая сессия того же файла (продолжение)
+    Если такой файл уже есть в событии - сессия сразу завершена
+    со ссылкой на существующее фото
+    """
+    from .models import Photo, UploadSession
+
+    filename = os.path.basename(filename or '')
+    sha256 = (sha256 or '').lower()
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if ext not in ALLOWED_EXTENSIONS:
+        raise UploadError(f'Неподдерживаемый формат: {filename}')
+    if not isinstance(size, int) or size <= 0:
+        raise UploadError('Некорректный размер файла')
+    if size > max_file_size():
+        raise UploadError(f'Файл больше {max_file_size() // (1024 * 1024)} МБ', status=413)
+    if len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256):
+        raise UploadError('Некорректный SHA-256')
+    if price is None:
+        price = Photo._meta.get_field('price').default
+
+    existing = UploadSession.objects.filter(
+        photographer=photographer,
+        event=event,
+        status=UploadSession.Status.OPEN,
+        sha256=sha256,
+        size=size,
+    ).order_by('created_at').first()
+    if existing is not None:
+        return existing
+
+    session = UploadSession(
+        photographer=photographer,
+        event=event,
+        price=price,
+        filename=filename,
+        size=size,
+        sha256=sha256,
+    )
+
+    duplicate = Photo.objects.filter(
+        photographer=photographer, event=event, content_hash=sha256
+    ).exclude(status='deleted').order_by('created_at').first()
+    if duplicate is not None:
+        session.status = UploadSession.Status.COMMITTED
+        session.received = size
+        session.photo = duplicate
+
+    session.save()
+    return session
+
+
+def append_chunk(session, offset: int, stream, length: int) -> int:
+    """
+    Дописывает часть длиной length со смещения offset из stream
+    Смещение должно совпадать с уже принятым объёмом (иначе 409 с текущим)
+    Возвращает новое смещение; при обрыве учитывается то, что успело прийти
+    (UploadError со смещением для продолжения)
+
+    Часть читается из сети вне транзакции: строку сессии блокирует только
+    короткое обновление received, условное по смещению. Параллельную запись
+    в тот же файл исключает блокировка файла части
+    """
+    from .models import UploadSession
+
+    if length <= 0:
+        raise UploadError('Пустая часть')
+    if length > max_chunk_size():
+        raise UploadError(f'Часть больше {max_chunk_size()} байт', status=413)
+
+    os.makedirs(session_dir(), exist_ok=True)
+    with open(part_path(session), 'ab') as f:
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError('Часть уже загружается', status=409, offset=session.received)
+
+        # Состояние - после блокировки: предыдущая часть могла только что завершиться
+        session = UploadSession.objects.get(pk=session.pk)
+        if session.status != UploadSession.Status.OPEN:
+            raise UploadError('Загрузка уже завершена', status=409, offset=session.received)
+        if offset != session.received:
+            raise UploadError('Неверное смещение', status=409, offset=session.received)
+        if offset + length > session.size:
+            raise UploadError('Часть выходит за размер файла', status=416, offset=session.received)
+
+        # Хвост от прерванной записи, не учтённый в received, отбрасываем
+        if f.tell() != offset:
+            f.truncate(offset)
+            f.seek(offset)
+        written = 0
+        broken = None
+        try:
+            while written < length:
+                block = stream.read(min(WRITE_BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                f.write(block)
+                written += len(block)
+        except (UnreadablePostError, OSError) as e:
+            # Клиент отключился - принятое сохраняем, он продолжит с received
+            broken = e
+        f.flush()
+        os.fsync(f.fileno())
+
+        if written:
+            updated = UploadSession.objects.filter(
+                pk=session.pk, status=UploadSession.Status.OPEN, received=offset
+            ).update(received=offset + written, updated_at=timezone.now())
+            if not updated:
+                session.refresh_from_db(fields=['status', 'received'])
+                raise UploadError('Загрузка изменилась во время передачи', status=409, offset=session.received)
+            session.received = offset + written
+
+    if broken is not None:
+        raise UploadError(f'Обрыв при передаче части: {broken}', offset=session.received)
+    return session.received
+
+
+def store_photo(photo, file):
+    """
+    Сохраняет оригинал нового фото с учётом точных дубликатов
+    Возвращает (результат, фото):
+    DUPLICATE - такой файл уже есть в этом событии (фото - существующее),
+    REUSED - взяты готовые версии дубликата из другого события,
+    STORED - файл сохранён, фото ждёт обработки
+    """
+    from .exif import read_file_metadata
+    from .services import photo_service
+
+    if not photo.content_hash:
+        photo.content_hash = content_hash(file)
+
+    duplicate = photo_service.find_duplicate(photo)
+    if duplicate is not None:
+        if duplicate.event_id == photo.event_id:
+            return DUPLICATE, duplicate
+        # Общий файл оригинала: загруженную копию не сохраняем
+        photo.original = duplicate.original.name
+        photo_service.reuse_processed(photo, duplicate)
+        return REUSED, photo
+
+    # Размеры, время съёмки и камера - из заголовков, без декодирования
+    photo_service.apply_metadata(photo, read_file_metadata(file))
+    photo.original = file
+    photo.save()
+    return STORED, photo
+
+
+def commit(session):
+    """
+    Проверяет размер и SHA-256, создаёт фото и ставит его в обработку
+    Возвращает сессию со ссылкой на фото
+    """
+    from .models import Photo, UploadSession
+    from .tasks import enqueue_processing
+
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status == UploadSession.Status.COMMITTED:
+            return session
+        if session.status != UploadSession.Status.OPEN:
+            raise UploadError('Загрузка отменена', status=409)
+        if session.received != session.size:
+            raise UploadError('Файл загружен не полностью', status=409, offset=session.received)
+
+        error = _verify(session)
+        if error is None:
+            photo = Photo(
+                photographer=session.photographer,
+                event=session.event,
+                price=session.price,
+                status='processing',
+                content_hash=session.sha256,
+            )
+            part = PartFile(part_path(session), session.filename)
+            try:
+                result, photo = store_photo(photo, part)
+            finally:
+                part.close()
+            _remove_part(session)
+
+            session.status = UploadSession.Status.COMMITTED
+            session.photo = photo
+            session.save(update_fields=['status', 'photo', 'updated_at'])
+
+    # Вне транзакции, чтобы отметка об ошибке не откатилась
+    if error is not None:
+        _fail(session, error)
+        raise UploadError(error, status=422)
+
+    if result == STORED:
+        enqueue_processing(photo)
+    return session
+
+
+def _verify(session):
+    """Текст ошибки, если временный файл не совпадает с заявленным, иначе None"""
+    path = part_path(session)
+    if not os.path.exists(path) or os.path.getsize(path) != session.size:
+        return 'Временный файл повреждён'
+    if content_hash(path) != session.sha256:
+        return 'SHA-256 не совпадает с заявленным'
+    return None
+
+
+def abort(session):
+    """Отменяет незавершённую загрузку и удаляет временный файл"""
+    from .models import UploadSession
+
+    if session.status == UploadSession.Status.OPEN:
+        session.status = UploadSession.Status.ABORTED
+        session.save(update_fields=['status', 'updated_at'])
+    _remove_part(session)
+    return session
+
+
+def _fail(session, error):
+    session.status = session.Status.FAILED
+    session.error = error
+    session.save(update_fields=['status', 'error', 'updated_at'])
+    _remove_part(session)
+
+
+def expire_sessions(hours=None) -> int:
+    """
+    Отменяет сессии без активности дольше UPLOAD_SESSION_TTL_HOURS
+    и удаляет их временные файлы, возвращает число сессий
+    """
+    from .models import UploadSession
+
+    if hours is None:
+        hours = getattr(settings, 'UPLOAD_SESSION_TTL_HOURS', 24)
+    stale = UploadSession.objects.filter(
+        status=UploadSession.Status.OPEN,
+        updated_at__lt=timezone.now() - timedelta(hours=hours),
+    )
+    expired = 0
+    for session in stale.iterator():
+        abort(session)
+        expired += 1
+    return expired
+
+
+def session_data(session) -> dict:
+    """Состояние сессии для ответа API"""
+    return {
+        'id': str(session.id),
+        'filename': session.filename,
+        'size': session.size,
+        'sha256': session.sha256,
+        'offset': session.received,
+        'status': session.status,
+        'event': session.event_id,
+        'photo': str(session.photo_id) if session.photo_id else None,
+        'chunk_size': max_chunk_size(),
+    }
@@ -8,4 +8,13 @@ urlpatterns = [
     path('', views.photo_gallery, name='gallery'),
     path('events/', views.events_list, name='events'),
     path('events/<int:pk>/', views.event_detail, name='event_detail'),
+    path('events/<int:pk>/timeline/', views.event_timeline, name='event_timeline'),
+    path('events/<int:pk>/timeline/photos/', views.event_timeline_photos, name='event_timeline_photos'),
+    path('search/', views.search_api, name='search'),
+    
+    # Приватные файлы по подписанной ссылке
+    path('media/<path:name>', views.protected_media, name='protected_media'),
+    
+    # Метрики обработки (Prometheus)
+    path('metrics/', views.processing_metrics, name='metrics'),
 ]
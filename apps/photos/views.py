@@ -1,11 +1,26 @@
 """
 Публичные views для фотографий и событий
 """
+import os
+import uuid
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404
+from django.utils import timezone
 from django.core.paginator import Paginator
+from . import bursts, search, timeline
+from .counters import view_counter
 from .models import Photo, Event
 
 
+# Сколько результатов отдаёт search_api
+SEARCH_EVENTS_LIMIT = 10
+SEARCH_PHOTOS_LIMIT = 24
+# Интервал ленты на странице события, минуты
+TIMELINE_PAGE_BUCKET_MINUTES = 10
+
+
 def photo_gallery(request):
     """Публичная галерея фото"""
     from .models import DeletionRequest
@@ -21,6 +36,13 @@ def photo_gallery(request):
         id__in=pending_deletion_photo_ids
     ).select_related('photographer__user', 'event').order_by('-created_at')
     
+    # Серия кадров показывается первым кадром
+    photos = bursts.collapse(photos)
+    
+    # Бейджи "Куплено" и "Это вы" для вошедшего пользователя
+    from apps.clients.services import annotate_user_status
+    photos = annotate_user_status(photos, request.user)
+    
     # Фильтр по событию (опционально)
     if request.GET.get('event'):
         photos = photos.filter(event__is_public=True)
@@ -38,6 +60,14 @@ def events_list(request):
         is_public=True
     ).select_related('photographer__user').order_by('-date')
     
+    # Полнотекстовый поиск (название, описание, место, город)
+    query = request.GET.get('q', '').strip()
+    if query:
+        events = search.filter_events(events, query).order_by('-search_rank', '-date')
+    
+    # Фасеты считаются до фильтров по типу и городу, чтобы видеть альтернативы
+    facets = search.cached('event_facets', {'q': query}, lambda: search.event_facets(events))
+    
     # Фильтры
     event_type = request.GET.get('type')
     city = request.GET.get('city')
@@ -53,32 +83,211 @@ def events_list(request):
     
     return render(request, 'photos/events.html', {
         'events': events,
-        'event_types': Event.EventType.choices
+        'event_types': Event.EventType.choices,
+        'facets': facets,
+        'query': query,
     })
 
 
-def event_detail(request, pk):
-    """Детали события"""
+def search_api(request):
+    """
+    Поиск по событиям и фото (JSON)
+    Параметры: q, type, city, month (ГГГГ-ММ), price (ключ из search.PRICE_RANGES)
+    """
     from .models import DeletionRequest
     
+    params = {key: request.GET.get(key, '').strip() for key in ('q', 'type', 'city', 'month', 'price')}
+    
+    def compute():
+        events = Event.objects.filter(is_public=True)
+        photos = Photo.objects.filter(status='active').exclude(
+            id__in=DeletionRequest.objects.filter(status='pending').values('photo_id')
+        )
+        if params['q']:
+            events = search.filter_events(events, params['q'])
+            photos = search.filter_photos(photos, params['q'])
+        
+        facets = search.photo_facets(photos)
+        
+        if params['type']:
+            events = events.filter(event_type=params['type'])
+            photos = photos.filter(event__event_type=params['type'])
+        if params['city']:
+            events = events.filter(city__iexact=params['city'])
+            photos = photos.filter(event__city__iexact=params['city'])
+        if params['month']:
+            try:
+                year, month = (int(part) for part in params['month'].split('-'))
+            except ValueError:
+                pass
+            else:
+                events = events.filter(date__year=year, date__month=month)
+                photos = photos.filter(event__date__year=year, event__date__month=month)
+        for key, low, high in search.PRICE_RANGES:
+            if params['price'] == key:
+                photos = photos.filter(price__gte=low)
+                if high is not None:
+                    photos = photos.filter(price__lt=high)
+        
+        ordering = ('-search_rank',) if params['q'] else ()
+        events = events.order_by(*ordering, '-date')[:SEARCH_EVENTS_LIMIT]
+        photos = photos.select_related('event').order_by(*ordering, '-created_at')[:SEARCH_PHOTOS_LIMIT]
+        
+        return {
+            'events': [{
+                'id': event.id,
+                'name': event.name,
+                'event_type': event.event_type,
+                'city': event.city,
+                'date': event.date.isoformat(),
+                'photos_count': event.photos_count,
+            } for event in events],
+            'photos': [{
+                'id': str(photo.id),
+                'title': photo.title,
+                'thumbnail': photo.thumbnail.url if photo.thumbnail else None,
+                'price': str(photo.price),
+                'event': photo.event.name if photo.event else None,
+            } for photo in photos],
+            'facets': facets,
+        }
+    
+    return JsonResponse(search.cached('search', params, compute))
+
+
+def _parse_uuid(value):
+    try:
+        return uuid.UUID(value) if value else None
+    except ValueError:
+        return None
+
+
+def event_detail(request, pk):
+    """
+    Детали события
+    С параметром at (ЧЧ:ММ или ISO) или after (курсор) фото идут по времени
+    съёмки начиная с выбранного момента - лента для больших забегов
+    Серии кадров свёрнуты, burst=<id первого кадра> показывает серию целиком
+    """
     event = get_object_or_404(Event, pk=pk, is_public=True)
+    view_counter.record(event, request)
     
     # Исключаем фото с активными запросами на удаление
-    pending_deletion_photo_ids = DeletionRequest.objects.filter(
-        status='pending'
-    ).values_list('photo_id', flat=True)
+    photos = timeline.timeline_photos(event)
+    photos_total = photos.count()
     
-    photos = Photo.objects.filter(
-        event=event, status='active'
-    ).exclude(
-        id__in=pending_deletion_photo_ids
-    ).order_by('-created_at')
+    context = {
+        'event': event,
+        'photos_total': photos_total,
+        'timeline': timeline.bucket_counts(photos, minutes=TIMELINE_PAGE_BUCKET_MINUTES),
+    }
     
-    paginator = Paginator(photos, 24)
-    page = request.GET.get('page')
-    photos = paginator.get_page(page)
+    start = timeline.parse_moment(request.GET.get('at'), event)
+    after = request.GET.get('after')
+    burst = _parse_uuid(request.GET.get('burst'))
+    if start or after:
+        context['photos'], context['next_cursor'] = timeline.page(photos, start=start, after=after)
+        context['timeline_mode'] = True
+    elif burst:
+        # Все кадры одной серии
+        context['photos'] = bursts.burst_photos(photos, burst)
+        context['burst_mode'] = True
+    else:
+        # Серии кадров свёрнуты до первого кадра
+        paginator = Paginator(bursts.collapse(photos).order_by('-created_at'), 24)
+        context['photos'] = paginator.get_page(request.GET.get('page'))
     
-    return render(request, 'photos/event_detail.html', {
-        'event': event,
-        'photos': photos
+    return render(request, 'photos/event_detail.html', context)
+
+
+def event_timeline(request, pk):
+    """
+    Количество фото события по интервалам времени съёмки (JSON)
+    Параметр minutes: 1, 5, 10, 15, 30 или 60
+    """
+    event = get_object_or_404(Event, pk=pk, is_public=True)
+    try:
+        minutes = int(request.GET.get('minutes', timeline.DEFAULT_BUCKET_MINUTES))
+    except ValueError:
+        minutes = timeline.DEFAULT_BUCKET_MINUTES
+    
+    data = timeline.bucket_counts(timeline.timeline_photos(event), minutes=minutes)
+    data['event'] = event.id
+    return JsonResponse(data)
+
+
+def event_timeline_photos(request, pk):
+    """
+    Страница фото события по времени съёмки (JSON)
+    Параметры: at - момент для прыжка, after - курсор next из прошлого ответа, limit
+    """
+    event = get_object_or_404(Event, pk=pk, is_public=True)
+    try:
+        limit = int(request.GET.get('limit', timeline.PAGE_SIZE))
+    except ValueError:
+        limit = timeline.PAGE_SIZE
+    
+    photos, next_cursor = timeline.page(
+        timeline.timeline_photos(event),
+        start=timeline.parse_moment(request.GET.get('at'), event),
+        after=request.GET.get('after'),
+        limit=limit,
+    )
+    return JsonResponse({
+        'photos': [{
+            'id': str(photo.id),
+            'taken_at': timezone.localtime(photo.taken_at).isoformat(),
+            'thumbnail': photo.thumbnail.url if photo.thumbnail else None,
+            'price': str(photo.price),
+        } for photo in photos],
+        'next': next_cursor,
     })
+
+
+def processing_metrics(request):
+    """
+    Метрики этапов обработки фото в формате Prometheus
+    Доступ по заголовку Authorization: Bearer <METRICS_TOKEN> или для staff
+    """
+    from .instrumentation import metrics
+    
+    if not getattr(settings, 'PHOTO_METRICS_ENABLED', False):
+        raise Http404
+    
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorized = request.user.is_staff or (
+        token and request.headers.get('Authorization') == f'Bearer {token}'
+    )
+    if not authorized:
+        return HttpResponse(status=403)
+    
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def protected_media(request, name):
+    """
+    Приватный файл (оригинал, селфи) по подписанной ссылке media.signed_url
+    Байты отдаёт фронтовой прокси (X-Accel-Redirect / X-Sendfile)
+    """
+    from . import media
+    
+    if not media.verify(name, request.GET.get('e'), request.GET.get('s')):
+        return HttpResponse('Ссылка недействительна или устарела', status=403)
+    
+    download_name = os.path.basename(name) if request.GET.get('dl') else ''
+    return media.serve_protected(name, download_name=download_name)
+
+
+def public_media(request, name):
+    """
+    Публичные версии (превью, водяной знак, аватары) без фронтового прокси
+    Только для разработки: в продакшене их отдаёт nginx
+    """
+    from django.views.static import serve
+    from . import media
+    
+    if not media.is_public(name):
+        raise Http404
+    response = serve(request, name, document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = media.IMMUTABLE_CACHE_CONTROL
+    return response
@@ -5,3 +5,6 @@ class RecognitionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.recognition'
     verbose_name = 'Распознавание лиц'
+
+    def ready(self):
+        from . import signals  # noqa: F401
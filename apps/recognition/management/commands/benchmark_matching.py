@@ -0,0 +1,32 @@
+"""
+Команда для нагрузочного теста сопоставления лиц
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import face_matching, report
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк сопоставления лиц на синтетических кодировках (без dlib)'
+
+    def add_arguments(self, parser):
+        face_matching.add_arguments(parser)
+
+    def handle(self, *args, **options):
+        result = face_matching.run(
+            faces=options['faces'],
+            clients=options['clients'],
+            queries=options['queries'],
+            repeat=options['repeat'],
+            seed=options['seed'],
+        )
+        report.write_report(result, options['output'], stream=self.stdout)
+
+        if face_matching.check(
+            result,
+            baseline_path=options['baseline'],
+            threshold=options['threshold'],
+            min_recall=options['min_recall'],
+            stream=self.stderr,
+        ):
+            raise CommandError('Сопоставление лиц хуже допустимого')
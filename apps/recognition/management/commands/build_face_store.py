@@ -0,0 +1,35 @@
+"""
+Команда для сборки хранилища кодировок лиц
+"""
+from django.core.management.base import BaseCommand
+from apps.photos.models import PhotoFace
+from apps.recognition.matching import sync_face_store
+from apps.recognition.store import face_store
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает memory-mapped хранилище кодировок лиц'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--append',
+            action='store_true',
+            help='Только дописать лица, которых ещё нет в хранилище',
+        )
+
+    def handle(self, *args, **options):
+        if not face_store.available:
+            self.stdout.write(self.style.ERROR('numpy недоступен!'))
+            return
+
+        self.stdout.write(f'Каталог хранилища: {face_store.directory}')
+
+        if options['append']:
+            added = sync_face_store()
+            self.stdout.write(self.style.SUCCESS(f'Дописано лиц: {added}'))
+        else:
+            faces = PhotoFace.objects.order_by('id').values_list('id', 'face_encoding')
+            total = face_store.rebuild(faces.iterator(chunk_size=2000))
+            self.stdout.write(self.style.SUCCESS(f'Записано лиц: {total}'))
+
+        self.stdout.write(f'Всего в хранилище: {len(face_store)}')
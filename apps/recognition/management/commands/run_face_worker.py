@@ -0,0 +1,42 @@
+"""
+Команда запуска пула распознавания лиц
+Модели face_recognition загружаются в процессы пула один раз при старте,
+процессы Django и Celery с FACE_WORKER_SOCKET отправляют фото через сокет
+"""
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.recognition.worker import FaceWorkerError, FaceWorkerServer
+
+
+class Command(BaseCommand):
+    help = 'Запускает пул распознавания лиц с прогретыми моделями на Unix-сокете'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default='', help='Путь к сокету (по умолчанию FACE_WORKER_SOCKET)')
+        parser.add_argument('--processes', type=int, default=0, help='Процессов пула (по умолчанию FACE_WORKER_PROCESSES)')
+        parser.add_argument('--detector', default='', help='Класс детектора (по умолчанию FACE_WORKER_DETECTOR)')
+
+    def handle(self, *args, **options):
+        server = FaceWorkerServer(
+            address=options['socket'] or None,
+            processes=options['processes'] or None,
+            detector=options['detector'] or None,
+        )
+        try:
+            server.start()
+        except FaceWorkerError as e:
+            raise CommandError(str(e))
+
+        # SIGTERM от супервизора - как Ctrl+C: закрыть сокет и остановить пул
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пул распознавания: {server.processes} процессов, сокет {server.address}'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
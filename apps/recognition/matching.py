@@ -0,0 +1,212 @@
+"""
+Сопоставление клиентов с лицами на фото
+- Шаблоны лиц клиентов по нескольким селфи
+- Поиск лиц клиента через хранилище кодировок
+- Векторное сопоставление лица на фото с шаблонами всех клиентов
+"""
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+
+from apps.photos.lazy import lazy_import
+from apps.photos.models import PhotoFace
+from apps.photos.storage import open_file
+from .services import face_service
+from .store import face_store
+
+np = lazy_import('numpy')
+
+
+# Размер пачки id для запросов к БД
+ID_BATCH_SIZE = 500
+
+
+class ClientTemplateIndex:
+    """
+    Шаблоны лиц всех клиентов в одной матрице
+    Лицо сравнивается со всеми эталонами за одну векторную операцию
+    """
+
+    def __init__(self, clients):
+        self.owners = []
+        vectors = []
+        for client in clients:
+            for encoding in client.get_face_template():
+                self.owners.append(client)
+                vectors.append(encoding)
+
+        self.matrix = None
+        if vectors and np is not None:
+            self.matrix = np.asarray(vectors, dtype=float)
+
+    def __bool__(self):
+        return self.matrix is not None
+
+    def best_match(self, encoding, tolerance: Optional[float] = None):
+        """
+        Ближайший клиент для лица
+        Возвращает (клиент, уверенность) или None
+        """
+        if self.matrix is None or encoding is None or len(encoding) == 0:
+            return None
+
+        if tolerance is None:
+            tolerance = face_service.tolerance
+
+        distances = np.linalg.norm(self.matrix - np.asarray(encoding, dtype=float), axis=1)
+        best = int(np.argmin(distances))
+        if distances[best] > tolerance:
+            return None
+        return self.owners[best], max(0, 1 - float(distances[best])) * 100
+
+
+def rebuild_client_template(profile) -> List[List[float]]:
+    """
+    Пересобирает шаблон лица клиента по всем обработанным селфи
+    """
+    encodings = list(
+        profile.selfies.exclude(face_encoding__isnull=True)
+        .order_by('created_at')
+        .values_list('face_encoding', flat=True)
+    )
+    template = face_service.build_template(encodings)
+
+    profile.face_template = template or None
+    profile.face_encoding = template[0] if template else None
+    profile.face_processed = bool(template)
+    profile.save(update_fields=['face_template', 'face_encoding', 'face_processed', 'updated_at'])
+    return template
+
+
+def extract_selfie_encoding(selfie) -> Optional[str]:
+    """
+    Извлекает кодировку лица с одного селфи
+    Возвращает текст ошибки или None при успехе
+    """
+    with open_file(selfie.image) as image:
+        faces = face_service.get_face_data(image)
+
+    if not faces:
+        return 'Лицо не обнаружено на фото'
+    if len(faces) > 1:
+        return 'На фото обнаружено более одного лица'
+
+    selfie.face_encoding = faces[0]['encoding']
+    selfie.save(update_fields=['face_encoding'])
+    return None
+
+
+def add_client_selfie(profile, image, replace: bool = False) -> Optional[str]:
+    """
+    Добавляет селфи в эталоны клиента и обновляет шаблон
+    Старые селфи сверх лимита CLIENT_MAX_SELFIES удаляются
+    Возвращает текст ошибки или None при успехе
+    """
+    from apps.accounts.models import ClientSelfie
+
+    selfie = ClientSelfie.objects.create(profile=profile, image=image)
+    profile.selfie = selfie.image.name
+    profile.save(update_fields=['selfie', 'updated_at'])
+
+    error = extract_selfie_encoding(selfie)
+    if error:
+        selfie.delete()
+        profile.face_processing_error = error
+        profile.save(update_fields=['face_processing_error', 'updated_at'])
+        return error
+
+    others = profile.selfies.exclude(id=selfie.id)
+    if replace:
+        others.delete()
+    else:
+        limit = getattr(settings, 'CLIENT_MAX_SELFIES', 5)
+        stale_ids = list(others.order_by('-created_at').values_list('id', flat=True)[limit - 1:])
+        if stale_ids:
+            profile.selfies.filter(id__in=stale_ids).delete()
+
+    profile.face_processing_error = ''
+    rebuild_client_template(profile)
+    return None
+
+
+def sync_face_store(chunk_size: int = 10000) -> int:
+    """
+    Дописывает в хранилище лица из БД, которых там ещё нет
+    Сравниваются множества id, а не наибольший id: хранилище своё на каждом
+    хосте, и лица, созданные на другом хосте (bulk_create без сигналов) или
+    закоммиченные позже лиц с большими id, имеют id ниже уже записанных.
+    Проход по id - индексный, кодировки читаются только для недостающих
+    """
+    if not face_store.available:
+        return 0
+
+    missing = []
+    chunk = []
+    face_ids = PhotoFace.objects.exclude(face_encoding=[]).order_by('id').values_list('id', flat=True)
+    for face_id in face_ids.iterator(chunk_size=chunk_size):
+        chunk.append(face_id)
+        if len(chunk) >= chunk_size:
+            missing.extend(np.asarray(chunk)[~face_store.contains(chunk)].tolist())
+            chunk = []
+    if chunk:
+        missing.extend(np.asarray(chunk)[~face_store.contains(chunk)].tolist())
+
+    added = 0
+    for start in range(0, len(missing), ID_BATCH_SIZE):
+        rows = PhotoFace.objects.filter(
+            id__in=missing[start:start + ID_BATCH_SIZE]
+        ).order_by('id').values_list('id', 'face_encoding')
+        added += face_store.append(rows)
+    return added
+
+
+def match_client_photos(
+    profile,
+    include_matched: bool = False,
+    active_only: bool = False
+) -> Tuple[int, int]:
+    """
+    Ищет лицо клиента на всех фото и привязывает найденные лица к нему
+    include_matched - перепривязывать лица, уже сопоставленные с другими
+    active_only - только лица на активных фото
+    Возвращает (всего совпадений, новых совпадений)
+
+    Поиск только читает хранилище: новые лица дописывают сигналы, сверку
+    с БД делают запуск воркера и build_face_store --append по расписанию
+    """
+    template = profile.get_face_template()
+    if not template:
+        return 0, 0
+
+    hits = face_store.search(template, face_service.tolerance)
+    if not hits:
+        return 0, 0
+
+    distances = dict(hits)
+    face_ids = list(distances)
+
+    matched_count = 0
+    updated = []
+    for start in range(0, len(face_ids), ID_BATCH_SIZE):
+        faces = PhotoFace.objects.filter(id__in=face_ids[start:start + ID_BATCH_SIZE])
+        if not include_matched:
+            faces = faces.filter(matched_user__isnull=True)
+        if active_only:
+            faces = faces.filter(photo__status='active')
+
+        for face in faces.only('id', 'matched_user_id'):
+            matched_count += 1
+            if face.matched_user_id == profile.user_id:
+                continue
+            face.matched_user_id = profile.user_id
+            face.match_confidence = max(0, 1 - distances[face.id]) * 100
+            updated.append(face)
+
+    PhotoFace.objects.bulk_update(
+        updated, ['matched_user', 'match_confidence'], batch_size=ID_BATCH_SIZE
+    )
+    if updated:
+        # bulk_update не шлёт post_save - сбрасываем цены клиента сами
+        from apps.payments import pricing
+        pricing.matches_changed([profile.user_id])
+    return matched_count, len(updated)
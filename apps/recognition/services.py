@@ -1,20 +1,74 @@
 """
 Сервис распознавания лиц
 Заглушка для разработки без face_recognition
+numpy загружается при первом расчёте (apps.photos.lazy)
+
+С FACE_WORKER_SOCKET поиск и кодирование лиц выполняет пул с прогретыми
+моделями (apps.recognition.worker), и face_recognition/dlib в этом
+процессе не импортируется. Без сокета модели загружаются при первом
+распознавании.
 """
+import importlib.util
 from typing import List, Tuple, Optional
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from apps.photos import instrumentation as stages
+from apps.photos.instrumentation import null_trace
+from apps.photos.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+# Флаг доступности библиотеки face_recognition (без её импорта - он загружает dlib)
+FACE_RECOGNITION_AVAILABLE = np is not None and importlib.util.find_spec('face_recognition') is not None
+
+_face_recognition = None
+
+
+def load_face_recognition():
+    """face_recognition для распознавания в этом процессе"""
+    global _face_recognition
+    if _face_recognition is None:
+        import face_recognition
+        _face_recognition = face_recognition
+    return _face_recognition
+
+
+def face_records(locations, encodings) -> List[dict]:
+    """Лица в формате get_face_data: координаты и кодировка списком"""
+    return [
+        {
+            'location': {
+                'top': location[0],
+                'right': location[1],
+                'bottom': location[2],
+                'left': location[3]
+            },
+            'encoding': encoding.tolist()
+        }
+        for location, encoding in zip(locations, encodings)
+    ]
+
 
-# Флаг доступности библиотеки face_recognition
-FACE_RECOGNITION_AVAILABLE = False
+def read_image(image) -> bytes:
+    """Байты изображения (путь или открытый файл) для отправки в пул"""
+    if hasattr(image, 'read'):
+        if hasattr(image, 'seek'):
+            image.seek(0)
+        return image.read()
+    with open(image, 'rb') as f:
+        return f.read()
 
-try:
-    import numpy as np
-    import face_recognition
-    FACE_RECOGNITION_AVAILABLE = True
-except ImportError:
-    np = None
-    face_recognition = None
+
+def face_distance(known_encodings, unknown_encoding):
+    """
+    Евклидовы расстояния от лица до набора известных лиц
+    Эквивалент face_recognition.face_distance, но без загрузки dlib
+    """
+    known = np.asarray(known_encodings, dtype=float)
+    if known.size == 0:
+        return np.empty(0)
+    return np.linalg.norm(known - np.asarray(unknown_encoding, dtype=float), axis=1)
 
 
 class FaceRecognitionService:
@@ -26,35 +80,57 @@ class FaceRecognitionService:
     def __init__(self):
         self.tolerance = getattr(settings, 'FACE_RECOGNITION_TOLERANCE', 0.6)
         self.model = getattr(settings, 'FACE_ENCODING_MODEL', 'large')
-        self.available = FACE_RECOGNITION_AVAILABLE
+        self.worker_socket = getattr(settings, 'FACE_WORKER_SOCKET', '')
+        self.available = bool(self.worker_socket) or FACE_RECOGNITION_AVAILABLE
+        self._worker = None
     
-    def get_face_locations(self, image_path: str) -> List[Tuple[int, int, int, int]]:
+    @property
+    def worker(self):
+        """Клиент пула распознавания (при заданном FACE_WORKER_SOCKET)"""
+        if self._worker is None:
+            from .worker import FaceWorkerClient
+            self._worker = FaceWorkerClient(self.worker_socket)
+        return self._worker
+    
+    def get_face_locations(self, image) -> List[Tuple[int, int, int, int]]:
         """
-        Находит все лица на изображении
+        Находит все лица на изображении (путь или открытый файл)
         Возвращает список координат (top, right, bottom, left)
         """
         if not self.available:
             print("[DEV] face_recognition не установлен, пропускаем распознавание")
             return []
         
+        if self.worker_socket:
+            return [
+                (face['location']['top'], face['location']['right'],
+                 face['location']['bottom'], face['location']['left'])
+                for face in self.get_face_data(image)
+            ]
+        
         try:
-            image = face_recognition.load_image_file(image_path)
+            face_recognition = load_face_recognition()
+            image = face_recognition.load_image_file(image)
             return face_recognition.face_locations(image, model='hog')
         except Exception as e:
             print(f"Ошибка определения лиц: {e}")
             return []
     
-    def get_face_encodings(self, image_path: str) -> List:
+    def get_face_encodings(self, image) -> List:
         """
         Получает кодировки (embeddings) всех лиц на изображении
-        128-мерный вектор для каждого лица
+        (путь или открытый файл) - 128-мерный вектор для каждого лица
         """
         if not self.available:
             print("[DEV] face_recognition не установлен, пропускаем распознавание")
             return []
         
+        if self.worker_socket:
+            return [np.asarray(face['encoding']) for face in self.get_face_data(image)]
+        
         try:
-            image = face_recognition.load_image_file(image_path)
+            face_recognition = load_face_recognition()
+            image = face_recognition.load_image_file(image)
             face_locations = face_recognition.face_locations(image, model='hog')
             encodings = face_recognition.face_encodings(
                 image, 
@@ -66,39 +142,49 @@ class FaceRecognitionService:
             print(f"Ошибка кодирования лиц: {e}")
             return []
     
-    def get_face_data(self, image_path: str) -> List[dict]:
+    def get_face_data(self, image, trace=null_trace) -> List[dict]:
         """
         Получает и координаты, и кодировки всех лиц
+        image - путь или открытый файл (например, из Storage API)
+        trace - ProcessingTrace для замера этапов детекции и кодирования
         """
         if not self.available:
             print("[DEV] face_recognition не установлен, пропускаем распознавание")
             return []
         
+        if self.worker_socket:
+            with trace.span(stages.OPEN_DECODE):
+                data = read_image(image)
+            # Декодирование, поиск и кодирование - в пуле, одним этапом
+            with trace.span(stages.FACE_DETECTION):
+                return self.worker.detect([data])[0]
+        
         try:
-            image = face_recognition.load_image_file(image_path)
-            face_locations = face_recognition.face_locations(image, model='hog')
-            encodings = face_recognition.face_encodings(
-                image, 
-                face_locations,
-                model=self.model
-            )
-            
-            faces = []
-            for location, encoding in zip(face_locations, encodings):
-                faces.append({
-                    'location': {
-                        'top': location[0],
-                        'right': location[1],
-                        'bottom': location[2],
-                        'left': location[3]
-                    },
-                    'encoding': encoding.tolist()
-                })
-            return faces
+            face_recognition = load_face_recognition()
+            with trace.span(stages.OPEN_DECODE):
+                image = face_recognition.load_image_file(image)
+            with trace.span(stages.FACE_DETECTION):
+                face_locations = face_recognition.face_locations(image, model='hog')
+            with trace.span(stages.FACE_ENCODING):
+                encodings = face_recognition.face_encodings(
+                    image, 
+                    face_locations,
+                    model=self.model
+                )
+            return face_records(face_locations, encodings)
         except Exception as e:
             print(f"Ошибка обработки лиц: {e}")
             return []
     
+    def get_face_data_batch(self, images) -> List[List[dict]]:
+        """
+        Лица для каждого изображения пачки
+        С пулом - один запрос, изображения распределяются по его процессам
+        """
+        if self.available and self.worker_socket:
+            return self.worker.detect([read_image(image) for image in images])
+        return [self.get_face_data(image) for image in images]
+    
     def compare_faces(
         self, 
         known_encoding: List[float], 
@@ -107,15 +193,13 @@ class FaceRecognitionService:
         """
         Сравнивает два лица
         Возвращает (совпадение, расстояние)
+        Нужен только numpy: расстояние считается так же, как face_recognition.face_distance
         """
-        if not self.available:
+        if np is None:
             return False, 0.0
         
         try:
-            known = np.array(known_encoding)
-            unknown = np.array(unknown_encoding)
-            
-            distance = face_recognition.face_distance([known], unknown)[0]
+            distance = float(face_distance([known_encoding], unknown_encoding)[0])
             match = distance <= self.tolerance
             confidence = max(0, 1 - distance) * 100
             
@@ -131,28 +215,59 @@ class FaceRecognitionService:
     ) -> List[Tuple[str, float]]:
         """
         Ищет совпадения целевого лица среди множества лиц
+        Все расстояния считаются одной векторной операцией
         """
-        if not self.available:
+        if np is None or not face_encodings:
             return []
         
         try:
-            target = np.array(target_encoding)
+            face_ids = [face_id for face_id, _ in face_encodings]
+            distances = face_distance([encoding for _, encoding in face_encodings], target_encoding)
             
-            matches = []
-            for face_id, encoding in face_encodings:
-                unknown = np.array(encoding)
-                distance = face_recognition.face_distance([target], unknown)[0]
-                
-                if distance <= self.tolerance:
-                    confidence = max(0, 1 - distance) * 100
-                    matches.append((face_id, confidence))
+            matches = [
+                (face_ids[i], max(0, 1 - float(distances[i])) * 100)
+                for i in np.nonzero(distances <= self.tolerance)[0]
+            ]
             
             matches.sort(key=lambda x: x[1], reverse=True)
             return matches
         except Exception as e:
             print(f"Ошибка поиска лиц: {e}")
             return []
+    
+    def build_template(
+        self,
+        encodings: List[List[float]],
+        medoids: Optional[int] = None
+    ) -> List[List[float]]:
+        """
+        Собирает компактный шаблон лица из нескольких эталонных кодировок:
+        среднее плюс несколько медоидов (жадный k-medoids)
+        """
+        if not encodings:
+            return []
+        if np is None or len(encodings) == 1:
+            return [list(encodings[0])]
+        
+        if medoids is None:
+            medoids = getattr(settings, 'FACE_TEMPLATE_MEDOIDS', 2)
+        
+        points = np.asarray(encodings, dtype=float)
+        distances = np.linalg.norm(points[:, None, :] - points[None, :, :], axis=2)
+        
+        chosen = []
+        nearest = np.full(len(points), np.inf)
+        for _ in range(min(medoids, len(points))):
+            # Берём точку, сильнее всего уменьшающую расстояние до ближайшего медоида
+            costs = np.minimum(distances, nearest[None, :]).sum(axis=1)
+            costs[chosen] = np.inf
+            best = int(np.argmin(costs))
+            chosen.append(best)
+            nearest = np.minimum(nearest, distances[best])
+        
+        template = [points.mean(axis=0)] + [points[i] for i in chosen]
+        return [vector.tolist() for vector in template]
 
 
-# Singleton instance
-face_service = FaceRecognitionService()
+# Singleton instance (создаётся при первом обращении)
+face_service = SimpleLazyObject(FaceRecognitionService)
@@ -0,0 +1,42 @@
+"""
+Сигналы распознавания лиц
+"""
+import logging
+
+from celery.signals import worker_ready
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from apps.photos.models import PhotoFace
+from .store import face_store
+
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=PhotoFace)
+def append_face_to_store(sender, instance, created, **kwargs):
+    """Дописывает новое лицо в хранилище кодировок после коммита"""
+    if not created or not instance.face_encoding:
+        return
+
+    rows = [(instance.id, instance.face_encoding)]
+    transaction.on_commit(lambda: face_store.append(rows))
+
+
+@worker_ready.connect
+def sync_store_on_worker_start(**kwargs):
+    """
+    Сверяет хранилище хоста с БД при запуске воркера Celery: лица,
+    записанные на других хостах, сигналы сюда не дописывают
+    """
+    from .matching import sync_face_store
+
+    try:
+        added = sync_face_store()
+    except Exception:
+        logger.exception('Сверка хранилища кодировок при запуске воркера')
+        return
+    if added:
+        logger.info('Дописано лиц в хранилище: %s', added)
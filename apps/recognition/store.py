@@ -0,0 +1,283 @@
+"""
+Дисковое хранилище кодировок лиц (memory-mapped)
+
+Кодировки всех PhotoFace лежат в плоском файле float32 (N x 128),
+рядом - файл-спутник с id лиц (int64). Файлы отображаются в память
+через numpy.memmap, поэтому все воркеры на одном хосте используют одну
+копию из page cache и не тратят время на разбор JSON при старте.
+
+Хранилище только дописывается. Удалённые и переобработанные лица
+остаются в файлах до пересборки - вызывающий код фильтрует id по БД.
+Пересборка пишет новое поколение файлов и атомарно переключает
+указатель `current`.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from apps.photos.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+ENCODING_SIZE = 128
+# Сколько строк обрабатывать за один проход при поиске
+SEARCH_CHUNK_ROWS = 65536
+
+
+class FaceEncodingStore:
+    """
+    Append-only хранилище кодировок лиц на диске
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self._directory = directory
+        self._lock = threading.Lock()
+        # (поколение, строк, кодировки, id)
+        self._mapped = None
+        # ((поколение, строк), отсортированные уникальные id)
+        self._known = None
+
+    @property
+    def available(self) -> bool:
+        return np is not None
+
+    @property
+    def directory(self) -> Path:
+        if self._directory is None:
+            self._directory = getattr(
+                settings, 'FACE_STORE_DIR', Path(settings.MEDIA_ROOT) / 'face_store'
+            )
+        return Path(self._directory)
+
+    # ---------- Файлы ----------
+
+    def _pointer_path(self) -> Path:
+        return self.directory / 'current'
+
+    def _paths(self, generation: str) -> Tuple[Path, Path]:
+        return (
+            self.directory / f'encodings-{generation}.f32',
+            self.directory / f'ids-{generation}.i64',
+        )
+
+    def _current_generation(self) -> Optional[str]:
+        try:
+            return self._pointer_path().read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def _write_lock(self):
+        """Межпроцессная блокировка записи (на Windows - только внутри процесса)"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.directory / '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _pack(rows: Iterable[Tuple[int, Sequence[float]]]):
+        ids, encodings = [], []
+        for face_id, encoding in rows:
+            if not encoding or len(encoding) != ENCODING_SIZE:
+                continue
+            ids.append(face_id)
+            encodings.append(encoding)
+        return (
+            np.asarray(ids, dtype='<i8'),
+            np.asarray(encodings, dtype='<f4').reshape(-1, ENCODING_SIZE),
+        )
+
+    @staticmethod
+    def _write(enc_file, ids_file, ids, encodings):
+        # Сначала кодировки, потом id: читатель берёт минимум из двух файлов,
+        # поэтому недописанная строка не будет видна
+        enc_file.write(encodings.tobytes())
+        enc_file.flush()
+        ids_file.write(ids.tobytes())
+        ids_file.flush()
+
+    # ---------- Запись ----------
+
+    def append(self, rows: Iterable[Tuple[int, Sequence[float]]]) -> int:
+        """
+        Дописывает лица в текущее поколение
+        rows - пары (id PhotoFace, кодировка)
+        """
+        if not self.available:
+            return 0
+
+        ids, encodings = self._pack(rows)
+        if not len(ids):
+            return 0
+
+        with self._write_lock():
+            generation = self._current_generation()
+            if generation is None:
+                generation = self._new_generation()
+            enc_path, ids_path = self._paths(generation)
+            with open(enc_path, 'ab') as enc_file, open(ids_path, 'ab') as ids_file:
+                self._write(enc_file, ids_file, ids, encodings)
+        return len(ids)
+
+    def rebuild(self, rows: Iterable[Tuple[int, Sequence[float]]], batch_size: int = 5000) -> int:
+        """
+        Полностью пересобирает хранилище из переданных лиц
+        """
+        if not self.available:
+            return 0
+
+        with self._write_lock():
+            old_generation = self._current_generation()
+            generation = f'{os.getpid()}-{os.urandom(4).hex()}'
+            enc_path, ids_path = self._paths(generation)
+
+            total = 0
+            batch = []
+            with open(enc_path, 'wb') as enc_file, open(ids_path, 'wb') as ids_file:
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        ids, encodings = self._pack(batch)
+                        self._write(enc_file, ids_file, ids, encodings)
+                        total += len(ids)
+                        batch = []
+                if batch:
+                    ids, encodings = self._pack(batch)
+                    self._write(enc_file, ids_file, ids, encodings)
+                    total += len(ids)
+
+            self._switch_generation(generation)
+
+            if old_generation and old_generation != generation:
+                for path in self._paths(old_generation):
+                    try:
+                        path.unlink()
+                    except OSError:
+                        # На Windows файл может быть ещё открыт читателями
+                        pass
+        return total
+
+    def _new_generation(self) -> str:
+        generation = f'{os.getpid()}-{os.urandom(4).hex()}'
+        for path in self._paths(generation):
+            path.touch()
+        self._switch_generation(generation)
+        return generation
+
+    def _switch_generation(self, generation: str):
+        tmp_path = self.directory / f'current.{os.getpid()}.tmp'
+        tmp_path.write_text(generation)
+        os.replace(tmp_path, self._pointer_path())
+
+    # ---------- Чтение ----------
+
+    def _load(self):
+        """
+        Возвращает (кодировки, id) как memmap-массивы
+        Переотображает файлы, только если сменилось поколение или размер
+        """
+        generation = self._current_generation()
+        if generation is None:
+            return None, None
+
+        enc_path, ids_path = self._paths(generation)
+        try:
+            rows = min(
+                os.path.getsize(enc_path) // (ENCODING_SIZE * 4),
+                os.path.getsize(ids_path) // 8,
+            )
+        except OSError:
+            return None, None
+
+        mapped = self._mapped
+        if mapped and mapped[0] == generation and mapped[1] == rows:
+            return mapped[2], mapped[3]
+
+        if rows == 0:
+            self._mapped = (generation, 0, None, None)
+            return None, None
+
+        encodings = np.memmap(enc_path, dtype='<f4', mode='r', shape=(rows, ENCODING_SIZE))
+        ids = np.memmap(ids_path, dtype='<i8', mode='r', shape=(rows,))
+        self._mapped = (generation, rows, encodings, ids)
+        return encodings, ids
+
+    def __len__(self):
+        if not self.available:
+            return 0
+        _, ids = self._load()
+        return 0 if ids is None else len(ids)
+
+    def _known_ids(self):
+        """Отсортированные id лиц хранилища (пересчёт при смене файлов)"""
+        _, ids = self._load()
+        if ids is None:
+            return None
+        key = self._mapped[:2]
+        known = self._known
+        if known is None or known[0] != key:
+            known = self._known = (key, np.unique(ids))
+        return known[1]
+
+    def contains(self, face_ids) -> 'np.ndarray':
+        """Маска: какие из face_ids уже есть в хранилище"""
+        face_ids = np.asarray(face_ids, dtype='<i8')
+        known = self._known_ids() if self.available else None
+        if known is None or not len(face_ids):
+            return np.zeros(len(face_ids), dtype=bool)
+        positions = np.minimum(np.searchsorted(known, face_ids), len(known) - 1)
+        return known[positions] == face_ids
+
+    def search(self, target_encoding, tolerance: float) -> List[Tuple[int, float]]:
+        """
+        Ищет лица, близкие к целевой кодировке
+        target_encoding - одна кодировка или шаблон из нескольких (берётся
+        минимальное расстояние до любой из них)
+        Возвращает список (id PhotoFace, расстояние), отсортированный по расстоянию
+        """
+        if not self.available:
+            return []
+
+        encodings, ids = self._load()
+        if encodings is None:
+            return []
+
+        targets = np.asarray(target_encoding, dtype='<f4').reshape(-1, ENCODING_SIZE)
+
+        found_ids, found_distances = [], []
+        for start in range(0, len(ids), SEARCH_CHUNK_ROWS):
+            chunk = encodings[start:start + SEARCH_CHUNK_ROWS]
+            distances = np.linalg.norm(chunk - targets[0], axis=1)
+            for target in targets[1:]:
+                np.minimum(distances, np.linalg.norm(chunk - target, axis=1), out=distances)
+            hits = np.nonzero(distances <= tolerance)[0]
+            if len(hits):
+                found_ids.append(ids[start + hits])
+                found_distances.append(distances[hits])
+
+        if not found_ids:
+            return []
+
+        found_ids = np.concatenate(found_ids)
+        found_distances = np.concatenate(found_distances)
+        order = np.argsort(found_distances, kind='stable')
+        return [(int(found_ids[i]), float(found_distances[i])) for i in order]
+
+
+# Singleton instance
+face_store = FaceEncodingStore()
@@ -1,15 +1,49 @@
 """
 Celery задачи для обработки лиц
+
+Очереди и приоритеты - photomarket/celery.py и CELERY_TASK_ROUTES:
+поиск лиц идёт в detection, сопоставление - в matching, селфи - в selfies.
+Селфи и поиск фото клиента - интерактивные (клиент ждёт), массовая
+догрузка process_all_pending_photos - пачками с низким приоритетом.
+
+Следующий шаг (сопоставление, поиск фото клиента) публикуется в outbox
+(apps.outbox) в транзакции с результатом шага; relay отправляет пачку
+задачами match_photos и find_photos_for_clients в очередь matching.
 """
+import io
+import logging
+
 from celery import shared_task
+from django.conf import settings
 from django.db import transaction
 
-from apps.accounts.models import ClientProfile
+from apps.accounts.models import ClientProfile, ClientSelfie
+from apps.outbox.relay import publish, publish_many
 from apps.photos.models import Photo, PhotoFace
+from apps.photos.storage import open_file
 from .services import face_service
+from .worker import FaceWorkerError
+from .matching import (
+    ID_BATCH_SIZE, ClientTemplateIndex, match_client_photos, rebuild_client_template,
+    extract_selfie_encoding,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Обработчики пачек в outbox
+MATCH_PHOTOS = 'apps.recognition.tasks.match_photos'
+FIND_CLIENT_PHOTOS = 'apps.recognition.tasks.find_photos_for_clients'
+
+PRIORITY_INTERACTIVE = getattr(settings, 'TASK_PRIORITY_INTERACTIVE', 0)
+PRIORITY_BULK = getattr(settings, 'TASK_PRIORITY_BULK', 9)
+
 
+def batch_size() -> int:
+    return getattr(settings, 'FACE_BATCH_SIZE', 16)
 
-@shared_task(bind=True, max_retries=3)
+
+@shared_task(bind=True, max_retries=3, acks_late=True)
 def process_photo_faces(self, photo_id: str):
     """
     Обрабатывает фотографию - находит все лица и сохраняет их кодировки
@@ -18,7 +52,8 @@ def process_photo_faces(self, photo_id: str):
         photo = Photo.objects.get(id=photo_id)
         
         # Получаем данные о лицах
-        faces_data = face_service.get_face_data(photo.original.path)
+        with open_file(photo.original) as image:
+            faces_data = face_service.get_face_data(image)
         
         with transaction.atomic():
             # Удаляем старые записи о лицах (если есть)
@@ -37,9 +72,9 @@ def process_photo_faces(self, photo_id: str):
             photo.faces_processed = True
             photo.status = 'active'
             photo.save()
-        
-        # Запускаем сопоставление с клиентами
-        match_faces_with_clients.delay(photo_id)
+            
+            # Сопоставление с клиентами - после коммита
+            publish(MATCH_PHOTOS, {'photo': str(photo_id)}, key=f'match_photo:{photo_id}')
         
         return f"Обработано {len(faces_data)} лиц на фото {photo_id}"
     
@@ -49,10 +84,11 @@ def process_photo_faces(self, photo_id: str):
         self.retry(exc=e, countdown=60)
 
 
-@shared_task(bind=True, max_retries=3)
+@shared_task(bind=True, max_retries=3, priority=PRIORITY_INTERACTIVE)
 def process_client_selfie(self, profile_id: int):
     """
-    Обрабатывает селфи клиента - извлекает кодировку лица
+    Обрабатывает селфи клиента - извлекает кодировки лиц со всех эталонов
+    и пересобирает шаблон лица
     """
     try:
         profile = ClientProfile.objects.get(id=profile_id)
@@ -62,29 +98,28 @@ def process_client_selfie(self, profile_id: int):
             profile.save()
             return "Селфи не найдено"
         
-        # Получаем кодировки лиц
-        faces_data = face_service.get_face_data(profile.selfie.path)
+        # Селфи, загруженное до появления нескольких эталонов
+        if not profile.selfies.exists():
+            ClientSelfie.objects.create(profile=profile, image=profile.selfie.name)
+        
+        # Извлекаем кодировки со всех ещё не обработанных селфи
+        errors = [
+            extract_selfie_encoding(selfie)
+            for selfie in profile.selfies.filter(face_encoding__isnull=True)
+        ]
+        errors = [error for error in errors if error]
         
-        if not faces_data:
-            profile.face_processing_error = "Лицо не обнаружено на фото"
-            profile.face_processed = False
+        # Собираем шаблон лица (среднее + медоиды) по всем эталонам
+        if not rebuild_client_template(profile):
+            profile.face_processing_error = errors[0] if errors else "Лицо не обнаружено на фото"
             profile.save()
             return "Лицо не найдено"
         
-        if len(faces_data) > 1:
-            profile.face_processing_error = "На фото обнаружено более одного лица"
-            profile.face_processed = False
+        with transaction.atomic():
+            profile.face_processing_error = ""
             profile.save()
-            return "Найдено несколько лиц"
-        
-        # Сохраняем кодировку первого (единственного) лица
-        profile.face_encoding = faces_data[0]['encoding']
-        profile.face_processed = True
-        profile.face_processing_error = ""
-        profile.save()
-        
-        # Запускаем поиск совпадений на всех фото
-        find_client_photos.delay(profile_id)
+            # Поиск совпадений на всех фото - после коммита
+            publish(FIND_CLIENT_PHOTOS, {'profile': profile_id}, key=f'find_client_photos:{profile_id}')
         
         return f"Селфи клиента {profile.user.username} обработано"
     
@@ -94,44 +129,79 @@ def process_client_selfie(self, profile_id: int):
         self.retry(exc=e, countdown=60)
 
 
+def _client_index():
+    """Шаблоны всех клиентов с обработанными лицами в одной матрице"""
+    clients = ClientProfile.objects.filter(
+        face_processed=True,
+        face_encoding__isnull=False
+    ).select_related('user')
+    return ClientTemplateIndex(clients)
+
+
+def _match_faces(photo_ids, index) -> int:
+    """
+    Сопоставляет лица фото с клиентами индекса, возвращает число совпадений
+    Изменённые лица пишутся одним bulk_update, цены клиентов сбрасываются
+    один раз на пачку
+    """
+    matches_count = 0
+    updated = []
+    users = set()
+    faces = PhotoFace.objects.filter(photo_id__in=photo_ids).only(
+        'id', 'face_encoding', 'matched_user_id', 'match_confidence'
+    )
+    for photo_face in faces:
+        match = index.best_match(photo_face.face_encoding)
+        if not match:
+            continue
+        client, confidence = match
+        matches_count += 1
+        if photo_face.matched_user_id == client.user_id and photo_face.match_confidence == confidence:
+            continue
+        users.update((photo_face.matched_user_id, client.user_id))
+        photo_face.matched_user_id = client.user_id
+        photo_face.match_confidence = confidence
+        updated.append(photo_face)
+
+    PhotoFace.objects.bulk_update(
+        updated, ['matched_user', 'match_confidence'], batch_size=ID_BATCH_SIZE
+    )
+    if updated:
+        # bulk_update не шлёт post_save - сбрасываем цены прежних и новых владельцев сами
+        from apps.payments import pricing
+        users.discard(None)
+        pricing.matches_changed(users)
+    return matches_count
+
+
+@shared_task
+def match_photos(payloads):
+    """Обработчик outbox: сопоставление пачки фото, индекс клиентов - один раз"""
+    photo_ids = list({payload['photo'] for payload in payloads})
+    return _match_faces(photo_ids, _client_index())
+
+
+@shared_task(priority=PRIORITY_INTERACTIVE)
+def find_photos_for_clients(payloads):
+    """Обработчик outbox: поиск фото для клиентов пачки"""
+    profile_ids = {payload['profile'] for payload in payloads}
+    for profile in ClientProfile.objects.filter(pk__in=profile_ids, face_encoding__isnull=False):
+        match_client_photos(profile, active_only=True)
+
+
 @shared_task
 def match_faces_with_clients(photo_id: str):
     """
     Сопоставляет лица на фото с зарегистрированными клиентами
     """
-    try:
-        photo = Photo.objects.get(id=photo_id)
-        photo_faces = PhotoFace.objects.filter(photo=photo)
-        
-        # Получаем всех клиентов с обработанными лицами
-        clients = ClientProfile.objects.filter(
-            face_processed=True,
-            face_encoding__isnull=False
-        ).select_related('user')
-        
-        matches_count = 0
-        
-        for photo_face in photo_faces:
-            for client in clients:
-                match, confidence = face_service.compare_faces(
-                    client.face_encoding,
-                    photo_face.face_encoding
-                )
-                
-                if match:
-                    photo_face.matched_user = client.user
-                    photo_face.match_confidence = confidence
-                    photo_face.save()
-                    matches_count += 1
-                    break  # Одно лицо = один клиент
-        
-        return f"Найдено {matches_count} совпадений для фото {photo_id}"
-    
-    except Photo.DoesNotExist:
+    if not Photo.objects.filter(id=photo_id).exists():
         return f"Фото {photo_id} не найдено"
+    
+    matches_count = _match_faces([photo_id], _client_index())
+    return f"Найдено {matches_count} совпадений для фото {photo_id}"
 
 
-@shared_task
+@shared_task(priority=PRIORITY_INTERACTIVE)
 def find_client_photos(profile_id: int):
     """
     Ищет все фото с лицом клиента
@@ -142,25 +212,7 @@ def find_client_photos(profile_id: int):
         if not profile.face_encoding:
             return "У клиента нет кодировки лица"
         
-        # Получаем все необработанные лица на активных фото
-        unmatched_faces = PhotoFace.objects.filter(
-            matched_user__isnull=True,
-            photo__status='active'
-        )
-        
-        matches_count = 0
-        
-        for face in unmatched_faces:
-            match, confidence = face_service.compare_faces(
-                profile.face_encoding,
-                face.face_encoding
-            )
-            
-            if match:
-                face.matched_user = profile.user
-                face.match_confidence = confidence
-                face.save()
-                matches_count += 1
+        _, matches_count = match_client_photos(profile, active_only=True)
         
         return f"Найдено {matches_count} фото для клиента {profile.user.username}"
     
@@ -168,18 +220,84 @@ def find_client_photos(profile_id: int):
         return f"Профиль {profile_id} не найден"
 
 
+@shared_task(bind=True, max_retries=3, acks_late=True)
+def process_photo_faces_batch(self, photo_ids):
+    """
+    Обрабатывает пачку фото за один вызов: модели уже загружены в процесс
+    воркера (или в пул FACE_WORKER_SOCKET - тогда пачка уходит туда одним
+    запросом), лица всей пачки пишутся одной транзакцией, сопоставление -
+    одной пачкой outbox. Фото с ошибкой чтения повторяются отдельно
+    """
+    from apps.recognition.store import face_store
+
+    photos = list(Photo.objects.filter(id__in=photo_ids))
+    images = {}
+    failed = []
+    for photo in photos:
+        try:
+            with open_file(photo.original) as image:
+                images[photo.pk] = image.read()
+        except Exception as e:
+            logger.warning('Лица фото %s: %s', photo.pk, e)
+            failed.append(str(photo.pk))
+
+    done = [photo for photo in photos if photo.pk in images]
+    try:
+        batch = face_service.get_face_data_batch([io.BytesIO(images[photo.pk]) for photo in done])
+    except FaceWorkerError as e:
+        # Пул недоступен - повторяем всю пачку
+        raise self.retry(exc=e, countdown=60)
+    faces_data = {photo.pk: faces for photo, faces in zip(done, batch)}
+    with transaction.atomic():
+        PhotoFace.objects.filter(photo__in=done).delete()
+        faces = PhotoFace.objects.bulk_create([
+            PhotoFace(photo=photo, face_location=face['location'], face_encoding=face['encoding'])
+            for photo in done
+            for face in faces_data[photo.pk]
+        ])
+        for photo in done:
+            photo.faces_count = len(faces_data[photo.pk])
+            photo.faces_processed = True
+            photo.status = 'active'
+        Photo.objects.bulk_update(done, ['faces_count', 'faces_processed', 'status'])
+
+        # bulk_create не шлёт post_save - дописываем лица в хранилище сами
+        rows = [(face.id, face.face_encoding) for face in faces if face.id and face.face_encoding]
+        if rows:
+            transaction.on_commit(lambda: face_store.append(rows))
+        publish_many(
+            MATCH_PHOTOS,
+            [{'photo': str(photo.pk)} for photo in done],
+            keys=[f'match_photo:{photo.pk}' for photo in done],
+        )
+
+    if failed:
+        self.retry(args=[failed], countdown=60)
+    return f"Обработано фото: {len(done)}, лиц: {len(faces)}"
+
+
 @shared_task
 def process_all_pending_photos():
     """
-    Обрабатывает все фото в статусе processing
+    Ставит все фото в статусе processing в обработку пачками
+    по FACE_BATCH_SIZE с низким приоритетом (догрузка)
     Запускается периодически через Celery Beat
     """
-    pending_photos = Photo.objects.filter(
+    pending_ids = Photo.objects.filter(
         status='processing',
         faces_processed=False
-    )
+    ).order_by('created_at').values_list('id', flat=True)
     
-    for photo in pending_photos:
-        process_photo_faces.delay(str(photo.id))
+    batch = []
+    batches = 0
+    for photo_id in pending_ids.iterator():
+        batch.append(str(photo_id))
+        if len(batch) == batch_size():
+            process_photo_faces_batch.apply_async(args=[batch], priority=PRIORITY_BULK)
+            batch = []
+            batches += 1
+    if batch:
+        process_photo_faces_batch.apply_async(args=[batch], priority=PRIORITY_BULK)
+        batches += 1
     
-    return f"Запущена обработка {pending_photos.count()} фото"
+    return f"Запущена обработка пачками: {batches}"
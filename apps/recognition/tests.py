@@ -0,0 +1,326 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from photomarket.celery import app
+
+from apps.accounts.models import ClientProfile, PhotographerProfile, User
+from apps.outbox import relay
+from apps.photos.models import Photo, PhotoFace
+from apps.recognition import matching, tasks
+from apps.recognition.services import face_service
+from apps.recognition.store import FaceEncodingStore
+from apps.recognition.worker import FaceWorkerClient, FaceWorkerError, FaceWorkerServer
+
+
+class SyncFaceStoreTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        override = override_settings(FACE_STORE_DIR=directory)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.store = FaceEncodingStore(directory)
+        patcher = mock.patch.object(matching, 'face_store', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = User.objects.create(username='photographer', user_type='photographer')
+        photographer = PhotographerProfile.objects.create(user=user)
+        self.photo = Photo.objects.create(photographer=photographer, original='x.jpg')
+
+    def faces(self, ids):
+        # bulk_create не шлёт post_save: так лица попадают в БД на другом хосте
+        return PhotoFace.objects.bulk_create([
+            PhotoFace(id=face_id, photo=self.photo, face_location={}, face_encoding=[face_id / 100] * 128)
+            for face_id in ids
+        ])
+
+    def test_faces_below_stored_ids_are_added(self):
+        self.faces([5, 6])
+        self.store.append([(5, [0.05] * 128), (6, [0.06] * 128)])
+        # Закоммичены позже или созданы на другом хосте - id ниже записанных
+        self.faces([1, 2, 3])
+
+        self.assertEqual(matching.sync_face_store(), 3)
+        self.assertEqual(self.store.contains([1, 2, 3, 4, 5, 6]).tolist(), [True, True, True, False, True, True])
+        self.assertEqual(matching.sync_face_store(), 0)
+        self.assertEqual(len(self.store), 5)
+
+    def test_search_reads_only_the_store(self):
+        faces = self.faces([1, 2, 3])
+        self.store.append([(face.id, face.face_encoding) for face in faces[:2]])
+        user = User.objects.create(username='client', user_type='client')
+        profile = ClientProfile.objects.create(user=user, face_encoding=[0.015] * 128)
+
+        # Лица одной пачкой и один UPDATE - без прохода по всем id лиц
+        with self.assertNumQueries(2):
+            self.assertEqual(matching.match_client_photos(profile), (2, 2))
+        # Лица нет в хранилище - его догонит сверка, а не поиск
+        self.assertFalse(PhotoFace.objects.filter(id=3, matched_user=user).exists())
+
+
+def encoding(value, index=0):
+    # Кодировка, отличающаяся от нулевой в одной координате
+    vector = [0.0] * 128
+    vector[index] = value
+    return vector
+
+
+@override_settings(CLIENT_MAX_SELFIES=3, FACE_TEMPLATE_MEDOIDS=2)
+class ClientTemplateTests(TestCase):
+    """Шаблон лица клиента по нескольким селфи"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=directory)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        user = User.objects.create(username='client', user_type='client')
+        self.profile = ClientProfile.objects.create(user=user)
+
+    def add(self, *faces):
+        with mock.patch.object(face_service, 'get_face_data', return_value=[{'encoding': face} for face in faces]):
+            return matching.add_client_selfie(self.profile, ContentFile(b'jpeg', name='selfie.jpg'))
+
+    def test_template_is_mean_and_medoids(self):
+        self.assertEqual(face_service.build_template([]), [])
+        self.assertEqual(face_service.build_template([encoding(0.1)]), [encoding(0.1)])
+
+        template = face_service.build_template([encoding(0.0), encoding(0.1), encoding(0.9)])
+        self.assertEqual(len(template), 3)
+        self.assertAlmostEqual(template[0][0], 1.0 / 3)
+        # Первый медоид - центральная точка, второй - лучше всего покрывает остальные
+        self.assertEqual(template[1][0], 0.1)
+
+    def test_selfies_limited_and_template_rebuilt(self):
+        for value in (0.1, 0.2, 0.3, 0.4):
+            self.assertIsNone(self.add(encoding(value)))
+        self.profile.refresh_from_db()
+        self.assertEqual(
+            sorted(selfie.face_encoding[0] for selfie in self.profile.selfies.all()), [0.2, 0.3, 0.4]
+        )
+        self.assertTrue(self.profile.face_processed)
+        self.assertEqual(len(self.profile.face_template), 3)
+        self.assertAlmostEqual(self.profile.face_encoding[0], 0.3)
+        self.assertEqual(self.profile.get_face_template(), self.profile.face_template)
+
+    def test_selfie_with_several_faces_is_rejected(self):
+        self.add(encoding(0.1))
+        self.assertEqual(self.add(encoding(0.2), encoding(0.3)), 'На фото обнаружено более одного лица')
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.selfies.count(), 1)
+        self.assertEqual(self.profile.face_processing_error, 'На фото обнаружено более одного лица')
+        self.assertEqual(self.profile.get_face_template(), [encoding(0.1)])
+
+    def test_face_matches_closest_template_vector(self):
+        # У первого клиента два ракурса, у второго один - посередине
+        first = ClientProfile(pk=1, face_template=[encoding(0.0), encoding(0.5, 1)])
+        second = ClientProfile(pk=2, face_encoding=encoding(0.3))
+        index = matching.ClientTemplateIndex([first, second])
+
+        self.assertIs(index.best_match(encoding(0.45, 1), tolerance=0.2)[0], first)
+        self.assertIs(index.best_match(encoding(0.25), tolerance=0.2)[0], second)
+        self.assertIsNone(index.best_match(encoding(0.9, 2), tolerance=0.2))
+        self.assertFalse(matching.ClientTemplateIndex([ClientProfile(pk=3)]))
+
+
+class MatchFacesTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(username='photographer', user_type='photographer')
+        photographer = PhotographerProfile.objects.create(user=user)
+        self.photo = Photo.objects.create(photographer=photographer, original='x.jpg')
+        self.client_user = User.objects.create(username='client', user_type='client')
+        PhotoFace.objects.bulk_create([
+            PhotoFace(photo=self.photo, face_location={}, face_encoding=[0.0] * 128),
+            PhotoFace(photo=self.photo, face_location={}, face_encoding=[0.01] * 128),
+            PhotoFace(photo=self.photo, face_location={}, face_encoding=[1.0] * 128),
+        ])
+
+    def test_matches_are_saved_in_one_batch(self):
+        client = mock.Mock(user_id=self.client_user.pk)
+        client.get_face_template.return_value = [[0.0] * 128]
+        index = matching.ClientTemplateIndex([client])
+
+        with mock.patch('apps.payments.pricing.matches_changed') as matches_changed:
+            # Лица фото и один UPDATE на все совпадения
+            with self.assertNumQueries(2):
+                self.assertEqual(tasks._match_faces([self.photo.pk], index), 2)
+        matches_changed.assert_called_once_with({self.client_user.pk})
+        self.assertEqual(
+            PhotoFace.objects.filter(matched_user=self.client_user).count(), 2
+        )
+
+
+@override_settings(CELERY_BROKER_URL='memory://', CELERY_RESULT_BACKEND='cache+memory://',
+                   CELERY_TASK_ALWAYS_EAGER=False)
+class MatchingQueueTests(TestCase):
+    """Маршруты, приоритеты и пачки задач на брокере в памяти"""
+
+    def setUp(self):
+        app.close()
+        self.addCleanup(app.close)
+        for queue in ('detection', 'matching', 'selfies', 'default'):
+            self.drain(queue)
+
+        user = User.objects.create(username='photographer', user_type='photographer')
+        self.photographer = PhotographerProfile.objects.create(user=user)
+
+    def drain(self, queue) -> list:
+        """Сообщения очереди: (задача, аргументы, приоритет)"""
+        messages = []
+        with app.connection_for_read() as connection:
+            simple = connection.SimpleQueue(queue, no_ack=True)
+            try:
+                while True:
+                    message = simple.get(block=False)
+                    args, _, _ = message.payload
+                    messages.append((message.headers['task'], args, message.properties.get('priority')))
+            except simple.Empty:
+                pass
+            finally:
+                simple.close()
+        return messages
+
+    def test_task_routes(self):
+        routes = {
+            'apps.recognition.tasks.match_photos': 'matching',
+            'apps.recognition.tasks.find_photos_for_clients': 'matching',
+            'apps.recognition.tasks.match_faces_with_clients': 'matching',
+            'apps.recognition.tasks.find_client_photos': 'matching',
+            'apps.recognition.tasks.process_client_selfie': 'selfies',
+            'apps.recognition.tasks.process_photo_faces_batch': 'detection',
+            'apps.outbox.tasks.relay_outbox': 'default',
+        }
+        for name, queue in routes.items():
+            self.assertEqual(app.amqp.router.route({}, name)['queue'].name, queue, name)
+
+    def test_outbox_batch_is_one_task_per_topic(self):
+        photos = [Photo.objects.create(photographer=self.photographer, original=f'{n}.jpg') for n in range(3)]
+        client = ClientProfile.objects.create(user=User.objects.create(username='client', user_type='client'))
+        with self.captureOnCommitCallbacks(execute=True):
+            relay.publish_many(
+                tasks.MATCH_PHOTOS,
+                [{'photo': str(photo.pk)} for photo in photos],
+                keys=[f'match_photo:{photo.pk}' for photo in photos],
+            )
+            relay.publish(tasks.FIND_CLIENT_PHOTOS, {'profile': client.pk})
+
+        messages = self.drain('matching')
+        self.assertEqual(sorted(messages), sorted([
+            (tasks.MATCH_PHOTOS, [[{'photo': str(photo.pk)} for photo in photos]],
+             settings.CELERY_TASK_DEFAULT_PRIORITY),
+            (tasks.FIND_CLIENT_PHOTOS, [[{'profile': client.pk}]], tasks.PRIORITY_INTERACTIVE),
+        ]))
+        self.assertEqual(self.drain('default'), [])
+
+    def test_backfill_batches_have_bulk_priority(self):
+        for n in range(3):
+            Photo.objects.create(photographer=self.photographer, original=f'{n}.jpg', status='processing')
+
+        with override_settings(FACE_BATCH_SIZE=2):
+            tasks.process_all_pending_photos()
+
+        messages = self.drain('detection')
+        self.assertEqual([len(args[0]) for _, args, _ in messages], [2, 1])
+        self.assertEqual({(name, priority) for name, _, priority in messages},
+                         {('apps.recognition.tasks.process_photo_faces_batch', tasks.PRIORITY_BULK)})
+
+
+class EchoDetector:
+    """Детектор для тестов пула: лицо с размером изображения и pid процесса"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def detect(self, data):
+        if data == b'bad':
+            raise ValueError('не изображение')
+        return [{'size': len(data), 'model': self.model, 'pid': os.getpid()}]
+
+
+def serve(address):
+    FaceWorkerServer(address, processes=1, detector='apps.recognition.tests.EchoDetector').serve_forever()
+
+
+class FaceWorkerTests(SimpleTestCase):
+    """Запрос-ответ пула распознавания через Unix-сокет"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.address = os.path.join(directory, 'faces.sock')
+        self.server = self.start()
+        self.client = FaceWorkerClient(self.address, timeout=10)
+        self.addCleanup(self.client._drop)
+
+    def start(self):
+        server = FaceWorkerServer(self.address, processes=2, detector='apps.recognition.tests.EchoDetector', model='small')
+        server.start()
+        self.addCleanup(server.close)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def test_faces_in_request_order(self):
+        images = [b'a', b'bb', b'ccc', b'dddd']
+        faces = self.client.detect(images)
+        self.assertEqual([[face['size'] for face in result] for result in faces], [[1], [2], [3], [4]])
+        self.assertEqual({face['model'] for result in faces for face in result}, {'small'})
+        self.assertNotIn(os.getpid(), {face['pid'] for result in faces for face in result})
+        self.assertEqual(self.client.detect([]), [])
+
+    def test_failed_image_is_empty(self):
+        with self.assertLogs('apps.recognition.worker', 'WARNING') as logs:
+            faces = self.client.detect([b'a', b'bad', b'ccc'])
+        self.assertEqual([len(result) for result in faces], [1, 0, 1])
+        self.assertIn('ValueError: не изображение', logs.output[0])
+
+    def test_ping_and_unknown_request(self):
+        self.assertEqual(self.client.ping()['processes'], 2)
+        with self.assertRaisesRegex(FaceWorkerError, 'Неизвестный запрос'):
+            self.client.call('resize')
+        # Соединение после ошибки запроса рабочее
+        self.assertEqual(len(self.client.detect([b'a'])), 1)
+
+    def test_reconnects_after_restart(self):
+        # Перезапуск run_face_worker - новый процесс сервера на том же сокете
+        self.server.close()
+        for _ in range(2):
+            # Не daemon: серверу нужен свой пул процессов
+            process = multiprocessing.get_context('fork').Process(target=serve, args=(self.address,))
+            process.start()
+            self.addCleanup(process.join)
+            self.addCleanup(process.terminate)
+            deadline = time.monotonic() + 10
+            while not os.path.exists(self.address) and time.monotonic() < deadline:
+                time.sleep(0.05)
+            # Первый запрос после перезапуска идёт по устаревшему соединению
+            self.assertEqual(self.client.detect([b'a'])[0][0]['size'], 1)
+            self.assertEqual(self.client.ping()['pid'], process.pid)
+            process.terminate()
+            process.join()
+            os.unlink(self.address)
+
+    def test_foreign_key_rejected(self):
+        with self.assertLogs('apps.recognition.worker', 'WARNING'):
+            with override_settings(SECRET_KEY='other'), self.assertRaises(FaceWorkerError):
+                FaceWorkerClient(self.address, timeout=10).ping()
+            # Следующее соединение сервер принимает уже после записи в лог
+            self.assertEqual(self.client.ping()['processes'], 2)
+
+    def test_unavailable(self):
+        with self.assertRaisesRegex(FaceWorkerError, 'недоступен'):
+            FaceWorkerClient(self.address + '.missing').ping()
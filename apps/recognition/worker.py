@@ -0,0 +1,221 @@
+"""
+Пул распознавания лиц с прогретыми моделями
+
+face_recognition загружает детектор HOG, модель ключевых точек и ResNet
+кодировщика (dlib) при импорте - это секунды и сотни МБ в каждом процессе.
+Пул держит модели в нескольких долгоживущих процессах, остальные процессы
+(веб, команды, Celery) отправляют им байты изображений через Unix-сокет
+и не импортируют dlib вовсе.
+
+- FaceWorkerServer (команда run_face_worker): слушает FACE_WORKER_SOCKET,
+  каждое соединение обслуживается своим потоком, изображения запроса
+  распределяются по процессам пула
+- FaceWorkerClient: постоянное соединение на поток, пачка изображений -
+  один запрос, ответ - лица каждого изображения в порядке запроса
+
+Протокол - multiprocessing.connection (pickle) с ключом из SECRET_KEY:
+подключиться могут только процессы с теми же настройками.
+"""
+import io
+import logging
+import os
+import threading
+from multiprocessing import Pool
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+from django.conf import settings
+from django.utils.crypto import salted_hmac
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+AUTH_SALT = 'apps.recognition.worker'
+
+
+class FaceWorkerError(Exception):
+    """Пул недоступен или не ответил"""
+
+
+def socket_path() -> str:
+    return getattr(settings, 'FACE_WORKER_SOCKET', '')
+
+
+def authkey() -> bytes:
+    return salted_hmac(AUTH_SALT, 'face-worker', algorithm='sha256').digest()
+
+
+class DlibDetector:
+    """Детектор face_recognition, модели загружаются один раз на процесс"""
+
+    def __init__(self, model='large'):
+        import face_recognition
+        import numpy as np
+        from .services import face_records
+
+        self.face_recognition = face_recognition
+        self.face_records = face_records
+        self.model = model
+        # Первый вызов создаёт детектор и кодировщик - делаем его до запросов
+        blank = np.zeros((64, 64, 3), dtype=np.uint8)
+        face_recognition.face_locations(blank, model='hog')
+        face_recognition.face_encodings(blank, [(0, 63, 63, 0)], model=model)
+
+    def detect(self, data: bytes) -> list:
+        image = self.face_recognition.load_image_file(io.BytesIO(data))
+        locations = self.face_recognition.face_locations(image, model='hog')
+        encodings = self.face_recognition.face_encodings(image, locations, model=self.model)
+        return self.face_records(locations, encodings)
+
+
+# --- Процессы пула ---
+
+_detector = None
+
+
+def _init_process(detector_path, model):
+    global _detector
+    _detector = import_string(detector_path)(model)
+
+
+def _ready(_):
+    return os.getpid()
+
+
+def _detect(data):
+    try:
+        return True, _detector.detect(data)
+    except Exception as e:
+        return False, f'{type(e).__name__}: {e}'
+
+
+# --- Сервер ---
+
+class FaceWorkerServer:
+    """Unix-сокет перед пулом процессов с загруженными моделями"""
+
+    def __init__(self, address=None, processes=None, detector=None, model=None):
+        self.address = address or socket_path()
+        self.processes = processes or getattr(settings, 'FACE_WORKER_PROCESSES', None) or os.cpu_count()
+        self.detector = detector or getattr(settings, 'FACE_WORKER_DETECTOR', 'apps.recognition.worker.DlibDetector')
+        self.model = model or getattr(settings, 'FACE_ENCODING_MODEL', 'large')
+        self.pool = None
+        self.listener = None
+
+    def start(self):
+        """Запускает пул (модели грузятся здесь) и открывает сокет"""
+        if not self.address:
+            raise FaceWorkerError('Не задан FACE_WORKER_SOCKET')
+        self.pool = Pool(self.processes, initializer=_init_process, initargs=(self.detector, self.model))
+        # Задача выполняется только после initializer: ждём прогрева до приёма запросов
+        self.pool.map(_ready, range(self.processes), chunksize=1)
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self.listener = Listener(self.address, family='AF_UNIX', authkey=authkey())
+        os.chmod(self.address, 0o660)
+
+    def serve_forever(self):
+        if self.listener is None:
+            self.start()
+        while True:
+            try:
+                conn = self.listener.accept()
+            except AuthenticationError:
+                logger.warning('Пул распознавания: неверный ключ клиента')
+                continue
+            except OSError:
+                # Сокет закрыт (close)
+                return
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn):
+        """Запросы одного клиента до закрытия соединения"""
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                conn.send(self.respond(request))
+
+    def respond(self, request):
+        operation = request[0] if isinstance(request, tuple) and request else None
+        if operation == 'detect':
+            images = request[1]
+            return 'ok', self.pool.map(_detect, images, chunksize=1) if images else []
+        if operation == 'ping':
+            return 'ok', {'processes': self.processes, 'detector': self.detector, 'pid': os.getpid()}
+        return 'error', f'Неизвестный запрос: {operation}'
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        if self.address and os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+# --- Клиент ---
+
+class FaceWorkerClient:
+    """Клиент пула: одно соединение на поток, переподключение при обрыве"""
+
+    def __init__(self, address=None, timeout=None):
+        self.address = address or socket_path()
+        self.timeout = timeout or getattr(settings, 'FACE_WORKER_TIMEOUT', 120)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            try:
+                conn = Client(self.address, family='AF_UNIX', authkey=authkey())
+            except (OSError, AuthenticationError) as e:
+                raise FaceWorkerError(f'Пул распознавания недоступен ({self.address}): {e}') from e
+            self._local.conn = conn
+        return conn
+
+    def _drop(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def call(self, *request):
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.send(request)
+                if not conn.poll(self.timeout):
+                    self._drop()
+                    raise FaceWorkerError(f'Пул распознавания не ответил за {self.timeout} с')
+                status, result = conn.recv()
+                break
+            except (EOFError, OSError) as e:
+                # Пул перезапущен - соединение устарело, пробуем ещё раз
+                self._drop()
+                if attempt == 2:
+                    raise FaceWorkerError(f'Обрыв соединения с пулом распознавания: {e}') from e
+        if status != 'ok':
+            raise FaceWorkerError(result)
+        return result
+
+    def detect(self, images) -> list:
+        """
+        Лица на каждом изображении (байты файла) в порядке запроса
+        Изображение с ошибкой даёт пустой список
+        """
+        faces = []
+        for ok, result in self.call('detect', list(images)):
+            if not ok:
+                logger.warning('Ошибка распознавания в пуле: %s', result)
+                result = []
+            faces.append(result)
+        return faces
+
+    def ping(self) -> dict:
+        return self.call('ping')
@@ -0,0 +1,8 @@
+"""
+Бенчмарки PhotoMarket
+
+Запуск без manage.py:
+    python -m benchmarks.photo_pipeline --sizes 12 24 45 --output results.json
+
+Результаты пишутся в JSON, чтобы сравнивать прогоны между релизами.
+"""
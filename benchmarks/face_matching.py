@@ -0,0 +1,281 @@
+"""
+Бенчмарк и нагрузочный тест сопоставления лиц
+
+Работает без dlib: 128-мерные кодировки генерируются напрямую.
+У каждого клиента есть центр, часть лиц на "фото" - его зашумлённые
+копии (заложенные совпадения), остальные - случайные лица.
+
+Замеряются:
+- compare_faces - попарное сравнение (как в старых циклах)
+- find_matching_faces - поиск лица клиента среди всех лиц
+- store_search - поиск через memory-mapped хранилище
+  (find_client_photos, search_photos, upload_selfie)
+- template_match - лицо на фото против шаблонов всех клиентов
+  (match_faces_with_clients, detect_faces)
+
+Точность и полнота считаются относительно точного перебора в float64.
+
+Запуск:
+    python -m benchmarks.face_matching --faces 1000 100000 --clients 100 1000
+    python -m benchmarks.face_matching --faces 1000000 --clients 100000 --queries 20
+    python manage.py benchmark_matching --baseline old.json --min-recall 0.99
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+from . import report
+
+
+DEFAULT_FACES = (1000, 10000, 100000)
+DEFAULT_CLIENTS = (100, 1000)
+ENCODING_SIZE = 128
+# Шум заложенного совпадения: расстояние до центра около 0.3 при пороге 0.6
+MATCH_NOISE = 0.3
+# Больше этого старые реализации на списках Python не гоняем - слишком долго
+LEGACY_MAX_FACES = 100000
+
+
+def unit_vectors(rng, count):
+    vectors = rng.normal(size=(count, ENCODING_SIZE))
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_dataset(faces: int, clients: int, matches_per_client: int = 5, seed: int = 0):
+    """
+    Синтетические кодировки с заложенными совпадениями
+    Возвращает (центры клиентов, кодировки лиц, владелец лица или -1)
+    """
+    rng = np.random.default_rng(seed)
+    centers = unit_vectors(rng, clients)
+    encodings = unit_vectors(rng, faces)
+    owners = np.full(faces, -1, dtype=np.int64)
+
+    planted = min(faces // 2, clients * matches_per_client)
+    positions = rng.choice(faces, size=planted, replace=False)
+    for n, position in enumerate(positions):
+        owner = n % clients
+        noise = rng.normal(size=ENCODING_SIZE)
+        noise *= MATCH_NOISE / np.linalg.norm(noise)
+        encodings[position] = centers[owner] + noise
+        owners[position] = owner
+
+    return centers, encodings, owners
+
+
+def exact_matches(target, encodings, tolerance, chunk=65536):
+    """Точный перебор в float64 - эталон для точности и полноты"""
+    found = []
+    for start in range(0, len(encodings), chunk):
+        distances = np.linalg.norm(encodings[start:start + chunk] - target, axis=1)
+        found.extend((start + np.nonzero(distances <= tolerance)[0]).tolist())
+    return set(found)
+
+
+def precision_recall(expected, actual):
+    true_positive = len(expected & actual)
+    precision = true_positive / len(actual) if actual else 1.0
+    recall = true_positive / len(expected) if expected else 1.0
+    return precision, recall
+
+
+def throughput(timings, items_per_call):
+    total = sum(timings)
+    return round(items_per_call * len(timings) / total, 1) if total else 0.0
+
+
+def run(faces=DEFAULT_FACES, clients=DEFAULT_CLIENTS, queries: int = 50,
+        repeat: int = 3, seed: int = 0, tolerance=None) -> dict:
+    """
+    Прогоняет все сценарии (сетка лиц x клиентов) и возвращает отчёт
+    """
+    from apps.recognition.matching import ClientTemplateIndex
+    from apps.recognition.services import face_service
+    from apps.recognition.store import FaceEncodingStore
+
+    tolerance = tolerance or face_service.tolerance
+    rng = np.random.default_rng(seed)
+    results = []
+
+    for face_count in faces:
+        for client_count in clients:
+            started = time.perf_counter()
+            centers, encodings, owners = make_dataset(face_count, client_count, seed=seed)
+            setup_seconds = time.perf_counter() - started
+            scenario = f'{face_count}f/{client_count}c'
+            base = {
+                'faces': face_count,
+                'clients': client_count,
+                'setup_s': round(setup_seconds, 3),
+            }
+
+            query_clients = rng.choice(client_count, size=min(queries, client_count), replace=False)
+            query_faces = rng.choice(face_count, size=min(queries, face_count), replace=False)
+
+            # --- compare_faces: попарно ---
+            pairs = [(centers[q].tolist(), encodings[f].tolist())
+                     for q, f in zip(query_clients, query_faces)]
+            timings = report.measure(
+                lambda: [face_service.compare_faces(a, b) for a, b in pairs], repeat
+            )
+            results.append({
+                'name': f'compare_faces@{scenario}', 'method': 'compare_faces', **base,
+                **report.summarize([t / len(pairs) for t in timings]),
+                'throughput_per_s': throughput(timings, len(pairs)),
+                'peak_rss_mb': report.peak_rss_mb(),
+            })
+
+            # --- find_matching_faces: клиент против всех лиц ---
+            if face_count <= LEGACY_MAX_FACES:
+                face_list = list(enumerate(encodings.tolist()))
+                target = centers[query_clients[0]]
+                expected = exact_matches(target, encodings, tolerance)
+                found = set()
+
+                def find():
+                    found.clear()
+                    found.update(i for i, _ in face_service.find_matching_faces(target, face_list))
+
+                timings = report.measure(find, repeat)
+                precision, recall = precision_recall(expected, found)
+                results.append({
+                    'name': f'find_matching_faces@{scenario}', 'method': 'find_matching_faces', **base,
+                    **report.summarize(timings),
+                    'throughput_per_s': throughput(timings, face_count),
+                    'precision': round(precision, 4), 'recall': round(recall, 4),
+                    'peak_rss_mb': report.peak_rss_mb(),
+                })
+                del face_list
+
+            # --- store_search: клиент против memory-mapped хранилища ---
+            directory = tempfile.mkdtemp(prefix='photomarket-store-')
+            try:
+                store = FaceEncodingStore(directory)
+                store.rebuild(zip(range(face_count), encodings.tolist()))
+                len(store)  # отображаем файлы в память до замеров
+
+                expected, actual = set(), set()
+                timings = []
+                for q in query_clients:
+                    target = centers[q]
+                    expected |= {(q, i) for i in exact_matches(target, encodings, tolerance)}
+                    t0 = time.perf_counter()
+                    hits = store.search(target, tolerance)
+                    timings.append(time.perf_counter() - t0)
+                    actual |= {(q, face_id) for face_id, _ in hits}
+
+                precision, recall = precision_recall(expected, actual)
+                results.append({
+                    'name': f'store_search@{scenario}', 'method': 'store_search', **base,
+                    **report.summarize(timings),
+                    'throughput_per_s': throughput(timings, face_count),
+                    'precision': round(precision, 4), 'recall': round(recall, 4),
+                    'store_mb': round(face_count * (ENCODING_SIZE * 4 + 8) / 2 ** 20, 1),
+                    'peak_rss_mb': report.peak_rss_mb(),
+                })
+                del store
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+            # --- template_match: лицо против шаблонов всех клиентов ---
+            stubs = [SimpleNamespace(id=i, get_face_template=lambda c=c: [c]) for i, c in enumerate(centers.tolist())]
+            started = time.perf_counter()
+            index = ClientTemplateIndex(stubs)
+            index_seconds = time.perf_counter() - started
+
+            expected, actual = set(), set()
+            timings = []
+            for f in query_faces:
+                distances = np.linalg.norm(centers - encodings[f], axis=1)
+                nearest = int(np.argmin(distances))
+                if distances[nearest] <= tolerance:
+                    expected.add((f, nearest))
+                t0 = time.perf_counter()
+                match = index.best_match(encodings[f], tolerance)
+                timings.append(time.perf_counter() - t0)
+                if match:
+                    actual.add((f, match[0].id))
+
+            precision, recall = precision_recall(expected, actual)
+            results.append({
+                'name': f'template_match@{scenario}', 'method': 'template_match', **base,
+                **report.summarize(timings),
+                'throughput_per_s': throughput(timings, 1),
+                'index_build_s': round(index_seconds, 3),
+                'precision': round(precision, 4), 'recall': round(recall, 4),
+                'peak_rss_mb': report.peak_rss_mb(),
+            })
+            del stubs, index, centers, encodings, owners
+
+    return {
+        'benchmark': 'face_matching',
+        'environment': report.environment(),
+        'tolerance': tolerance,
+        'results': results,
+    }
+
+
+def check(result, baseline_path=None, threshold: float = 0.2,
+          min_recall: float = 0.99, stream=None) -> int:
+    """
+    Проверяет отчёт: полнота не ниже min_recall и нет замедления
+    p50 сверх threshold относительно базового прогона
+    Возвращает код выхода (1 при провале)
+    """
+    stream = stream or sys.stderr
+    failed = False
+
+    for row in result['results']:
+        if 'recall' in row and row['recall'] < min_recall:
+            stream.write(f"ПОЛНОТА {row['name']}: {row['recall']:.4f} < {min_recall}\n")
+            failed = True
+
+    if baseline_path:
+        baseline = json.loads(Path(baseline_path).read_text(encoding='utf-8'))
+        changes, regressions = report.compare(result, baseline, threshold=threshold)
+        for name, old, new, change in changes:
+            stream.write(f'{name}: {old:.3f} -> {new:.3f} мс ({change:+.0%})\n')
+        for name, old, new, change in regressions:
+            stream.write(f'РЕГРЕССИЯ {name}: {change:+.0%} (порог {threshold:.0%})\n')
+        failed = failed or bool(regressions)
+
+    return 1 if failed else 0
+
+
+def add_arguments(parser):
+    parser.add_argument('--faces', type=int, nargs='+', default=list(DEFAULT_FACES),
+                        help='Количество лиц на фото (10^3-10^6)')
+    parser.add_argument('--clients', type=int, nargs='+', default=list(DEFAULT_CLIENTS),
+                        help='Количество клиентов (10^2-10^5)')
+    parser.add_argument('--queries', type=int, default=50, help='Запросов на сценарий')
+    parser.add_argument('--repeat', type=int, default=3, help='Повторов для пакетных замеров')
+    parser.add_argument('--seed', type=int, default=0, help='Зерно генератора')
+    parser.add_argument('--output', help='Файл для JSON-отчёта (по умолчанию stdout)')
+    parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Допустимое замедление p50 относительно базового прогона')
+    parser.add_argument('--min-recall', type=float, default=0.99,
+                        help='Минимальная полнота относительно точного перебора')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк сопоставления лиц')
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    report.setup_django()
+    result = run(faces=args.faces, clients=args.clients, queries=args.queries,
+                 repeat=args.repeat, seed=args.seed)
+    report.write_report(result, args.output)
+    return check(result, args.baseline, args.threshold, args.min_recall)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
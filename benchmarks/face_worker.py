@@ -0,0 +1,177 @@
+"""
+Бенчмарк пула распознавания: запуск и память процесса-клиента
+
+Сравниваются два режима процесса, которому нужно распознавание
+(веб, Celery):
+- local  - face_recognition загружается в сам процесс (без FACE_WORKER_SOCKET)
+- worker - фото уходят в пул run_face_worker через Unix-сокет
+
+Для каждого режима в отдельном процессе замеряются:
+- setup_s - django.setup и импорт сервиса распознавания
+- first_call_s - первое распознавание (в local - с загрузкой моделей)
+- p50/p95 повторных вызовов, пиковый RSS и загружен ли dlib
+Для пула отдельно - время до готовности и RSS всех его процессов.
+
+Без face_recognition режим local пропускается, а пул запускается
+с заглушкой детектора (benchmarks.fixtures.StubFaceDetector) - замер
+показывает цену протокола и память клиента, но не моделей.
+
+Запуск:
+    python -m benchmarks.face_worker --megapixels 12 --repeat 20 --processes 4
+"""
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from . import report
+from .fixtures import make_image
+
+
+ROOT = Path(__file__).resolve().parent.parent
+STUB_DETECTOR = 'benchmarks.fixtures.StubFaceDetector'
+
+
+def probe(image, repeat: int) -> dict:
+    """Замер внутри процесса-клиента (запускается через --probe)"""
+    started = time.perf_counter()
+    report.setup_django()
+    from apps.recognition.services import face_service
+    setup_s = time.perf_counter() - started
+
+    def call():
+        with open(image, 'rb') as f:
+            return face_service.get_face_data(f)
+
+    started = time.perf_counter()
+    faces = call()
+    first_call_s = time.perf_counter() - started
+    timings = report.measure(call, repeat, warmup=0)
+    return {
+        'setup_s': round(setup_s, 3),
+        'first_call_s': round(first_call_s, 3),
+        **report.summarize(timings),
+        'faces': len(faces),
+        'peak_rss_mb': report.peak_rss_mb(),
+        'dlib_loaded': 'dlib' in sys.modules,
+    }
+
+
+def run_probe(image, repeat: int, socket: str = '') -> dict:
+    env = dict(os.environ, FACE_WORKER_SOCKET=socket)
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'benchmarks.face_worker', '--probe', str(image), '--repeat', str(repeat)],
+        cwd=ROOT, env=env,
+    )
+    return json.loads(output)
+
+
+def tree_rss_mb(pid: int):
+    """Текущий RSS процесса и его детей в МБ по /proc (None без /proc)"""
+    proc = Path('/proc')
+    if not proc.is_dir():
+        return None
+    pids = [pid]
+    for stat in proc.glob('[0-9]*/stat'):
+        try:
+            # ppid - четвёртое поле, имя процесса в скобках может содержать пробелы
+            fields = stat.read_text().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == pid:
+            pids.append(int(stat.parent.name))
+    total_kb = 0
+    for child in pids:
+        try:
+            for line in (proc / str(child) / 'status').read_text().splitlines():
+                if line.startswith('VmRSS:'):
+                    total_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return round(total_kb / 1024, 1)
+
+
+def start_pool(socket: str, processes: int, detector: str, timeout: float = 300):
+    """Запускает run_face_worker, возвращает (процесс, секунд до готовности)"""
+    from apps.recognition.worker import FaceWorkerClient, FaceWorkerError
+
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, 'manage.py', 'run_face_worker', '--socket', socket,
+         '--processes', str(processes), '--detector', detector],
+        cwd=ROOT, stdout=subprocess.DEVNULL,
+    )
+    client = FaceWorkerClient(socket, timeout=timeout)
+    while True:
+        try:
+            client.ping()
+            return server, time.perf_counter() - started
+        except FaceWorkerError:
+            if server.poll() is not None or time.perf_counter() - started > timeout:
+                server.kill()
+                raise
+            time.sleep(0.05)
+
+
+def run(megapixels: float, repeat: int, processes: int, detector=None) -> dict:
+    local_available = importlib.util.find_spec('face_recognition') is not None
+    detector = detector or (None if local_available else STUB_DETECTOR)
+    results = []
+    with tempfile.TemporaryDirectory(prefix='face_worker_') as directory:
+        image = make_image(directory, megapixels)
+
+        if local_available:
+            results.append({'name': 'local', **run_probe(image, repeat)})
+        else:
+            results.append({'name': 'local', 'skipped': 'face_recognition не установлен'})
+
+        socket = os.path.join(directory, 'face-worker.sock')
+        from django.conf import settings
+        detector = detector or settings.FACE_WORKER_DETECTOR
+        server, ready_s = start_pool(socket, processes, detector)
+        try:
+            pool_rss_mb = tree_rss_mb(server.pid)
+            results.append({
+                'name': 'worker', 'detector': detector, 'processes': processes,
+                'pool_ready_s': round(ready_s, 3), 'pool_rss_mb': pool_rss_mb,
+                **run_probe(image, repeat, socket),
+            })
+        finally:
+            server.terminate()
+            server.wait()
+
+    return {
+        'benchmark': 'face_worker',
+        'environment': report.environment(),
+        'megapixels': megapixels,
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк пула распознавания лиц')
+    parser.add_argument('--megapixels', type=float, default=12, help='Размер тестового кадра')
+    parser.add_argument('--repeat', type=int, default=10, help='Повторных вызовов в каждом режиме')
+    parser.add_argument('--processes', type=int, default=2, help='Процессов пула')
+    parser.add_argument('--detector', help='Класс детектора пула (по умолчанию FACE_WORKER_DETECTOR)')
+    parser.add_argument('--output', help='Файл для JSON-отчёта (по умолчанию stdout)')
+    parser.add_argument('--probe', metavar='IMAGE', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        report.write_report(probe(args.probe, args.repeat))
+        return 0
+
+    report.setup_django()
+    result = run(args.megapixels, args.repeat, args.processes, args.detector)
+    report.write_report(result, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
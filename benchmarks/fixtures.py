@@ -0,0 +1,137 @@
+"""
+Синтетические данные для бенчмарков
+- Тестовые изображения заданного размера в мегапикселях
+- Заглушка детектора лиц для хостов без face_recognition
+- Заменители полей модели Photo, которые пишут во временный каталог
+"""
+import io
+import math
+import os
+import uuid
+from pathlib import Path
+
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def image_size(megapixels: float, aspect: float = 3 / 2):
+    """Ширина и высота кадра 3:2 для заданного числа мегапикселей"""
+    height = int(math.sqrt(megapixels * 1_000_000 / aspect))
+    width = int(height * aspect)
+    return width, height
+
+
+def make_image(directory, megapixels: float, seed: int = 0, quality: int = 92) -> Path:
+    """
+    Создаёт JPEG заданного размера
+    Шум поверх градиента, чтобы JPEG сжимался как настоящая фотография
+    """
+    width, height = image_size(megapixels)
+    path = Path(directory) / f'bench_{megapixels}mp_{seed}.jpg'
+    if path.exists():
+        return path
+
+    if np is not None:
+        rng = np.random.default_rng(seed)
+        gradient = np.linspace(0, 200, width, dtype=np.float32)[None, :, None]
+        noise = rng.integers(0, 56, size=(height, width, 3), dtype=np.uint8)
+        pixels = (gradient + noise).clip(0, 255).astype(np.uint8)
+        img = Image.fromarray(pixels, 'RGB')
+    else:
+        img = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+        img = Image.blend(img, Image.effect_noise((width, height), 40).convert('RGB'), 0.3)
+
+    img.save(path, format='JPEG', quality=quality)
+    return path
+
+
+class StubFaceDetector:
+    """
+    Заглушка детектора лиц
+    Декодирует изображение и делает проход по уменьшенной копии в оттенках
+    серого, как HOG-детектор, но лиц не находит
+    Подходит и как FACE_WORKER_DETECTOR пула распознавания
+    """
+
+    def __init__(self, model=None):
+        self.model = model
+
+    def detect(self, data: bytes):
+        return self.get_face_data(io.BytesIO(data))
+
+    def get_face_data(self, image_path):
+        img = Image.open(image_path)
+        img.draft('L', (img.width // 4, img.height // 4))
+        gray = img.convert('L')
+        if np is not None:
+            pixels = np.asarray(gray, dtype=np.float32)
+            np.gradient(pixels)
+        return []
+
+
+class BenchFile:
+    """Заменитель FieldFile: сохраняет содержимое во временный каталог и считает байты"""
+
+    def __init__(self, directory, path=None):
+        self.directory = Path(directory)
+        self.path = str(path) if path else None
+        self.bytes_written = 0
+
+    def __bool__(self):
+        return self.path is not None
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def open(self, mode='rb'):
+        return open(self.path, mode)
+
+    def save(self, name, content, save=True):
+        data = content.read()
+        self.path = str(self.directory / name)
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        self.bytes_written += len(data)
+
+
+class BenchPhoto:
+    """
+    Заменитель модели Photo без обращения к БД
+    """
+
+    def __init__(self, original_path, output_dir):
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        self.id = uuid.uuid4()
+        self.original = BenchFile(output_dir, original_path)
+        self.thumbnail = BenchFile(output_dir)
+        self.watermarked = BenchFile(output_dir)
+        self.status = 'processing'
+        self.faces_count = 0
+        self.width = 0
+        self.height = 0
+        self.file_size = 0
+        self.taken_at = None
+        self.camera_model = ''
+        self.content_hash = ''
+        self.perceptual_hash = None
+        self.burst_leader_id = None
+        # Без события серии не ищутся
+        self.event_id = None
+
+    @property
+    def bytes_written(self):
+        return self.thumbnail.bytes_written + self.watermarked.bytes_written
+
+    def save(self, *args, **kwargs):
+        pass
+
+    def cleanup(self):
+        for field in (self.thumbnail, self.watermarked):
+            if field.path and os.path.exists(field.path):
+                os.remove(field.path)
@@ -0,0 +1,133 @@
+"""
+Бенчмарк конвейера обработки фотографий (PhotoProcessingService)
+
+Замеряет на синтетических кадрах 12/24/45 Мп:
+- create_thumbnail
+- create_watermarked
+- detect_faces (заглушка детектора, если face_recognition недоступен)
+- process_photo целиком
+
+Каждый этап включает открытие оригинала. Запись в БД не замеряется:
+фото подменяется BenchPhoto, а сопоставление с клиентами отключено.
+
+Запуск:
+    python -m benchmarks.photo_pipeline --sizes 12 24 45 --repeat 5 --output results.json
+    python manage.py benchmark_photos --baseline old.json
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+from . import report
+from .fixtures import BenchPhoto, StubFaceDetector, image_size, make_image
+
+
+DEFAULT_SIZES = (12, 24, 45)
+
+
+def run(sizes=DEFAULT_SIZES, repeat: int = 5, workdir=None, detector=None) -> dict:
+    """
+    Прогоняет бенчмарк и возвращает отчёт (dict, готовый для JSON)
+    """
+    from PIL import Image
+    from apps.photos.services import PhotoProcessingService
+    from apps.recognition.services import face_service
+
+    if detector is None:
+        detector = face_service if face_service.available else StubFaceDetector()
+
+    own_workdir = workdir is None
+    workdir = Path(workdir or tempfile.mkdtemp(prefix='photomarket-bench-'))
+    output_dir = workdir / 'output'
+
+    service = PhotoProcessingService()
+    # Распознавание без записи лиц и записи об обработке в БД,
+    # SHA-256 считается, но дубликаты в БД не ищутся
+    service.detect_faces = lambda photo, trace=None: len(detector.get_face_data(photo.original.path))
+    service.save_processing_record = lambda photo, trace: None
+    service.find_duplicate = lambda photo: None
+
+    results = []
+    try:
+        for megapixels in sizes:
+            path = make_image(workdir, megapixels)
+            width, height = image_size(megapixels)
+
+            stages = {
+                'create_thumbnail': lambda photo: service.create_thumbnail(photo, Image.open(path)),
+                'create_watermarked': lambda photo: service.create_watermarked(photo, Image.open(path)),
+                'detect_faces': lambda photo: detector.get_face_data(str(path)),
+                'process_photo': service.process_photo,
+            }
+
+            for stage, func in stages.items():
+                written = []
+
+                def case():
+                    photo = BenchPhoto(path, output_dir)
+                    result = func(photo)
+                    if stage == 'process_photo' and result is not True:
+                        raise RuntimeError(f'process_photo завершился ошибкой на {megapixels} Мп')
+                    written.append(photo.bytes_written)
+                    photo.cleanup()
+
+                timings = report.measure(case, repeat)
+                results.append({
+                    'name': f'{stage}@{megapixels}mp',
+                    'stage': stage,
+                    'megapixels': megapixels,
+                    'width': width,
+                    'height': height,
+                    **report.summarize(timings),
+                    'bytes_written': written[-1] if written else 0,
+                    'peak_rss_mb': report.peak_rss_mb(),
+                })
+    finally:
+        if own_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'benchmark': 'photo_pipeline',
+        'environment': report.environment(),
+        'detector': type(detector).__name__,
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк обработки фотографий')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='Размеры кадров в мегапикселях')
+    parser.add_argument('--repeat', type=int, default=5, help='Повторов на каждый этап')
+    parser.add_argument('--output', help='Файл для JSON-отчёта (по умолчанию stdout)')
+    parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Допустимое замедление p50 относительно базового прогона')
+    args = parser.parse_args(argv)
+
+    report.setup_django()
+    result = run(sizes=args.sizes, repeat=args.repeat)
+    report.write_report(result, args.output)
+    return check_baseline(result, args.baseline, args.threshold)
+
+
+def check_baseline(result, baseline_path, threshold, stream=None) -> int:
+    """Сравнивает с базовым прогоном, возвращает код выхода (1 при регрессии)"""
+    if not baseline_path:
+        return 0
+
+    stream = stream or sys.stderr
+    baseline = json.loads(Path(baseline_path).read_text(encoding='utf-8'))
+    changes, regressions = report.compare(result, baseline, threshold=threshold)
+    for name, old, new, change in changes:
+        stream.write(f'{name}: {old:.1f} -> {new:.1f} мс ({change:+.0%})\n')
+    for name, old, new, change in regressions:
+        stream.write(f'РЕГРЕССИЯ {name}: {change:+.0%} (порог {threshold:.0%})\n')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Общие утилиты бенчмарков: замеры, перцентили, память, JSON-отчёты
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+def setup_django():
+    """Настраивает Django для запуска бенчмарка без manage.py"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'photomarket.settings')
+    import django
+    django.setup()
+
+
+def percentile(values, q: float) -> float:
+    """Перцентиль с линейной интерполяцией (q от 0 до 100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss_mb():
+    """
+    Пиковый RSS процесса в МБ (None на Windows)
+    Значение монотонно: это максимум за всё время жизни процесса
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss /= 1024  # на macOS в байтах, на Linux в килобайтах
+    return round(rss / 1024, 1)
+
+
+def measure(func, repeat: int, warmup: int = 1):
+    """Запускает func несколько раз, возвращает длительности в секундах"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def summarize(timings) -> dict:
+    """Сводка по длительностям в миллисекундах"""
+    ms = [t * 1000 for t in timings]
+    return {
+        'runs': len(ms),
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'mean_ms': round(sum(ms) / len(ms), 3) if ms else 0.0,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=Path(__file__).resolve().parent,
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    """Описание окружения для сравнения прогонов"""
+    info = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+    try:
+        import PIL
+        info['pillow'] = PIL.__version__
+    except ImportError:
+        pass
+    try:
+        import numpy
+        info['numpy'] = numpy.__version__
+    except ImportError:
+        pass
+    return info
+
+
+def write_report(report: dict, output=None, stream=None):
+    """Пишет отчёт в файл или в поток (по умолчанию stdout)"""
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        Path(output).write_text(text, encoding='utf-8')
+    else:
+        (stream or sys.stdout).write(text + '\n')
+
+
+def compare(report: dict, baseline: dict, metric: str = 'p50_ms', threshold: float = 0.2):
+    """
+    Сравнивает отчёт с базовым прогоном (результаты сопоставляются по name)
+    Возвращает список (name, было, стало, изменение) и список регрессий
+    сверх порога threshold (0.2 = медленнее на 20%)
+    """
+    previous = {r['name']: r for r in baseline.get('results', [])}
+    changes, regressions = [], []
+    for result in report.get('results', []):
+        old = previous.get(result['name'])
+        if not old or metric not in result or not old.get(metric):
+            continue
+        change = result[metric] / old[metric] - 1
+        row = (result['name'], old[metric], result[metric], change)
+        changes.append(row)
+        if change > threshold:
+            regressions.append(row)
+    return changes, regressions
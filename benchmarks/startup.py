@@ -0,0 +1,162 @@
+"""
+Бенчмарк запуска веб-воркера (photomarket.wsgi) и бюджет импорта
+
+Каждый прогон - отдельный процесс `python -X importtime`, который
+импортирует photomarket.wsgi и загружает URLconf (все views) - то же,
+что делает воркер gunicorn до первого ответа. Замеряются:
+- import_s - импорт photomarket.wsgi (django.setup, приложения, сигналы)
+- urls_s - загрузка URLconf и модулей views
+- peak_rss_mb - пиковый RSS процесса
+- self-время импорта по пакетам верхнего уровня (из -X importtime)
+
+Бюджет (код выхода 1 при нарушении):
+- ни одна из тяжёлых библиотек (HEAVY_MODULES) не выполнена при запуске:
+  numpy и PIL регистрируются apps.photos.lazy и загружаются при первой
+  обработке, face_recognition/dlib - только в пуле распознавания
+- --budget-ms - предел p50 полного запуска
+- --baseline - нет замедления сверх --threshold относительно прошлого прогона
+
+Запуск:
+    python -m benchmarks.startup --repeat 10
+    python -m benchmarks.startup --budget-ms 1500 --baseline startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from . import report
+
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ('numpy', 'PIL.Image', 'face_recognition', 'dlib')
+TOP_PACKAGES = 12
+
+
+def probe() -> dict:
+    """Замер внутри запускаемого процесса (--probe)"""
+    started = time.perf_counter()
+    import photomarket.wsgi  # noqa: F401
+    import_s = time.perf_counter() - started
+
+    from django.urls import get_resolver
+    from apps.photos.lazy import is_loaded
+
+    started = time.perf_counter()
+    get_resolver().url_patterns
+    urls_s = time.perf_counter() - started
+    return {
+        'import_s': import_s,
+        'urls_s': urls_s,
+        'peak_rss_mb': report.peak_rss_mb(),
+        'loaded': [name for name in HEAVY_MODULES if is_loaded(name)],
+    }
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Self-время импорта (мкс) по пакетам верхнего уровня из вывода -X importtime"""
+    packages = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # заголовок
+        packages[parts[2].strip().split('.')[0]] += int(parts[0])
+    return dict(packages)
+
+
+def run_probe() -> tuple:
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='photomarket.settings')
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'benchmarks.startup', '--probe'],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    wall_s = time.perf_counter() - started
+    return json.loads(process.stdout), parse_importtime(process.stderr), wall_s
+
+
+def run(repeat: int) -> dict:
+    probes, packages = [], defaultdict(list)
+    wall = []
+    for _ in range(repeat):
+        result, by_package, wall_s = run_probe()
+        probes.append(result)
+        wall.append(wall_s)
+        for name, us in by_package.items():
+            packages[name].append(us)
+
+    startup = [p['import_s'] + p['urls_s'] for p in probes]
+    top = sorted(packages.items(), key=lambda item: -report.percentile(item[1], 50))[:TOP_PACKAGES]
+    return {
+        'benchmark': 'startup',
+        'environment': report.environment(),
+        'results': [
+            {'name': 'wsgi_startup', **report.summarize(startup)},
+            {'name': 'wsgi_import', **report.summarize([p['import_s'] for p in probes])},
+            {'name': 'urlconf', **report.summarize([p['urls_s'] for p in probes])},
+            {'name': 'process', **report.summarize(wall)},
+        ],
+        'peak_rss_mb': max(p['peak_rss_mb'] or 0 for p in probes) or None,
+        'heavy_loaded': sorted({name for p in probes for name in p['loaded']}),
+        'import_self_ms_by_package': {
+            name: round(report.percentile(values, 50) / 1000, 1) for name, values in top
+        },
+    }
+
+
+def check(result, budget_ms=None, baseline_path=None, threshold: float = 0.2, stream=None) -> int:
+    """
+    Проверяет бюджет запуска, возвращает код выхода (1 при провале)
+    """
+    stream = stream or sys.stderr
+    failed = False
+
+    for name in result['heavy_loaded']:
+        stream.write(f'ИМПОРТ {name} при запуске веб-воркера\n')
+        failed = True
+
+    startup = result['results'][0]
+    if budget_ms is not None and startup['p50_ms'] > budget_ms:
+        stream.write(f"ЗАПУСК p50 {startup['p50_ms']:.0f} мс > {budget_ms:.0f} мс\n")
+        failed = True
+
+    if baseline_path:
+        baseline = json.loads(Path(baseline_path).read_text(encoding='utf-8'))
+        changes, regressions = report.compare(result, baseline, threshold=threshold)
+        for name, old, new, change in changes:
+            stream.write(f'{name}: {old:.1f} -> {new:.1f} мс ({change:+.0%})\n')
+        for name, old, new, change in regressions:
+            stream.write(f'РЕГРЕССИЯ {name}: {change:+.0%} (порог {threshold:.0%})\n')
+        failed = failed or bool(regressions)
+
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк запуска веб-воркера')
+    parser.add_argument('--repeat', type=int, default=5, help='Запусков процесса')
+    parser.add_argument('--budget-ms', type=float, help='Предел p50 запуска (импорт + URLconf)')
+    parser.add_argument('--output', help='Файл для JSON-отчёта (по умолчанию stdout)')
+    parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Допустимое замедление p50 относительно базового прогона')
+    parser.add_argument('--probe', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        sys.stdout.write(json.dumps(probe()) + '\n')
+        return 0
+
+    result = run(args.repeat)
+    report.write_report(result, args.output)
+    return check(result, args.budget_ms, args.baseline, args.threshold)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
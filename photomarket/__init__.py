@@ -1 +1,6 @@
 # PhotoMarket - Сервис поиска и покупки фотографий по лицу
+
+# Приложение Celery загружается вместе с Django, чтобы shared_task его видели
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
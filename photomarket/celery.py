@@ -0,0 +1,39 @@
+"""
+Приложение Celery
+
+Настройки - из Django settings с префиксом CELERY_. Очереди:
+- detection - поиск и кодирование лиц (CPU): отдельные воркеры,
+  concurrency по числу ядер
+- matching - сопоставление лиц с клиентами (лёгкие задачи)
+- selfies - селфи клиентов (интерактивные, клиент ждёт результат)
+- default - outbox, уведомления о платежах, книга проводок
+
+Запуск:
+    celery -A photomarket worker -Q detection -c 4 -l info
+    celery -A photomarket worker -Q selfies,matching,default -l info
+    celery -A photomarket beat -l info
+
+Внутри очереди интерактивные задачи обгоняют массовые по приоритету
+(TASK_PRIORITY_INTERACTIVE / TASK_PRIORITY_BULK в settings).
+"""
+import os
+
+from celery import Celery
+from kombu import Queue
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'photomarket.settings')
+
+QUEUES = ('detection', 'matching', 'selfies', 'default')
+
+# Уровней приоритета в каждой очереди
+MAX_PRIORITY = 9
+
+app = Celery('photomarket')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.conf.task_queues = tuple(
+    Queue(name, routing_key=name, queue_arguments={'x-max-priority': MAX_PRIORITY})
+    for name in QUEUES
+)
+app.autodiscover_tasks()
+
@@ -0,0 +1,149 @@
+"""
+Профилировщик SQL-запросов на уровне запроса
+- Количество запросов, суммарное время БД, повторы (N+1) по отпечаткам
+- Заголовок Server-Timing для DevTools
+- Выборочный лог (QUERY_PROFILER_SAMPLE_RATE) и лог всех превышений
+- Бюджеты запросов по имени view (QUERY_BUDGETS): warn или raise (в тестах)
+"""
+import json
+import logging
+import random
+import re
+import time
+import warnings
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger('apps.queries')
+
+# Сколько повторяющихся отпечатков показывать в логе и ошибке
+TOP_DUPLICATES = 5
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(Exception):
+    """View выполнил больше запросов, чем разрешено бюджетом"""
+
+
+def fingerprint(sql: str) -> str:
+    """
+    Нормализует SQL: литералы и списки IN (...) заменяются заглушками,
+    чтобы запросы, отличающиеся только параметрами, совпадали
+    """
+    sql = _STRING_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryProfile:
+    """Собирает запросы через connection.execute_wrapper"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        """Отпечатки, выполненные больше одного раза: [(sql, раз)]"""
+        return [(sql, n) for sql, n in self.fingerprints.most_common() if n > 1]
+
+    @property
+    def duplicate_count(self) -> int:
+        return sum(n - 1 for _, n in self.duplicates)
+
+
+def get_query_budget(view_name):
+    """Бюджет запросов для view (None - без ограничения)"""
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    if view_name in budgets:
+        return budgets[view_name]
+    return getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+
+
+class QueryProfilerMiddleware:
+    """
+    Профилирует SQL каждого запроса
+    Включается QUERY_PROFILER_ENABLED, режим бюджетов - QUERY_BUDGET_MODE
+    ('off', 'warn' или 'raise')
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.mode = getattr(settings, 'QUERY_BUDGET_MODE', 'warn')
+        self.sample_rate = getattr(settings, 'QUERY_PROFILER_SAMPLE_RATE', 0.0)
+        self.server_timing = getattr(settings, 'QUERY_PROFILER_SERVER_TIMING', True)
+
+    def __call__(self, request):
+        profile = QueryProfile()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else None
+
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'db;dur={profile.duration * 1000:.1f};'
+                f'desc="{profile.count} queries, {profile.duplicate_count} duplicates"'
+            )
+
+        budget = get_query_budget(view_name) if view_name else None
+        over_budget = budget is not None and profile.count > budget
+
+        if over_budget or random.random() < self.sample_rate:
+            self.log(request, view_name, profile, budget, over_budget)
+
+        if over_budget and self.mode != 'off':
+            self.report_budget(view_name, profile, budget)
+
+        return response
+
+    def log(self, request, view_name, profile, budget, over_budget):
+        data = {
+            'event': 'request_queries',
+            'view': view_name,
+            'path': request.path,
+            'method': request.method,
+            'queries': profile.count,
+            'db_ms': round(profile.duration * 1000, 1),
+            'budget': budget,
+            'duplicates': [
+                {'sql': sql[:300], 'count': n} for sql, n in profile.duplicates[:TOP_DUPLICATES]
+            ],
+        }
+        level = logging.WARNING if over_budget else logging.INFO
+        logger.log(level, json.dumps(data, ensure_ascii=False))
+
+    def report_budget(self, view_name, profile, budget):
+        lines = [f'{view_name}: {profile.count} запросов при бюджете {budget}']
+        for sql, n in profile.duplicates[:TOP_DUPLICATES]:
+            lines.append(f'  x{n}: {sql[:200]}')
+        message = '\n'.join(lines)
+
+        if self.mode == 'raise':
+            raise QueryBudgetExceeded(message)
+        warnings.warn(message, RuntimeWarning)
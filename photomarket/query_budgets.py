@@ -0,0 +1,85 @@
+"""
+Бюджеты SQL-запросов по view (имя из resolver_match.view_name)
+
+Проверяются QueryProfilerMiddleware. В тестах включайте
+QUERY_BUDGET_MODE = 'raise', чтобы регрессия (новый N+1) роняла тест:
+photomarket/tests.py запрашивает так каждый view из списка.
+Бюджет не должен зависеть от количества строк на странице: если для
+прохождения его приходится поднимать вместе с данными - это N+1.
+
+None - без ограничения (обработка загруженных файлов в запросе).
+View без записи получают QUERY_BUDGET_DEFAULT.
+"""
+
+QUERY_BUDGETS = {
+    # photomarket
+    'home': 8,
+    'license': 2,
+    'privacy': 2,
+
+    # accounts (сессия и пользователь - 2 запроса на любой авторизованный запрос)
+    'accounts:register': 6,
+    'accounts:login': 6,
+    'accounts:logout': 6,
+    'accounts:dashboard': 4,
+    'accounts:profile': 5,
+    'accounts:profile_edit': 8,
+
+    # clients
+    'clients:dashboard': 10,
+    'clients:upload_selfie': 20,
+    'clients:search_photos': 12,
+    'clients:my_photos': 9,
+    'clients:photo_detail': 5,
+    'clients:request_deletion': 8,
+    'clients:purchases': 6,
+    'clients:deletion_requests': 6,
+
+    # photos
+    'photos:gallery': 4,
+    'photos:events': 4,
+    'photos:event_detail': 7,
+    'photos:event_timeline': 3,
+    'photos:event_timeline_photos': 3,
+    'photos:search': 6,
+    'photos:protected_media': 0,
+    'public_media': 0,
+    'photos:metrics': 3,
+
+    # payments (оплата с FakeBackend: заказ, покупки и проводки пачкой; outbox - после ответа,
+    # +1 на разбиение bulk_create большого заказа в SQLite)
+    'payments:create_payment': 23,
+    'payments:cart': 8,
+    'payments:cart_add': 8,
+    'payments:cart_remove': 6,
+    'payments:checkout': 23,
+    'payments:buy_bundle': 23,
+    'payments:order': 8,
+    'payments:success': 8,
+    'payments:download': 10,
+    'payments:yookassa_webhook': 20,
+
+    # photographers
+    'photographers:dashboard': 10,
+    'photographers:events': 7,
+    'photographers:event_create': 6,
+    'photographers:event_detail': 8,
+    'photographers:event_edit': 12,  # + UPDATE на каждую изменённую скидку (PriceTier)
+    'photographers:photos': 7,
+    'photographers:photo_upload': None,
+    'photographers:upload_sessions': 8,
+    'photographers:upload_session': 8,
+    'photographers:upload_session_commit': None,
+    'photographers:photo_edit': 8,
+    'photographers:photo_delete': 8,
+    'photographers:sales': 8,
+    'photographers:earnings_chart': 5,
+    'photographers:deletion_requests': 7,
+    'photographers:deletion_request_detail': 10,
+    'photographers:withdrawal': 10,  # блокировка фотографа, остаток по книге, заявка и проводки
+
+    # recognition API
+    'recognition:selfie_status': 4,
+    'recognition:matched_photos': 6,
+    'recognition:photo_faces': 5,
+}
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'apps.photos',        # Фотографии и события
     'apps.payments',      # Платежи и транзакции
     'apps.recognition',   # Распознавание лиц
+    'apps.outbox',        # Действия после коммита (outbox)
 ]
 
 MIDDLEWARE = [
@@ -50,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'photomarket.middleware.QueryProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'photomarket.urls'
@@ -119,6 +121,52 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Раздача медиа (apps.photos.media)
+# Публичные версии nginx отдаёт из MEDIA_ROOT сам, приватные файлы - по подписанной ссылке
+PUBLIC_MEDIA_PREFIXES = ('thumbnails/', 'watermarked/', 'avatars/')
+SIGNED_MEDIA_TTL_SECONDS = 300  # Срок действия ссылки на оригинал
+# '' - файлы отдаёт Django, 'nginx' - X-Accel-Redirect, 'sendfile' - X-Sendfile
+MEDIA_ACCEL_MODE = os.getenv('MEDIA_ACCEL_MODE', '')
+MEDIA_ACCEL_PREFIX = '/protected-media/'  # internal location в nginx
+
+# Хранилище медиа: local (MEDIA_ROOT) или s3 (AWS, MinIO, Yandex Object Storage)
+# Обработка читает файлы только через Storage API (apps.photos.storage)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local').lower()
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+if STORAGE_BACKEND == 's3':
+    from botocore.config import Config as S3ClientConfig
+
+    STORAGES['default'] = {
+        'BACKEND': 'storages.backends.s3.S3Storage',
+        'OPTIONS': {
+            'bucket_name': os.getenv('S3_BUCKET', 'photomarket'),
+            'endpoint_url': os.getenv('S3_ENDPOINT_URL') or None,  # MinIO: http://localhost:9000
+            'region_name': os.getenv('S3_REGION', 'ru-central1'),
+            'access_key': os.getenv('S3_ACCESS_KEY', ''),
+            'secret_key': os.getenv('S3_SECRET_KEY', ''),
+            # MinIO и большинство совместимых хранилищ требуют path-style адреса
+            'addressing_style': os.getenv('S3_ADDRESSING_STYLE', 'path'),
+            # Бакет приватный, ссылки на файлы подписываются
+            'default_acl': None,
+            'querystring_auth': True,
+            'querystring_expire': 3600,
+            'file_overwrite': False,
+            # Файлы до 10 МБ читаются в память, крупнее - во временный файл
+            'max_memory_size': 10 * 1024 * 1024,
+            # Общий пул соединений клиента для всех потоков процесса
+            'client_config': S3ClientConfig(
+                max_pool_connections=int(os.getenv('S3_MAX_POOL_CONNECTIONS', '32')),
+                connect_timeout=5,
+                read_timeout=60,
+                retries={'max_attempts': 5, 'mode': 'adaptive'},
+                tcp_keepalive=True,
+            ),
+        },
+    }
+
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -139,20 +187,145 @@ LOGOUT_REDIRECT_URL = 'home'
 # YooKassa Settings (ЮКасса)
 YOOKASSA_SHOP_ID = os.getenv('YOOKASSA_SHOP_ID', '')
 YOOKASSA_SECRET_KEY = os.getenv('YOOKASSA_SECRET_KEY', '')
-
-# Celery Settings (для асинхронного распознавания лиц)
+# Платёжный провайдер (apps.payments.backends): FakeBackend или YooKassaBackend
+PAYMENT_BACKEND = os.getenv('PAYMENT_BACKEND', 'apps.payments.backends.FakeBackend')
+# FakeBackend: оплата подтверждается сразу, иначе ждёт уведомления (simulate_payment_webhooks)
+FAKE_PAYMENT_AUTO_CAPTURE = os.getenv('FAKE_PAYMENT_AUTO_CAPTURE', 'True').lower() in ('true', '1', 'yes')
+# Уведомления о платежах (apps.payments.webhooks)
+WEBHOOK_ASYNC = os.getenv('WEBHOOK_ASYNC', 'False').lower() in ('true', '1', 'yes')  # Применять задачей Celery
+WEBHOOK_BATCH_SIZE = 100   # Событий в одной транзакции
+WEBHOOK_MAX_ATTEMPTS = 5   # Затем событие помечается failed
+
+# Книга проводок (apps.payments.ledger): снимки остатков только по проводкам
+# старше задержки - больше самой долгой транзакции с проводками
+LEDGER_SNAPSHOT_LAG_SECONDS = 600
+
+# Действия после коммита (apps.outbox.relay)
+OUTBOX_ASYNC = os.getenv('OUTBOX_ASYNC', 'False').lower() in ('true', '1', 'yes')  # Отправлять задачей Celery
+OUTBOX_BATCH_SIZE = 200             # Сообщений в одной транзакции
+OUTBOX_MAX_ATTEMPTS = 8             # Затем сообщение помечается failed
+OUTBOX_BACKOFF_SECONDS = 30         # Первая задержка повтора, дальше удваивается
+OUTBOX_MAX_BACKOFF_SECONDS = 3600
+OUTBOX_RETENTION_DAYS = 7           # Хранение выполненных (relay_outbox --purge)
+
+# Celery Settings (для асинхронного распознавания лиц), очереди - photomarket/celery.py
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = 'django-db'
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'apps.photos.tasks.process_uploaded_photo': {'queue': 'detection'},
+    'apps.photos.tasks.process_uploaded_photos': {'queue': 'detection'},
+    'apps.recognition.tasks.process_photo_faces': {'queue': 'detection'},
+    'apps.recognition.tasks.process_photo_faces_batch': {'queue': 'detection'},
+    'apps.recognition.tasks.match_faces_with_clients': {'queue': 'matching'},
+    'apps.recognition.tasks.find_client_photos': {'queue': 'matching'},
+    'apps.recognition.tasks.match_photos': {'queue': 'matching'},
+    'apps.recognition.tasks.find_photos_for_clients': {'queue': 'matching'},
+    'apps.recognition.tasks.process_client_selfie': {'queue': 'selfies'},
+}
+# Приоритет внутри очереди: Redis первыми отдаёт меньшие номера, RabbitMQ - большие
+TASK_PRIORITY_INTERACTIVE = 0 if CELERY_BROKER_URL.startswith('redis') else 9
+TASK_PRIORITY_BULK = 9 if CELERY_BROKER_URL.startswith('redis') else 0
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    # Приоритеты в Redis: отдельный список на каждый уровень
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+# Воркер не резервирует задачи заранее: приоритет срабатывает, длинные
+# задачи распознавания не застревают за чужими
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Массовая догрузка не забирает все CPU воркеров распознавания
+CELERY_TASK_ANNOTATIONS = {
+    'apps.recognition.tasks.process_photo_faces_batch': {'rate_limit': os.getenv('FACE_BATCH_RATE_LIMIT', '30/m')},
+}
+CELERY_BEAT_SCHEDULE = {
+    'relay-outbox': {'task': 'apps.outbox.tasks.relay_outbox', 'schedule': 60.0},
+    'process-webhook-events': {'task': 'apps.payments.tasks.process_webhook_events', 'schedule': 300.0},
+    'snapshot-ledger-balances': {'task': 'apps.payments.tasks.snapshot_ledger_balances', 'schedule': 3600.0},
+    'process-pending-photos': {'task': 'apps.recognition.tasks.process_all_pending_photos', 'schedule': 600.0},
+}
+# Фото в одной задаче process_photo_faces_batch
+FACE_BATCH_SIZE = 16
 
 # Face Recognition Settings
 FACE_RECOGNITION_TOLERANCE = 0.6  # Порог схожести лиц (меньше = строже)
 FACE_ENCODING_MODEL = 'large'     # 'small' или 'large'
+# Memory-mapped хранилище кодировок лиц (общее для всех воркеров на хосте)
+FACE_STORE_DIR = os.getenv('FACE_STORE_DIR', str(MEDIA_ROOT / 'face_store'))
+CLIENT_MAX_SELFIES = 5            # Сколько эталонных селфи хранить на клиента
+FACE_TEMPLATE_MEDOIDS = 2         # Медоидов в шаблоне лица (плюс среднее)
+# Пул распознавания с прогретыми моделями (manage.py run_face_worker):
+# с сокетом процессы Django и Celery не загружают dlib, а отправляют фото в пул
+FACE_WORKER_SOCKET = os.getenv('FACE_WORKER_SOCKET', '')
+FACE_WORKER_PROCESSES = int(os.getenv('FACE_WORKER_PROCESSES', '0')) or None  # None - по числу ядер
+FACE_WORKER_TIMEOUT = 120         # Секунд на ответ пула
+FACE_WORKER_DETECTOR = 'apps.recognition.worker.DlibDetector'
 
 # Photo Settings
 MAX_PHOTO_SIZE_MB = 50
+# SHA-256 оригинала считается во время загрузки (дедупликация фото)
+FILE_UPLOAD_HANDLERS = [
+    'apps.photos.uploadhandlers.HashingMemoryFileUploadHandler',
+    'apps.photos.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
+# Загрузка по частям (apps.photos.uploads)
+UPLOAD_SESSION_DIR = os.getenv('UPLOAD_SESSION_DIR', str(MEDIA_ROOT / 'uploads' / 'partial'))
+UPLOAD_CHUNK_MAX_BYTES = 8 * 1024 * 1024  # Наибольшая часть в одном PUT
+UPLOAD_SESSION_TTL_HOURS = 24             # Незавершённые загрузки удаляет cleanup_upload_sessions
+# Обработка загруженных фото задачей Celery (иначе сразу в запросе)
+PHOTO_PROCESSING_ASYNC = os.getenv('PHOTO_PROCESSING_ASYNC', 'False').lower() in ('true', '1', 'yes')
 WATERMARK_OPACITY = 0.3
 WATERMARK_TEXT = 'PhotoMarket'
 THUMBNAIL_SIZE = (400, 400)
+# Счётчики просмотров (apps.photos.counters)
+VIEW_COUNTER_DEDUPE_SECONDS = 30 * 60  # Повторный просмотр тем же посетителем не считается
+VIEW_COUNTER_FLUSH_SECONDS = 10        # Как часто сбрасывать просмотры в БД (и сколько теряется при SIGKILL)
+VIEW_COUNTER_MAX_PENDING = 1000        # Сбрасывать раньше, если накопилось столько просмотров
+# Серии кадров (apps.photos.bursts)
+BURST_WINDOW_SECONDS = 3       # Наибольший промежуток между соседними кадрами серии
+BURST_MAX_DISTANCE = 10        # Порог расстояния Хэмминга dHash для кадров одной серии
+BURST_PROPAGATE_DISTANCE = 6   # Лица соседнего кадра переносятся без распознавания
+# Кэш поиска и фасетов (apps.photos.search), секунды
+SEARCH_CACHE_SECONDS = 300
+# Метрики этапов обработки фото в формате Prometheus (/photos/metrics/), общие для процессов - в БД
+PHOTO_METRICS_ENABLED = os.getenv('PHOTO_METRICS_ENABLED', 'False') == 'True'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Кэш предложений цен со скидками событий (apps.payments.pricing), секунды
+PRICING_CACHE_SECONDS = 300
 
 # Commission Settings (Комиссия сервиса)
 SERVICE_COMMISSION_PERCENT = 15  # 15% с каждой продажи
+
+# Профилировщик SQL-запросов (photomarket.middleware.QueryProfilerMiddleware)
+QUERY_PROFILER_ENABLED = os.getenv('QUERY_PROFILER_ENABLED', str(DEBUG)).lower() in ('true', '1', 'yes')
+QUERY_PROFILER_SAMPLE_RATE = float(os.getenv('QUERY_PROFILER_SAMPLE_RATE', '0.01'))
+# 'off', 'warn' или 'raise' (в тестах: превышение бюджета роняет запрос)
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', 'warn')
+QUERY_BUDGET_DEFAULT = 30
+from .query_budgets import QUERY_BUDGETS  # noqa: E402
+
+# Logging (структурированные логи обработки фото - logger apps.photos.processing)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'apps': {
+            'handlers': ['console'],
+            'level': os.getenv('APPS_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
@@ -0,0 +1,220 @@
+import datetime
+import io
+import json
+import shutil
+import tempfile
+from decimal import Decimal
+
+from django.core.files.base import ContentFile
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.urls import get_resolver
+
+from apps.accounts.models import ClientProfile, PhotographerProfile, User
+from apps.payments import services
+from apps.payments.models import CartItem, Order
+from apps.photos import media, uploads
+from apps.photos.counters import view_counter
+from apps.photos.models import DeletionRequest, Event, Photo, PhotoFace
+from benchmarks import face_matching, photo_pipeline, report
+from photomarket.query_budgets import QUERY_BUDGETS
+
+
+# Только при DEBUG (photomarket/urls.py) - в тестах не подключён
+DEBUG_ONLY_VIEWS = {'public_media'}
+
+
+@override_settings(
+    QUERY_PROFILER_ENABLED=True, QUERY_BUDGET_MODE='raise', QUERY_PROFILER_SAMPLE_RATE=0,
+    PHOTO_METRICS_ENABLED=True, METRICS_TOKEN='metrics', SEARCH_CACHE_SECONDS=0,
+    PRICING_CACHE_SECONDS=0,
+)
+class QueryBudgetTests(TransactionTestCase):
+    """
+    Каждый view из QUERY_BUDGETS с профилировщиком в режиме raise:
+    превышение бюджета роняет запрос QueryBudgetExceeded
+    Строк на странице несколько - N+1 выходит за бюджет
+    TransactionTestCase: atomic внутри view не превращается в SAVEPOINT
+    и RELEASE, запросов столько же, сколько в продакшене
+    """
+
+    PHOTOS = 5
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=directory, UPLOAD_SESSION_DIR=directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(view_counter.flush)
+
+        self.photographer_user = User.objects.create(username='photographer', user_type='photographer')
+        self.photographer = PhotographerProfile.objects.create(user=self.photographer_user)
+        self.client_user = User.objects.create(username='client', user_type='client')
+        self.client_profile = ClientProfile.objects.create(
+            user=self.client_user, face_processed=True, face_encoding=[0.0] * 128,
+        )
+        self.event = Event.objects.create(
+            photographer=self.photographer, name='Забег', city='Казань',
+            date=datetime.date(2026, 5, 1), is_public=True,
+        )
+        self.bought = [self.photo(n) for n in range(self.PHOTOS)]
+        self.fresh = [self.photo(n) for n in range(self.PHOTOS, 2 * self.PHOTOS)]
+
+        order = services.pay_order(services.create_order(self.client_profile, self.bought), 'http://testserver/')
+        self.purchases = list(order.purchases.order_by('photo__taken_at'))
+        self.deletion = DeletionRequest.objects.create(
+            photo=self.bought[-1], requester=self.client_user, reason='Не хочу'
+        )
+        data = b'0' * 1024
+        self.upload = uploads.create_session(self.photographer, 'new.jpg', len(data), '0' * 64)
+
+    def photo(self, n):
+        photo = Photo(
+            photographer=self.photographer, event=self.event, status='active', price=Decimal('100'),
+            title=f'Финиш {n}', taken_at=datetime.datetime(2026, 5, 1, 10, n, tzinfo=datetime.timezone.utc),
+        )
+        for field in ('original', 'thumbnail', 'watermarked'):
+            getattr(photo, field).save(f'{field}{n}.jpg', ContentFile(f'{field}{n}'.encode()), save=False)
+        photo.save()
+        PhotoFace.objects.create(
+            photo=photo, face_location={}, face_encoding=[0.0] * 128,
+            matched_user=self.client_user, match_confidence=90,
+        )
+        return photo
+
+    def requests(self):
+        """(view, пользователь, метод, путь, параметры) в порядке выполнения"""
+        event, photo, fresh = self.event.pk, self.bought[0], self.fresh
+        purchase = self.purchases[0]
+        webhook = json.dumps({'event': 'payment.succeeded', 'object': {'id': 'unknown', 'status': 'succeeded'}})
+        return [
+            ('home', None, 'get', '/', {}),
+            ('license', None, 'get', '/license/', {}),
+            ('privacy', None, 'get', '/privacy/', {}),
+            ('accounts:register', None, 'get', '/accounts/register/', {}),
+            ('accounts:login', None, 'get', '/accounts/login/', {}),
+            ('photos:gallery', None, 'get', '/photos/', {}),
+            ('photos:events', None, 'get', '/photos/events/', {}),
+            ('photos:event_detail', None, 'get', f'/photos/events/{event}/', {}),
+            ('photos:event_timeline', None, 'get', f'/photos/events/{event}/timeline/', {}),
+            ('photos:event_timeline_photos', None, 'get', f'/photos/events/{event}/timeline/photos/', {}),
+            ('photos:search', None, 'get', '/photos/search/', {'data': {'q': 'финиш'}}),
+            ('photos:protected_media', None, 'get', media.signed_url(photo.original), {}),
+            ('photos:metrics', None, 'get', '/photos/metrics/', {'HTTP_AUTHORIZATION': 'Bearer metrics'}),
+            ('payments:yookassa_webhook', None, 'post', '/payments/webhook/yookassa/',
+             {'data': webhook, 'content_type': 'application/json'}),
+
+            ('accounts:dashboard', self.client_user, 'get', '/accounts/dashboard/', {}),
+            ('accounts:profile', self.client_user, 'get', '/accounts/profile/', {}),
+            ('accounts:profile_edit', self.client_user, 'get', '/accounts/profile/edit/', {}),
+            ('clients:dashboard', self.client_user, 'get', '/client/', {}),
+            ('clients:upload_selfie', self.client_user, 'get', '/client/upload-selfie/', {}),
+            ('clients:search_photos', self.client_user, 'get', '/client/search-photos/', {}),
+            ('clients:my_photos', self.client_user, 'get', '/client/my-photos/', {}),
+            ('clients:photo_detail', self.client_user, 'get', f'/client/photo/{photo.pk}/', {}),
+            ('clients:request_deletion', self.client_user, 'get', f'/client/photo/{photo.pk}/request-deletion/', {}),
+            ('clients:purchases', self.client_user, 'get', '/client/purchases/', {}),
+            ('clients:deletion_requests', self.client_user, 'get', '/client/deletion-requests/', {}),
+            ('recognition:selfie_status', self.client_user, 'get', '/api/recognition/selfie-status/', {}),
+            ('recognition:matched_photos', self.client_user, 'get', '/api/recognition/matched-photos/', {}),
+            ('recognition:photo_faces', self.client_user, 'get', f'/api/recognition/photo/{photo.pk}/faces/', {}),
+            ('payments:cart_add', self.client_user, 'post', f'/payments/cart/add/{fresh[0].pk}/', {}),
+            ('payments:cart', self.client_user, 'get', '/payments/cart/', {}),
+            ('payments:cart_remove', self.client_user, 'post', f'/payments/cart/remove/{fresh[0].pk}/', {}),
+            ('payments:checkout', self.client_user, 'post', '/payments/checkout/', {}),
+            ('payments:order', self.client_user, 'get', f'/payments/orders/{purchase.order_id}/', {}),
+            ('payments:success', self.client_user, 'get', f'/payments/success/{purchase.pk}/', {}),
+            ('payments:download', self.client_user, 'get',
+             f'/payments/download/{purchase.pk}/{purchase.download_token}/', {}),
+            ('payments:create_payment', self.client_user, 'get', f'/payments/buy/{fresh[3].pk}/', {}),
+            ('payments:buy_bundle', self.client_user, 'post', f'/payments/bundle/{event}/', {}),
+            ('accounts:logout', self.client_user, 'post', '/accounts/logout/', {}),
+
+            ('photographers:dashboard', self.photographer_user, 'get', '/photographer/', {}),
+            ('photographers:events', self.photographer_user, 'get', '/photographer/events/', {}),
+            ('photographers:event_create', self.photographer_user, 'get', '/photographer/events/create/', {}),
+            ('photographers:event_detail', self.photographer_user, 'get', f'/photographer/events/{event}/', {}),
+            ('photographers:event_edit', self.photographer_user, 'get', f'/photographer/events/{event}/edit/', {}),
+            ('photographers:photos', self.photographer_user, 'get', '/photographer/photos/', {}),
+            ('photographers:upload_sessions', self.photographer_user, 'get', '/photographer/uploads/', {}),
+            ('photographers:upload_session', self.photographer_user, 'get',
+             f'/photographer/uploads/{self.upload.pk}/', {}),
+            ('photographers:photo_edit', self.photographer_user, 'get', f'/photographer/photos/{photo.pk}/edit/', {}),
+            ('photographers:photo_delete', self.photographer_user, 'get',
+             f'/photographer/photos/{photo.pk}/delete/', {}),
+            ('photographers:sales', self.photographer_user, 'get', '/photographer/sales/', {}),
+            ('photographers:earnings_chart', self.photographer_user, 'get', '/photographer/sales/chart/', {}),
+            ('photographers:deletion_requests', self.photographer_user, 'get', '/photographer/deletion-requests/', {}),
+            ('photographers:deletion_request_detail', self.photographer_user, 'get',
+             f'/photographer/deletion-requests/{self.deletion.pk}/', {}),
+            ('photographers:withdrawal', self.photographer_user, 'get', '/photographer/withdrawal/', {}),
+        ]
+
+    def test_views_within_budget(self):
+        CartItem.objects.create(buyer=self.client_profile, photo=self.fresh[1])
+        CartItem.objects.create(buyer=self.client_profile, photo=self.fresh[2])
+        clients = {}
+        for view_name, user, method, path, extra in self.requests():
+            with self.subTest(view=view_name):
+                if user not in clients:
+                    clients[user] = Client(SERVER_NAME='localhost')
+                    if user is not None:
+                        clients[user].force_login(user)
+                client = clients[user]
+                response = getattr(client, method)(path, **extra)
+                self.assertEqual(response.resolver_match.view_name, view_name)
+                self.assertLess(response.status_code, 500)
+                self.assertIn('Server-Timing', response)
+
+        # Оформление корзины и покупка набора действительно прошли
+        self.assertEqual(Order.objects.filter(status=Order.Status.PAID).count(), 4)
+
+    def test_every_budget_is_exercised(self):
+        routed = {name for name in get_resolver().reverse_dict if isinstance(name, str)}
+        for namespace, (_, resolver) in get_resolver().namespace_dict.items():
+            routed |= {f'{namespace}:{name}' for name in resolver.reverse_dict if isinstance(name, str)}
+
+        limited = {name for name, budget in QUERY_BUDGETS.items() if budget is not None}
+        exercised = {view_name for view_name, *_ in self.requests()}
+        self.assertEqual(limited - exercised, DEBUG_ONLY_VIEWS)
+        self.assertEqual(limited & routed, exercised)
+
+
+class BenchmarkTests(TestCase):
+    """Бенчмарки на минимальных размерах: отчёт, точность и проверка регрессий"""
+
+    def slower(self, result, factor):
+        # Базовый прогон, в factor раз быстрее текущего
+        return {'results': [{**row, 'p50_ms': row['p50_ms'] / factor} for row in result['results']]}
+
+    def test_photo_pipeline(self):
+        result = photo_pipeline.run(sizes=[1], repeat=1)
+        rows = {row['stage']: row for row in result['results']}
+        self.assertEqual(set(rows), {'create_thumbnail', 'create_watermarked', 'detect_faces', 'process_photo'})
+        self.assertTrue(all(row['megapixels'] == 1 and row['p50_ms'] > 0 for row in rows.values()))
+        self.assertGreater(rows['create_thumbnail']['bytes_written'], 0)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        baseline = f'{directory}/baseline.json'
+        report.write_report(result, baseline)
+        self.assertEqual(photo_pipeline.check_baseline(result, baseline, 0.2, stream=io.StringIO()), 0)
+
+        report.write_report(self.slower(result, 2), baseline)
+        stream = io.StringIO()
+        self.assertEqual(photo_pipeline.check_baseline(result, baseline, 0.2, stream=stream), 1)
+        self.assertIn('РЕГРЕССИЯ process_photo@1mp', stream.getvalue())
+
+    def test_face_matching(self):
+        result = face_matching.run(faces=[1000], clients=[20], queries=5, repeat=1)
+        rows = {row['method']: row for row in result['results']}
+        self.assertEqual(set(rows), {'compare_faces', 'find_matching_faces', 'store_search', 'template_match'})
+        # Векторный поиск находит те же лица, что точный перебор
+        for method in ('find_matching_faces', 'store_search', 'template_match'):
+            self.assertGreaterEqual(rows[method]['recall'], 0.99, method)
+            self.assertGreaterEqual(rows[method]['precision'], 0.99, method)
+        self.assertEqual(face_matching.check(result, stream=io.StringIO()), 0)
+
+        stream = io.StringIO()
+        self.assertEqual(face_matching.check(result, min_recall=1.01, stream=stream), 1)
+        self.assertIn('ПОЛНОТА store_search@1000f/20c', stream.getvalue())
@@ -28,8 +28,10 @@ urlpatterns = [
 ]
 
 # Serve media files in development
+# Только публичные версии; оригиналы и селфи - через photos:protected_media
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    from apps.photos.views import public_media
+    urlpatterns += [path(f'{settings.MEDIA_URL.strip("/")}/<path:name>', public_media, name='public_media')]
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATICFILES_DIRS[0])
 
 # Кастомные страницы ошибок
@@ -0,0 +1,108 @@
+/* PhotoMarket - загрузка фото по частям с продолжением после обрыва */
+
+const ChunkedUpload = (function() {
+    const MAX_RETRIES = 5;
+
+    function csrfToken(form) {
+        return form.querySelector('[name=csrfmiddlewaretoken]').value;
+    }
+
+    async function sha256(file) {
+        const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function request(url, options, token) {
+        options.headers = Object.assign({'X-CSRFToken': token}, options.headers || {});
+        options.credentials = 'same-origin';
+        const response = await fetch(url, options);
+        const data = await response.json().catch(() => ({}));
+        return {ok: response.ok, status: response.status, data: data};
+    }
+
+    function pause(attempt) {
+        return new Promise(resolve => setTimeout(resolve, Math.min(30000, 1000 * 2 ** attempt)));
+    }
+
+    // Один файл: сессия (или продолжение открытой), части с offset, commit
+    async function uploadFile(file, options) {
+        const hash = await sha256(file);
+        const created = await request(options.url, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({
+                filename: file.name, size: file.size, sha256: hash,
+                event: options.event, price: options.price,
+            }),
+        }, options.token);
+        if (!created.ok) {
+            throw new Error(created.data.error || `HTTP ${created.status}`);
+        }
+
+        let session = created.data;
+        const sessionUrl = `${options.url}${session.id}/`;
+        let attempt = 0;
+        while (session.status === 'open' && session.offset < file.size) {
+            const chunk = file.slice(session.offset, session.offset + session.chunk_size);
+            let result;
+            try {
+                result = await request(sessionUrl, {
+                    method: 'PUT',
+                    headers: {'Upload-Offset': String(session.offset), 'Content-Type': 'application/octet-stream'},
+                    body: chunk,
+                }, options.token);
+            } catch (e) {
+                result = {ok: false, status: 0, data: {}};
+            }
+
+            if (result.ok) {
+                session = result.data;
+                attempt = 0;
+            } else if (result.status === 409 && result.data.offset !== undefined) {
+                // Сервер принял другой объём - продолжаем с его смещения
+                session.offset = result.data.offset;
+            } else if (result.status === 0 || result.status >= 500) {
+                if (++attempt > MAX_RETRIES) throw new Error('Нет соединения с сервером');
+                await pause(attempt);
+                const state = await request(sessionUrl, {method: 'GET'}, options.token).catch(() => null);
+                if (state && state.ok) session = state.data;
+            } else {
+                throw new Error(result.data.error || `HTTP ${result.status}`);
+            }
+            options.onProgress(file, session.offset / file.size);
+        }
+
+        const committed = await request(`${sessionUrl}commit/`, {method: 'POST'}, options.token);
+        if (!committed.ok) {
+            throw new Error(committed.data.error || `HTTP ${committed.status}`);
+        }
+        options.onProgress(file, 1);
+        return committed.data;
+    }
+
+    async function uploadAll(form, files, onProgress) {
+        const options = {
+            url: form.dataset.uploadsUrl,
+            token: csrfToken(form),
+            event: form.querySelector('[name=event]').value || null,
+            price: form.querySelector('[name=price]').value,
+            onProgress: onProgress,
+        };
+        const results = {done: 0, failed: []};
+        for (const file of files) {
+            try {
+                await uploadFile(file, options);
+                results.done++;
+            } catch (e) {
+                results.failed.push(`${file.name}: ${e.message}`);
+            }
+        }
+        return results;
+    }
+
+    function supported() {
+        return !!(window.fetch && window.crypto && crypto.subtle && Blob.prototype.slice);
+    }
+
+    return {supported: supported, uploadAll: uploadAll};
+})();